@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Batch Processing
+Objective:  Run preprocessing, flood/recharge suitability and Flood MAR for many watersheds in parallel as a part of ATUR project
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+
+"""
+Each watershed (extent shapefile) is processed by FloodMAR_Driver.RunWatershed in a separate worker process of a ProcessPoolExecutor.
+    - Every worker has its own arcpy session, and RunWatershed scopes the extent/mask/snap raster environment to the call, so no environment state is shared between watersheds.
+    - Workers are started with 'spawn' and are replaced after every watershed (max_tasks_per_child=1 where available).
+    - Watersheds are only started while the estimated memory of the running watersheds fits in the memory budget (at least one always runs).
+    - A worker killed mid-run (e.g. by the OOM killer) breaks the pool, and every watershed running in it. The pool is recreated and those watersheds are run again, up to ATTEMPTS times; a watershed broken that often is marked 'worker died', and the batch goes on.
+    - The printed output of each watershed is written to <log folder>/<watershed>.log.
+    - Workers only write to the stores of their own watershed workspace. The Flood MAR rasters are merged into the shared <workspace>/FloodMAR store by this process, one watershed after the other as they finish (FloodMAR_Driver.MergeFloodMAR), so no two processes write to the same file gdb.
+A summary table of wall time per stage is printed and saved as BatchSummary.csv in the base workspace.
+With --trace, every stage of every watershed appends a trace event to the trace file (Instrumentation.py), for a critical path and hotspot report per watershed.
+
+Usage:
+    python Batch_Processing.py <extent shapefiles or folder> [--workspace WS] [--workers N] [--memory-gb GB] [--trace TRACE.jsonl]
+"""
+
+import os
+import sys
+import glob
+import struct
+import traceback
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from time import perf_counter
+
+import pandas as pd
+
+# Default base workspace, each watershed is processed in <base workspace>/<watershed name>
+WORKSPACE = "D:/Saved_GIS_Projects/ATUR_Temp/Temp_Workspace"
+# DEM cell size (m) used to estimate the grid size of each watershed
+CELL_SIZE = 30.0
+# Approximate bytes per grid cell held by a watershed run (flood, recharge and Flood MAR float32 outputs, plus alignment copies)
+BYTES_PER_CELL = 24
+# Runs of a watershed whose worker dies before it is marked failed (the killed worker cannot be told apart from the others running in the broken pool)
+ATTEMPTS = 2
+
+# Extent shapefiles from a list of shapefiles and/or folders of shapefiles
+def ListExtents(Paths):
+    extents = []
+    for path in Paths:
+        if os.path.isdir(path):
+            extents.extend(sorted(glob.glob(os.path.join(path, '*.shp'))))
+        else:
+            extents.append(path)
+    return extents
+
+# Bounding box (xmin, ymin, xmax, ymax) from the header of a shapefile, read without arcpy
+def ShapefileBounds(Shapefile):
+    with open(Shapefile, 'rb') as f:
+        header = f.read(100)
+    return struct.unpack('<4d', header[36:68])
+
+# Estimated memory (bytes) of one watershed run, from the extent bounding box
+def EstimateMemory(ExtentFeat, CellSize=CELL_SIZE):
+    try:
+        xmin, ymin, xmax, ymax = ShapefileBounds(ExtentFeat)
+    except (OSError, struct.error):
+        return 0
+    cells = max(xmax - xmin, 0) / CellSize * max(ymax - ymin, 0) / CellSize
+    return int(cells * BYTES_PER_CELL)
+
+# Worker, process one watershed with printed output redirected to a per-watershed log
+def _RunWatershed(WatershedName, ExtentFeat, Workspace, LogFolder, Options):
+    from FloodMAR_Driver import RunWatershed
+
+    timings = {}
+    start = perf_counter()
+    logFile = os.path.join(LogFolder, f'{WatershedName}.log')
+    with open(logFile, 'w') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        print(f'Watershed: {WatershedName}')
+        print(f'Extent: {ExtentFeat}')
+        try:
+            RunWatershed(WatershedName, ExtentFeat, Workspace, Timings=timings, Merge=False, **Options)
+            status = 'done'
+        except Exception:
+            traceback.print_exc()
+            status = 'failed'
+    timings['total'] = perf_counter() - start
+
+    return {'watershed': WatershedName, 'status': status, **timings, 'log': logFile}
+
+# Merge the Flood MAR raster of a finished watershed into the shared store, in this process only
+# Returns: watershed status
+def _MergeWatershed(WatershedName, Workspace, Store):
+    from FloodMAR_Driver import MergeFloodMAR
+
+    try:
+        MergeFloodMAR(WatershedName, Workspace, Store)
+        return 'done'
+    except Exception:
+        traceback.print_exc()
+        return 'merge failed'
+
+# Process a batch of watersheds
+# Requires: Extents=<list of extent shapefiles and/or folders>, Workspace=<base workspace>, Workers=<max worker processes>, MemoryBudget=<GB available to the workers, or None for no limit>, Options=<keyword arguments for RunWatershed (e.g. Inputs, Tables, SaveIntermediates, BlockSize)>
+# Returns: summary DataFrame, one row per watershed with wall time (s) per stage
+def RunBatch(Extents, Workspace=WORKSPACE, Workers=None, MemoryBudget=None, LogFolder=None, Options=None):
+    extents = ListExtents(Extents)
+    Workers = Workers or max(1, (os.cpu_count() or 2) // 2)
+    LogFolder = LogFolder or os.path.join(Workspace, 'logs')
+    os.makedirs(LogFolder, exist_ok=True)
+    Options = Options or {}
+    budget = MemoryBudget * 1024 ** 3 if MemoryBudget else None
+
+    # Largest watersheds first, so the long runs start early
+    jobs = sorted(((os.path.splitext(os.path.basename(e))[0], e, EstimateMemory(e)) for e in extents), key=lambda job: -job[2])
+    print(f'Processing {len(jobs)} watersheds with up to {Workers} workers...')
+
+    poolArgs = {'max_workers': Workers, 'mp_context': multiprocessing.get_context('spawn')}
+    if sys.version_info >= (3, 11):
+        poolArgs['max_tasks_per_child'] = 1
+    results = []
+    attempts = {}  # watershed name: runs started
+    pool = ProcessPoolExecutor(**poolArgs)
+    try:
+        running = {}  # future: job
+        pending = list(jobs)
+        broken = False
+        while pending or running:
+            # A broken pool is replaced once all of its futures are collected
+            if broken and not running:
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = ProcessPoolExecutor(**poolArgs)
+                broken = False
+            # Start watersheds while workers are free and the memory budget allows (always at least one)
+            while pending and len(running) < Workers and not broken:
+                fits = [j for j in pending if budget is None or not running or sum(job[2] for job in running.values()) + j[2] <= budget]
+                if not fits:
+                    break
+                job = fits[0]
+                name, extent, memory = job
+                pending.remove(job)
+                attempts[name] = attempts.get(name, 0) + 1
+                print(f'\tStarting {name} (~{memory / 1024 ** 3:.1f} GB)...')
+                running[pool.submit(_RunWatershed, name, extent, os.path.join(Workspace, name), LogFolder, Options)] = job
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = running.pop(future)
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    broken = True
+                    if attempts[job[0]] < ATTEMPTS:
+                        print(f'\t{job[0]} lost its worker, retrying...')
+                        pending.insert(0, job)
+                        continue
+                    result = {'watershed': job[0], 'status': 'worker died', 'log': os.path.join(LogFolder, f'{job[0]}.log')}
+                if result['status'] == 'done':
+                    result['status'] = _MergeWatershed(result['watershed'], os.path.join(Workspace, result['watershed']), Options.get('Store', 'gdb'))
+                print(f"\t{result['watershed']} {result['status']}" + (f" in {result['total']:.1f} s" if 'total' in result else ''))
+                results.append(result)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    summary = pd.DataFrame(results).set_index('watershed')
+    print('Batch Summary (wall time, s, and skippedPercent, % of cells outside the extent never read):')
+    print('\n'.join('\t' + line for line in summary.round(1).to_string().splitlines()))
+    summary.to_csv(os.path.join(Workspace, 'BatchSummary.csv'))
+
+    return summary
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run Flood MAR for a batch of watersheds.')
+    parser.add_argument('extents', nargs='+', help='extent shapefiles, or folders of extent shapefiles')
+    parser.add_argument('--workspace', default=WORKSPACE, help='base workspace, one sub-folder per watershed')
+    parser.add_argument('--workers', type=int, default=None, help='max worker processes')
+    parser.add_argument('--memory-gb', type=float, default=None, help='memory budget for all workers (GB)')
+    parser.add_argument('--trace', default=None, help='trace file (JSON lines) of per-stage events, refer to Instrumentation.py')
+    parser.add_argument('--build-index', action='store_true', help='save the class-combination index of every watershed for re-weighting, refer to Combination_Index.py')
+    parser.add_argument('--index-step', type=float, default=None, help='class quantization step of the index (default 0.25); the re-weighting error grows with it, finer steps give larger indexes')
+    args = parser.parse_args()
+
+    if args.trace:
+        from Instrumentation import Enable
+        Enable(args.trace)
+    options = {'BuildIndex': args.build_index or args.index_step is not None, 'IndexStep': args.index_step}
+    RunBatch(args.extents, args.workspace, args.workers, args.memory_gb, Options=options)
+    if args.trace:
+        print(f'\tTrace saved to {args.trace}, summarize with: python Instrumentation.py report {args.trace}')
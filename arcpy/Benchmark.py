@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Benchmark
+Objective:  Benchmark suite of the preprocessing stages and the Flood MAR chain on synthetic data, with baseline regression checks, as a part of ATUR Suitability Analysis
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import os
+import sys
+import json
+import platform
+import subprocess
+import tempfile
+from contextlib import ExitStack
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+# Peak resident memory of the stage processes (not available on Windows)
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from Synthetic_Data import GenerateDataset, OpenDataset, PolygonLayers, GridTransform, CELL_SIZE, PRECIP_FACTOR, EPSG, TABLES, TABLE_NAMES
+
+"""
+Times the NumPy backend of every stage on seeded synthetic data (Synthetic_Data.py), so a change can be checked for speed and memory on a plain Linux box, without arcpy or the ATUR data.
+    - Stages: classification (Classification.py, all nine layers), hydrologic_conditioning (Flow_Routing.py), slope (Slope_Tiles.py), drainage_density (Drainage_Density_Raster.py), resample (Bilinear_Resample.py, precipitation onto the DEM grid), feat_to_rast (Scanline_Rasterize.py, lithology and soil), floodmar (FloodMAR_Driver.RunFloodMAR), and chain (every preprocessing stage then Flood MAR, end to end).
+    - Each run is a separate process, so its peak RSS is the stage's own. Inputs are generated once per size and seed and reused, and the layers a stage needs (e.g. flow direction for drainage density) are produced by running the upstream stages first, untimed. Outputs are written to a .npy store, as Preprocessing.py with store='npy'.
+    - Each stage records wall time, throughput (Mpix/s of the DEM grid) and peak RSS. With --repeat, the fastest time and the largest RSS are kept.
+    - --save-baseline stores the results (keyed stage@size) in a JSON file; --baseline compares against it and exits with status 1 if any stage is slower, or uses more memory, than the baseline by more than the tolerance.
+Example: python Benchmark.py --sizes 1024 4096 --repeat 3 --baseline Benchmark_Baseline.json
+"""
+
+STAGES = ['hydrologic_conditioning', 'slope', 'drainage_density', 'resample', 'feat_to_rast', 'classification', 'floodmar', 'chain']
+# Layers written by each stage, and the stages that must have run before it
+OUTPUTS = {
+    'hydrologic_conditioning': ('FlowDir', 'FlowAcc', 'Streams'),
+    'slope': ('Slope',),
+    'drainage_density': ('Drainage',),
+    'resample': ('Precip',),
+    'feat_to_rast': ('Lithology', 'Soil'),
+    'classification': tuple(f'Classified_{name}' for name in ('DEM', 'Slope', 'Lineaments', 'Drainage', 'Precip', 'NDVI', 'Lithology', 'Soil', 'LULC')),
+    'floodmar': ('Flood', 'Recharge', 'FloodMAR'),
+    'chain': ('Flood', 'Recharge', 'FloodMAR'),
+}
+DEPENDS = {
+    'drainage_density': ('hydrologic_conditioning',),
+    'classification': ('slope', 'drainage_density', 'resample', 'feat_to_rast'),
+    'floodmar': ('slope', 'drainage_density', 'resample', 'feat_to_rast'),
+}
+# Stage parameters, as Preprocessing.py
+STREAM_THRESHOLD = 1000
+SEARCH_RADIUS = 1000
+# Defaults: grid sizes (cells per side), allowed slowdown/memory growth over the baseline, and timing slack (s) below which differences are noise
+SIZES = (1024,)
+TOLERANCE = 0.25
+SLACK = 0.05
+FOLDER = os.path.join(tempfile.gettempdir(), 'FloodMAR_Benchmark')
+# Value code field of the rasterized polygons, as Feat_to_Rast.py
+CODE_FIELDS = {'Lithology': 'UNIT_NAME', 'Soil': 'ClassName'}
+CELL = (CELL_SIZE, CELL_SIZE)
+
+# Layers store of a dataset (stage outputs)
+def LayersLocation(Folder, Size, Seed=0):
+    from Raster_Store import StoreLocation
+
+    return StoreLocation(Folder, f'Synthetic_{Size}_{Seed}_Layers', 'npy')
+
+def _Open(Layers, Name):
+    from Raster_Store import DatasetPath, OpenRaster
+
+    return OpenRaster(DatasetPath(Layers, Name))
+
+def _Save(Layers, Name, Array, NoData=np.nan):
+    from Raster_Store import DatasetPath, SaveRaster
+
+    return SaveRaster(Array, GridTransform(), DatasetPath(Layers, Name), NoData, EPSG)
+
+def _Create(Layers, Name, Shape, DType=np.float32, NoData=np.nan):
+    from Raster_Store import DatasetPath, CreateRaster
+
+    return CreateRaster(DatasetPath(Layers, Name), Shape, DType, GridTransform(), NoData, EPSG)
+
+# Stages ----------------
+# Requires: Inputs=<dict of synthetic input name: raster source, refer to Synthetic_Data.OpenDataset, plus 'Polygons' for feat_to_rast and chain>, Layers=<layers store>, Workers=<threads of the tiled stages>
+
+def HydrologicConditioning(Inputs, Layers, Workers=None):
+    from Flow_Routing import FlowRouting, FLOW_NODATA
+
+    flowDir, flowAcc, streams = FlowRouting(Inputs['DEM'][:, :], np.nan, STREAM_THRESHOLD, CellSize=CELL)
+    _Save(Layers, 'FlowDir', flowDir, FLOW_NODATA)
+    _Save(Layers, 'FlowAcc', np.where(flowDir != FLOW_NODATA, flowAcc, np.nan).astype(np.float32))
+    _Save(Layers, 'Streams', streams.astype(np.uint8), 0)
+
+def Slope(Inputs, Layers, Workers=None):
+    from Slope_Tiles import SlopeTiles
+
+    slope, _ = SlopeTiles(Inputs['DEM'], CELL, NoData=np.nan, Workers=Workers)
+    _Save(Layers, 'Slope', slope)
+
+def DrainageDensity(Inputs, Layers, Workers=None):
+    from Drainage_Density_Raster import DrainageDensityRaster
+
+    density = DrainageDensityRaster(_Open(Layers, 'FlowDir')[:, :], _Open(Layers, 'Streams')[:, :] != 0, CELL, SEARCH_RADIUS)
+    _Save(Layers, 'Drainage', density)
+
+def Resample(Inputs, Layers, Workers=None):
+    from Bilinear_Resample import BilinearResample
+
+    shape = Inputs['DEM'].shape
+    with _Create(Layers, 'Precip', shape) as output:
+        BilinearResample(Inputs['Precip'][:, :], GridTransform(CELL_SIZE * PRECIP_FACTOR), GridTransform(), shape, Output=output, NoData=np.nan, Workers=Workers)
+
+def FeatToRast(Inputs, Layers, Workers=None):
+    from Raster_Store import DatasetPath
+    from Scanline_Rasterize import RasterizePolygons, WriteCodeTable, CodeTablePath
+
+    for name, (features, codes) in Inputs['Polygons'].items():
+        with _Create(Layers, name, Inputs['DEM'].shape, np.uint16, 0) as output:
+            RasterizePolygons(features, GridTransform(), Inputs['DEM'].shape, Output=output, Workers=Workers)
+        WriteCodeTable(codes, CodeTablePath(DatasetPath(Layers, name)), CODE_FIELDS[name])
+
+# Sources, categorical code tables and classification tables of the suitability models
+def _ModelInputs(Inputs, Layers):
+    from Raster_Store import DatasetPath
+    from Scanline_Rasterize import ReadCodeTable, CodeTablePath
+
+    sources = {'DEM': Inputs['DEM'], 'NDVI': Inputs['NDVI'], 'Lineaments': Inputs['Lineaments'], 'LULC': Inputs['LULC']}
+    sources.update({name: _Open(Layers, name) for name in ('Slope', 'Drainage', 'Precip', 'Lithology', 'Soil')})
+    codes = {name: ReadCodeTable(CodeTablePath(DatasetPath(Layers, name)), field) for name, field in CODE_FIELDS.items()}
+    catTables = {'flood': pd.read_csv(f'{TABLES}/Flooding_CategoricalClassificationSchemas.csv'), 'recharge': pd.read_csv(f'{TABLES}/Recharge_CategoricalClassificationSchemas.csv')}
+    return sources, codes, catTables
+
+# Classification of the nine layers with the flooding tables, one output per layer (Classification.py)
+def Classification(Inputs, Layers, Workers=None):
+    from FloodMAR_Driver import CONTINUOUS_LAYERS, CATEGORICAL_LAYERS, LinearFunction
+    from Lookup_Reclass import CompileCategoricalTable, ReclassifyBlocks, NODATA_CLASS
+    from Raster_Statistics import MultiRasterStatistics
+    from Rescale_Functions import RescaleBlocks
+
+    sources, codes, catTables = _ModelInputs(Inputs, Layers)
+    shape = Inputs['DEM'].shape
+    stats = MultiRasterStatistics({name: sources[name] for name in CONTINUOUS_LAYERS}, Workers=Workers)
+    with ExitStack() as stack:
+        outputs = [stack.enter_context(_Create(Layers, f'Classified_{name}', shape)) for name in CONTINUOUS_LAYERS]
+        RescaleBlocks([sources[name] for name in CONTINUOUS_LAYERS], [LinearFunction('flood', name, stats[name]) for name in CONTINUOUS_LAYERS], outputs, Stats=[stats[name] for name in CONTINUOUS_LAYERS])
+    for name in CATEGORICAL_LAYERS:
+        lut = CompileCategoricalTable(catTables['flood'], TABLE_NAMES.get(name, name), codes.get(name))
+        with _Create(Layers, f'Classified_{name}', shape, np.uint8, NODATA_CLASS) as output:
+            ReclassifyBlocks(sources[name], lut, output)
+
+def FloodMAR(Inputs, Layers, Workers=None):
+    from FloodMAR_Driver import RunFloodMAR
+
+    sources, codes, catTables = _ModelInputs(Inputs, Layers)
+    layerWeights = pd.read_csv(f'{TABLES}/LayerWeights.csv')
+    shape = Inputs['DEM'].shape
+    with ExitStack() as stack:
+        outputs = {model: stack.enter_context(_Create(Layers, name, shape)) for model, name in (('flood', 'Flood'), ('recharge', 'Recharge'), ('floodmar', 'FloodMAR'))}
+        RunFloodMAR(sources, catTables, layerWeights, codes, outputs)
+
+# Every preprocessing stage, then Flood MAR
+def Chain(Inputs, Layers, Workers=None):
+    for function in (HydrologicConditioning, Slope, DrainageDensity, Resample, FeatToRast, FloodMAR):
+        function(Inputs, Layers, Workers)
+
+FUNCTIONS = {'hydrologic_conditioning': HydrologicConditioning, 'slope': Slope, 'drainage_density': DrainageDensity, 'resample': Resample,
+             'feat_to_rast': FeatToRast, 'classification': Classification, 'floodmar': FloodMAR, 'chain': Chain}
+
+# Run a stage in this process (the --child entry point)
+# Returns: dict of wall time (s), throughput (Mpix/s) and peak RSS (MB, None without the resource module)
+def RunStage(Stage, Folder, Size, Seed=0, Workers=None):
+    from Raster_Store import CreateStore
+
+    inputs = OpenDataset(Folder, Size, Seed)
+    # Polygons are the stage's input features, built before the clock starts
+    if Stage in ('feat_to_rast', 'chain'):
+        inputs['Polygons'] = PolygonLayers(Size, Seed)
+    layers = LayersLocation(Folder, Size, Seed)
+    CreateStore(layers)
+    start = perf_counter()
+    FUNCTIONS[Stage](inputs, layers, Workers)
+    seconds = perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource is not None else None  # KB on Linux
+    return {'seconds': seconds, 'mpixPerSecond': Size * Size / 1e6 / seconds, 'peakRssMB': peak}
+
+# Run a stage in a new process
+def _RunChild(Stage, Folder, Size, Seed, Workers):
+    command = [sys.executable, os.path.abspath(__file__), '--child', Stage, '--folder', Folder, '--sizes', str(Size), '--seed', str(Seed)]
+    if Workers:
+        command += ['--workers', str(Workers)]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'{Stage}@{Size} failed:\n{result.stderr}')
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+# Upstream stages whose outputs are missing, in stage order
+def _Missing(Stages, Folder, Size, Seed):
+    from Raster_Store import DatasetPath
+
+    layers = LayersLocation(Folder, Size, Seed)
+    needed = set()
+    pending = [depend for stage in Stages for depend in DEPENDS.get(stage, ())]
+    while pending:
+        stage = pending.pop()
+        if stage not in needed:
+            needed.add(stage)
+            pending.extend(DEPENDS.get(stage, ()))
+    return [stage for stage in STAGES if stage in needed and not all(os.path.isfile(DatasetPath(layers, name)) for name in OUTPUTS[stage])]
+
+# Benchmark stages at several sizes
+# Requires: Sizes=<grid sizes (cells per side)>, Stages=<stage names, refer to STAGES>, Repeat=<runs per stage, fastest time and largest RSS kept>, Workers=<threads of the tiled stages, None for all cores>
+# Returns: dict of 'stage@size': result dict, refer to RunStage
+def RunBenchmark(Sizes=SIZES, Stages=STAGES, Folder=FOLDER, Seed=0, Repeat=1, Workers=None):
+    results = {}
+    for size in Sizes:
+        print(f'Size {size} x {size} ({size * size / 1e6:.1f} Mpix)...')
+        GenerateDataset(Folder, size, Seed)
+        for stage in _Missing(Stages, Folder, size, Seed):
+            print(f'\tPreparing {stage} layers (untimed)...')
+            _RunChild(stage, Folder, size, Seed, Workers)
+        for stage in Stages:
+            runs = [_RunChild(stage, Folder, size, Seed, Workers) for _ in range(Repeat)]
+            best = min(runs, key=lambda run: run['seconds'])
+            peaks = [run['peakRssMB'] for run in runs if run['peakRssMB'] is not None]
+            results[f'{stage}@{size}'] = {**best, 'peakRssMB': max(peaks) if peaks else None}
+            print(f"\t{stage:<24}{best['seconds']:>9.2f} s{best['mpixPerSecond']:>9.2f} Mpix/s" + (f'{max(peaks):>9.0f} MB' if peaks else ''))
+
+    return results
+
+# Machine the results were taken on
+def Environment():
+    return {'machine': platform.machine(), 'processor': platform.processor(), 'system': platform.system(), 'cpus': os.cpu_count(),
+            'python': platform.python_version(), 'numpy': np.__version__}
+
+# Save results to a baseline file (results already in the file for other stages or sizes are kept)
+def SaveBaseline(Results, Path):
+    baseline = {'environment': Environment(), 'results': {}}
+    if os.path.isfile(Path):
+        with open(Path) as file:
+            baseline['results'] = json.load(file).get('results', {})
+    baseline['results'].update(Results)
+    with open(Path, 'w') as file:
+        json.dump(baseline, file, indent=2, sort_keys=True)
+    return Path
+
+# Compare results against a baseline file
+# Requires: Tolerance=<allowed relative increase of wall time and peak RSS>, Slack=<allowed absolute increase of wall time (s)>
+# Returns: list of regression messages, empty if none
+def CompareBaseline(Results, Path, Tolerance=TOLERANCE, Slack=SLACK):
+    with open(Path) as file:
+        baseline = json.load(file)
+    if baseline.get('environment') != Environment():
+        print(f"\tNote: baseline taken on another environment, {baseline.get('environment')}")
+    regressions = []
+    print('Baseline Comparison:')
+    print(f'\t{"stage@size":<32}{"time":>10}{"baseline":>10}{"change":>9}{"RSS MB":>9}{"baseline":>10}{"change":>9}')
+    for key, result in Results.items():
+        reference = baseline.get('results', {}).get(key)
+        if reference is None:
+            print(f'\t{key:<32}{result["seconds"]:>10.2f}{"-":>10}')
+            continue
+        timeChange = result['seconds'] / reference['seconds'] - 1
+        line = f"\t{key:<32}{result['seconds']:>10.2f}{reference['seconds']:>10.2f}{timeChange:>+9.0%}"
+        if result['seconds'] > reference['seconds'] * (1 + Tolerance) + Slack:
+            regressions.append(f"{key} took {result['seconds']:.2f} s, {timeChange:+.0%} over the baseline {reference['seconds']:.2f} s")
+        if result['peakRssMB'] is not None and reference.get('peakRssMB') is not None:
+            rssChange = result['peakRssMB'] / reference['peakRssMB'] - 1
+            line += f"{result['peakRssMB']:>9.0f}{reference['peakRssMB']:>10.0f}{rssChange:>+9.0%}"
+            if result['peakRssMB'] > reference['peakRssMB'] * (1 + Tolerance):
+                regressions.append(f"{key} peak RSS {result['peakRssMB']:.0f} MB, {rssChange:+.0%} over the baseline {reference['peakRssMB']:.0f} MB")
+        print(line)
+
+    return regressions
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the Flood MAR stages on synthetic data.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help='grid sizes, cells per side (e.g. 1024 4096 20000)')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES, help='stages to run')
+    parser.add_argument('--folder', default=FOLDER, help='folder of the synthetic datasets and stage outputs')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per stage, the fastest is kept')
+    parser.add_argument('--workers', type=int, default=None, help='threads of the tiled stages (default all cores)')
+    parser.add_argument('--baseline', default=None, help='baseline JSON to compare against, exit status 1 on regression')
+    parser.add_argument('--save-baseline', default=None, help='baseline JSON to save the results to')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='allowed relative increase of time and peak RSS')
+    parser.add_argument('--child', default=None, choices=STAGES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(RunStage(args.child, args.folder, args.sizes[0], args.seed, args.workers)))
+        sys.exit(0)
+
+    results = RunBenchmark(args.sizes, args.stages, args.folder, args.seed, args.repeat, args.workers)
+    if args.save_baseline:
+        print(f'\tBaseline saved to {SaveBaseline(results, args.save_baseline)}')
+    if args.baseline:
+        regressions = CompareBaseline(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION: {regression}')
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Bilinear Resample
+Objective:  Streaming bilinear resampling onto a snap raster grid (NumPy, no arcpy) as a part of ATUR Suitability Analysis
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from Block_Processing import BLOCK_SIZE, IterBlocks, ReadBlock, SourceNoData, ValidMask
+from Raster_IO import CellCenters, TransformOrigin, TransformCellSize
+
+"""
+Native backend for arcpy.management.Resample(Raster, Output, cell size, 'BILINEAR') followed by the processing mask.
+The output grid is any target grid (e.g. the snap raster within the extent), so the source and target grids need not share an origin or a cell size ratio.
+    - The target grid is walked in blocks. For each block the source position of every target column and row is computed once, as an index and weight vector along each axis (the interpolation is separable).
+    - Where the source is in another coordinate system, the target cell centers are projected into it (Raster_IO.CoordinateTransform) and every cell gets its own source position, so the source is interpolated once (rather than projected, i.e. interpolated, then resampled).
+    - Only the source window spanning those indices (the cells around the block, plus a 1 cell margin for the second interpolation point) is read.
+    - The 4 neighbours are gathered with the index vectors and blended with the weight vectors, all vectorized. NoData neighbours are left out and the remaining weights renormalized; target cells outside the source extent are NoData.
+    - Cells outside an optional mask (e.g. the snap raster within the processing mask, read per block) are NoData; blocks entirely outside it read no source.
+    - Blocks are independent and run on a thread pool.
+"""
+
+# Source index and weight vectors along one axis
+# Requires: Centers=<target cell center coordinates along the axis>, Origin=<source edge coordinate of index 0>, Step=<signed source cell size along the axis>, Size=<source cells along the axis>
+# Returns: (lower index, upper index, weight of the upper index, True where inside the source extent)
+def AxisWeights(Centers, Origin, Step, Size):
+    position = (Centers - Origin) / Step - 0.5  # fractional index of the source cell centers
+    inside = (position >= -0.5) & (position <= Size - 0.5)
+    position = np.clip(position, 0, Size - 1)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, Size - 1)
+    return lower, upper, (position - lower).astype(np.float64), inside
+
+# Resample one target block
+def _ResampleBlock(Source, SourceTransform, TargetTransform, Window, NoData, Output, Mask=None, Project=None):
+    rows, cols = Source.shape[:2]
+    rowSlice, colSlice = Window
+    out = np.full((rowSlice.stop - rowSlice.start, colSlice.stop - colSlice.start), np.nan, dtype=np.float32)
+    mask = None if Mask is None else ReadBlock(Mask, Window).astype(bool)
+    if mask is not None and not mask.any():
+        Output[Window] = out
+        return
+    x, _ = CellCenters(TargetTransform, 0, np.arange(colSlice.start, colSlice.stop))
+    _, y = CellCenters(TargetTransform, np.arange(rowSlice.start, rowSlice.stop), 0)
+    if Project is None:
+        x, y = x[None, :], y[:, None]
+    else:
+        # Cell centers in the source coordinate system, a source position per cell
+        x, y = Project(*np.meshgrid(x, y))
+    sx0, sy0 = TransformOrigin(SourceTransform)
+    cellX, cellY = TransformCellSize(SourceTransform)
+    c0, c1, wx, insideX = AxisWeights(x, sx0, cellX, cols)
+    r0, r1, wy, insideY = AxisWeights(y, sy0, -cellY, rows)
+    inside = np.broadcast_to(insideY & insideX, out.shape)
+    if inside.any():
+        # Source window of the block, every index it needs
+        top, bottom, left, right = r0.min(), r1.max() + 1, c0.min(), c1.max() + 1
+        block = ReadBlock(Source, (slice(top, bottom), slice(left, right)))
+        valid = ValidMask(block, NoData)
+        values = np.where(valid, block, 0).astype(np.float64)
+        weights = valid.astype(np.float64)
+        r0, r1, c0, c1 = r0 - top, r1 - top, c0 - left, c1 - left
+        total = np.zeros(out.shape, dtype=np.float64)
+        weight = np.zeros(out.shape, dtype=np.float64)
+        for rowIndex, rowWeight in ((r0, 1 - wy), (r1, wy)):
+            for colIndex, colWeight in ((c0, 1 - wx), (c1, wx)):
+                w = rowWeight * colWeight * weights[rowIndex, colIndex]
+                total += w * values[rowIndex, colIndex]
+                weight += w
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[...] = np.where(weight > 0, total / weight, np.nan)
+        out[~inside] = np.nan
+    if mask is not None:
+        out[~mask] = np.nan
+    Output[Window] = out
+
+# Bilinear resampling of a source raster onto a target grid
+# Requires: Source=<raster source, see Block_Processing.py>, SourceTransform=<geotransform of the source>, TargetTransform=<geotransform of the target grid>, TargetShape=<(rows, cols) of the target grid>, Output=<optional preallocated float32 array-like>, NoData=<source NoData value>, Workers=<threads>,
+#           Mask=<optional boolean raster source on the target grid, cells outside it are NoData>, Project=<optional function of target (X, Y) grids giving source (X, Y), see Raster_IO.CoordinateTransform; None when both grids share a coordinate system>
+# Returns: Output
+def BilinearResample(Source, SourceTransform, TargetTransform, TargetShape, Output=None, NoData=None, BlockSize=BLOCK_SIZE, Workers=None, Mask=None, Project=None):
+    NoData = NoData if NoData is not None else SourceNoData(Source)
+    if Output is None:
+        Output = np.empty(TargetShape, dtype=np.float32)
+    windows = list(IterBlocks(TargetShape, BlockSize))
+    with ThreadPoolExecutor(max_workers=Workers or os.cpu_count() or 1) as pool:
+        list(pool.map(lambda window: _ResampleBlock(Source, SourceTransform, TargetTransform, window, NoData, Output, Mask, Project), windows))
+
+    return Output
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Block Processing
+Objective:  Shared helpers for streaming rasters block by block (NumPy, no arcpy) as a part of ATUR Suitability Analysis
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+from collections import deque
+
+import numpy as np
+
+# Default block size (rows, cols). A 1024 x 1024 float32 block is 4 MB per layer.
+BLOCK_SIZE = (1024, 1024)
+
+# Raster "sources" used throughout the NumPy backends are any array-like object with a 2D .shape that can be sliced with
+# [rowSlice, colSlice] and returns a numpy array (numpy arrays, np.memmap, np.load(..., mmap_mode='r'), Raster_IO readers).
+# Only the requested window is read, so memory use is bounded by the block size, not the raster size.
+
+# Yield (rowSlice, colSlice) windows covering a raster of the given shape, in row-major order
+def IterBlocks(Shape, BlockSize=BLOCK_SIZE):
+    rows, cols = Shape[0], Shape[1]
+    blockRows, blockCols = BlockSize
+    for r0 in range(0, rows, blockRows):
+        for c0 in range(0, cols, blockCols):
+            yield slice(r0, min(r0 + blockRows, rows)), slice(c0, min(c0 + blockCols, cols))
+
+# Tile states of a processing mask, refer to Tile_Index.py
+EMPTY, PARTIAL, FULL = 0, 1, 2
+
+# Yield (window, state, mask block) for the windows of IterBlocks, classified against a processing mask
+# Mask=<None, boolean raster source (True inside processing extent), or Tile_Index.TileIndex>
+# The mask block is a new boolean array for PARTIAL tiles, None for FULL tiles (every cell inside, no per-cell masking) and EMPTY tiles (nothing inside, nothing to read)
+def MaskedBlocks(Shape, BlockSize=BLOCK_SIZE, Mask=None):
+    if Mask is not None and hasattr(Mask, 'MaskedBlocks'):
+        yield from Mask.MaskedBlocks(BlockSize)
+        return
+    for window in IterBlocks(Shape, BlockSize):
+        if Mask is None:
+            yield window, FULL, None
+            continue
+        mask = ReadBlock(Mask, window).astype(bool)
+        if not mask.any():
+            yield window, EMPTY, None
+        elif mask.all():
+            yield window, FULL, None
+        else:
+            yield window, PARTIAL, mask
+
+# Map a function over items on a thread pool, results in item order
+# Unlike Pool.map, at most Ahead items are in flight, so blocks (and mask blocks) are not all read ahead of the consumer
+def BoundedMap(Pool, Function, Items, Ahead):
+    pending = deque()
+    for item in Items:
+        pending.append(Pool.submit(Function, item))
+        if len(pending) >= Ahead:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+# Read a window from a raster source as a numpy array
+def ReadBlock(Source, Window):
+    return np.asarray(Source[Window])
+
+# Check that all raster sources share the same grid (i.e. the same snap raster grid), return its shape
+# Sources carrying a geotransform (Raster_IO and Raster_Store readers) must also share it, so same-shape rasters on different origins or cell sizes are never combined cell by cell
+def CommonShape(Sources):
+    shapes = {tuple(s.shape[:2]) for s in Sources}
+    if len(shapes) != 1:
+        raise ValueError(f'Input rasters must share the same grid, got shapes {sorted(shapes)}')
+    transforms = [tuple(s.transform) for s in Sources if getattr(s, 'transform', None) is not None]
+    if transforms:
+        # Within a thousandth of a cell, so float rounding of the origins is not a mismatch
+        tolerance = 1e-3 * max(abs(transforms[0][1]), abs(transforms[0][5]))
+        if not np.allclose(transforms, transforms[0], rtol=0, atol=tolerance):
+            raise ValueError(f'Input rasters must share the same grid, got geotransforms {sorted(set(transforms))}')
+    return shapes.pop()
+
+# NoData value of a raster source, if it carries one (Raster_IO readers do), otherwise None
+def SourceNoData(Source):
+    return getattr(Source, 'noData', None)
+
+# Boolean mask of valid (not NoData) cells in a block
+# NoData=None means NaN for float blocks and "no NoData" for integer blocks
+def ValidMask(Block, NoData=None):
+    isFloat = np.issubdtype(Block.dtype, np.floating)
+    if NoData is None or (isinstance(NoData, float) and np.isnan(NoData)):
+        if isFloat:
+            return ~np.isnan(Block)
+        return np.ones(Block.shape, dtype=bool)
+    valid = Block != NoData
+    if isFloat:
+        valid &= ~np.isnan(Block)
+    return valid
+
+# Boolean raster source of the valid (not NoData) cells of another raster source, read window by window (e.g. a snap raster as a processing mask)
+class ValidSource:
+
+    def __init__(self, Source, NoData=None):
+        self.source = Source
+        self.noData = NoData if NoData is not None else SourceNoData(Source)
+        self.shape = tuple(Source.shape[:2])
+
+    def __getitem__(self, Window):
+        return ValidMask(ReadBlock(self.source, Window), self.noData)
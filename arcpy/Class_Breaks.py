@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Class Breaks
+Objective:  Data-driven class breaks (quantile or Jenks) for the continuous classification tables, from mergeable quantile sketches, as a part of ATUR Suitability Analysis
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from Block_Processing import BLOCK_SIZE, MaskedBlocks, BoundedMap, ReadBlock, CommonShape, SourceNoData, ValidMask, EMPTY
+
+"""
+The range breakpoints of the continuous classification tables (e.g. DEM 578/1140/1307/1420/1536 in Flooding_ContinuousClassificationSchemas.csv) were set by hand for San Pedro. This tool derives them from the data of any watershed.
+    - Each layer is streamed once, window by window on a thread pool. Every window is summarized by a KLL quantile sketch (Karnin, Lang & Liberty 2016): levels of compactors, level h holding items of weight 2^h. A full level is sorted and every other item (random offset) is promoted to the next level, so a sketch holds O(K log(n / K)) values whatever the size of the raster, with rank error ~1/K.
+    - Sketches of the windows are merged (level by level, then compacted) in window order, so the result does not depend on the number of threads.
+    - Breaks are quantiles of the sketch (equal count classes), or Jenks natural breaks (Fisher's exact optimal 1D classification) of a quantile summary of the sketch (JENKS_POINTS equal weight points), so Jenks costs the same for any raster size.
+    - The output is a continuous classification table (layer,startValue,endValue,newValue). The layers, number of classes and class values (newValue, in order of increasing range) are taken from a template table, e.g. the existing schema, so the direction of each layer (high values suitable or not) is kept.
+"""
+
+# Default sketch accuracy (items in the top compactor)
+SKETCH_K = 200
+# Points of the quantile summary classified by Jenks
+JENKS_POINTS = 1000
+METHODS = ('quantile', 'jenks')
+
+# KLL quantile sketch
+class KLLSketch:
+
+    def __init__(self, K=SKETCH_K, Seed=0):
+        self.k = K
+        self.levels = [np.zeros(0)]
+        self.count = 0
+        self.minimum = np.inf
+        self.maximum = -np.inf
+        self._rng = np.random.default_rng(Seed)
+
+    # Capacity of a level, decreasing geometrically (2/3) below the top level
+    def _Capacity(self, Level):
+        return max(2, int(np.ceil(self.k * (2 / 3) ** (len(self.levels) - Level - 1))))
+
+    # Compact full levels until every level is within capacity
+    def _Compress(self):
+        while True:
+            full = [h for h, items in enumerate(self.levels) if items.size > self._Capacity(h)]
+            if not full:
+                return
+            h = full[0]
+            if h + 1 == len(self.levels):
+                self.levels.append(np.zeros(0))
+            items = np.sort(self.levels[h])
+            odd = items.size % 2
+            # An odd item stays at its level, every other of the rest is promoted with twice the weight
+            self.levels[h + 1] = np.concatenate([self.levels[h + 1], items[odd:][self._rng.integers(2)::2]])
+            self.levels[h] = items[:odd]
+
+    # Add an array of (valid) values
+    def Update(self, Values):
+        values = np.asarray(Values, dtype=np.float64).ravel()
+        if not values.size:
+            return self
+        self.count += values.size
+        self.minimum, self.maximum = min(self.minimum, values.min()), max(self.maximum, values.max())
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._Compress()
+        return self
+
+    # Merge the sketch of another part of the same raster
+    def Merge(self, Other):
+        while len(self.levels) < len(Other.levels):
+            self.levels.append(np.zeros(0))
+        for h, items in enumerate(Other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self.count += Other.count
+        self.minimum, self.maximum = min(self.minimum, Other.minimum), max(self.maximum, Other.maximum)
+        self._Compress()
+        return self
+
+    # Values held by the sketch (sorted) and their weights
+    def Items(self):
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(level.size, 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        return items[order], weights[order]
+
+    # Approximate quantiles (q in 0 - 1), the exact minimum and maximum at q = 0 and 1
+    def Quantiles(self, Q):
+        q = np.atleast_1d(np.asarray(Q, dtype=np.float64))
+        if not self.count:
+            return np.full(q.shape, np.nan)
+        items, weights = self.Items()
+        cumulative = np.cumsum(weights)
+        index = np.minimum(np.searchsorted(cumulative, q * cumulative[-1]), items.size - 1)
+        out = items[index]
+        out[q <= 0] = self.minimum
+        out[q >= 1] = self.maximum
+        return out
+
+# Sketch of the valid cells of one window of every source (State and mask block from Block_Processing.MaskedBlocks)
+def _WindowSketches(Sources, NoData, Window, State, Mask, K):
+    sketches = []
+    for source, noData in zip(Sources, NoData):
+        sketch = KLLSketch(K, Seed=Window[0].start * 7919 + Window[1].start)
+        if State != EMPTY:
+            block = ReadBlock(source, Window)
+            valid = ValidMask(block, noData)
+            if np.issubdtype(block.dtype, np.floating):
+                valid &= ~np.isnan(block)
+            if Mask is not None:
+                valid &= Mask
+            sketch.Update(block[valid])
+        sketches.append(sketch)
+    return sketches
+
+# Quantile sketches of several rasters on the same grid in one blocked pass
+# Requires: Sources=<dict of name: raster source, see Block_Processing.py>, NoData=<optional dict of name: NoData value>, Mask=<optional boolean raster source, True inside processing extent, or Tile_Index.TileIndex>, K=<sketch accuracy>, Workers=<threads>
+# Returns: dict of name: KLLSketch
+def SketchRasters(Sources, NoData=None, Mask=None, K=SKETCH_K, BlockSize=BLOCK_SIZE, Workers=None):
+    names = list(Sources)
+    sources = [Sources[name] for name in names]
+    noData = [(NoData or {}).get(name, SourceNoData(Sources[name])) for name in names]
+    shape = CommonShape(sources + ([Mask] if Mask is not None else []))
+    totals = [KLLSketch(K) for _ in names]
+    Workers = Workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=Workers) as pool:
+        for sketches in BoundedMap(pool, lambda block: _WindowSketches(sources, noData, *block, K), MaskedBlocks(shape, BlockSize, Mask), 2 * Workers):
+            for total, sketch in zip(totals, sketches):
+                total.Merge(sketch)
+
+    return dict(zip(names, totals))
+
+# Jenks natural breaks (Fisher's exact method): the classification of sorted values into Classes contiguous classes with the least total within-class sum of squares
+# Requires: Values=<1D array>, Classes=<number of classes>
+# Returns: Classes - 1 interior breaks (upper value of each class but the last)
+def JenksBreaks(Values, Classes):
+    x = np.sort(np.asarray(Values, dtype=np.float64))
+    n = x.size
+    Classes = min(Classes, n)
+    prefix = np.concatenate([[0.0], np.cumsum(x)])
+    prefixSq = np.concatenate([[0.0], np.cumsum(x ** 2)])
+    # cost[j] = least sum of squares of x[:j + 1] in c classes, start[c][j] = first index of the last class
+    cost = prefixSq[1:] - prefix[1:] ** 2 / np.arange(1, n + 1)
+    starts = []
+    for c in range(1, Classes):
+        newCost = np.full(n, np.inf)
+        start = np.zeros(n, dtype=np.int64)
+        for j in range(c, n):
+            i = np.arange(c, j + 1)  # first index of the last class
+            size = j + 1 - i
+            total = prefix[j + 1] - prefix[i]
+            within = prefixSq[j + 1] - prefixSq[i] - total ** 2 / size
+            candidates = cost[i - 1] + within
+            best = int(np.argmin(candidates))
+            newCost[j], start[j] = candidates[best], i[best]
+        cost = newCost
+        starts.append(start)
+    # Walk the class starts back from the last value
+    breaks, j = [], n - 1
+    for start in reversed(starts):
+        i = start[j]
+        breaks.append(x[i - 1])
+        j = i - 1
+    return np.array(breaks[::-1])
+
+# Class breaks of a layer from its sketch
+# Returns: Classes + 1 edges, from the layer minimum to its maximum
+def SketchBreaks(Sketch, Classes, Method='quantile'):
+    if Method not in METHODS:
+        raise ValueError(f'Unknown method {Method}, expected one of {METHODS}')
+    if Method == 'quantile':
+        inner = Sketch.Quantiles(np.arange(1, Classes) / Classes)
+    else:
+        inner = JenksBreaks(Sketch.Quantiles(np.linspace(0, 1, JENKS_POINTS)), Classes)
+    return np.concatenate([[Sketch.minimum], inner, [Sketch.maximum]])
+
+# Continuous classification table from layer sketches
+# Requires: Sketches=<dict of layer name: KLLSketch>, Template=<continuous classification df (layer,startValue,endValue,newValue), giving the number of classes and class values of each layer>, Method=<'quantile' or 'jenks'>, Digits=<significant digits of the interior breaks>
+# Returns: df in the template format; layers without a sketch are copied from the template
+def ClassBreaksTable(Sketches, Template, Method='quantile', Digits=4):
+    rows = []
+    for layer, table in Template.groupby('layer', sort=False):
+        table = table.sort_values('startValue')
+        sketch = Sketches.get(layer)
+        if sketch is None or not sketch.count:
+            rows.extend(table.to_dict('records'))
+            continue
+        edges = SketchBreaks(sketch, len(table), Method)
+        edges[1:-1] = [float(f'{edge:.{Digits}g}') for edge in edges[1:-1]]
+        # Breaks rounded onto each other (few distinct values) would leave empty classes
+        edges = np.maximum.accumulate(edges)
+        for start, end, newValue in zip(edges[:-1], edges[1:], table['newValue'].values):
+            rows.append({'layer': layer, 'startValue': float(start), 'endValue': float(end), 'newValue': newValue})
+
+    return pd.DataFrame(rows, columns=['layer', 'startValue', 'endValue', 'newValue'])
+
+# Class breaks of preprocessed layers, written as a continuous classification table
+# Requires: Rasters=<dict of layer name: raster path (Raster_Store path, or any arcpy raster with ExtentFeat)>, Template=<template classification table (.csv)>, Output=<output table (.csv)>, ExtentFeat=<optional extent shapefile, arcpy rasters are aligned to Snap_Raster within it>
+# Returns: the output df
+def WriteClassBreaks(Rasters, Template, Output, Method='quantile', ExtentFeat=None, Snap_Raster=None, K=SKETCH_K, BlockSize=BLOCK_SIZE, Workers=None):
+    from Raster_Store import OpenRaster
+
+    if ExtentFeat is not None:
+        from Raster_IO import ArcRasterReader, AlignRaster
+        sources = {name: ArcRasterReader(AlignRaster(raster, Snap_Raster, ExtentFeat)) for name, raster in Rasters.items()}
+    else:
+        sources = {name: OpenRaster(raster) for name, raster in Rasters.items()}
+    print(f'\tSketching {len(sources)} layers...')
+    sketches = SketchRasters(sources, K=K, BlockSize=BlockSize, Workers=Workers)
+    table = ClassBreaksTable(sketches, pd.read_csv(Template), Method)
+    table.to_csv(Output, index=False)
+    print(f'\t{Method.capitalize()} breaks written to {Output}')
+    print('\n'.join('\t\t' + line for line in table.to_string(index=False).splitlines()))
+
+    return table
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Derive continuous classification breaks from the data of a watershed.')
+    parser.add_argument('layers', nargs='+', help='layer=raster pairs, e.g. Slope=ws/LayerPreprocessing.gdb/Slope')
+    parser.add_argument('--template', required=True, help='classification table giving layers, classes and class values')
+    parser.add_argument('--output', required=True, help='output classification table (.csv)')
+    parser.add_argument('--method', choices=METHODS, default='quantile')
+    parser.add_argument('--extent', default=None, help='extent shapefile, arcpy rasters are aligned to the snap raster within it')
+    parser.add_argument('--snap', default=None, help='snap raster (with --extent)')
+    parser.add_argument('--workers', type=int, default=None, help='threads')
+    args = parser.parse_args()
+
+    WriteClassBreaks(dict(layer.split('=', 1) for layer in args.layers), args.template, args.output, args.method, args.extent, args.snap, Workers=args.workers)
@@ -11,16 +11,27 @@ import arcpy
 from arcpy.sa import *
 from sys import argv
 
+from Instrumentation import Traced
+
 # Special characters for improved readability of geoprocessing messages
 nl = '\n'  # var can be used in f-strings to represent newline character
 tb = '\t'  # var can be used in f-strings to represent tab character
 
 # For classifying an input raster to discrete "levels".
-def DiscreteClassification(Raster, ReclassTable, LayerName, Output, Value='VALUE'):  # Discrete Classification
+# Backend='numpy' reclassifies through a compiled lookup table, refer to Lookup_Reclass.py for details
+@Traced(Tags=('LayerName', 'Backend'))
+def DiscreteClassification(Raster, ReclassTable, LayerName, Output, Value='VALUE', Backend='arcpy'):  # Discrete Classification
 
     # Modify Reclass Table
     # Filter Layer from Layers in ReclassTable, drop 'layer' column
     table = ReclassTable[ReclassTable['layer'] == LayerName].drop('layer', axis=1)
+
+    if Backend == 'numpy':
+        from Lookup_Reclass import CompileRangeTable, ReclassifyRaster
+        print('\tRemapping', LayerName, 'data using a discrete classification schema (NumPy)...')
+        print('\n'.join('\t\t' + line for line in table.to_string().splitlines()))
+        return ReclassifyRaster(Raster, CompileRangeTable(ReclassTable, LayerName), Output)
+
     # Remap must be given as a string, formatted as "startValue endValue newValue;..."
     # Convert table to nested list
     """
@@ -55,12 +66,47 @@ def DiscreteClassification(Raster, ReclassTable, LayerName, Output, Value='VALUE
 
     return outRaster
 
+# Codes of a raster without the Value field (e.g. rasterized with Feat_to_Rast Backend='numpy'), from its sidecar code table, refer to Scanline_Rasterize.py
+# Returns: dict of VALUE code: field value, None if the raster has the field (or Value='VALUE')
+def SidecarCodes(Raster, Value, LayerName):
+    import os
+    from Scanline_Rasterize import CodeTablePath, ReadCodeTable
+
+    if Value.upper() == 'VALUE' or arcpy.ListFields(str(Raster), Value):
+        return None
+    codeTable = CodeTablePath(Raster)
+    if not os.path.isfile(codeTable):
+        raise ValueError(f'{LayerName} raster has no {Value} field and no code table ({codeTable}).')
+    return ReadCodeTable(codeTable, Value)
+
 # For classifying a categorical raster.
-def CategoricalClassification(Raster, ReclassTable, LayerName, Output, Value='VALUE'):  # Categorical Classification
+# Backend='numpy' reclassifies through a dense integer LUT over the raster's VAT codes, refer to Lookup_Reclass.py for details
+# Rasters without the Value field are reclassified on the codes of their sidecar code table, refer to SidecarCodes
+@Traced(Tags=('LayerName', 'Backend'))
+def CategoricalClassification(Raster, ReclassTable, LayerName, Output, Value='VALUE', Backend='arcpy'):  # Categorical Classification
     
     # Modify Reclass Table
     # Filter Layer from Layers in ReclassTable, drop 'layer' column
     table = ReclassTable[ReclassTable['layer'] == LayerName].drop('layer', axis=1)
+
+    if Backend == 'numpy':
+        from Lookup_Reclass import CompileCategoricalTable, ReclassifyRaster
+        from Raster_IO import ReadValueTable
+        print('\tRemapping', LayerName, 'data using a categorical classification schema (NumPy)...')
+        print('\n'.join('\t\t' + line for line in table.to_string().splitlines()))
+        # Raster codes are the values themselves unless reclassifying on a VAT attribute (e.g. UNIT_NAME)
+        codes = SidecarCodes(Raster, Value, LayerName)
+        if codes is None and Value.upper() != 'VALUE':
+            codes = ReadValueTable(Raster, Value)
+        return ReclassifyRaster(Raster, CompileCategoricalTable(ReclassTable, LayerName, codes), Output)
+
+    # Field values of a raster without the field are remapped by their codes
+    codes = SidecarCodes(Raster, Value, LayerName)
+    if codes is not None:
+        lookup = {name: str(code) for code, name in codes.items()}
+        table = table[table['oldValue'].isin(lookup.keys())].assign(oldValue=lambda df: df['oldValue'].map(lookup))
+        Value = 'VALUE'
+
     # Remap must be given as a string, formatted as "oldValue newValue;..."
     # Any oldValue in remap which contain spaces must be wrapped in '' (e.g. '"Early Proterozoic granitic rocks" 1;...')
     # Convert table to nested list
@@ -99,7 +145,18 @@ def CategoricalClassification(Raster, ReclassTable, LayerName, Output, Value='VA
     return outRaster
 
 # For categorizing an input raster using a continuous function (i.e. linear, etc.)
-def ContinuousClassification(Raster, Function, LayerName, Output, From=1, To=5):  # Continuous Classification
+# Backend='numpy' requires a Function from Rescale_Functions.py (same arguments as the arcpy.sa Tf* functions)
+@Traced(Tags=('LayerName', 'Backend'))
+def ContinuousClassification(Raster, Function, LayerName, Output, From=1, To=5, Backend='arcpy'):  # Continuous Classification
+
+    if Backend == 'numpy':
+        from Rescale_Functions import RescaleBlocks
+        from Raster_IO import ArcRasterReader, SaveArcRaster
+        print('\tRemapping', LayerName, 'data using a continuous classification function (NumPy)...')
+        print(f'\t\t{Function}')
+        reader = ArcRasterReader(Raster)
+        outArray = RescaleBlocks([reader], [Function], From=From, To=To)[0]
+        return SaveArcRaster(outArray, reader.transform, Output, SpatialReference=reader.spatialReference)
 
     # To allow overwriting outputs change overwriteOutput option to True.
     arcpy.env.overwriteOutput = True
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Combination Index
+Objective:  Class-combination index of the classified layers, for re-weighting the suitability maps without re-running the overlay, as a part of ATUR Suitability Analysis
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+from Block_Processing import BLOCK_SIZE, IterBlocks, MaskedBlocks, ReadBlock, CommonShape, EMPTY
+from Suitability_Pipeline import CompileLayers, ClassLevels
+
+"""
+The layer weights (LayerWeights.csv) are provisional, and every change means re-running the flood and recharge overlays. But each cell is a tuple of nine classified values, and the number of distinct tuples is far smaller than the number of cells.
+The index is built in one streamed pass (classification as FloodMAR_Driver.py):
+    - Each layer's classified values of both models are coded as a pair of class levels. Classes are quantized to STEP (1/4) on [0, To], so categorical classes (integers) are exact, while continuous (Tf function) classes are rounded by at most STEP / 2. Weighted sums are then off by at most STEP / 2 * the sum of the continuous layer weights, 0.06 for LayerWeights.csv (0.47 flood, 0.45 recharge) on the 1 - 5 scale. A much finer step (e.g. 1/64) keeps nearly every cell distinct, so the index is as large as the grid.
+    - Flood MAR normalizes both sums by their min/max, which are off by the same bound, so each normalized sum is off by at most 4 * bound / (max - min) and their product by the sum of the two (QuantizationBound).
+    - The nine layer codes of a cell are its combination. The distinct combinations of each block (np.unique) are looked up in the sorted combinations seen so far (np.searchsorted), and new ones are numbered in turn and merged in, so no per-combination Python runs. Each cell gets its uint32 combination id (NODATA_ID where any layer is NoData, or outside the mask).
+    - The combination table holds the class values of every layer and model, and the cell count, of each combination.
+    - Where the combinations exceed MAX_RATIO per cell (checked as the table grows, against the grid size, and at the end, against the valid cells), re-weighting would gain little over the Flood MAR pipeline, and no index is built (None).
+Re-weighting is then a weighted sum over the table (float32, left to right, as Weighted_Overlay.py) and a gather of the combination values by id. Flood MAR normalization takes min/max over the table.
+The index is saved in the watershed workspace, CombinationIndex.mmap/Ids.npy (memory mapped, refer to Raster_Store.py), CombinationIndex.mmap/Combinations.csv and CombinationIndex.mmap/Index.json (step and continuous layers).
+"""
+
+# Class quantization step (categorical classes are exact, continuous classes are rounded by at most STEP / 2), and combination id of NoData cells
+STEP = 1 / 4
+# Combinations per valid cell above which the index would be about as large as the data, and no index is built
+MAX_RATIO = 0.25
+NODATA_ID = np.iinfo(np.uint32).max
+INDEX_NAME = 'CombinationIndex'
+
+# Combination ids of a raster grid and their class values
+# Requires: Ids=<uint32 raster source of combination ids>, Table=<df, one row per combination id, columns <model>_<layer> (class value) and count>, Layers=<layer names in raster calculator order>, Models=<model names>, Step=<class quantization step>, Continuous=<names of the layers whose classes are rounded to Step, all layers if None>
+class CombinationIndex:
+
+    def __init__(self, Ids, Table, Layers, Models, Transform=None, Step=STEP, Continuous=None):
+        self.ids = Ids
+        self.table = Table
+        self.layers = list(Layers)
+        self.models = list(Models)
+        self.transform = Transform
+        self.step = Step
+        self.continuous = list(Continuous) if Continuous is not None else list(self.layers)
+
+    # Suitability of every combination for a model, (class * weight) summed left to right in float32, as Weighted_Overlay.py
+    # Requires: Weights=<dict of layer name: weight>
+    # Returns: float32 array, one value per combination id
+    def Reweight(self, Model, Weights):
+        total = None
+        for layer in self.layers:
+            term = (self.table[f'{Model}_{layer}'].to_numpy(np.float64) * np.float64(Weights[layer])).astype(np.float32)
+            total = term if total is None else total + term
+        return total
+
+    # Raster of per-combination values, gathered by id
+    # Requires: Values=<array, one value per combination id>, Output=<optional preallocated float32 array-like>
+    def Render(self, Values, Output=None, OutNoData=np.nan, BlockSize=BLOCK_SIZE):
+        values = np.append(np.asarray(Values, dtype=np.float32), np.float32(OutNoData))
+        if Output is None:
+            Output = np.empty(self.ids.shape[:2], dtype=np.float32)
+        for window in IterBlocks(self.ids.shape[:2], BlockSize):
+            # NoData ids gather the appended NoData value
+            Output[window] = values[np.minimum(ReadBlock(self.ids, window), len(values) - 1)]
+        return Output
+
+    # Flood, recharge and Flood MAR for new layer weights
+    # Requires: LayerWeights=<LayerWeights.csv df>
+    # Returns: dict of 'flood'/'recharge'/'floodmar': float32 array, as FloodMAR_Driver.RunFloodMAR
+    def Suitability(self, LayerWeights, BlockSize=BLOCK_SIZE):
+        from FloodMAR_Driver import ModelWeights
+
+        values = {model: self.Reweight(model, ModelWeights(LayerWeights, model)) for model in self.models}
+        # Min-max normalization over the combinations present, i.e. over the valid cells
+        normalized = [(values[model] - values[model].min()) / (values[model].max() - values[model].min()) for model in ('flood', 'recharge')]
+        values['floodmar'] = (normalized[0] * normalized[1]).astype(np.float32)
+        return {name: self.Render(value, BlockSize=BlockSize) for name, value in values.items()}
+
+    # Largest difference of Suitability from the unquantized classification (FloodMAR_Driver.RunFloodMAR), float32 rounding aside
+    # Requires: LayerWeights=<LayerWeights.csv df>
+    # Returns: dict of 'flood'/'recharge'/'floodmar': bound
+    def QuantizationBound(self, LayerWeights):
+        from FloodMAR_Driver import ModelWeights
+
+        bounds, ranges = {}, {}
+        for model in self.models:
+            weights = ModelWeights(LayerWeights, model)
+            bounds[model] = float(self.step / 2 * sum(abs(weights[layer]) for layer in self.continuous))
+            values = self.Reweight(model, weights)
+            ranges[model] = float(values.max() - values.min()) if values.size else 0.0
+        # Value, minimum and maximum of each sum are each off by its bound; normalized values are within 0 - 1, so the product is off by at most the sum
+        bounds['floodmar'] = sum(min(1.0, 4 * bounds[model] / ranges[model]) if ranges[model] > 0 else 1.0 for model in ('flood', 'recharge'))
+        return bounds
+
+    # Save to <Workspace>/CombinationIndex.mmap (Ids.npy and Combinations.csv)
+    def Save(self, Workspace, SpatialReference=None, BlockSize=BLOCK_SIZE):
+        from Raster_Store import StoreLocation, DatasetPath, CopyRaster
+
+        folder = StoreLocation(Workspace, INDEX_NAME, 'npy')
+        os.makedirs(folder, exist_ok=True)
+        self.ids = CopyRaster(self.ids, DatasetPath(folder, 'Ids'), self.transform, NODATA_ID, SpatialReference, BlockSize)
+        self.table.to_csv(os.path.join(folder, 'Combinations.csv'), index_label='id')
+        with open(os.path.join(folder, 'Index.json'), 'w') as file:
+            json.dump({'step': self.step, 'continuous': self.continuous}, file)
+        return folder
+
+    @classmethod
+    def Load(cls, Workspace):
+        from Raster_Store import StoreLocation, DatasetPath, OpenRaster
+
+        folder = StoreLocation(Workspace, INDEX_NAME, 'npy')
+        table = pd.read_csv(os.path.join(folder, 'Combinations.csv'), index_col='id')
+        columns = [column for column in table.columns if column != 'count']
+        models = list(dict.fromkeys(column.split('_', 1)[0] for column in columns))
+        layers = list(dict.fromkeys(column.split('_', 1)[1] for column in columns))
+        with open(os.path.join(folder, 'Index.json')) as file:
+            meta = json.load(file)
+        ids = OpenRaster(DatasetPath(folder, 'Ids'))
+        return cls(ids, table, layers, models, getattr(ids, 'transform', None), meta['step'], meta['continuous'])
+
+# Build the combination index of the classified layers of several models in one streamed pass
+# Requires: Models=<dict of model name: list of Suitability_Pipeline.PipelineLayer, same layer names in raster calculator order, refer to FloodMAR_Driver.BuildModels>, Mask=<optional boolean raster source or Tile_Index.TileIndex, True inside processing extent>, Output=<optional preallocated uint32 array-like of ids>, Step=<class quantization step, 1 / integer>, MaxRatio=<combinations per cell above which no index is built>, Continuous=<names of the layers with continuous (Tf function) classes, for the quantization bound, all layers if None>
+# Returns: CombinationIndex, None if the combinations do not compress the grid
+def BuildCombinationIndex(Models, Mask=None, Output=None, From=1, To=5, Transform=None, BlockSize=BLOCK_SIZE, Step=STEP, MaxRatio=MAX_RATIO, Continuous=None):
+    models = list(Models)
+    layers = [layer.name for layer in Models[models[0]]]
+    allLayers = [layer for model in models for layer in Models[model]]
+    shape = CommonShape([layer.source for layer in allLayers] + ([Mask] if Mask is not None else []))
+    CompileLayers(allLayers, From, To, BlockSize)
+    if Output is None:
+        Output = np.empty(shape, dtype=np.uint32)
+    levels = int(round(To / Step)) + 1
+    if levels ** len(models) > NODATA_ID:
+        raise ValueError(f'{len(models)} models cannot be coded in uint32 layer codes.')
+
+    rowType = np.dtype((np.void, 4 * len(layers)))
+    keys = np.empty(0, dtype=rowType)  # Distinct combinations seen so far, sorted
+    keyIds = np.empty(0, dtype=np.uint32)  # Id of each sorted combination
+    combinations, counts = [], np.zeros(0, dtype=np.int64)
+    limit = int(MaxRatio * shape[0] * shape[1])
+    for window, state, mask in MaskedBlocks(shape, BlockSize, Mask):
+        if state == EMPTY:
+            Output[window] = NODATA_ID
+            continue
+        blockShape = (window[0].stop - window[0].start, window[1].stop - window[1].start)
+        valid = np.ones(blockShape, dtype=bool) if mask is None else mask
+        codes = np.zeros(blockShape + (len(layers),), dtype=np.uint32)
+        blocks = {}  # Source blocks read for this window, keyed on source identity
+        for model in models:
+            for j, layer in enumerate(Models[model]):
+                if id(layer.source) not in blocks:
+                    blocks[id(layer.source)] = ReadBlock(layer.source, window)
+                level = ClassLevels(layer.Classify(blocks[id(layer.source)]), layer.classNoData, Step, levels)
+                valid &= level >= 0
+                codes[..., j] = codes[..., j] * levels + np.maximum(level, 0).astype(np.uint32)
+        # Distinct combinations of the block, looked up in the sorted combinations seen so far, new ones get the next ids
+        rows = np.ascontiguousarray(codes[valid]).view(rowType).ravel()
+        unique, inverse, blockCounts = np.unique(rows, return_inverse=True, return_counts=True)
+        position = np.searchsorted(keys, unique)
+        found = position < keys.size
+        found[found] = keys[position[found]] == unique[found]
+        local = np.empty(unique.size, dtype=np.uint32)
+        local[found] = keyIds[position[found]]
+        local[~found] = np.arange(counts.size, counts.size + np.count_nonzero(~found), dtype=np.uint32)
+        keys = np.insert(keys, position[~found], unique[~found])
+        keyIds = np.insert(keyIds, position[~found], local[~found])
+        combinations.append(unique[~found].view(np.uint32).reshape(-1, len(layers)))
+        counts = np.append(counts, np.zeros(np.count_nonzero(~found), dtype=np.int64))
+        counts[local] += blockCounts
+        if keys.size > limit:
+            print(f'\t\tMore than {limit} combinations ({MaxRatio:g} per cell), no index is built, re-weighting runs the Flood MAR pipeline.')
+            return None
+        ids = np.full(blockShape, NODATA_ID, dtype=np.uint32)
+        ids[valid] = local[inverse.ravel()]
+        Output[window] = ids
+    if counts.size > MaxRatio * max(counts.sum(), 1):
+        print(f'\t\t{counts.size} combinations over {counts.sum()} cells (more than {MaxRatio:g} per cell), no index is built, re-weighting runs the Flood MAR pipeline.')
+        return None
+
+    # Class values of each combination, decoded from the layer codes
+    codes = np.concatenate(combinations).astype(np.int64) if combinations else np.zeros((0, len(layers)), dtype=np.int64)
+    columns = {}
+    for m, model in enumerate(models):
+        divisor = levels ** (len(models) - m - 1)
+        for j, name in enumerate(layers):
+            columns[f'{model}_{name}'] = (codes[:, j] // divisor % levels) * Step
+    table = pd.DataFrame({**columns, 'count': counts})
+    table.index.name = 'id'
+    print(f'\t\t{len(table)} combinations of {len(layers)} layers, over {int(table["count"].sum())} cells.')
+
+    return CombinationIndex(Output, table, layers, models, Transform, Step, Continuous)
+
+# Combination index of a watershed, from the same sources and classification tables as FloodMAR_Driver.RunFloodMAR
+# Requires: Sources=<dict of layer name: raster source, all on the same grid>, CatTables=<dict of model: categorical classification df>, LayerWeights=<LayerWeights.csv df>, Codes=<dict of categorical layer name: VAT codes>, Stats=<dict of continuous layer name: stats dict>, Step=<class quantization step, 1 / integer>
+# Returns: CombinationIndex, None if the combinations do not compress the grid
+def BuildWatershedIndex(Sources, CatTables, LayerWeights, Codes, Stats, Mask=None, Transform=None, BlockSize=BLOCK_SIZE, Step=STEP, MaxRatio=MAX_RATIO):
+    from FloodMAR_Driver import BuildModels, CONTINUOUS_LAYERS
+
+    # Weights are not used by the index, only by Reweight
+    models = BuildModels(Sources, CatTables, LayerWeights, Codes or {}, Stats)
+    return BuildCombinationIndex(models, Mask, Transform=Transform, BlockSize=BlockSize, Step=Step, MaxRatio=MaxRatio, Continuous=CONTINUOUS_LAYERS)
+
+# Re-weight a watershed from its saved combination index, saving flood, recharge and Flood MAR
+# Requires: Workspace=<watershed workspace holding the index>, LayerWeights=<LayerWeights.csv path or df>, Outputs=<dict of 'flood'/'recharge'/'floodmar': output dataset path, refer to Raster_Store.py>
+def ReweightWatershed(Workspace, LayerWeights, Outputs, SpatialReference=None, BlockSize=BLOCK_SIZE):
+    from Raster_Store import SaveRaster
+
+    index = CombinationIndex.Load(Workspace)
+    weights = pd.read_csv(LayerWeights) if isinstance(LayerWeights, str) else LayerWeights
+    print(f'Re-weighting {len(index.table)} combinations...')
+    bounds = index.QuantizationBound(weights)
+    print(f"\tClasses quantized to {index.step:g}, difference from the Flood MAR pipeline at most: " + ', '.join(f'{name} {bound:.3f}' for name, bound in bounds.items()))
+    results = index.Suitability(weights, BlockSize)
+    for name, output in Outputs.items():
+        SaveRaster(results[name], index.transform, output, SpatialReference=SpatialReference)
+        print(f'\t{name}: {output}')
+
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Re-weight flood, recharge and Flood MAR suitability from a saved combination index.')
+    parser.add_argument('workspace', help='watershed workspace holding CombinationIndex.mmap')
+    parser.add_argument('--weights', required=True, help='layer weights table (LayerWeights.csv format)')
+    parser.add_argument('--flood', default=None, help='output flooding suitability raster')
+    parser.add_argument('--recharge', default=None, help='output recharge suitability raster')
+    parser.add_argument('--floodmar', default=None, help='output Flood MAR raster')
+    parser.add_argument('--epsg', type=int, default=32612, help='spatial reference of the outputs')
+    args = parser.parse_args()
+
+    outputs = {name: path for name, path in (('flood', args.flood), ('recharge', args.recharge), ('floodmar', args.floodmar)) if path}
+    ReweightWatershed(args.workspace, args.weights, outputs, args.epsg)
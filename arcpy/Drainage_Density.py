@@ -12,21 +12,38 @@ import arcpy
 from arcpy.sa import *
 from sys import argv
 
+from Instrumentation import Traced
+
 # Special characters for improved readability of geoprocessing messages
 nl = '\n'  # var can be used in f-strings to represent newline character
 tb = '\t'  # var can be used in f-strings to represent tab character
 
-def DrainageDensity(Streams, Drain_Density, Snap_Raster, Mask_Geom):  # Drainage_Density
+# Search_Radius=<line density search radius (m)>
+# Backend='numpy' sums D8 stream length in a circular window of the stream raster (no stream features), refer to Drainage_Density_Raster.py for details
+# Requires (Backend='numpy'): FlowDir=<flow direction raster>, StreamsRast=<stream raster>, from Hydrologic_Conditioning.py
+@Traced(Tags=('Backend',))
+def DrainageDensity(Streams, Drain_Density, Snap_Raster, Mask_Geom, Search_Radius=1000, Backend='arcpy', FlowDir=None, StreamsRast=None):  # Drainage_Density
     
-    # To allow overwriting outputs change overwriteOutput option to True.
-    arcpy.env.overwriteOutput = True
-    arcpy.env.extent = Mask_Geom  # Default processing extent
-    arcpy.env.mask = Mask_Geom
-    arcpy.env.snapRaster = Snap_Raster
-
-    # Process: Line Density (Line Density) (sa)
-    outLDense = arcpy.sa.LineDensity(Streams, population_field="NONE", cell_size=Snap_Raster, search_radius=1000, area_unit_scale_factor='SQUARE_KILOMETERS')
-    print(f'\t{arcpy.GetMessages().replace(nl, nl+tb)}')
-    outLDense.save(Drain_Density)
-
-    return outLDense
+    # Processing environment, scoped to this function (the global arcpy.env is left unchanged).
+    # To allow overwriting outputs overwriteOutput option is True.
+    with arcpy.EnvManager(overwriteOutput=True, extent=Mask_Geom, mask=Mask_Geom, snapRaster=Snap_Raster):
+
+        if Backend == 'numpy':
+            from Drainage_Density_Raster import DrainageDensityRaster
+            from Flow_Routing import FLOW_NODATA
+            from Raster_IO import TransformCellSize
+            from Raster_Store import OpenRaster, SaveRaster
+
+            # Process: Drainage density from the stream raster
+            print('\tDrainage Density (NumPy)...')
+            flowDir = OpenRaster(FlowDir, NoData=FLOW_NODATA)
+            streams = OpenRaster(StreamsRast, NoData=0)[:, :] > 0
+            density = DrainageDensityRaster(flowDir[:, :], streams, TransformCellSize(flowDir.transform), Search_Radius)
+            return SaveRaster(density, flowDir.transform, Drain_Density, SpatialReference=flowDir.spatialReference)
+
+        # Process: Line Density (Line Density) (sa)
+        outLDense = arcpy.sa.LineDensity(Streams, population_field="NONE", cell_size=Snap_Raster, search_radius=Search_Radius, area_unit_scale_factor='SQUARE_KILOMETERS')
+        print(f'\t{arcpy.GetMessages().replace(nl, nl+tb)}')
+        outLDense.save(Drain_Density)
+
+        return outLDense
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Drainage Density Raster
+Objective:  Raster-native drainage density (stream length per area in a circular window, NumPy, no arcpy) as a part of ATUR Suitability Analysis
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import numpy as np
+
+from Block_Processing import BLOCK_SIZE, IterBlocks
+from Flow_Routing import D8_CODES, D8_OFFSETS, FLOW_NODATA, DownstreamIndex
+
+"""
+Native replacement for arcpy.sa.LineDensity(stream features, search_radius, area_unit_scale_factor='SQUARE_KILOMETERS'), computed on the stream raster, so no stream polylines are needed.
+    - Each stream cell carries the length of the stream from its center to the center of its downstream stream cell, the D8 step length (cell size, or cell size * sqrt(2) on diagonals). Stream ends (flow into NoData or off the grid) carry no length, as the polylines end at the cell center.
+    - The length within a circle of the search radius around every cell center is summed exactly from row-wise prefix sums: for every row offset of the circle, the sum over its span of columns is the difference of two prefix sums.
+    - Density = length (km) / circle area (km^2), as LineDensity (the full circle area is used at the edge of the extent).
+"""
+
+# Stream length (m) carried by each stream cell
+# Requires: FlowDir=<uint8 D8 direction array (Flow_Routing.py)>, Streams=<boolean array, True for stream cells>, CellSize=<(x, y) cell size (m)>
+# Returns: float64 array, 0 for non-stream cells
+def StreamLength(FlowDir, Streams, CellSize):
+    cellX, cellY = CellSize
+    streams = np.asarray(Streams, dtype=bool)
+    length = np.zeros(FlowDir.shape, dtype=np.float64)
+    for code, (dr, dc) in zip(D8_CODES, D8_OFFSETS):
+        length[FlowDir == code] = np.hypot(dr * cellY, dc * cellX)
+    # Only steps into a downstream stream cell are drawn
+    down = DownstreamIndex(FlowDir)
+    flat = streams.ravel()
+    drawn = flat & (down >= 0)
+    drawn[drawn] = flat[down[drawn]]
+    length[~drawn.reshape(FlowDir.shape)] = 0.0
+    return length
+
+# Half width (cells) of each row of a circle, cells whose center is within Radius of the center cell
+# Returns: (row offsets, half width of each row)
+def CircleRows(Radius, CellSize):
+    cellX, cellY = CellSize
+    reach = int(np.floor(Radius / cellY))
+    offsets = np.arange(-reach, reach + 1)
+    halfWidth = np.floor(np.sqrt(np.maximum(Radius ** 2 - (offsets * cellY) ** 2, 0)) / cellX + 1e-9).astype(np.int64)
+    return offsets, halfWidth
+
+# Sum of Values over a circle around every cell
+# Requires: Values=<2D array>, Radius=<circle radius (map units)>, CellSize=<(x, y) cell size>
+def CircleSum(Values, Radius, CellSize, BlockSize=BLOCK_SIZE):
+    rows, cols = Values.shape
+    offsets, halfWidth = CircleRows(Radius, CellSize)
+    reachRows, reachCols = int(offsets.max()), int(halfWidth.max())
+    # Row-wise prefix sums of the zero padded values, prefix[:, j] = sum of the first j padded columns
+    padded = np.pad(np.asarray(Values, dtype=np.float64), ((reachRows, reachRows), (reachCols + 1, reachCols)))
+    prefix = np.cumsum(padded, axis=1)
+    out = np.zeros((rows, cols), dtype=np.float64)
+    for rowSlice, colSlice in IterBlocks((rows, cols), BlockSize):
+        block = out[rowSlice, colSlice]
+        c0, c1 = colSlice.start + reachCols + 1, colSlice.stop + reachCols + 1
+        for dy, hw in zip(offsets, halfWidth):
+            band = prefix[rowSlice.start + reachRows + dy:rowSlice.stop + reachRows + dy]
+            block += band[:, c0 + hw:c1 + hw] - band[:, c0 - hw - 1:c1 - hw - 1]
+    return out
+
+# Drainage density (km/km^2) from flow direction and streams
+# Requires: FlowDir=<uint8 D8 direction array>, Streams=<boolean array>, CellSize=<(x, y) cell size (m)>, Radius=<search radius (m)>
+# Returns: float32 density, NaN outside the DEM (FLOW_NODATA)
+def DrainageDensityRaster(FlowDir, Streams, CellSize, Radius=1000, BlockSize=BLOCK_SIZE):
+    FlowDir = np.asarray(FlowDir)
+    length = StreamLength(FlowDir, Streams, CellSize)
+    density = CircleSum(length, Radius, CellSize, BlockSize) / 1000 / (np.pi * Radius ** 2 / 1e6)
+    density = density.astype(np.float32)
+    density[FlowDir == FLOW_NODATA] = np.nan
+    return density
+
+# Agreement of the native drainage density with arcpy LineDensity
+# Requires: Density=<native density>, Reference=<LineDensity array on the same grid>, Valid=<optional boolean array of cells to compare>
+# Returns: dict of mean absolute error, RMSE, maximum absolute error, bias, relative error of the mean and correlation
+def AccuracyReport(Density, Reference, Valid=None):
+    density = np.asarray(Density, dtype=np.float64)
+    reference = np.asarray(Reference, dtype=np.float64)
+    valid = ~np.isnan(density) & ~np.isnan(reference)
+    if Valid is not None:
+        valid &= Valid
+    density, reference = density[valid], reference[valid]
+    error = density - reference
+    report = {
+        'cells': int(valid.sum()),
+        'meanAbsoluteError': float(np.mean(np.abs(error))),
+        'rmse': float(np.sqrt(np.mean(error ** 2))),
+        'maxAbsoluteError': float(np.max(np.abs(error))),
+        'bias': float(np.mean(error)),
+        'relativeMeanError': float(np.mean(error) / np.mean(reference)) if np.mean(reference) else 0.0,
+        'correlation': float(np.corrcoef(density, reference)[0, 1]) if density.size > 1 else 1.0,
+    }
+    print('\tNative vs. LineDensity drainage density (km/km^2):')
+    print('\n'.join(f'\t\t{name}: {value:.6g}' for name, value in report.items()))
+
+    return report
+
+# Compare the native drainage density with arcpy LineDensity on stream features (e.g. the outputs of HydrologicConditioning)
+# Requires: FlowDir=<flow direction raster>, StreamsRast=<stream raster>, StreamsFeat=<stream features>, Snap_Raster=<raster to match extent and resolution>, Mask_Geom=<feature to define mask>, Search_Radius=<search radius (m)>
+# Returns: dict from AccuracyReport
+def CompareWithLineDensity(FlowDir, StreamsRast, StreamsFeat, Snap_Raster, Mask_Geom, Search_Radius=1000):
+    import arcpy
+    from Raster_IO import ArcRasterReader, AlignRaster, TransformCellSize
+
+    flowDir = ArcRasterReader(FlowDir, NoData=FLOW_NODATA)
+    streams = ArcRasterReader(StreamsRast, NoData=0)[:, :] > 0
+    density = DrainageDensityRaster(flowDir[:, :], streams, TransformCellSize(flowDir.transform), Search_Radius)
+    with arcpy.EnvManager(extent=Mask_Geom, mask=Mask_Geom, snapRaster=Snap_Raster):
+        lineDensity = arcpy.sa.LineDensity(StreamsFeat, population_field="NONE", cell_size=Snap_Raster, search_radius=Search_Radius, area_unit_scale_factor='SQUARE_KILOMETERS')
+    reference = ArcRasterReader(AlignRaster(lineDensity, FlowDir, Mask_Geom))[:, :]
+
+    return AccuracyReport(density, reference)
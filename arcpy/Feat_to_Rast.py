@@ -11,21 +11,48 @@ import arcpy
 from arcpy.sa import *
 from sys import argv
 
+from Instrumentation import Traced
+
 # Special characters for improved readability of geoprocessing messages
 nl = '\n'  # var can be used in f-strings to represent newline character
 tb = '\t'  # var can be used in f-strings to represent tab character
 
-def FeatToRast(Feat, Value_Field, Output, Snap_Raster, Mask_Geom):  # Feature to Raster
+# Backend='numpy' rasterizes polygons by scanline to uint16 codes of Value_Field, with a sidecar code table (<output>_Codes.csv), refer to Scanline_Rasterize.py for details
+@Traced(Tags=('Value_Field', 'Backend'))
+def FeatToRast(Feat, Value_Field, Output, Snap_Raster, Mask_Geom, Backend='arcpy', Workers=None):  # Feature to Raster
+
+    # Processing environment, scoped to this function (the global arcpy.env is left unchanged).
+    # To allow overwriting outputs overwriteOutput option is True.
+    with arcpy.EnvManager(overwriteOutput=True, extent=Mask_Geom, mask=Mask_Geom, snapRaster=Snap_Raster):
+
+        if Backend == 'numpy':
+            import numpy as np
+            from Block_Processing import ValidSource
+            from Scanline_Rasterize import ReadPolygonsArcpy, CodeFeatures, RasterizePolygons, WriteCodeTable, CodeTablePath
+            from Raster_IO import ArcRasterReader, AlignRaster
+            from Raster_Store import CreateRaster
+
+            # Process: Feature to Raster, on the snap raster grid within the mask, tile by tile into the output
+            print('\tConverting Features to Raster (NumPy)...')
+            target = ArcRasterReader(AlignRaster(Snap_Raster, Snap_Raster, Mask_Geom))
+            # Features are projected to the grid's coordinate system as they are read
+            rings, values = ReadPolygonsArcpy(Feat, Value_Field, target.spatialReference)
+            features, codes = CodeFeatures(rings, values)
+            with CreateRaster(Output, target.shape, np.uint16, target.transform, NoData=0, SpatialReference=target.spatialReference) as outRaster:
+                RasterizePolygons(features, target.transform, target.shape, Output=outRaster, Workers=Workers, Mask=ValidSource(target))
+            codeTable = WriteCodeTable(codes, CodeTablePath(Output), Value_Field)
+            print(f'\t\t{len(features)} features, {len(codes)} {Value_Field} codes, code table: {codeTable}')
+            return Output
 
-    # To allow overwriting outputs change overwriteOutput option to True.
-    arcpy.env.overwriteOutput = True
-    arcpy.env.extent = Mask_Geom  # Default processing extent
-    arcpy.env.mask = Mask_Geom  # Default processing mask
-    arcpy.env.snapRaster = Snap_Raster  # Default processing snap raster
+        # A code table left by the numpy backend would no longer match the VAT of this output
+        import os
+        from Scanline_Rasterize import CodeTablePath
+        if os.path.isfile(CodeTablePath(Output)):
+            os.remove(CodeTablePath(Output))
 
-    # Process: Feature to Raster (ConvertFeatureToRaster) (ra)
-    print('\tConverting Features to Raster...')
-    outRaster = arcpy.conversion.FeatureToRaster(Feat, Value_Field, Output, Snap_Raster)
-    print(f'\t\t{arcpy.GetMessages().replace(nl, nl+tb+tb)}')
+        # Process: Feature to Raster (ConvertFeatureToRaster) (ra)
+        print('\tConverting Features to Raster...')
+        outRaster = arcpy.conversion.FeatureToRaster(Feat, Value_Field, Output, Snap_Raster)
+        print(f'\t\t{arcpy.GetMessages().replace(nl, nl+tb+tb)}')
 
-    return outRaster
+        return outRaster
@@ -27,6 +27,9 @@ ap.env.workspace = ws  # Set default arcpy workspace
 gdb_name = 'FloodMAR.gdb'
 gdb = f'{ws}/{gdb_name}'
 
+# Raster math backend, one of 'arcpy' (Raster Calculator) or 'expression' (normalization and product in a single fused expression, refer to Raster_Expression.py)
+mathBackend = 'arcpy'
+
 
 # Arc Environment Settings
 ap.env.overwriteOutput = True  # Enable file overwriting
@@ -40,6 +43,10 @@ ap.env.outputCoordinateSystem = sr
 nl = '\n'  # var can be used in f-strings to represent newline character
 tb = '\t'  # var can be used in f-strings to represent tab character
 
+# Trace events of this run (with FLOODMAR_TRACE set) are tagged with the watershed, refer to Instrumentation.py
+from Instrumentation import Span, SetTags
+SetTags(watershed=watershedName)
+
 # Check workspace for geodatabase (gdb)
 if ap.Exists(gdb):
     print('GDB', gdb_name, 'Exists.')
@@ -53,18 +60,35 @@ else:
 floodSuitability = ap.sa.Raster(f'{ws}/{watershedName}/Flooding.gdb/Flooding_Suitability')
 rechargeSuitability = ap.sa.Raster(f'{ws}/{watershedName}/Recharge.gdb/Recharge_Suitability')
 
-# Get min and max values for each layer
-floodMin = floodSuitability.minimum
-floodMax = floodSuitability.maximum
-rechargeMin = rechargeSuitability.minimum
-rechargeMax = rechargeSuitability.maximum
-
-# Normalize each raster to 0 - 1, overwrite layer
-print('Normalizing Rasters to 0 - 1 Range...')
-floodSuitability = (floodSuitability - floodMin)/(floodMax - floodMin)
-rechargeSuitability = (rechargeSuitability - rechargeMin)/(rechargeMax - rechargeMin)
-
-print('Calculating Raster Math...')
-print('\tExpression: Flood_Suitability * Recharge_Suitability')
-floodMar = floodSuitability * rechargeSuitability
-floodMar.save(f'{gdb}/{watershedName}_FloodMAR')
+# Get min and max values for each layer, in a single pass, cached in the watershed workspace (refer to Raster_Statistics.py)
+from Raster_Statistics import LayerStatistics
+suitabilityStats = LayerStatistics(f'{ws}/{watershedName}', None, {'flood': f'{ws}/{watershedName}/Flooding.gdb/Flooding_Suitability', 'recharge': f'{ws}/{watershedName}/Recharge.gdb/Recharge_Suitability'})
+floodMin = suitabilityStats['flood']['minimum']
+floodMax = suitabilityStats['flood']['maximum']
+rechargeMin = suitabilityStats['recharge']['minimum']
+rechargeMax = suitabilityStats['recharge']['maximum']
+
+with Span('FloodMAR', backend=mathBackend):
+    if mathBackend == 'expression':
+        # Normalization and product are evaluated together, block by block, without intermediate rasters
+        import numpy as np
+        from Raster_Expression import Layer, Normalize
+        from Raster_IO import ArcRasterReader
+        from Raster_Store import CreateRaster
+        print('Calculating Raster Math...')
+        print('\tExpression: ((Flood_Suitability - floodMin) / (floodMax - floodMin)) * ((Recharge_Suitability - rechargeMin) / (rechargeMax - rechargeMin))')
+        floodReader, rechargeReader = ArcRasterReader(floodSuitability), ArcRasterReader(rechargeSuitability)
+        floodMar = Normalize(Layer(floodReader), floodMin, floodMax) * Normalize(Layer(rechargeReader), rechargeMin, rechargeMax)
+        # Each block is written to its window of the output raster, the result is never held whole in memory
+        with CreateRaster(f'{gdb}/{watershedName}_FloodMAR', floodReader.shape, np.float32, floodReader.transform, SpatialReference=sr) as outFloodMar:
+            floodMar.Evaluate(Output=outFloodMar)
+    else:
+        # Normalize each raster to 0 - 1, overwrite layer
+        print('Normalizing Rasters to 0 - 1 Range...')
+        floodSuitability = (floodSuitability - floodMin)/(floodMax - floodMin)
+        rechargeSuitability = (rechargeSuitability - rechargeMin)/(rechargeMax - rechargeMin)
+
+        print('Calculating Raster Math...')
+        print('\tExpression: Flood_Suitability * Recharge_Suitability')
+        floodMar = floodSuitability * rechargeSuitability
+        floodMar.save(f'{gdb}/{watershedName}_FloodMAR')
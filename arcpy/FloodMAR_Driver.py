@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Flood MAR Driver
+Objective:  Compute flooding suitability, recharge suitability and Flood MAR in a single run as a part of ATUR project
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+
+"""
+Replaces running FloodSuitability.py, RechargeSuitability.py and FloodMAR.py one after the other.
+Every input window is read once, and classified by both the flooding and recharge classification tables (and weight columns), so both suitability rasters are produced in the same pass, with the layer statistics computed only once.
+Running min/max of both suitability rasters are kept during that pass, so {watershed}_FloodMAR (the product of the min-max normalized suitabilities) only costs a cheap second pass over the two outputs.
+The classification functions (TfLinear slopes and thresholds) match FloodSuitability.py and RechargeSuitability.py.
+
+The core (RunFloodMAR) uses the NumPy backends and does not require arcpy. RunWatershed (and the script section at the bottom) reads and writes the ATUR file GDBs through arcpy.
+"""
+
+import numpy as np
+import pandas as pd
+from time import perf_counter
+
+from Block_Processing import BLOCK_SIZE
+from Instrumentation import Traced
+from Lookup_Reclass import CompileCategoricalTable
+from Rescale_Functions import TfLinear
+from Raster_Statistics import CachedStatistics
+from Raster_Expression import Layer, Normalize
+from Suitability_Pipeline import PipelineLayer, FusedSuitabilityModels
+
+# Layers in raster calculator order
+CONTINUOUS_LAYERS = ['DEM', 'Slope', 'Lineaments', 'Drainage', 'Precip', 'NDVI']
+CATEGORICAL_LAYERS = ['Lithology', 'Soil', 'LULC']
+LAYERS = CONTINUOUS_LAYERS + CATEGORICAL_LAYERS
+# Layer names used in the categorical classification tables, where they differ from LayerWeights.csv
+TABLE_NAMES = {'Soil': 'Soils'}
+# Weight column of LayerWeights.csv for each model
+WEIGHT_COLUMNS = {'flood': 'floodingWeight', 'recharge': 'rechargeWeight'}
+
+# TfLinear settings of each model, as in FloodSuitability.py and RechargeSuitability.py
+# slope: -1 for a negative slope (minimum = data maximum), +1 for a positive slope; thresholds and values below/above as given to TfLinear
+LINEAR_FUNCTIONS = {
+    'flood': {
+        'DEM':        {'slope': -1, 'lowerThreshold': 0, 'valueBelowThreshold': 5, 'upperThreshold': None, 'valueAboveThreshold': 0},
+        'Slope':      {'slope': -1, 'lowerThreshold': None, 'valueBelowThreshold': 5, 'upperThreshold': None, 'valueAboveThreshold': 0},
+        'Lineaments': {'slope': -1, 'lowerThreshold': None, 'valueBelowThreshold': 5, 'upperThreshold': None, 'valueAboveThreshold': 0},
+        'Drainage':   {'slope': 1, 'lowerThreshold': None, 'valueBelowThreshold': 0, 'upperThreshold': None, 'valueAboveThreshold': 5},
+        'Precip':     {'slope': 1, 'lowerThreshold': None, 'valueBelowThreshold': 0, 'upperThreshold': None, 'valueAboveThreshold': 5},
+        'NDVI':       {'slope': -1, 'lowerThreshold': None, 'valueBelowThreshold': 5, 'upperThreshold': None, 'valueAboveThreshold': 0},
+    },
+    'recharge': {
+        'DEM':        {'slope': -1, 'lowerThreshold': 0, 'valueBelowThreshold': 5, 'upperThreshold': None, 'valueAboveThreshold': 0},
+        'Slope':      {'slope': -1, 'lowerThreshold': None, 'valueBelowThreshold': 5, 'upperThreshold': None, 'valueAboveThreshold': 0},
+        'Lineaments': {'slope': 1, 'lowerThreshold': None, 'valueBelowThreshold': 5, 'upperThreshold': None, 'valueAboveThreshold': 0},
+        'Drainage':   {'slope': -1, 'lowerThreshold': None, 'valueBelowThreshold': 0, 'upperThreshold': None, 'valueAboveThreshold': 5},
+        'Precip':     {'slope': 1, 'lowerThreshold': None, 'valueBelowThreshold': 0, 'upperThreshold': None, 'valueAboveThreshold': 5},
+        'NDVI':       {'slope': 1, 'lowerThreshold': None, 'valueBelowThreshold': 5, 'upperThreshold': None, 'valueAboveThreshold': 0},
+    },
+}
+
+# TfLinear function of a continuous layer for a model, from the layer statistics
+def LinearFunction(Model, LayerName, Stats):
+    settings = dict(LINEAR_FUNCTIONS[Model][LayerName])
+    slope = settings.pop('slope')
+    if not Stats.get('count'):
+        raise ValueError(f'{LayerName} has no valid cells, its {Model} TfLinear minimum and maximum are undefined.')
+    low, high = Stats['minimum'], Stats['maximum']
+    # TfLinear: Set minimum > maximum for a negative slope
+    if slope < 0:
+        low, high = high, low
+    return TfLinear(minimum=low, maximum=high, **settings)
+
+# Layer weights of a model from the LayerWeights.csv table
+def ModelWeights(LayerWeights, Model):
+    column = WEIGHT_COLUMNS[Model]
+    return {layer: LayerWeights[LayerWeights['layer'] == layer][column].values[0] for layer in LAYERS}
+
+# Build the fused pipeline layers of both models
+# Requires: Sources=<dict of layer name: raster source, all on the same grid>, CatTables=<dict of model: categorical classification df>, LayerWeights=<LayerWeights.csv df>, Codes=<dict of categorical layer name: VAT codes dict (or None if oldValue are raster values)>, Stats=<dict of continuous layer name: stats dict>
+def BuildModels(Sources, CatTables, LayerWeights, Codes, Stats):
+    models = {}
+    for model in WEIGHT_COLUMNS:
+        weights = ModelWeights(LayerWeights, model)
+        layers = []
+        for name in CONTINUOUS_LAYERS:
+            layers.append(PipelineLayer(name, Sources[name], LinearFunction(model, name, Stats[name]), weights[name], Stats=Stats[name]))
+        for name in CATEGORICAL_LAYERS:
+            lut = CompileCategoricalTable(CatTables[model], TABLE_NAMES.get(name, name), Codes.get(name))
+            layers.append(PipelineLayer(name, Sources[name], lut, weights[name]))
+        models[model] = layers
+
+    return models
+
+# Product of two min-max normalized rasters, (flood - floodMin)/(floodMax - floodMin) * (recharge - rechargeMin)/(rechargeMax - rechargeMin)
+# Evaluated as a single fused expression, block by block, refer to Raster_Expression.py
+@Traced()
+def NormalizedProduct(Flood, Recharge, FloodRange, RechargeRange, Output=None, BlockSize=BLOCK_SIZE, Mask=None):
+    expression = Normalize(Layer(Flood, NoData=np.nan), *FloodRange) * Normalize(Layer(Recharge, NoData=np.nan), *RechargeRange)
+    return expression.Evaluate(Output, Mask, BlockSize=BlockSize)
+
+# Flood, recharge and Flood MAR in one run
+# Requires: Sources=<dict of layer name: raster source, all on the same grid>, CatTables=<dict of model: categorical classification df>, LayerWeights=<LayerWeights.csv df>, Codes=<dict of categorical layer name: VAT codes>, Outputs=<optional dict of 'flood'/'recharge'/'floodmar': preallocated float32 array-like>, Mask=<optional boolean raster source or Tile_Index.TileIndex, True inside processing extent>, SaveIntermediates=<debug flag, keep the classified layers>, Timings=<optional dict, filled with wall time (s) per stage>, StatsCache=<optional Raster_Statistics.StatisticsCache>, StatsKeys=<dict of continuous layer name: cache key, with StatsCache>
+# Returns: (dict of outputs, dict of model: {layer name: classified array}, empty unless SaveIntermediates)
+@Traced()
+def RunFloodMAR(Sources, CatTables, LayerWeights, Codes=None, Outputs=None, Mask=None, SaveIntermediates=False, BlockSize=BLOCK_SIZE, Timings=None, StatsCache=None, StatsKeys=None):
+    Outputs = dict(Outputs or {})
+    Codes = Codes or {}
+    Timings = Timings if Timings is not None else {}
+
+    # Statistics of the continuous layers, computed once for both models in a single pass (or taken from the cache), refer to Raster_Statistics.py
+    start = perf_counter()
+    print('\tLayer Statistics...')
+    stats = CachedStatistics({name: Sources[name] for name in CONTINUOUS_LAYERS}, StatsKeys, StatsCache, Mask=Mask, BlockSize=BlockSize)
+    Timings['statistics'] = perf_counter() - start
+
+    # Pass 1, classify and weight both models
+    start = perf_counter()
+    print('\tClassifying Layers and Calculating Flood and Recharge Suitability...')
+    models = BuildModels(Sources, CatTables, LayerWeights, Codes, stats)
+    suitability, ranges, intermediates = FusedSuitabilityModels(models, {m: Outputs.get(m) for m in models}, Mask, SaveIntermediates, BlockSize=BlockSize)
+    Outputs.update(suitability)
+    Timings['suitability'] = perf_counter() - start
+
+    # Pass 2, normalize to 0 - 1 and multiply
+    start = perf_counter()
+    print('\tNormalizing Rasters to 0 - 1 Range and Calculating Flood MAR...')
+    print('\t\tExpression: Flood_Suitability * Recharge_Suitability')
+    Outputs['floodmar'] = NormalizedProduct(Outputs['flood'], Outputs['recharge'], ranges['flood'], ranges['recharge'], Outputs.get('floodmar'), BlockSize, Mask)
+    Timings['floodmar'] = perf_counter() - start
+
+    return Outputs, intermediates
+
+
+# Default input data absolute filepaths
+# All input layers for maximum available extent, clipping and processing extent determined by the extent feature (shapefile)
+INPUTS = {
+    'DEM': r"C:\GIS_Projects\ATUR\Data\DEM\Study_area_SRTM.tif",
+    'Precip': r"C:\GIS_Projects\ATUR\Data\Climate\PRISM_ppt_30yrnormal_800m.tif",
+    'Lithology': r"C:\GIS_Projects\ATUR\Data\Geology\GeologicUnits\Geology of Arizona - Units - SGMC.shp",
+    'Soil': r"C:\GIS_Projects\ATUR\Data\Soils\AZ_Soil_Hydric_Group.lpkx",
+    'Lineaments': r'C:\GIS_Projects\ATUR\Data\Geology\Faults\Arizona_Lineament_Density.lpkx',
+    'NDVI': r"C:\GIS_Projects\ATUR\Data\Climate\NDVI_10yrMean.tif",
+    'LULC': r"C:\GIS_Projects\ATUR\Data\LULC\ESRI_LULC_30m_clip.tif",
+}
+# Classification Schema Tables (folder)
+TABLES = r"C:\GIS_Projects\ATUR\Documents\Quarto\SanPedro_Flood-MAR\SanPedro_Flood-MAR\arcpy\Classification_Tables"
+
+# Preprocessing, flooding and recharge suitability, and Flood MAR for one watershed (arcpy)
+# All arcpy environment settings are scoped to this call, so watersheds processed one after the other (e.g. in a batch worker) do not share extent/mask state
+# Requires: WatershedName=<name of watershed or extent>, ExtentFeat=<extent shapefile, i.e. mask>, Workspace=<watershed workspace folder>, Inputs=<dict of input filepaths>, Tables=<classification tables folder>, Timings=<optional dict, filled with wall time (s) per stage>, PreprocessWorkers=<max worker processes for preprocessing stages, refer to Stage_Graph.py>, PreprocessBackend=<'arcpy' or 'numpy' preprocessing stages, refer to Preprocessing.py>, Store=<'gdb', 'zarr', 'cog' or 'npy' store of the preprocessed layers and outputs, other than 'gdb' requires PreprocessBackend='numpy', refer to Raster_Store.py>, BuildIndex=<save the class-combination index of the watershed for re-weighting, refer to Combination_Index.py>, IndexStep=<class quantization step of the index, Combination_Index.STEP if None>, SensitivitySamples=<number of Monte Carlo weight samples for uncertainty bands, 0 for none, refer to Weight_Sensitivity.py>, Merge=<copy {WatershedName}_FloodMAR into the shared FloodMAR store of the base workspace, refer to MergeFloodMAR>
+# Outputs are written to stores in the watershed workspace only (including <Workspace>/FloodMAR), so watersheds run in parallel never write to the same file gdb
+@Traced(Tags={'watershed': 'WatershedName', 'backend': 'PreprocessBackend', 'store': 'Store'})
+def RunWatershed(WatershedName, ExtentFeat, Workspace, Inputs=INPUTS, Tables=TABLES, SaveIntermediates=False, BlockSize=BLOCK_SIZE, Timings=None, PreprocessWorkers=None, PreprocessBackend='arcpy', Store='gdb', BuildIndex=False, IndexStep=None, SensitivitySamples=0, Merge=True):
+    import arcpy as ap
+    import os
+    from Raster_IO import ArcRasterReader, ReadValueTable, AlignRaster
+    from Raster_Store import StoreLocation, DatasetPath, CreateStore, OpenRaster, SaveRaster, CopyRaster
+
+    Timings = Timings if Timings is not None else {}
+    # Make ws dir if it does not already exist
+    os.makedirs(Workspace, exist_ok=True)
+    catClassifications = {'flood': pd.read_csv(f'{Tables}/Flooding_CategoricalClassificationSchemas.csv'), 'recharge': pd.read_csv(f'{Tables}/Recharge_CategoricalClassificationSchemas.csv')}
+    layerWeights = pd.read_csv(f'{Tables}/LayerWeights.csv')
+    # Spatial Reference (sr)
+    sr = ap.SpatialReference(32612)  # Spatial reference = WGS 1984 UTM Zone 12N (WKID = 32612)
+    # Units = m
+
+    # Arc Environment Settings, restored on exit
+    with ap.EnvManager(workspace=Workspace, overwriteOutput=True, extent=ExtentFeat, mask=ExtentFeat, snapRaster=Inputs['DEM'], outputCoordinateSystem=sr):
+        # Check workspace for geodatabases (gdb)
+        floodGdb = StoreLocation(Workspace, 'Flooding', Store)
+        rechargeGdb = StoreLocation(Workspace, 'Recharge', Store)
+        floodMarGdb = StoreLocation(Workspace, 'FloodMAR', Store)
+        for gdb in [floodGdb, rechargeGdb, floodMarGdb]:
+            if ap.Exists(gdb):
+                print('GDB', gdb, 'Exists.')
+            else:
+                print('No GDB', f'{gdb}.', 'Initializing GDB.')
+                CreateStore(gdb)
+
+        # Preprocess Requisite Layers ---------
+        start = perf_counter()
+        # Cached stages are skipped, refer to Stage_Cache.py
+        preprocessing = StoreLocation(Workspace, 'LayerPreprocessing', Store)
+        print('Preprocessing Layers.')
+        from Preprocessing import PreprocessLayers
+        PreprocessLayers(Workspace, extentFeat=ExtentFeat, dem=Inputs['DEM'], precipitation=Inputs['Precip'], lithology=Inputs['Lithology'], workers=PreprocessWorkers, backend=PreprocessBackend,
+                         streamFeatures=Store == 'gdb', store=Store)
+        ap.env.workspace = Workspace
+        Timings['preprocessing'] = perf_counter() - start
+
+        # Align every input to the DEM grid within the extent, so all layers can be read window by window
+        start = perf_counter()
+        print('Aligning Layers to Snap Raster...')
+        rasters = {'DEM': Inputs['DEM'], 'Slope': DatasetPath(preprocessing, 'Slope'), 'Lineaments': Inputs['Lineaments'], 'Drainage': DatasetPath(preprocessing, 'Drainage_Density'),
+                   'Precip': DatasetPath(preprocessing, 'Precipitation'), 'NDVI': Inputs['NDVI'], 'Lithology': DatasetPath(preprocessing, 'Lithology'), 'Soil': Inputs['Soil'], 'LULC': Inputs['LULC']}
+        # Preprocessed layers in a Zarr/COG/.npy store are already on the DEM grid within the extent, and are read window by window from the store
+        stored = {'Slope', 'Drainage', 'Precip', 'Lithology'} if Store != 'gdb' else set()
+        aligned = {name: AlignRaster(raster, Inputs['DEM'], ExtentFeat) for name, raster in rasters.items() if name not in stored}
+        sources = {name: ArcRasterReader(raster) for name, raster in aligned.items()}
+        # Tiles of the grid outside the extent feature are never read or computed, refer to Tile_Index.py
+        from Tile_Index import MaskTileIndex
+        tiles = MaskTileIndex(Workspace, ExtentFeat, sources['DEM'].transform, sources['DEM'].shape, BlockSize, sr)
+        Timings['skippedPercent'] = 100 * tiles.Report()['skipped']
+        if Store == 'npy':
+            # Aligned inputs are decoded once into the .npy store, the statistics and classification passes then read the same mapped pages
+            sources = {name: CopyRaster(source, DatasetPath(preprocessing, f'Aligned_{name}'), source.transform, source.noData, sr, BlockSize, tiles) for name, source in sources.items()}
+        sources.update({name: OpenRaster(rasters[name]) for name in stored})
+        # Categorical rasters classified on a VAT attribute (VALUE codes are kept by the alignment)
+        # Lithology rasterized natively carries its UNIT_NAME codes in a sidecar code table instead of a VAT, refer to Scanline_Rasterize.py
+        from Scanline_Rasterize import CodeTablePath, ReadCodeTable
+        lithologyCodes = CodeTablePath(rasters['Lithology'])
+        codes = {'Lithology': ReadCodeTable(lithologyCodes, 'UNIT_NAME') if os.path.isfile(lithologyCodes) else ReadValueTable(rasters['Lithology'], 'UNIT_NAME'),
+                 'Soil': ReadValueTable(rasters['Soil'], 'ClassName')}
+        Timings['alignment'] = perf_counter() - start
+
+        # FLOOD MAR -----------------
+        print('Calculating Flood MAR...')
+        # Layer statistics are cached per (raster, extent, snap raster) in the workspace
+        from Raster_Statistics import StatisticsCache
+        statsCache = StatisticsCache(Workspace)
+        statsKeys = {name: statsCache.Key(rasters[name], ExtentFeat, Inputs['DEM']) for name in CONTINUOUS_LAYERS}
+        outputs, intermediates = RunFloodMAR(sources, catClassifications, layerWeights, codes, Mask=tiles, SaveIntermediates=SaveIntermediates, BlockSize=BlockSize, Timings=Timings,
+                                             StatsCache=statsCache, StatsKeys=statsKeys)
+
+        start = perf_counter()
+        transform = sources['DEM'].transform
+        SaveRaster(outputs['flood'], transform, DatasetPath(floodGdb, 'Flooding_Suitability'), SpatialReference=sr)
+        SaveRaster(outputs['recharge'], transform, DatasetPath(rechargeGdb, 'Recharge_Suitability'), SpatialReference=sr)
+        SaveRaster(outputs['floodmar'], transform, DatasetPath(floodMarGdb, f'{WatershedName}_FloodMAR'), SpatialReference=sr)
+        if SaveIntermediates:
+            from Suitability_Pipeline import SaveIntermediateRasters
+            SaveIntermediateRasters(intermediates['flood'], transform, floodGdb, sr)
+            SaveIntermediateRasters(intermediates['recharge'], transform, rechargeGdb, sr)
+        Timings['save'] = perf_counter() - start
+
+        if BuildIndex:
+            # Class-combination index, so new layer weights only need a re-weighting of the combinations, refer to Combination_Index.py
+            start = perf_counter()
+            print('Building Combination Index...')
+            from Combination_Index import BuildWatershedIndex, STEP
+            # Statistics are cached by the Flood MAR run
+            stats = CachedStatistics({name: sources[name] for name in CONTINUOUS_LAYERS}, statsKeys, statsCache, Mask=tiles, BlockSize=BlockSize)
+            index = BuildWatershedIndex(sources, catClassifications, layerWeights, codes, stats, tiles, transform, BlockSize, Step=IndexStep or STEP)
+            if index is not None:
+                index.Save(Workspace, sr, BlockSize)
+            else:
+                # No compression, new weights are run through RunFloodMAR; an index left by an earlier run would no longer match
+                import shutil
+                from Combination_Index import INDEX_NAME
+                shutil.rmtree(StoreLocation(Workspace, INDEX_NAME, 'npy'), ignore_errors=True)
+            Timings['combinations'] = perf_counter() - start
+
+        if SensitivitySamples:
+            # Mean, std, percentile bands and class agreement over weight samples around LayerWeights.csv, refer to Weight_Sensitivity.py
+            start = perf_counter()
+            print('Calculating Weight Sensitivity...')
+            from Weight_Sensitivity import RunSensitivity
+            stats = CachedStatistics({name: sources[name] for name in CONTINUOUS_LAYERS}, statsKeys, statsCache, Mask=tiles, BlockSize=BlockSize)
+            sensitivity, samples = RunSensitivity(sources, catClassifications, layerWeights, codes, stats, SensitivitySamples, Mask=tiles, BlockSize=BlockSize)
+            # Saved to the watershed's own Sensitivity store only, never merged into a shared store
+            sensitivityGdb = CreateStore(StoreLocation(Workspace, 'Sensitivity', Store))
+            for name, array in sensitivity.items():
+                SaveRaster(array, transform, DatasetPath(sensitivityGdb, f'{WatershedName}_Sensitivity_{name}'), SpatialReference=sr)
+            for model, table in samples.items():
+                table.to_csv(os.path.join(Workspace, f'SensitivityWeights_{model}.csv'), index_label='sample')
+            Timings['sensitivity'] = perf_counter() - start
+
+    if Merge:
+        MergeFloodMAR(WatershedName, Workspace, Store)
+
+    return Timings
+
+# Copy the Flood MAR raster of a watershed into the shared store of the base workspace, <base workspace>/FloodMAR (created if it does not exist)
+# Parallel watersheds are merged one after the other once they are done, by a single process (refer to Batch_Processing.py)
+def MergeFloodMAR(WatershedName, Workspace, Store='gdb'):
+    import os
+    from Raster_Store import StoreLocation, DatasetPath, CreateStore, CopyDataset
+
+    shared = CreateStore(StoreLocation(os.path.dirname(Workspace), 'FloodMAR', Store))
+    output = DatasetPath(shared, f'{WatershedName}_FloodMAR')
+    print(f'Merging {WatershedName}_FloodMAR into {shared}...')
+    return CopyDataset(DatasetPath(StoreLocation(Workspace, 'FloodMAR', Store), f'{WatershedName}_FloodMAR'), output)
+
+
+if __name__ == '__main__':
+    # Workspace (ws)
+    # Update ws as needed!
+    watershedName = 'Salt'  # Name of watershed or extent to be used in processing (ATUR for maximum state-wide extent)
+    ws = f"D:/Saved_GIS_Projects/ATUR_Temp/Temp_Workspace/{watershedName}"
+    extentFeat = rf"C:\GIS_Projects\ATUR\Data\Arizona_Boundary\{watershedName}.shp"  # i.e. mask
+    # Debug, save Classified_X layers of both models
+    saveIntermediates = False
+
+    RunWatershed(watershedName, extentFeat, ws, SaveIntermediates=saveIntermediates)
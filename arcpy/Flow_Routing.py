@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Flow Routing
+Objective:  Depression filling, D8 flow direction, flow accumulation and stream thresholding (NumPy, no arcpy) as a part of ATUR Suitability Analysis
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import numpy as np
+
+from Block_Processing import ValidMask
+
+"""
+Native backend for Hydrologic_Conditioning.py (arcpy.sa.FlowDirection(force_flow='FORCE') + FlowAccumulation + Con(VALUE >= threshold)).
+    - Depressions are filled with the result of priority-flood (Barnes et al., 2014), computed on the basin graph instead of cell by cell: every cell is labelled with the pit its steepest descent ends in (pointer jumping), adjacent basins are joined by their lowest pass (the higher cell of the lowest neighbouring pair), and basins on the edge of the DEM are joined to the outside. The water level of a basin is the lowest possible highest pass on a path to the outside, the maximum pass on the path of the minimum spanning tree (Boruvka), and each cell is raised to the water level of its basin. All steps are vectorized over whole arrays (a few arrays of the raster size), the graph has one node per pit.
+    - D8 direction is the steepest downhill neighbour of the filled DEM (drop / distance, vectorized over the 8 neighbours); cells without a downhill neighbour (filled depressions and flats) flow towards an outlet of the flat, breadth first from the outlets across cells of equal elevation.
+    - As with force_flow='FORCE', all cells at the edge of the DEM (including cells next to NoData) flow outward.
+    - Flow accumulation is a topological traversal of the direction graph: cells without inflow form the first wave, and a cell joins the next wave once all of its upstream neighbours are done (indegree queue), so every cell is visited once. The stream threshold is applied to each wave as it is finalized.
+Directions use the ESRI D8 codes, 0 where a cell has no downstream neighbour (sinks, only when Fill=False) and FLOW_NODATA outside the DEM.
+"""
+
+# ESRI D8 codes and (row, column) offsets: E, SE, S, SW, W, NW, N, NE
+D8_CODES = (1, 2, 4, 8, 16, 32, 64, 128)
+D8_OFFSETS = ((0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1))
+# Outward directions of edge cells are chosen orthogonal first (E, S, W, N, then the diagonals)
+EDGE_ORDER = (0, 2, 4, 6, 1, 3, 5, 7)
+FLOW_NODATA = 255
+
+# D8 code of the opposite direction
+def _Opposite(k):
+    return D8_CODES[(k + 4) % 8]
+
+# Cells at the edge of the DEM, on the edge of the grid or next to NoData
+def EdgeCells(Valid):
+    padded = np.pad(Valid, 1, constant_values=False)
+    rows, cols = Valid.shape
+    inner = np.ones(Valid.shape, dtype=bool)
+    for dr, dc in D8_OFFSETS:
+        inner &= padded[1 + dr:1 + dr + rows, 1 + dc:1 + dc + cols]
+    return Valid & ~inner
+
+# Index dtype of flat cell indices of a grid
+def _IndexType(Size):
+    return np.int32 if Size < np.iinfo(np.int32).max else np.int64
+
+# Pointer jumping, the root of every node of a forest (Parent[root] == root)
+def _Roots(Parent):
+    while True:
+        jumped = Parent[Parent]
+        if np.array_equal(jumped, Parent):
+            return Parent
+        Parent = jumped
+
+# Basin (index of the pit reached by steepest descent) of every cell, -1 outside the DEM
+# Returns: (basin array, number of basins)
+def DescentBasins(Surface, Valid):
+    rows, cols = Surface.shape
+    padded = np.pad(Surface, 1, constant_values=np.inf)
+    lowest = Surface.copy()
+    down = np.arange(rows * cols, dtype=_IndexType(rows * cols))
+    for dr, dc in D8_OFFSETS:
+        neighbour = padded[1 + dr:1 + dr + rows, 1 + dc:1 + dc + cols]
+        lower = (neighbour < lowest) & Valid
+        lowest[lower] = neighbour[lower]
+        cells = np.flatnonzero(lower)
+        down[cells] = cells + (dr * cols + dc)
+    del padded, lowest
+    pits = np.flatnonzero(Valid.ravel() & (down == np.arange(down.size, dtype=down.dtype)))
+    basinOf = np.full(down.size, -1, dtype=down.dtype)
+    basinOf[pits] = np.arange(pits.size, dtype=down.dtype)
+    basins = basinOf[_Roots(down)]
+    basins[~Valid.ravel()] = -1
+    return basins.reshape(rows, cols), pits.size
+
+# Spill edges of the basin graph, lowest pass between every pair of adjacent basins, and from every basin on the edge of the DEM to the outside (node Count)
+# Returns: (basin, basin, pass elevation) arrays, sorted by pass elevation
+def SpillEdges(Surface, Valid, Basins, Count):
+    rows, cols = Surface.shape
+    low, high, level = [], [], []
+    # Each pair of neighbours once (E, SE, S, SW)
+    for dr, dc in D8_OFFSETS[:4]:
+        a = (slice(0, rows - dr), slice(max(0, -dc), cols - max(0, dc)))
+        b = (slice(dr, rows), slice(max(0, dc), cols - max(0, -dc)))
+        basinA, basinB = Basins[a], Basins[b]
+        cross = (basinA >= 0) & (basinB >= 0) & (basinA != basinB)
+        basinA, basinB = basinA[cross], basinB[cross]
+        low.append(np.minimum(basinA, basinB))
+        high.append(np.maximum(basinA, basinB))
+        level.append(np.maximum(Surface[a][cross], Surface[b][cross]))
+    edges = EdgeCells(Valid)
+    low.append(Basins[edges])
+    high.append(np.full(low[-1].size, Count, dtype=Basins.dtype))
+    level.append(Surface[edges])
+    low, high, level = np.concatenate(low), np.concatenate(high), np.concatenate(level)
+
+    # Lowest pass of every pair
+    key = low.astype(np.int64) * (Count + 1) + high
+    order = np.lexsort((level, key))
+    key = key[order]
+    first = order[np.r_[True, key[1:] != key[:-1]]]
+    low, high, level = low[first], high[first], level[first]
+    order = np.argsort(level, kind='stable')
+    return low[order], high[order], level[order]
+
+# Minimum spanning tree of a connected graph (Boruvka, each round every component joins along its lowest edge)
+# Requires: Low/High=<node arrays of the edges>, Nodes=<number of nodes>, edges sorted by weight (ties broken by position)
+# Returns: positions of the tree edges
+def SpanningTree(Low, High, Nodes):
+    component = np.arange(Nodes, dtype=np.int64)
+    rank = np.arange(Low.size, dtype=np.int64)
+    tree = []
+    while True:
+        a, b = component[Low[rank]], component[High[rank]]
+        external = a != b
+        rank, a, b = rank[external], a[external], b[external]
+        if not rank.size:
+            break
+        best = np.full(Nodes, Low.size, dtype=np.int64)
+        np.minimum.at(best, a, rank)
+        np.minimum.at(best, b, rank)
+        heads = np.flatnonzero(best < Low.size)
+        chosen = np.searchsorted(rank, best[heads])
+        other = np.where(a[chosen] == heads, b[chosen], a[chosen])
+        parent = np.arange(Nodes, dtype=np.int64)
+        parent[heads] = other
+        # Components choosing each other (the same edge), the smaller one is the root
+        mutual = (parent[other] == heads) & (heads < other)
+        parent[heads[mutual]] = heads[mutual]
+        tree.append(rank[chosen])
+        component = _Roots(parent)[component]
+    return np.unique(np.concatenate(tree)) if tree else rank
+
+# Water level of every node, the lowest possible highest pass on a path to the Root (maximum edge weight on the tree path)
+def TreeLevels(Low, High, Weight, Nodes, Root):
+    source, target, weight = np.r_[Low, High], np.r_[High, Low], np.r_[Weight, Weight]
+    order = np.argsort(source, kind='stable')
+    target, weight = target[order], weight[order]
+    starts = np.searchsorted(source[order], np.arange(Nodes + 1))
+    levels = np.full(Nodes, -np.inf, dtype=np.float64)
+    visited = np.zeros(Nodes, dtype=bool)
+    visited[Root] = True
+    frontier = np.array([Root])
+    # Breadth first from the root, a node's level is the higher of its edge and its parent's level
+    while frontier.size:
+        counts = starts[frontier + 1] - starts[frontier]
+        total = int(counts.sum())
+        if not total:
+            break
+        parents = np.repeat(frontier, counts)
+        positions = np.repeat(starts[frontier] - np.cumsum(counts) + counts, counts) + np.arange(total)
+        children = target[positions]
+        new = ~visited[children]
+        children, parents = children[new], parents[new]
+        levels[children] = np.maximum(weight[positions[new]], levels[parents])
+        visited[children] = True
+        frontier = children
+    return levels
+
+# Depression filling, vectorized priority-flood on the basin graph
+# Requires: DEM=<2D elevation array>, Valid=<boolean array, True for valid cells>
+# Returns: filled DEM (NoData cells unchanged)
+def FillDepressions(DEM, Valid):
+    DEM = np.asarray(DEM)
+    dtype = DEM.dtype if DEM.dtype.kind == 'f' else np.float64
+    surface = np.where(Valid, DEM, np.inf).astype(dtype)
+    basins, count = DescentBasins(surface, Valid)
+    low, high, level = SpillEdges(surface, Valid, basins, count)
+    tree = SpanningTree(low, high, count + 1)
+    # The outside is the last node, so NoData cells (basin -1) get its level (-inf)
+    levels = TreeLevels(low[tree], high[tree], level[tree], count + 1, count).astype(dtype)
+    return np.where(Valid, np.maximum(surface, levels[basins]), DEM).astype(dtype)
+
+# Directions of flat cells (no downhill neighbour) draining to an outlet of the flat, breadth first across cells of equal elevation
+# Direction is updated in place, flats without an outlet (sinks) remain 0
+def FlatDirections(Surface, Valid, Direction):
+    rows, cols = Surface.shape
+    width = cols + 2
+    flat = Valid & (Direction == 0)
+    if not flat.any():
+        return Direction
+    surface = np.pad(np.where(Valid, Surface, np.inf), 1, constant_values=np.inf).ravel()
+    open_ = np.pad(flat, 1, constant_values=False).ravel()
+    direction = np.pad(Direction, 1).ravel()
+    # Outlets, resolved cells next to a flat cell
+    near = np.zeros(Surface.shape, dtype=bool)
+    padded = np.pad(flat, 1, constant_values=False)
+    for dr, dc in D8_OFFSETS:
+        near |= padded[1 + dr:1 + dr + rows, 1 + dc:1 + dc + cols]
+    frontier = np.flatnonzero(np.pad(near & Valid & ~flat, 1).ravel())
+    while frontier.size:
+        reached = []
+        for k, (dr, dc) in enumerate(D8_OFFSETS):
+            cells = frontier + (dr * width + dc)
+            joined = open_[cells] & (surface[cells] == surface[frontier])
+            cells = cells[joined]
+            open_[cells] = False
+            direction[cells] = _Opposite(k)
+            reached.append(cells)
+        frontier = np.concatenate(reached)
+    Direction[...] = direction.reshape(rows + 2, width)[1:-1, 1:-1]
+    return Direction
+
+# D8 flow direction (ESRI codes)
+# Requires: DEM=<2D elevation array, filled unless sinks are wanted>, Valid=<boolean array, True for valid cells>, CellSize=<(x, y) cell size>
+# Returns: uint8 direction array, 0 for sinks, FLOW_NODATA outside the DEM
+def D8Direction(DEM, Valid, CellSize=(1.0, 1.0)):
+    rows, cols = DEM.shape
+    cellX, cellY = CellSize
+    padded = np.pad(np.where(Valid, DEM, np.inf).astype(np.float64), 1, constant_values=np.inf)
+    center = padded[1:-1, 1:-1]
+    bestDrop = np.zeros(DEM.shape, dtype=np.float64)
+    direction = np.zeros(DEM.shape, dtype=np.uint8)
+    for code, (dr, dc) in zip(D8_CODES, D8_OFFSETS):
+        distance = np.hypot(dr * cellY, dc * cellX)
+        # NoData (inf - inf) is never steeper
+        with np.errstate(invalid='ignore'):
+            drop = (center - padded[1 + dr:1 + dr + rows, 1 + dc:1 + dc + cols]) / distance
+        steeper = drop > bestDrop
+        bestDrop[steeper] = drop[steeper]
+        direction[steeper] = code
+
+    # FORCE, edge cells flow outward (orthogonal directions first)
+    edges = EdgeCells(Valid)
+    outward = np.zeros(DEM.shape, dtype=np.uint8)
+    validPadded = np.pad(Valid, 1, constant_values=False)
+    for k in EDGE_ORDER[::-1]:
+        dr, dc = D8_OFFSETS[k]
+        outside = ~validPadded[1 + dr:1 + dr + rows, 1 + dc:1 + dc + cols]
+        outward[outside] = D8_CODES[k]
+    direction[edges] = outward[edges]
+
+    # Filled depressions and flats flow towards their outlet
+    FlatDirections(DEM, Valid, direction)
+    direction[~Valid] = FLOW_NODATA
+    return direction
+
+# Flat index of the downstream cell of every cell, -1 where flow leaves the DEM (or sinks and NoData)
+def DownstreamIndex(FlowDir):
+    rows, cols = FlowDir.shape
+    indexType = np.int32 if rows * cols < np.iinfo(np.int32).max else np.int64
+    down = np.full(rows * cols, -1, dtype=indexType)
+    valid = (FlowDir != FLOW_NODATA)
+    for code, (dr, dc) in zip(D8_CODES, D8_OFFSETS):
+        r, c = np.nonzero(FlowDir == code)
+        rr, cc = r + dr, c + dc
+        inside = (rr >= 0) & (rr < rows) & (cc >= 0) & (cc < cols)
+        r, c, rr, cc = r[inside], c[inside], rr[inside], cc[inside]
+        inside = valid[rr, cc]
+        down[(r * cols + c)[inside]] = (rr * cols + cc)[inside]
+    return down
+
+# Accumulation over a flow graph in topological order (indegree queue): each cell receives (accumulation + 1) of every upstream cell
+# Requires: Down=<flat index of the downstream node of every node, -1 for none>, Valid=<boolean array, True for nodes of the graph>, Initial=<optional uint32 starting value of every node (e.g. inflow from outside the graph)>, Threshold=<minimum accumulation of a stream node, or None>
+# Returns: (uint32 accumulation, boolean stream array (VALUE >= Threshold), None if Threshold is None)
+def AccumulateGraph(Down, Valid, Initial=None, Threshold=None):
+    indegree = np.bincount(Down[Down >= 0], minlength=Down.size)
+    # D8 cells have at most 8 upstream neighbours, other graphs (e.g. tile boundaries, Flow_Tiles.py) may have more
+    indegree = indegree.astype(np.uint8 if indegree.size == 0 or indegree.max() <= np.iinfo(np.uint8).max else np.uint32)
+    accumulation = np.zeros(Down.size, dtype=np.uint32) if Initial is None else np.array(Initial, dtype=np.uint32)
+    streams = np.zeros(Down.size, dtype=bool) if Threshold is not None else None
+
+    # Waves of nodes whose upstream nodes are all done
+    wave = np.flatnonzero(Valid & (indegree == 0))
+    visited = 0
+    while wave.size:
+        visited += wave.size
+        if streams is not None:
+            streams[wave] = accumulation[wave] >= Threshold
+        targets = Down[wave]
+        flowing = targets >= 0
+        sources, targets = wave[flowing], targets[flowing]
+        if not targets.size:
+            break
+        order = np.argsort(targets, kind='stable')
+        targets = targets[order]
+        cells, starts, counts = np.unique(targets, return_index=True, return_counts=True)
+        accumulation[cells] += np.add.reduceat(accumulation[sources[order]] + np.uint32(1), starts)
+        indegree[cells] -= counts.astype(indegree.dtype)
+        wave = cells[indegree[cells] == 0]
+
+    if visited != np.count_nonzero(Valid):
+        raise ValueError('Flow direction grid contains a cycle.')
+    return accumulation, streams
+
+# Flow accumulation (number of upstream cells, as arcpy.sa.FlowAccumulation) with fused stream thresholding
+# Requires: FlowDir=<uint8 D8 direction array>, Threshold=<minimum flow accumulation of a stream cell, or None>
+# Returns: (uint32 flow accumulation, boolean stream array (VALUE >= Threshold), None if Threshold is None)
+def FlowAccumulation(FlowDir, Threshold=None):
+    shape = FlowDir.shape
+    accumulation, streams = AccumulateGraph(DownstreamIndex(FlowDir), (FlowDir != FLOW_NODATA).ravel(), Threshold=Threshold)
+
+    return accumulation.reshape(shape), (streams.reshape(shape) if streams is not None else None)
+
+# Depression filling, D8 flow direction, flow accumulation and stream thresholding
+# Requires: DEM=<2D elevation array>, NoData=<DEM NoData value, NaN for float arrays>, Threshold=<minimum flow accumulation of a stream cell>, Fill=<fill depressions (False leaves sinks, as FlowDirection on an unfilled DEM)>, CellSize=<(x, y) cell size>
+# Returns: (uint8 flow direction, uint32 flow accumulation, boolean streams)
+def FlowRouting(DEM, NoData=None, Threshold=1000, Fill=True, CellSize=(1.0, 1.0)):
+    DEM = np.asarray(DEM)
+    valid = ValidMask(DEM, NoData)
+    flowDir = D8Direction(FillDepressions(DEM, valid) if Fill else DEM, valid, CellSize)
+    flowAcc, streams = FlowAccumulation(flowDir, Threshold)
+
+    return flowDir, flowAcc, streams
+
+# Agreement of the native outputs with the arcpy outputs
+# Requires: FlowDir/FlowAcc/Streams=<native outputs>, ArcFlowDir/ArcFlowAcc/ArcStreams=<arrays of the arcpy outputs on the same grid>, Valid=<boolean array, True for valid cells>
+# Returns: dict of direction agreement, flow accumulation agreement and maximum difference, and stream intersection over union
+def CompareRouting(FlowDir, FlowAcc, Streams, ArcFlowDir, ArcFlowAcc, ArcStreams, Valid):
+    flowAcc = FlowAcc[Valid].astype(np.float64)
+    arcFlowAcc = np.nan_to_num(np.asarray(ArcFlowAcc, dtype=np.float64)[Valid], nan=-1)
+    streams, arcStreams = Streams[Valid], np.asarray(ArcStreams)[Valid]
+    union = np.count_nonzero(streams | arcStreams)
+    return {
+        'cells': int(np.count_nonzero(Valid)),
+        'directionAgreement': float(np.mean(FlowDir[Valid] == np.asarray(ArcFlowDir)[Valid])),
+        'accumulationAgreement': float(np.mean(flowAcc == arcFlowAcc)),
+        'accumulationMaxDifference': float(np.max(np.abs(flowAcc - arcFlowAcc))) if flowAcc.size else 0.0,
+        'streamIoU': float(np.count_nonzero(streams & arcStreams) / union) if union else 1.0,
+    }
+
+# Check the native backend against arcpy (FlowDirection FORCE and FlowAccumulation) on a test DEM
+# Requires: DEM=<test DEM raster>, Threshold=<minimum flow accumulation of a stream cell>, Fill=<fill depressions; arcpy.sa.Fill is applied before FlowDirection so both fill the same depressions>
+# Returns: dict from CompareRouting
+def CompareWithArcpy(DEM, Threshold=1000, Fill=True):
+    import arcpy
+    from Raster_IO import ArcRasterReader, TransformCellSize
+
+    reader = ArcRasterReader(DEM)
+    dem = reader[:, :]
+    valid = ValidMask(dem, reader.noData)
+    flowDir, flowAcc, streams = FlowRouting(dem, reader.noData, Threshold, Fill, TransformCellSize(reader.transform))
+
+    surface = arcpy.sa.Fill(DEM) if Fill else arcpy.Raster(DEM)
+    arcFlowDir = arcpy.sa.FlowDirection(surface, force_flow='FORCE', flow_direction_type='D8')
+    arcFlowAcc = arcpy.sa.FlowAccumulation(arcFlowDir, flow_direction_type='D8')
+    arcDir = ArcRasterReader(arcFlowDir, NoData=FLOW_NODATA)[:, :]
+    arcAcc = ArcRasterReader(arcFlowAcc)[:, :]
+    report = CompareRouting(flowDir, flowAcc, streams, arcDir, arcAcc, arcAcc >= Threshold, valid)
+    print('\tNative vs. arcpy flow routing:')
+    print('\n'.join(f'\t\t{name}: {value}' for name, value in report.items()))
+
+    return report
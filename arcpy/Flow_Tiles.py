@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Flow Tiles
+Objective:  Tile-parallel flow accumulation with boundary stitching for DEMs larger than memory (NumPy, no arcpy) as a part of ATUR Suitability Analysis
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from Block_Processing import IterBlocks
+from Flow_Routing import AccumulateGraph, DownstreamIndex, FLOW_NODATA
+
+"""
+The flow direction grid is a .npy file opened as a memory map, and flow accumulation (and streams) are written to .npy memory maps, so each worker only holds one tile.
+    1. Each tile (with a 1 cell halo, to know where flow leaving the tile goes) is accumulated on its own, ignoring inflow from other tiles, and written to the output.
+       Exit cells (cells draining into another tile) are returned with their local accumulation, and every cell on the tile perimeter is linked, by pointer jumping along the flow path, to the exit cell its flow leaves the tile from.
+    2. The boundary graph, exit cell -> exit cell its flow leaves the next tile from, is accumulated in topological order (Flow_Routing.AccumulateGraph), giving the final accumulation of every exit cell and so the inflow to every tile.
+    3. Tiles receiving inflow are accumulated again, seeded with their inflow; every other tile is already final.
+Flow accumulation is an integer count and inflow only adds along flow paths, so the result is exactly equal to the single-pass Flow_Routing.FlowAccumulation. Memory is bounded by the tile size (plus the boundary graph, a few cells per tile perimeter).
+"""
+
+# Flow accumulation written for NoData cells (unsigned, so 0 remains a valid accumulation)
+ACCUMULATION_NODATA = np.iinfo(np.uint32).max
+# Default tile size (rows, cols). A 4096 x 4096 tile is 16 MB of directions and a few hundred MB of working arrays.
+TILE_SIZE = (4096, 4096)
+
+# Flow graph of one tile
+# Returns: (direction block, global index of each cell, global index of each downstream cell (-1 for none), downstream index within the tile (-1 for none or outside the tile))
+def _TileGraph(FlowDir, Window):
+    rows, cols = FlowDir.shape
+    rowSlice, colSlice = Window
+    r0, r1, c0, c1 = rowSlice.start, rowSlice.stop, colSlice.start, colSlice.stop
+    # 1 cell halo, clipped to the grid, so flow into NoData or off the grid ends at the tile edge as it does in the whole grid
+    hr0, hr1, hc0, hc1 = max(r0 - 1, 0), min(r1 + 1, rows), max(c0 - 1, 0), min(c1 + 1, cols)
+    halo = np.asarray(FlowDir[hr0:hr1, hc0:hc1])
+    down = DownstreamIndex(halo).astype(np.int64)
+    haloRows, haloCols = np.divmod(down, hc1 - hc0)
+    globalDown = np.where(down >= 0, (haloRows + hr0) * cols + haloCols + hc0, -1).reshape(halo.shape)
+
+    height, width = r1 - r0, c1 - c0
+    block = halo[r0 - hr0:r0 - hr0 + height, c0 - hc0:c0 - hc0 + width]
+    globalDown = globalDown[r0 - hr0:r0 - hr0 + height, c0 - hc0:c0 - hc0 + width].ravel()
+    cells = ((np.arange(r0, r1, dtype=np.int64) * cols)[:, None] + np.arange(c0, c1, dtype=np.int64)).ravel()
+    targetRows, targetCols = np.divmod(globalDown, cols)
+    targetRows, targetCols = targetRows - r0, targetCols - c0
+    inside = (globalDown >= 0) & (targetRows >= 0) & (targetRows < height) & (targetCols >= 0) & (targetCols < width)
+    localDown = np.where(inside, targetRows * width + targetCols, -1)
+
+    return block, cells, globalDown, localDown
+
+# Write a tile of accumulation and streams to the output memory maps
+def _WriteTile(Output, Streams, Window, Accumulation, StreamCells, Valid, Shape):
+    out = np.load(Output, mmap_mode='r+')
+    out[Window] = np.where(Valid, Accumulation, ACCUMULATION_NODATA).reshape(Shape)
+    out.flush()
+    if Streams is not None:
+        streams = np.load(Streams, mmap_mode='r+')
+        streams[Window] = StreamCells.reshape(Shape)
+        streams.flush()
+
+# Worker, pass 1: accumulate a tile without inflow, link its perimeter to its exit cells
+def _LocalTile(FlowDirPath, Output, Streams, Window, Threshold):
+    flowDir = np.load(FlowDirPath, mmap_mode='r')
+    block, cells, globalDown, localDown = _TileGraph(flowDir, Window)
+    valid = (block != FLOW_NODATA).ravel()
+    accumulation, streams = AccumulateGraph(localDown, valid, Threshold=Threshold)
+    _WriteTile(Output, Streams, Window, accumulation, streams, valid, block.shape)
+
+    # Exit cells drain into a valid cell of another tile
+    exits = (globalDown >= 0) & (localDown < 0)
+    # Pointer jumping, the last cell of the flow path of every cell within the tile
+    terminal = np.where(localDown >= 0, localDown, np.arange(localDown.size))
+    while True:
+        jumped = terminal[terminal]
+        if np.array_equal(jumped, terminal):
+            break
+        terminal = jumped
+    perimeter = np.zeros(block.shape, dtype=bool)
+    perimeter[[0, -1], :] = True
+    perimeter[:, [0, -1]] = True
+    perimeter = np.flatnonzero(perimeter.ravel() & valid)
+    perimeterExit = np.where(exits[terminal[perimeter]], cells[terminal[perimeter]], -1)
+
+    return {'exitCells': cells[exits], 'exitDown': globalDown[exits], 'exitAccumulation': accumulation[exits],
+            'perimeterCells': cells[perimeter], 'perimeterExit': perimeterExit}
+
+# Worker, pass 3: accumulate a tile again, seeded with its inflow from other tiles
+def _CorrectTile(FlowDirPath, Output, Streams, Window, Threshold, Entries, Inflow):
+    flowDir = np.load(FlowDirPath, mmap_mode='r')
+    block, cells, globalDown, localDown = _TileGraph(flowDir, Window)
+    valid = (block != FLOW_NODATA).ravel()
+    rows, cols = np.divmod(Entries, flowDir.shape[1])
+    initial = np.zeros(localDown.size, dtype=np.uint32)
+    initial[(rows - Window[0].start) * block.shape[1] + cols - Window[1].start] = Inflow
+    accumulation, streams = AccumulateGraph(localDown, valid, initial, Threshold)
+    _WriteTile(Output, Streams, Window, accumulation, streams, valid, block.shape)
+
+# Final accumulation of the exit cells of all tiles, from the boundary graph
+# Returns: (entry cells receiving inflow, inflow of each entry cell)
+def ResolveBoundaries(Links):
+    exitCells = np.concatenate([link['exitCells'] for link in Links])
+    exitDown = np.concatenate([link['exitDown'] for link in Links])
+    exitAccumulation = np.concatenate([link['exitAccumulation'] for link in Links])
+    perimeterCells = np.concatenate([link['perimeterCells'] for link in Links])
+    perimeterExit = np.concatenate([link['perimeterExit'] for link in Links])
+    if not exitCells.size:
+        return exitCells, exitAccumulation
+
+    # Boundary graph, exit cell -> exit cell its flow leaves the next tile from (-1 where the flow path ends within the next tile)
+    order = np.argsort(exitCells)
+    exitCells, exitDown, exitAccumulation = exitCells[order], exitDown[order], exitAccumulation[order]
+    order = np.argsort(perimeterCells)
+    perimeterCells, perimeterExit = perimeterCells[order], perimeterExit[order]
+    nextExit = perimeterExit[np.searchsorted(perimeterCells, exitDown)]
+    down = np.where(nextExit >= 0, np.searchsorted(exitCells, nextExit), -1)
+    final, _ = AccumulateGraph(down, np.ones(exitCells.size, dtype=bool), exitAccumulation)
+
+    # Inflow of each entry cell, sum of (accumulation + 1) of the exit cells draining into it
+    order = np.argsort(exitDown, kind='stable')
+    entries, starts = np.unique(exitDown[order], return_index=True)
+    inflow = np.add.reduceat(final[order] + np.uint32(1), starts)
+    return entries, inflow
+
+# Tiled flow accumulation
+# Requires: FlowDir=<.npy file of the uint8 D8 direction grid (Flow_Routing.py codes, FLOW_NODATA outside the DEM)>, Output=<output .npy file of uint32 flow accumulation, ACCUMULATION_NODATA outside the DEM>, Streams=<optional output .npy file of uint8 streams (1 where VALUE >= Threshold)>, Threshold=<minimum flow accumulation of a stream cell>, TileSize=<(rows, cols) tile size>, Workers=<max worker processes (1 runs every tile in this process)>
+# Returns: (flow accumulation memory map, streams memory map or None)
+def TiledFlowAccumulation(FlowDir, Output, Streams=None, Threshold=None, TileSize=TILE_SIZE, Workers=None):
+    shape = np.load(FlowDir, mmap_mode='r').shape
+    np.lib.format.open_memmap(Output, mode='w+', dtype=np.uint32, shape=shape).flush()
+    if Streams is not None:
+        np.lib.format.open_memmap(Streams, mode='w+', dtype=np.uint8, shape=shape).flush()
+    threshold = Threshold if Streams is not None else None
+    windows = list(IterBlocks(shape, TileSize))
+    Workers = Workers or min(len(windows), os.cpu_count() or 1)
+    print(f'\tTiled Flow Accumulation ({len(windows)} tiles, {Workers} workers)...')
+
+    pool = ProcessPoolExecutor(max_workers=Workers, mp_context=multiprocessing.get_context('spawn')) if Workers > 1 else None
+    try:
+        run = pool.map if pool is not None else map
+        # Pass 1, tiles without inflow
+        links = list(run(_LocalTile, *zip(*[(FlowDir, Output, Streams, window, threshold) for window in windows])))
+
+        # Pass 2, boundary graph
+        entries, inflow = ResolveBoundaries(links)
+
+        # Pass 3, tiles receiving inflow
+        tileRows, tileCols = np.divmod(entries, shape[1])
+        tiles = (tileRows // TileSize[0]) * ((shape[1] + TileSize[1] - 1) // TileSize[1]) + tileCols // TileSize[1]
+        jobs = []
+        for tile in np.unique(tiles):
+            inTile = tiles == tile
+            jobs.append((FlowDir, Output, Streams, windows[tile], threshold, entries[inTile], inflow[inTile]))
+        print(f'\t\t{len(jobs)} of {len(windows)} tiles receive inflow from {entries.size} boundary cells.')
+        if jobs:
+            list(run(_CorrectTile, *zip(*jobs)))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    return np.load(Output, mmap_mode='r'), (np.load(Streams, mmap_mode='r') if Streams is not None else None)
+
+# Copy a raster to a .npy file window by window (e.g. an arcpy flow direction raster for TiledFlowAccumulation)
+# Requires: Source=<raster source, see Block_Processing.py>, Output=<output .npy file>, NoData=<source NoData value>, OutNoData=<value written for NoData cells>
+def SourceToNpy(Source, Output, DType=np.uint8, NoData=None, OutNoData=FLOW_NODATA, BlockSize=TILE_SIZE):
+    out = np.lib.format.open_memmap(Output, mode='w+', dtype=DType, shape=tuple(Source.shape[:2]))
+    for window in IterBlocks(out.shape, BlockSize):
+        block = np.asarray(Source[window])
+        out[window] = block if NoData is None else np.where(block == NoData, OutNoData, block)
+    out.flush()
+
+    return Output
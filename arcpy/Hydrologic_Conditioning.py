@@ -12,38 +12,102 @@ import arcpy
 from arcpy.sa import *
 from sys import argv
 
+from Instrumentation import Traced
+
 # Special characters for improved readability of geoprocessing messages
 nl = '\n'  # var can be used in f-strings to represent newline character
 tb = '\t'  # var can be used in f-strings to represent tab character
 
-def HydrologicConditioning(DEM, FlowDir, FlowAcc, StreamsRast, StreamsFeat):  # Hydrologic_Conditioning
+# Threshold=<minimum flow accumulation (cells) of a stream cell>, StreamsFeat=None skips stream features
+# Fill=True fills depressions before flow direction (arcpy.sa.Fill, or Flow_Routing.FillDepressions), Fill=False routes flow over the DEM as is (sinks end their flow paths)
+# Fill=None (default) fills with the numpy and tiled backends only, the arcpy backend runs FlowDirection on the unfilled DEM as before
+# Backend='numpy' fills depressions, routes flow and (with shapely and pyogrio installed) extracts stream features natively, refer to Flow_Routing.py and Stream_Vectors.py for details
+# Backend='tiled' accumulates the arcpy flow direction tile by tile (DEMs larger than memory), refer to Flow_Tiles.py for details
+@Traced(Tags=('Backend',))
+def HydrologicConditioning(DEM, FlowDir, FlowAcc, StreamsRast, StreamsFeat, Threshold=1000, Backend='arcpy', TileSize=None, Workers=None, Fill=None):  # Hydrologic_Conditioning
+
+    # Processing environment, scoped to this function (the global arcpy.env is left unchanged).
+    # To allow overwriting outputs overwriteOutput option is True.
+    with arcpy.EnvManager(overwriteOutput=True):
+
+        if Fill is None:
+            Fill = Backend in ('numpy', 'tiled')
+
+        if Backend == 'numpy':
+            import numpy as np
+            from Flow_Routing import FlowRouting, FLOW_NODATA
+            from Raster_IO import ArcRasterReader, TransformCellSize
+            from Raster_Store import SaveRaster
+
+            # Process: Fill, Flow Direction, Flow Accumulation and Con in a single native pass, refer to Flow_Routing.py for details
+            print(f'\t{"Filling Depressions, " if Fill else ""}Flow Direction, Flow Accumulation and Thresholding Streams (NumPy)...')
+            # Read the DEM within the processing mask
+            dem = arcpy.sa.ExtractByMask(DEM, arcpy.env.mask) if arcpy.env.mask else arcpy.Raster(DEM)
+            reader = ArcRasterReader(dem)
+            flowDir, flowAcc, streams = FlowRouting(reader[:, :], reader.noData, Threshold, Fill, CellSize=TransformCellSize(reader.transform))
+            valid = flowDir != FLOW_NODATA
+            outFlowDir = SaveRaster(flowDir, reader.transform, FlowDir, NoData=FLOW_NODATA, SpatialReference=reader.spatialReference)
+            SaveRaster(np.where(valid, flowAcc, np.nan).astype(np.float32), reader.transform, FlowAcc, SpatialReference=reader.spatialReference)
+            outStreamsRast = SaveRaster(streams.astype(np.uint8), reader.transform, StreamsRast, NoData=0, SpatialReference=reader.spatialReference)
+        elif Backend == 'tiled':
+            import os
+            from Flow_Routing import FLOW_NODATA
+            from Flow_Tiles import TiledFlowAccumulation, SourceToNpy, ACCUMULATION_NODATA, TILE_SIZE
+            from Raster_IO import ArcRasterReader, SaveArcRasterBlocks
+
+            # Process: Fill (Fill) (sa) and Flow Direction (Flow Direction) (sa)
+            print(f'\t{"Filling Depressions, " if Fill else ""}Flow Direction...')
+            outFlowDir = arcpy.sa.FlowDirection(arcpy.sa.Fill(DEM) if Fill else DEM, force_flow='FORCE', flow_direction_type='D8')
+            print(f'\t\t{arcpy.GetMessages().replace(nl, nl+tb+tb)}')
+            outFlowDir.save(FlowDir)
 
-    # To allow overwriting outputs change overwriteOutput option to True.
-    arcpy.env.overwriteOutput = True
+            # Process: Flow Accumulation and Con, tile by tile through .npy memory maps in the scratch folder
+            TileSize = TileSize or TILE_SIZE
+            reader = ArcRasterReader(FlowDir, NoData=FLOW_NODATA)
+            scratch = arcpy.env.scratchFolder
+            flowDirNpy = SourceToNpy(reader, os.path.join(scratch, 'Flow_Direction.npy'), BlockSize=TileSize)
+            flowAcc, streams = TiledFlowAccumulation(flowDirNpy, os.path.join(scratch, 'Flow_Accumulation.npy'), os.path.join(scratch, 'Streams_Raster.npy'),
+                                                     Threshold, TileSize, Workers)
+            SaveArcRasterBlocks(flowAcc, reader.transform, FlowAcc, NoData=ACCUMULATION_NODATA, SpatialReference=reader.spatialReference, BlockSize=TileSize)
+            outStreamsRast = SaveArcRasterBlocks(streams, reader.transform, StreamsRast, NoData=0, SpatialReference=reader.spatialReference, BlockSize=TileSize)
+            del flowAcc, streams
+        else:
+            # Process: Fill (Fill) (sa) and Flow Direction (Flow Direction) (sa)
+            print(f'\t{"Filling Depressions, " if Fill else ""}Flow Direction...')
+            outFlowDir = arcpy.sa.FlowDirection(arcpy.sa.Fill(DEM) if Fill else DEM, force_flow='FORCE', flow_direction_type='D8')
+            print(f'\t\t{arcpy.GetMessages().replace(nl, nl+tb+tb)}')
+            outFlowDir.save(FlowDir)
 
-    # Process: Flow Direction (Flow Direction) (sa)
-    print('\tFlow Direction...')
-    outFlowDir = arcpy.sa.FlowDirection(DEM, force_flow='FORCE', flow_direction_type='D8')
-    print(f'\t\t{arcpy.GetMessages().replace(nl, nl+tb+tb)}')
-    outFlowDir.save(FlowDir)
 
+            # Process: Flow Accumulation (Flow Accumulation) (sa)
+            print('\tFlow Accumulation...')
+            outFlowAcc = arcpy.sa.FlowAccumulation(outFlowDir, flow_direction_type='D8')
+            print(f'\t\t{arcpy.GetMessages().replace(nl, nl+tb+tb)}')
+            outFlowAcc.save(FlowAcc)
 
-    # Process: Flow Accumulation (Flow Accumulation) (sa)
-    print('\tFlow Accumulation...')
-    outFlowAcc = arcpy.sa.FlowAccumulation(outFlowDir, flow_direction_type='D8')
-    print(f'\t\t{arcpy.GetMessages().replace(nl, nl+tb+tb)}')
-    outFlowAcc.save(FlowAcc)
+            # Process: Con (Con) (sa)
+            print('\tThresholding Streams...')
+            outStreamsRast = Con(outFlowAcc, in_true_raster_or_constant=1, in_false_raster_or_constant='', where_clause=f"VALUE >= {Threshold}")
+            print(f'\t\t{arcpy.GetMessages().replace(nl, nl+tb+tb)}')
+            outStreamsRast.save(StreamsRast)
 
-    # Process: Con (Con) (sa)
-    print('\tThresholding Streams...')
-    outStreamsRast = Con(outFlowAcc, in_true_raster_or_constant=1, in_false_raster_or_constant='', where_clause="VALUE >= 1000")
-    print(f'\t\t{arcpy.GetMessages().replace(nl, nl+tb+tb)}')
-    outStreamsRast.save(StreamsRast)
 
+        # Stream features are optional (StreamsFeat=None), e.g. when drainage density is computed from the stream raster
+        if StreamsFeat is None:
+            return outStreamsRast
 
-    # Process: Stream to Feature (Stream to Feature) (sa)
-    print('\tStreams (Raster) to Features...')
-    outStreamsFeat = arcpy.sa.StreamToFeature(outStreamsRast, outFlowDir, StreamsFeat, "SIMPLIFY")
-    print(f'\t\t{arcpy.GetMessages().replace(nl, nl+tb+tb)}')
+        # Process: Stream to Feature (Stream to Feature) (sa)
+        import Stream_Vectors
+        if Backend == 'numpy' and Stream_Vectors.shapely is not None and Stream_Vectors.pyogrio is not None:
+            # Native stream links, simplified with the SIMPLIFY tolerance of StreamToFeature (sqrt(0.5) * cell size), refer to Stream_Vectors.py for details
+            print('\tStreams (Raster) to Features (NumPy)...')
+            cellSize, _ = TransformCellSize(reader.transform)
+            Stream_Vectors.StreamToFeature(flowDir, streams, reader.transform, StreamsFeat, Tolerance=np.sqrt(0.5) * cellSize,
+                                           CRS=f'EPSG:{reader.spatialReference.factoryCode}')
+            outStreamsFeat = StreamsFeat
+        else:
+            print('\tStreams (Raster) to Features...')
+            outStreamsFeat = arcpy.sa.StreamToFeature(outStreamsRast, outFlowDir, StreamsFeat, "SIMPLIFY")
+            print(f'\t\t{arcpy.GetMessages().replace(nl, nl+tb+tb)}')
 
-    return outStreamsFeat
+        return outStreamsFeat
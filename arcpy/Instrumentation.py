@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Instrumentation
+Objective:  Structured per-stage trace events (JSON lines) and a critical-path/hotspot report, as a part of ATUR Suitability Analysis
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import os
+import sys
+import json
+import functools
+import itertools
+import threading
+from time import time, perf_counter, process_time
+
+# Peak resident memory (psutil where the resource module is not available, i.e. Windows)
+try:
+    import resource
+except ImportError:
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+"""
+The stage scripts report progress as printed geoprocessing messages, which say nothing about where the time and I/O of a long batch run go.
+With tracing enabled (FLOODMAR_TRACE=<path of a .jsonl file>, or Enable(path)), every traced call appends one JSON line to the trace file when it returns:
+    - id and parent id (the traced call it ran within, across Stage_Graph.py worker processes too), name, tags (e.g. watershed, layer), process id, start and end (epoch s), status
+    - wall and CPU time (s, CPU of the whole process, so threads of the stage are included), peak RSS of the process (MB) and its growth during the call
+    - pixels and bytes read and written through the raster readers and writers (Raster_IO.py, Raster_Store.py), storage bytes read and written by the process (OS counters, where available)
+    - stage and statistics cache hits and misses (Stage_Cache.py, Raster_Statistics.py), and notes recorded with Note(...) during the call (e.g. the stages skipped as cached)
+Counters are process wide: a call's counts include its nested calls, and anything run concurrently in the same process.
+Stage functions are wrapped with @Traced(...), and other sections (e.g. the raster calculator in the suitability scripts) with Span(...). With tracing disabled, a traced call costs a single check, and counters return at once.
+Report: python Instrumentation.py report <trace.jsonl>, critical path and hotspots (self time, i.e. time not spent in nested traced calls) per watershed.
+"""
+
+TRACE_VARIABLE = 'FLOODMAR_TRACE'
+COUNTERS = ('pixelsRead', 'pixelsWritten', 'bytesRead', 'bytesWritten', 'cacheHits', 'cacheMisses')
+TOP = 10
+
+_path = os.environ.get(TRACE_VARIABLE) or None
+_counters = dict.fromkeys(COUNTERS, 0)
+_lock = threading.Lock()
+_ids = itertools.count(1)
+_local = threading.local()
+# Tags of the outermost events of this process
+_tags = {}
+# Events of the running traced calls of this process, by id
+_open = {}
+
+# Enable tracing to a JSON lines file (also for worker processes started afterwards), or disable it
+def Enable(Path):
+    global _path
+    _path = os.path.abspath(Path)
+    os.environ[TRACE_VARIABLE] = _path
+
+def Disable():
+    global _path
+    _path = None
+    os.environ.pop(TRACE_VARIABLE, None)
+
+def Enabled():
+    return _path is not None
+
+# Tags of the outermost events of this process (e.g. the watershed of a suitability script), inherited by nested events
+def SetTags(**Tags):
+    _tags.update(Tags)
+
+# Add to a counter of the running traced calls
+def Count(Name, Value=1):
+    if _path is None:
+        return
+    with _lock:
+        _counters[Name] += Value
+
+# Count the pixels and bytes of a window read or written
+# Requires: Kind=<'Read' or 'Written'>, Window=<(rowSlice, colSlice)>, Shape=<(rows, cols) of the raster>, DType=<numpy dtype of the raster>
+def CountWindow(Kind, Window, Shape, DType):
+    if _path is None:
+        return
+    r0, r1, _ = Window[0].indices(Shape[0])
+    c0, c1, _ = Window[1].indices(Shape[1])
+    pixels = max(r1 - r0, 0) * max(c1 - c0, 0)
+    with _lock:
+        _counters[f'pixels{Kind}'] += pixels
+        _counters[f'bytes{Kind}'] += pixels * DType.itemsize
+
+# Peak RSS of the process so far (MB)
+def _PeakRss():
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024  # bytes on macOS, KB on Linux
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / 1024 ** 2
+    return None
+
+# Storage bytes (read, written) of the process so far
+def _StorageIO():
+    try:
+        with open('/proc/self/io') as file:
+            fields = dict(line.split(': ') for line in file.read().splitlines())
+        return int(fields['read_bytes']), int(fields['write_bytes'])
+    except (OSError, KeyError, ValueError):
+        pass
+    if psutil is not None:
+        try:
+            io = psutil.Process().io_counters()
+            return io.read_bytes, io.write_bytes
+        except (AttributeError, psutil.Error):
+            pass
+    return None
+
+def _Stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+# (id, tags) of the innermost running traced call of this thread, e.g. to hand to a worker process as the Parent of its spans
+def Context():
+    stack = _Stack()
+    return stack[-1] if stack else None
+
+# Record a value in the notes of the innermost running traced call of this thread (e.g. the stages skipped as cached), a list per name
+# Notes are not tags: nested events do not inherit them, and no event is written for them
+def Note(Name, Value):
+    if _path is None:
+        return
+    context = Context()
+    event = _open.get(context[0]) if context is not None else None
+    if event is not None:
+        with _lock:
+            event.setdefault('notes', {}).setdefault(Name, []).append(Value)
+
+def _Write(Event):
+    line = json.dumps(Event, default=str) + '\n'
+    with _lock:
+        with open(_path, 'a') as file:
+            file.write(line)
+
+# A traced section, as a context manager
+# Requires: Name=<event name>, Parent=<optional Context() of the calling process, for spans started in a worker process>, Tags=<event tags (e.g. watershed='SanPedro', layer='DEM'), inherited by nested events>
+class Span:
+
+    def __init__(self, Name, Parent=None, /, **Tags):
+        self.name = Name
+        self.parent = Parent
+        self.tags = Tags
+        self.event = None
+
+    def __enter__(self):
+        if _path is None:
+            return self
+        parent, tags = Context() or self.parent or (None, _tags)
+        self.id = f'{os.getpid()}-{next(_ids)}'
+        self.event = {'id': self.id, 'parent': parent, 'name': self.name, 'tags': {**tags, **self.tags}, 'pid': os.getpid()}
+        _Stack().append((self.id, self.event['tags']))
+        _open[self.id] = self.event
+        with _lock:
+            self._counters = dict(_counters)
+        self._io = _StorageIO()
+        self._peak = _PeakRss()
+        self._cpu = process_time()
+        self._wall = perf_counter()
+        self.event['start'] = time()
+        return self
+
+    def __exit__(self, excType, exc, traceback):
+        if self.event is None:
+            return False
+        wall = perf_counter() - self._wall
+        event = self.event
+        event.update({'end': event['start'] + wall, 'wall': wall, 'cpu': process_time() - self._cpu, 'status': 'ok' if excType is None else 'error'})
+        if excType is not None:
+            event['error'] = f'{excType.__name__}: {exc}'
+        peak = _PeakRss()
+        event['peakRssMB'] = peak
+        event['rssGrowthMB'] = peak - self._peak if peak is not None else None
+        with _lock:
+            event.update({name: _counters[name] - self._counters[name] for name in COUNTERS})
+        io = _StorageIO()
+        event['storageRead'], event['storageWritten'] = (io[0] - self._io[0], io[1] - self._io[1]) if io is not None and self._io is not None else (None, None)
+        _Stack().pop()
+        _open.pop(self.id, None)
+        _Write(event)
+        return False
+
+# Trace every call of a function
+# Requires: Name=<event name, default the function name>, Tags=<names of arguments recorded as tags, e.g. ('LayerName', 'Backend'), or dict of tag name: argument name>
+def Traced(Name=None, Tags=()):
+
+    def Decorator(Function):
+        name = Name or Function.__name__
+        arguments = dict(Tags) if isinstance(Tags, dict) else {tag: tag for tag in Tags}
+        signature = None
+
+        @functools.wraps(Function)
+        def Wrapper(*args, **kwargs):
+            nonlocal signature
+            if _path is None:
+                return Function(*args, **kwargs)
+            tags = {}
+            if arguments:
+                import inspect
+                signature = signature or inspect.signature(Function)
+                bound = signature.bind_partial(*args, **kwargs)
+                bound.apply_defaults()
+                tags = {tag: bound.arguments[argument] for tag, argument in arguments.items() if argument in bound.arguments}
+            with Span(name, **tags):
+                return Function(*args, **kwargs)
+
+        return Wrapper
+
+    return Decorator
+
+# Report ----------------
+# Read a trace file
+# Returns: list of event dicts
+def ReadTrace(Path):
+    events = []
+    with open(Path) as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                events.append(json.loads(line))
+    return events
+
+# Chain of the children of an event ending last: the child ending last, then the child ending last before it started, and so on
+def CriticalPath(Children, Tolerance=1e-3):
+    path = []
+    limit = float('inf')
+    for event in sorted(Children, key=lambda e: e['end'], reverse=True):
+        if event['end'] <= limit + Tolerance:
+            path.append(event)
+            limit = event['start']
+    return path[::-1]
+
+# Per event name totals of a set of events: calls, wall, self wall (outside nested traced calls), CPU, counters and the largest peak RSS
+def Hotspots(Events, Children):
+    totals = {}
+    for event in Events:
+        total = totals.setdefault(event['name'], {'calls': 0, 'wall': 0.0, 'self': 0.0, 'cpu': 0.0, 'peakRssMB': 0.0, **dict.fromkeys(COUNTERS, 0)})
+        total['calls'] += 1
+        total['wall'] += event['wall']
+        total['self'] += max(event['wall'] - sum(child['wall'] for child in Children.get(event['id'], [])), 0.0)
+        total['cpu'] += event['cpu']
+        total['peakRssMB'] = max(total['peakRssMB'], event.get('peakRssMB') or 0.0)
+        for name in COUNTERS:
+            total[name] += event.get(name) or 0
+    return sorted(totals.items(), key=lambda item: item[1]['self'], reverse=True)
+
+# Readable byte count
+def _Size(Bytes):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if Bytes < 1024 or unit == 'GB':
+            return f'{Bytes:.0f} {unit}' if unit == 'B' else f'{Bytes:.1f} {unit}'
+        Bytes /= 1024
+
+# Print the critical path and hotspots of a trace, per watershed
+def Report(Path, Top=TOP):
+    events = ReadTrace(Path)
+    byId = {event['id']: event for event in events}
+    children = {}
+    for event in events:
+        if event['parent'] in byId:
+            children.setdefault(event['parent'], []).append(event)
+    groups = {}
+    for event in events:
+        groups.setdefault(event['tags'].get('watershed', '(no watershed)'), []).append(event)
+
+    for watershed, group in groups.items():
+        roots = [event for event in group if event['parent'] not in byId]
+        start, end = min(e['start'] for e in group), max(e['end'] for e in group)
+        print(f'{watershed}: {len(group)} events, {end - start:.1f} s')
+
+        # Critical path, from the outermost calls down through their nested calls
+        print(f'\t{"Critical Path:":<56}{"start s":>9}{"wall s":>9}')
+        def PrintPath(Events, Depth):
+            for event in CriticalPath(Events):
+                tags = ', '.join(f'{k}={v}' for k, v in event['tags'].items() if k != 'watershed')
+                label = '  ' * Depth + event['name'] + (f' ({tags})' if tags else '')
+                print(f"\t{label:<56}{event['start'] - start:>9.2f}{event['wall']:>9.2f} s" + (' [error]' if event['status'] != 'ok' else ''))
+                PrintPath(children.get(event['id'], []), Depth + 1)
+        PrintPath(roots, 1)
+        cached = [stage for event in group for stage in event.get('notes', {}).get('cachedStages', [])]
+        if cached:
+            print(f'\tCached stages (skipped): {", ".join(cached)}')
+
+        print(f'\tHotspots (top {Top} by self time):')
+        print(f'\t\t{"name":<32}{"calls":>6}{"self s":>9}{"wall s":>9}{"cpu s":>9}{"Mpix read":>11}{"Mpix written":>14}{"read":>10}{"written":>10}{"cache hit/miss":>16}{"peak MB":>9}')
+        for name, total in Hotspots(group, children)[:Top]:
+            print(f"\t\t{name:<32}{total['calls']:>6}{total['self']:>9.2f}{total['wall']:>9.2f}{total['cpu']:>9.2f}{total['pixelsRead'] / 1e6:>11.1f}{total['pixelsWritten'] / 1e6:>14.1f}"
+                  f"{_Size(total['bytesRead']):>10}{_Size(total['bytesWritten']):>10}{total['cacheHits']:>9}/{total['cacheMisses']:<6}{total['peakRssMB']:>9.0f}")
+
+        errors = [event for event in group if event['status'] != 'ok']
+        for event in errors:
+            print(f"\tError in {event['name']}: {event.get('error')}")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Flood MAR trace tools.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    report = commands.add_parser('report', help='critical path and hotspots of a trace, per watershed')
+    report.add_argument('trace', help='trace file (JSON lines)')
+    report.add_argument('--top', type=int, default=TOP, help='number of hotspots')
+    args = parser.parse_args()
+
+    if args.command == 'report':
+        Report(args.trace, args.top)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Lookup Reclass
+Objective:  Vectorized lookup table reclassification (NumPy, no arcpy) as a part of ATUR Suitability Analysis
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import numpy as np
+
+from Block_Processing import BLOCK_SIZE, IterBlocks, ReadBlock, SourceNoData, ValidMask
+
+"""
+NumPy backend for Classification.DiscreteClassification and Classification.CategoricalClassification.
+Each filtered reclass table is compiled once,
+    - range tables (layer,startValue,endValue,newValue) to sorted breakpoints, looked up with np.searchsorted
+    - categorical tables (layer,oldValue,newValue) to a dense integer LUT indexed by raster VALUE codes
+and rasters are then reclassified block by block with no per-pixel Python.
+Classified outputs are uint8, with NODATA_CLASS marking NoData (including "NODATA" entries and values missing from the table, as missing_values='NODATA' in arcpy).
+"""
+
+NODATA_CLASS = 255  # NoData value for classified (uint8) rasters
+
+# Convert a newValue column to uint8 classes ("NODATA" -> NODATA_CLASS)
+def _ClassValues(Values):
+    return np.array([NODATA_CLASS if str(v).strip().upper() == 'NODATA' else int(v) for v in Values], dtype=np.uint8)
+
+# Compiled range (discrete) classification
+# Like arcpy Reclassify, ranges include their end value, and only the first range includes its start value, so a value on the boundary of two ranges is assigned to the lower range.
+class RangeLUT:
+
+    def __init__(self, Starts, Ends, Values):
+        order = np.argsort(Starts, kind='stable')
+        self.starts = np.asarray(Starts, dtype=np.float64)[order]
+        self.ends = np.asarray(Ends, dtype=np.float64)[order]
+        self.values = np.asarray(Values, dtype=np.uint8)[order]
+        if np.any(self.ends < self.starts) or np.any(self.starts[1:] < self.ends[:-1]):
+            raise ValueError('Reclass ranges must not overlap')
+
+    def __call__(self, Block, NoData=None):
+        block = np.asarray(Block)
+        # Index of the first range with endValue >= value
+        idx = np.searchsorted(self.ends, block, side='left')
+        np.minimum(idx, len(self.ends) - 1, out=idx)
+        inRange = (block <= self.ends[idx]) & ((block > self.starts[idx]) | ((idx == 0) & (block >= self.starts[0])))
+        out = self.values[idx]
+        out[~(inRange & ValidMask(block, NoData))] = NODATA_CLASS
+        return out
+
+# Compiled categorical classification, a dense LUT over the raster's integer VALUE codes
+class CategoricalLUT:
+
+    def __init__(self, Lut, Offset):
+        self.lut = np.asarray(Lut, dtype=np.uint8)
+        self.offset = int(Offset)
+
+    def __call__(self, Block, NoData=None):
+        block = np.asarray(Block)
+        valid = ValidMask(block, NoData)
+        idx = block.astype(np.int64) - self.offset
+        valid &= (idx >= 0) & (idx < len(self.lut))
+        idx[~valid] = 0
+        out = self.lut[idx]
+        out[~valid] = NODATA_CLASS
+        return out
+
+# Compile a range reclass table (i.e. Flooding_ContinuousClassificationSchemas.csv) for a single layer
+# Requires: ReclassTable=<df containing reclassification schema>, LayerName=<used to filter ReclassTable>
+def CompileRangeTable(ReclassTable, LayerName):
+    table = ReclassTable[ReclassTable['layer'] == LayerName]
+    if table.empty:
+        raise ValueError(f'No reclass entries for layer {LayerName}')
+    return RangeLUT(table['startValue'].values, table['endValue'].values, _ClassValues(table['newValue'].values))
+
+# Compile a categorical reclass table (i.e. Flooding_CategoricalClassificationSchemas.csv) for a single layer
+# Requires: ReclassTable=<df containing reclassification schema>, LayerName=<used to filter ReclassTable>, Codes=<dict of raster VALUE code: attribute value (e.g. UNIT_NAME) from the value attribute table, or None if oldValue are the raster values themselves>
+def CompileCategoricalTable(ReclassTable, LayerName, Codes=None):
+    table = ReclassTable[ReclassTable['layer'] == LayerName]
+    if table.empty:
+        raise ValueError(f'No reclass entries for layer {LayerName}')
+    # Attribute value -> class, compared as stripped strings (no quoting required)
+    remap = dict(zip((str(v).strip() for v in table['oldValue'].values), _ClassValues(table['newValue'].values)))
+    if Codes is None:
+        Codes = {int(float(v)): v for v in remap}
+    if not Codes:
+        return CategoricalLUT(np.array([], dtype=np.uint8), 0)
+    codes = np.fromiter(Codes.keys(), dtype=np.int64, count=len(Codes))
+    offset = codes.min()
+    lut = np.full(codes.max() - offset + 1, NODATA_CLASS, dtype=np.uint8)
+    for code, name in Codes.items():
+        newValue = remap.get(str(name).strip())
+        if newValue is not None:
+            lut[code - offset] = newValue
+
+    return CategoricalLUT(lut, offset)
+
+# Reclassify a raster source with a compiled LUT, chunk by chunk
+# Requires: Source=<raster source, see Block_Processing.py>, Lut=<RangeLUT or CategoricalLUT>, Output=<optional preallocated uint8 array-like, or None>
+def ReclassifyBlocks(Source, Lut, Output=None, NoData=None, BlockSize=BLOCK_SIZE):
+    if NoData is None:
+        NoData = SourceNoData(Source)
+    if Output is None:
+        Output = np.empty(Source.shape, dtype=np.uint8)
+    for window in IterBlocks(Source.shape, BlockSize):
+        Output[window] = Lut(ReadBlock(Source, window), NoData)
+
+    return Output
+
+# Reclassify an arcpy raster with a compiled LUT and save the result
+# Requires: Raster=<input raster to classify>, Lut=<RangeLUT or CategoricalLUT>, Output=<output raster>
+def ReclassifyRaster(Raster, Lut, Output):
+    from Raster_IO import ArcRasterReader, SaveArcRaster
+
+    reader = ArcRasterReader(Raster)
+    outArray = ReclassifyBlocks(reader, Lut)
+
+    return SaveArcRaster(outArray, reader.transform, Output, NoData=NODATA_CLASS, SpatialReference=reader.spatialReference)
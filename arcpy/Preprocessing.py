@@ -7,40 +7,111 @@ Date:       1/7/25
 
 Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
 """
+import os
 import arcpy as ap
 from arcpy.sa import *
 from sys import argv
 
+from Instrumentation import Traced
+
 # Special characters for improved readability of geoprocessing messages
 nl = '\n'  # var can be used in f-strings to represent newline character
 tb = '\t'  # var can be used in f-strings to represent tab character
 
+# Stage stores ----------------
+# File geodatabases do not support concurrent writers. With parallel workers each stage writes to its own folder (<workspace>/Stages/<stage>, also its
+# scratch workspace) holding Outputs.gdb, and its outputs are copied into LayerPreprocessing.gdb by the main process when it is done, one stage at a time
+def StageFolder(workspace, name):
+    return os.path.join(workspace, 'Stages', name)
+
+# Create the folder and gdb of a stage (main process, before the stage starts)
+def CreateStageStore(folder):
+    os.makedirs(folder, exist_ok=True)
+    if not ap.Exists(os.path.join(folder, 'Outputs.gdb')):
+        ap.management.CreateFileGDB(folder, 'Outputs.gdb')
+
+# Copy the outputs of a stage (and their sidecar code tables) into the shared gdb and remove the stage folder (main process, after the stage is done)
+def PublishStageOutputs(folder, names, gdb):
+    import shutil
+    from Raster_Store import CopyDataset, DatasetPath
+    from Scanline_Rasterize import CodeTablePath
+
+    with ap.EnvManager(overwriteOutput=True):
+        for name in names:
+            source, output = DatasetPath(os.path.join(folder, 'Outputs.gdb'), name), DatasetPath(gdb, name)
+            if ap.Describe(source).dataType == 'FeatureClass':
+                ap.management.CopyFeatures(source, output)
+            else:
+                CopyDataset(source, output)
+            if os.path.isfile(CodeTablePath(source)):
+                os.replace(CodeTablePath(source), CodeTablePath(output))
+    shutil.rmtree(folder, ignore_errors=True)
+
 # Preprocessing of thematic layers used in ATUR Flood MAR suitability analysis
-def PreprocessLayers(workspace, extentFeat, dem, precipitation, lithology):
-    
-    # Arc Environment Settings
-    ap.env.workspace = workspace  # Set default arcpy workspace
-    ap.env.overwriteOutput = True  # Enable file overwriting
-    ap.env.extent = extentFeat  # Default processing extent
-    ap.env.mask = extentFeat  # Default processing mask
-    ap.env.snapRaster = dem  # Default processing snap raster
-    gdb_name = 'LayerPreprocessing.gdb'
-    gdb = f'{workspace}/{gdb_name}'
+# Stages are cached on their inputs, extent, snap raster, coordinate system and parameters; only stages whose key changed (or whose outputs are missing) are re-run. Refer to Stage_Cache.py for details
+# backend='numpy' runs the stages with a native backend where one exists (hydrologic conditioning, slope, resampling and rasterization, refer to Flow_Routing.py, Slope_Tiles.py, Bilinear_Resample.py and Scanline_Rasterize.py), backend='tiled' accumulates flow tile by tile (refer to Flow_Tiles.py)
+# With backend='numpy' drainage density is computed from the stream raster (refer to Drainage_Density_Raster.py), streamFeatures=False skips the Stream_Features output it no longer needs
+# fillDepressions=True fills depressions with every backend, False routes flow over the unfilled DEM, None (default) fills with the numpy and tiled backends only, refer to Hydrologic_Conditioning.py
+# Stages are run as a dependency graph, independent stages in parallel worker processes (workers=1 runs them in order in this process). Refer to Stage_Graph.py for details
+# With a file gdb and more than one worker, stages write to their own gdb and the main process copies their outputs into LayerPreprocessing.gdb (refer to StageFolder above)
+# store='zarr' or 'cog' writes the layers to a chunked, compressed store (LayerPreprocessing.zarr, or LayerPreprocessing/<layer>.tif) instead of the file gdb, store='npy' to uncompressed memory mapped arrays (LayerPreprocessing.mmap/<layer>.npy) read without copying by later stages, refer to Raster_Store.py. Requires backend='numpy' and streamFeatures=False (arcpy tools write to gdb or tif only)
+@Traced(Tags=('backend', 'store'))
+def PreprocessLayers(workspace, extentFeat, dem, precipitation, lithology, streamThreshold=1000, searchRadius=1000, workers=None, backend='arcpy', streamFeatures=True, store='gdb', fillDepressions=None):
+    from Raster_Store import StoreLocation, DatasetPath
+
+    if store != 'gdb' and (backend != 'numpy' or streamFeatures):
+        raise ValueError(f"store='{store}' requires backend='numpy' and streamFeatures=False.")
+    gdb = StoreLocation(workspace, 'LayerPreprocessing', store)
 
     # Spatial Reference (sr)
     sr = ap.SpatialReference(32612)  # Spatial reference = WGS 1984 UTM Zone 12N (WKID = 32612)
-    ap.env.outputCoordinateSystem = sr
     # Units = m
 
+    # Arc Environment Settings
+    # Applied to each stage for the duration of the stage only (the global arcpy.env is left unchanged)
+    stageEnv = {
+        'workspace': workspace,  # Default arcpy workspace
+        'overwriteOutput': True,  # Enable file overwriting
+        'extent': extentFeat,  # Default processing extent
+        'mask': extentFeat,  # Default processing mask
+        'snapRaster': dem,  # Default processing snap raster
+        'outputCoordinateSystem': sr.factoryCode,  # Passed as WKID, refer to Stage_Graph.py
+    }
+
     # Check workspace for geodatabase (gdb)
     if ap.Exists(gdb):
         print('Preprocessing GDB Exists.')
-    else:
+    elif store == 'gdb':
         print('No Preprocessing GDB. Initializing LayerPreprocessing GDB in WS.')
         # Create an ESRI file gdb
         # out_folder_path = out_path, out_name = "FloodMAR.gdb"
-        out_gdb = ap.management.CreateFileGDB(workspace, gdb_name)
+        out_gdb = ap.management.CreateFileGDB(workspace, os.path.basename(gdb))
+    else:
+        print(f'No Preprocessing store. Initializing {os.path.basename(gdb)} in WS.')
+        os.makedirs(gdb, exist_ok=True)
+
+    # Stage cache
+    from Stage_Cache import StageCache
+    cache = StageCache(workspace, Exists=ap.Exists if store == 'gdb' else os.path.exists)
+    # Settings shared by all stages (processing extent geometry, snap raster and coordinate system)
+    extentKey = cache.Key('Extent', Inputs=[extentFeat])
+    snapKey = cache.Key('SnapRaster', Inputs=[dem])
+    env = {'crs': sr.factoryCode}
 
+    # Stage graph
+    from functools import partial
+    from Stage_Graph import Stage, RunGraph
+    stages = []
+
+    # Store a stage writes to, its environment and its Setup/Publish callables (the shared store when stages run one at a time or the store supports concurrent writers)
+    staged = store == 'gdb' and (workers or os.cpu_count() or 1) > 1
+
+    def StageOptions(name, outputs):
+        if not staged:
+            return gdb, {'Env': stageEnv}
+        folder = StageFolder(workspace, name)
+        return os.path.join(folder, 'Outputs.gdb'), {'Env': dict(stageEnv, scratchWorkspace=folder), 'Setup': partial(CreateStageStore, folder),
+                                                     'Publish': partial(PublishStageOutputs, folder, outputs, gdb)}
         
     # PREPROCESSING -------------------
     # Hydrologic Conditioning and Streams ------------
@@ -50,18 +121,26 @@ def PreprocessLayers(workspace, extentFeat, dem, precipitation, lithology):
 
     # Condition DEM
     # Requires: DEM=<input DEM>, FlowDir=<intermediate output>, FlowAcc=<intermediate output>, StreamsRast=<intermediate output>, StreamsFeat=<output stream features polyline>
-    print('Hydrologically Conditioning DEM...')
-    streams = HydrologicConditioning(dem, f'{gdb}/Flow_Direction', f'{gdb}/Flow_Accumulation', f'{gdb}/Streams_Raster', f'{gdb}/Stream_Features')
+    streams = DatasetPath(gdb, 'Stream_Features') if streamFeatures or backend != 'numpy' else None
+    hydroNames = ['Flow_Direction', 'Flow_Accumulation', 'Streams_Raster'] + (['Stream_Features'] if streams is not None else [])
+    hydroGdb, hydroOptions = StageOptions('HydrologicConditioning', hydroNames)
+    hydroOutputs = [DatasetPath(hydroGdb, name) for name in hydroNames[:3]] + [DatasetPath(hydroGdb, 'Stream_Features') if streams is not None else None]
+    hydroKey = cache.Key('HydrologicConditioning', Inputs=[dem], Depends=[extentKey, snapKey], Params=dict(env, threshold=streamThreshold, backend=backend, features=streams is not None, fill=fillDepressions))
+    stages.append(Stage('HydrologicConditioning', HydrologicConditioning, [dem, *hydroOutputs], {'Threshold': streamThreshold, 'Backend': backend, 'Fill': fillDepressions},
+                        Key=hydroKey, Outputs=[DatasetPath(gdb, name) for name in hydroNames], **hydroOptions))
 
     # Drainage Density -------------
     # Refer to Drainage_Density.py for details
     # Import drainage density function from external script
     from Drainage_Density import DrainageDensity
 
-    # Calculate drainage density
+    # Calculate drainage density (depends on the stream features, or the flow direction and stream rasters with backend='numpy')
     # Requires: Streams=<input stream features>, Drain_Density=<output drainage density raster>, Snap_Raster=<raster to match extent and resolution>, Mask_Geom=<feature to define mask>
-    print('Calculating Drainage Density...')
-    drainage = DrainageDensity(streams, f'{gdb}/Drainage_Density', dem, Mask_Geom=extentFeat)
+    drainageKey = cache.Key('DrainageDensity', Depends=[hydroKey, extentKey, snapKey], Params=dict(env, radius=searchRadius, backend=backend))
+    drainageBackend = {'Backend': 'numpy', 'FlowDir': DatasetPath(gdb, 'Flow_Direction'), 'StreamsRast': DatasetPath(gdb, 'Streams_Raster')} if backend == 'numpy' else {}
+    drainageGdb, drainageOptions = StageOptions('DrainageDensity', ['Drainage_Density'])
+    stages.append(Stage('DrainageDensity', DrainageDensity, [streams, DatasetPath(drainageGdb, 'Drainage_Density'), dem], {'Mask_Geom': extentFeat, 'Search_Radius': searchRadius, **drainageBackend},
+                        Depends=['HydrologicConditioning'], Key=drainageKey, Outputs=[DatasetPath(gdb, 'Drainage_Density')], **drainageOptions))
 
     # Slope ----------------
     # Refer to Slope.py for details
@@ -70,8 +149,10 @@ def PreprocessLayers(workspace, extentFeat, dem, precipitation, lithology):
 
     # Calculate Slope
     # Requires: DEM=<input DEM>, Slope=<output slope raster>
-    print('Calculating Slope...')
-    slope = CalcSlope(dem, f'{gdb}/Slope', dem, Mask_Geom=extentFeat)
+    slopeKey = cache.Key('CalcSlope', Inputs=[dem], Depends=[extentKey, snapKey], Params=dict(env, backend=backend))
+    slopeGdb, slopeOptions = StageOptions('CalcSlope', ['Slope'])
+    stages.append(Stage('CalcSlope', CalcSlope, [dem, DatasetPath(slopeGdb, 'Slope'), dem], {'Mask_Geom': extentFeat, 'Backend': 'numpy' if backend == 'numpy' else 'arcpy'},
+                        Key=slopeKey, Outputs=[DatasetPath(gdb, 'Slope')], **slopeOptions))
 
     # Precipitation Preprocessing --------------
     # Refer to Resample_Raster.py for details
@@ -80,8 +161,10 @@ def PreprocessLayers(workspace, extentFeat, dem, precipitation, lithology):
 
     # Resample precipitation data
     # Requires: Raster=<input raster data>, Output=<output raster>, Snap_Raster=<raster to match extent and resolution>
-    print('Precipitation Preprocessing...')
-    precip = ResampleRaster(precipitation, f'{gdb}/Precipitation', dem, extentFeat)
+    precipKey = cache.Key('ResampleRaster', Inputs=[precipitation], Depends=[extentKey, snapKey], Params=dict(env, method='BILINEAR', backend=backend))
+    precipGdb, precipOptions = StageOptions('ResampleRaster', ['Precipitation'])
+    stages.append(Stage('ResampleRaster', ResampleRaster, [precipitation, DatasetPath(precipGdb, 'Precipitation'), dem, extentFeat], {'Backend': 'numpy' if backend == 'numpy' else 'arcpy'},
+                        Key=precipKey, Outputs=[DatasetPath(gdb, 'Precipitation')], **precipOptions))
 
     # Lithology Preprocessing --------------
     # Refer to Feat_to_Rast.py for details
@@ -90,5 +173,17 @@ def PreprocessLayers(workspace, extentFeat, dem, precipitation, lithology):
 
     # Convert lithology feature data to raster
     # Requires: Feat=<input feature layer>, Value_Field=<field corresponding to raster values>, Output=<output raster>, Snap_Raster=<raster to match extent and resolution>
-    print('Lithology Preprocessing...')
-    litho = FeatToRast(lithology, "UNIT_NAME", f'{gdb}/Lithology', dem, extentFeat) 
+    lithoKey = cache.Key('FeatToRast', Inputs=[lithology], Depends=[extentKey, snapKey], Params=dict(env, field='UNIT_NAME', backend=backend))
+    lithoOutputs = [DatasetPath(gdb, 'Lithology')]
+    if backend == 'numpy':
+        # UNIT_NAME codes are written to a sidecar code table, refer to Scanline_Rasterize.py
+        from Scanline_Rasterize import CodeTablePath
+        lithoOutputs.append(CodeTablePath(DatasetPath(gdb, 'Lithology')))
+    lithoGdb, lithoOptions = StageOptions('FeatToRast', ['Lithology'])
+    stages.append(Stage('FeatToRast', FeatToRast, [lithology, "UNIT_NAME", DatasetPath(lithoGdb, 'Lithology'), dem, extentFeat], {'Backend': 'numpy' if backend == 'numpy' else 'arcpy'},
+                        Key=lithoKey, Outputs=lithoOutputs, **lithoOptions))
+
+    # Run stages
+    # Hydrologic conditioning -> drainage density is the only dependency, slope, precipitation and lithology run alongside it
+    print('Preprocessing Layers...')
+    return RunGraph(stages, Workers=workers, Cache=cache)
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Raster Expression
+Objective:  Lazy raster expressions (map algebra on raster sources), evaluated block by block in one fused pass, as a part of ATUR Suitability Analysis
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import re
+
+import numpy as np
+
+from Block_Processing import BLOCK_SIZE, MaskedBlocks, ReadBlock, CommonShape, SourceNoData, ValidMask, EMPTY
+
+# Optional, fused evaluation of the expression (NumPy evaluation of the expression tree otherwise)
+try:
+    import numexpr as ne
+except ImportError:
+    ne = None
+
+"""
+Map algebra such as FloodMAR.py,
+    ((flood - floodMin) / (floodMax - floodMin)) * ((recharge - rechargeMin) / (rechargeMax - rechargeMin))
+materializes a temporary raster for every operator. Here the Python operators only build an expression tree over raster sources (Layer) and scalars:
+    floodMar = ((Layer(flood) - floodMin) / (floodMax - floodMin)) * ((Layer(recharge) - rechargeMin) / (rechargeMax - rechargeMin))
+    floodMar.Evaluate(Output)
+    - Fold() evaluates every scalar-only subtree once (e.g. floodMax - floodMin) and drops identities (x * 1, x + 0, x / 1).
+    - Evaluate() compiles the folded tree (Kernel) to a single numexpr expression and evaluates it block by block, so only the blocks of the inputs and of the final result are ever in memory, and only the result is written. Without numexpr the folded tree itself is evaluated with NumPy operators, node by node.
+    - As in map algebra, a NoData cell in any input is NoData in the result.
+    - Layers are cast to DType (float32 by default) and the folded scalars are rounded to DType, so the arithmetic is done in DType, as NumPy does for a float32 array and Python floats.
+Symbol names an in-memory block instead of a raster source, e.g. x of the Tf functions of Rescale_Functions.py, which are built and compiled as expressions of this module.
+WeightedSum builds the weighted overlay of the suitability scripts, (DEM_Classified * demWeight) + ... + (LULC_Classified * lulcWeight), in the same way. Products are rounded to float32 rather than computed in double precision first (Weighted_Overlay.py reproduces the raster calculator exactly), so sums may differ from it in the last float32 digit.
+"""
+
+# Functions available in expressions (numexpr names)
+_NUMPY_FUNCTIONS = {'where': np.where, 'exp': np.exp, 'log': np.log, 'abs': np.abs, 'sqrt': np.sqrt}
+# NumPy evaluation of the binary operators, for constant folding and evaluation without numexpr
+_OPERATORS = {'+': np.add, '-': np.subtract, '*': np.multiply, '/': np.true_divide, '**': np.power,
+              '>': np.greater, '<': np.less, '>=': np.greater_equal, '<=': np.less_equal, '==': np.equal}
+
+# Expression node, Python operators build the tree
+class Expression:
+
+    def __add__(self, other): return Operation('+', self, _Wrap(other))
+    def __radd__(self, other): return Operation('+', _Wrap(other), self)
+    def __sub__(self, other): return Operation('-', self, _Wrap(other))
+    def __rsub__(self, other): return Operation('-', _Wrap(other), self)
+    def __mul__(self, other): return Operation('*', self, _Wrap(other))
+    def __rmul__(self, other): return Operation('*', _Wrap(other), self)
+    def __truediv__(self, other): return Operation('/', self, _Wrap(other))
+    def __rtruediv__(self, other): return Operation('/', _Wrap(other), self)
+    def __pow__(self, other): return Operation('**', self, _Wrap(other))
+    def __neg__(self): return Operation('*', Constant(-1.0), self)
+    def __gt__(self, other): return Operation('>', self, _Wrap(other))
+    def __lt__(self, other): return Operation('<', self, _Wrap(other))
+    def __ge__(self, other): return Operation('>=', self, _Wrap(other))
+    def __le__(self, other): return Operation('<=', self, _Wrap(other))
+
+    # Expression with scalar subtrees evaluated
+    def Fold(self):
+        return self
+
+    # Compile the folded expression once, refer to Kernel
+    def Compile(self, DType=np.float32):
+        return Kernel(self, DType)
+
+    # Evaluate the expression block by block
+    # Requires: Output=<optional preallocated array-like>, Mask=<optional boolean raster source, True inside processing extent, or Tile_Index.TileIndex>, OutNoData=<value written to NoData cells>, DType=<working and output dtype>
+    # Returns: Output
+    def Evaluate(self, Output=None, Mask=None, OutNoData=np.nan, DType=np.float32, BlockSize=BLOCK_SIZE):
+        kernel = self.Compile(DType)
+        if not kernel.layers:
+            raise ValueError(f'Expression {kernel.text} has no raster layers.')
+        shape = CommonShape([layer.source for layer in kernel.layers] + ([Mask] if Mask is not None else []))
+        if Output is None:
+            Output = np.empty(shape, dtype=DType)
+        buffer = np.empty(BlockSize, dtype=DType)
+        for window, state, mask in MaskedBlocks(shape, BlockSize, Mask):
+            if state == EMPTY:
+                Output[window] = OutNoData
+                continue
+            rows, cols = window[0].stop - window[0].start, window[1].stop - window[1].start
+            valid = np.ones((rows, cols), dtype=bool) if mask is None else mask
+            blocks = {}
+            for i, layer in enumerate(kernel.layers):
+                block = ReadBlock(layer.source, window)
+                valid &= ValidMask(block, layer.noData)
+                blocks[f'l{i}'] = block.astype(DType, copy=False)
+            out = kernel(blocks, buffer[:rows, :cols])
+            out[~valid] = OutNoData
+            Output[window] = out
+
+        return Output
+
+    def __repr__(self):
+        kernel = self.Compile(np.float64)
+        return 'Expression({})'.format(re.sub(r'\bc\d+\b', lambda match: repr(float(kernel.constants[match.group()])), kernel.text))
+
+# Compiled expression: the folded tree, its numexpr text (layers named l<i>, constants c<i>, symbols by name) and the constants rounded to DType
+class Kernel:
+
+    def __init__(self, Expression, DType=np.float32):
+        self.expression = Expression.Fold()
+        self.dtype = np.dtype(DType)
+        self.layers, self.constants = [], {}
+        self.text = self.expression._Text(self.layers, self.constants, self.dtype)
+
+    # Index of a layer source in the compiled layers (l<i>)
+    def LayerIndex(self, Layer):
+        return next(i for i, layer in enumerate(self.layers) if layer.source is Layer.source)
+
+    # Evaluate on blocks into Out (fused with numexpr, node by node with NumPy otherwise)
+    # Requires: Blocks=<dict of l<i> (layer blocks, cast to DType) and symbol names: block>, Out=<output block>
+    def __call__(self, Blocks, Out):
+        if ne is not None:
+            ne.evaluate(self.text, local_dict=dict(self.constants, **Blocks), out=Out, casting='unsafe')
+        else:
+            with np.errstate(all='ignore'):
+                Out[...] = self.expression._Evaluate(Blocks, self)
+        return Out
+
+# Scalar
+class Constant(Expression):
+
+    def __init__(self, Value):
+        self.value = float(Value)
+
+    def _Text(self, Layers, Constants, DType):
+        name = f'c{len(Constants)}'
+        Constants[name] = DType.type(self.value)
+        return name
+
+    def _Evaluate(self, Blocks, Kernel):
+        return Kernel.dtype.type(self.value)
+
+# Raster source (see Block_Processing.py), NoData defaults to the NoData value carried by the source
+class Layer(Expression):
+
+    def __init__(self, Source, NoData=None):
+        self.source = Source
+        self.noData = NoData if NoData is not None else SourceNoData(Source)
+
+    def _Text(self, Layers, Constants, DType):
+        # A source used several times is read once per block
+        for i, layer in enumerate(Layers):
+            if layer.source is self.source:
+                return f'l{i}'
+        Layers.append(self)
+        return f'l{len(Layers) - 1}'
+
+    def _Evaluate(self, Blocks, Kernel):
+        return Blocks[f'l{Kernel.LayerIndex(self)}']
+
+# Named in-memory block, given to Kernel by name (e.g. x, the block a Tf function is evaluated on)
+class Symbol(Expression):
+
+    def __init__(self, Name):
+        self.name = Name
+
+    def _Text(self, Layers, Constants, DType):
+        return self.name
+
+    def _Evaluate(self, Blocks, Kernel):
+        return Blocks[self.name]
+
+# Binary operator
+class Operation(Expression):
+
+    def __init__(self, Operator, Left, Right):
+        self.operator = Operator
+        self.left = Left
+        self.right = Right
+
+    def Fold(self):
+        left, right = self.left.Fold(), self.right.Fold()
+        leftConstant, rightConstant = isinstance(left, Constant), isinstance(right, Constant)
+        if leftConstant and rightConstant:
+            with np.errstate(all='ignore'):
+                return Constant(_OPERATORS[self.operator](left.value, right.value))
+        # Identities
+        if rightConstant and ((self.operator in ('+', '-') and right.value == 0) or (self.operator in ('*', '/', '**') and right.value == 1)):
+            return left
+        if leftConstant and ((self.operator == '+' and left.value == 0) or (self.operator == '*' and left.value == 1)):
+            return right
+        return Operation(self.operator, left, right)
+
+    def _Text(self, Layers, Constants, DType):
+        return f'({self.left._Text(Layers, Constants, DType)} {self.operator} {self.right._Text(Layers, Constants, DType)})'
+
+    def _Evaluate(self, Blocks, Kernel):
+        return _OPERATORS[self.operator](self.left._Evaluate(Blocks, Kernel), self.right._Evaluate(Blocks, Kernel))
+
+# Function call (where, exp, log, abs, sqrt)
+class Function(Expression):
+
+    def __init__(self, Name, *Args):
+        if Name not in _NUMPY_FUNCTIONS:
+            raise ValueError(f'Unknown function {Name}, expected one of {list(_NUMPY_FUNCTIONS)}')
+        self.name = Name
+        self.args = [_Wrap(arg) for arg in Args]
+
+    def Fold(self):
+        args = [arg.Fold() for arg in self.args]
+        if all(isinstance(arg, Constant) for arg in args):
+            with np.errstate(all='ignore'):
+                return Constant(_NUMPY_FUNCTIONS[self.name](*(arg.value for arg in args)))
+        return Function(self.name, *args)
+
+    def _Text(self, Layers, Constants, DType):
+        return f'{self.name}({", ".join(arg._Text(Layers, Constants, DType) for arg in self.args)})'
+
+    def _Evaluate(self, Blocks, Kernel):
+        return _NUMPY_FUNCTIONS[self.name](*(arg._Evaluate(Blocks, Kernel) for arg in self.args))
+
+# Scalars are wrapped as constants
+def _Wrap(Value):
+    return Value if isinstance(Value, Expression) else Constant(Value)
+
+# Function helpers
+def Where(Condition, Then, Else):
+    return Function('where', Condition, Then, Else)
+
+def Exp(Value):
+    return Function('exp', Value)
+
+def Log(Value):
+    return Function('log', Value)
+
+def Abs(Value):
+    return Function('abs', Value)
+
+# True where a value is not NaN (x == x), e.g. to keep NoData cells NoData through a Where
+def IsValid(Value):
+    value = _Wrap(Value)
+    return Operation('==', value, value)
+
+# Weighted sum of layers, (Layer_1 * Weight_1) + ... + (Layer_n * Weight_n), i.e. the weighted overlay of the suitability scripts
+# Requires: Layers=<list of raster sources or expressions>, Weights=<list of layer weights, same order>
+def WeightedSum(Layers, Weights):
+    if len(Layers) != len(Weights):
+        raise ValueError(f'{len(Layers)} layers were given with {len(Weights)} weights')
+    terms = [(layer if isinstance(layer, Expression) else Layer(layer)) * weight for layer, weight in zip(Layers, Weights)]
+    total = terms[0]
+    for term in terms[1:]:
+        total = total + term
+    return total
+
+# Min-max normalization, (Layer - Minimum) / (Maximum - Minimum)
+def Normalize(Source, Minimum, Maximum):
+    return ((Source if isinstance(Source, Expression) else Layer(Source)) - Minimum) / (_Wrap(Maximum) - Minimum)
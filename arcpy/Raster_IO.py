@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Raster IO
+Objective:  Windowed raster readers and writers bridging arcpy rasters and the NumPy backends as a part of ATUR Suitability Analysis
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import threading
+
+import numpy as np
+
+from Block_Processing import BLOCK_SIZE, IterBlocks
+from Instrumentation import CountWindow
+
+# Optional, vectorized coordinate transformations (arcpy point projection on a lattice otherwise)
+try:
+    import pyproj
+except ImportError:
+    pyproj = None
+
+"""
+arcpy is imported inside the functions that need it, so the NumPy backends can import this module on machines without an ArcGIS licence.
+Georeferencing is carried as a GDAL style geotransform tuple, (originX, cellSizeX, 0, originY, 0, -cellSizeY), where (originX, originY) is the upper left corner of the raster.
+"""
+
+# Geotransform helpers ----------------
+# Upper left corner (x, y) and cell size (x, y) from a geotransform
+def TransformOrigin(Transform):
+    return Transform[0], Transform[3]
+
+def TransformCellSize(Transform):
+    return Transform[1], -Transform[5]
+
+# Geotransform of a window (rowSlice, colSlice) of a raster
+def WindowTransform(Transform, Window):
+    rowSlice, colSlice = Window
+    x0, cellX, rotX, y0, rotY, negCellY = Transform
+    return (x0 + colSlice.start * cellX, cellX, rotX, y0 + rowSlice.start * negCellY, rotY, negCellY)
+
+# Cell center coordinates for row/column index arrays
+def CellCenters(Transform, Rows, Cols):
+    x0, cellX, _, y0, _, negCellY = Transform
+    return x0 + (np.asarray(Cols) + 0.5) * cellX, y0 + (np.asarray(Rows) + 0.5) * negCellY
+
+
+# arcpy bridge ----------------
+# Windowed, read-only array-like view of an arcpy raster. Slicing with [rowSlice, colSlice] reads only that window.
+# Reads are serialized, so a reader can be shared by a thread pool (e.g. Raster_Statistics.py)
+class ArcRasterReader:
+
+    def __init__(self, Raster, NoData=None):
+        import arcpy
+
+        self.raster = arcpy.Raster(str(Raster))
+        self.shape = (self.raster.height, self.raster.width)
+        extent = self.raster.extent
+        cellX, cellY = self.raster.meanCellWidth, self.raster.meanCellHeight
+        self.transform = (extent.XMin, cellX, 0.0, extent.YMax, 0.0, -cellY)
+        self.spatialReference = self.raster.spatialReference
+        # NoData value used for the returned arrays; NaN for float rasters, the raster's own NoData value for integer rasters
+        if NoData is None:
+            if self.raster.isInteger:
+                NoData = self.raster.noDataValue if self.raster.noDataValue is not None else np.iinfo(np.int32).min
+            else:
+                NoData = np.nan
+        self.noData = NoData
+        self.dtype = np.dtype(np.int32 if self.raster.isInteger else np.float32)
+        self._lock = threading.Lock()
+
+    def __getitem__(self, Window):
+        import arcpy
+
+        rowSlice, colSlice = Window
+        r0, r1, _ = rowSlice.indices(self.shape[0])
+        c0, c1, _ = colSlice.indices(self.shape[1])
+        x0, cellX, _, y0, _, negCellY = self.transform
+        # RasterToNumPyArray is anchored on the lower left corner of the window
+        lowerLeft = arcpy.Point(x0 + c0 * cellX, y0 + r1 * negCellY)
+        CountWindow('Read', Window, self.shape, self.dtype)
+        with self._lock:
+            return arcpy.RasterToNumPyArray(self.raster, lowerLeft, c1 - c0, r1 - r0, nodata_to_value=self.noData)
+
+# Clip a raster to the processing extent on the snap raster grid (cell size and alignment), so it can be read window by window alongside the other layers
+# Requires: Raster=<input raster>, Snap_Raster=<raster to match extent and resolution>, Mask_Geom=<feature to define mask>
+def AlignRaster(Raster, Snap_Raster, Mask_Geom):
+    import arcpy
+
+    with arcpy.EnvManager(snapRaster=Snap_Raster, cellSize=Snap_Raster, extent=Mask_Geom, mask=Mask_Geom):
+        return arcpy.sa.ExtractByMask(Raster, Mask_Geom)
+
+# Lattice spacing (cells) of the arcpy coordinate transformation, exact at the lattice points and bilinear in between
+LATTICE_STEP = 32
+
+# Coordinate transformation between two spatial references, e.g. of target cell centers into the coordinate system of a source raster
+# With pyproj every coordinate is transformed. Otherwise points are projected with arcpy on a lattice of every Step rows and columns (plus the last) and interpolated in between; a projection is smooth at that scale, the interpolation error is far below a cell.
+# Requires: FromSR/ToSR=<arcpy spatial references>, Step=<lattice spacing (cells)>
+# Returns: function of (X, Y) coordinate grids (2D, one row and column per cell), giving (X, Y) in ToSR
+def CoordinateTransform(FromSR, ToSR, Step=LATTICE_STEP):
+    if pyproj is not None and FromSR.factoryCode and ToSR.factoryCode:
+        transformer = pyproj.Transformer.from_crs(FromSR.factoryCode, ToSR.factoryCode, always_xy=True)
+        return lambda X, Y: transformer.transform(X, Y)
+
+    import arcpy
+
+    def Transform(X, Y):
+        rows = np.unique(np.r_[np.arange(0, X.shape[0], Step), X.shape[0] - 1])
+        cols = np.unique(np.r_[np.arange(0, X.shape[1], Step), X.shape[1] - 1])
+        lattice = np.array([(point.X, point.Y) for point in (arcpy.PointGeometry(arcpy.Point(x, y), FromSR).projectAs(ToSR).firstPoint
+                                                            for x, y in zip(X[np.ix_(rows, cols)].ravel(), Y[np.ix_(rows, cols)].ravel()))])
+        lattice = lattice.reshape(rows.size, cols.size, 2)
+        # Fractional lattice position of every row and column, blended from the 4 surrounding lattice points
+        r = np.interp(np.arange(X.shape[0]), rows, np.arange(rows.size))
+        c = np.interp(np.arange(X.shape[1]), cols, np.arange(cols.size))
+        r0, c0 = np.minimum(r.astype(np.int64), rows.size - 1), np.minimum(c.astype(np.int64), cols.size - 1)
+        r1, c1 = np.minimum(r0 + 1, rows.size - 1), np.minimum(c0 + 1, cols.size - 1)
+        wr, wc = (r - r0)[:, None, None], (c - c0)[None, :, None]
+        blended = ((1 - wr) * (1 - wc) * lattice[np.ix_(r0, c0)] + (1 - wr) * wc * lattice[np.ix_(r0, c1)]
+                   + wr * (1 - wc) * lattice[np.ix_(r1, c0)] + wr * wc * lattice[np.ix_(r1, c1)])
+        return blended[..., 0], blended[..., 1]
+
+    return Transform
+
+# Save a numpy array as an arcpy raster
+# Requires: Array=<2D numpy array>, Transform=<geotransform of the array>, Output=<output raster>, NoData=<value to be written as NoData>, SpatialReference=<optional arcpy spatial reference>
+def SaveArcRaster(Array, Transform, Output, NoData=np.nan, SpatialReference=None):
+    import arcpy
+
+    x0, cellX, _, y0, _, negCellY = Transform
+    lowerLeft = arcpy.Point(x0, y0 + Array.shape[0] * negCellY)
+    outRaster = arcpy.NumPyArrayToRaster(Array, lowerLeft, cellX, -negCellY, value_to_nodata=NoData)
+    CountWindow('Written', (slice(None), slice(None)), Array.shape, Array.dtype)
+    outRaster.save(Output)
+    if SpatialReference is not None:
+        arcpy.management.DefineProjection(Output, SpatialReference)
+
+    return outRaster
+
+# Pixel types of MosaicToNewRaster for numpy dtypes
+PIXEL_TYPES = {'uint8': '8_BIT_UNSIGNED', 'int8': '8_BIT_SIGNED', 'uint16': '16_BIT_UNSIGNED', 'int16': '16_BIT_SIGNED',
+               'uint32': '32_BIT_UNSIGNED', 'int32': '32_BIT_SIGNED', 'float32': '32_BIT_FLOAT', 'float64': '64_BIT'}
+
+# Save a raster source larger than memory (e.g. a .npy memory map) as an arcpy raster, block by block
+# Each block is saved to a temporary raster in the scratch folder and the blocks are mosaicked into the output
+# Requires: Source=<raster source, see Block_Processing.py>, Transform=<geotransform of the source>, Output=<output raster>, NoData=<value to be written as NoData>, SpatialReference=<optional arcpy spatial reference>
+def SaveArcRasterBlocks(Source, Transform, Output, NoData=np.nan, SpatialReference=None, BlockSize=BLOCK_SIZE):
+    import os
+    import shutil
+    import tempfile
+    import arcpy
+
+    windows = list(IterBlocks(Source.shape, BlockSize))
+    if len(windows) == 1:
+        return SaveArcRaster(np.asarray(Source[windows[0]]), Transform, Output, NoData, SpatialReference)
+
+    folder = tempfile.mkdtemp(dir=arcpy.env.scratchFolder)
+    try:
+        parts = []
+        for i, window in enumerate(windows):
+            block = np.asarray(Source[window])
+            parts.append(os.path.join(folder, f'block_{i}.tif'))
+            SaveArcRaster(block, WindowTransform(Transform, window), parts[-1], NoData)
+        cellX, _ = TransformCellSize(Transform)
+        arcpy.management.MosaicToNewRaster(parts, os.path.dirname(Output), os.path.basename(Output), SpatialReference,
+                                           PIXEL_TYPES[block.dtype.name], cellX, 1)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    return arcpy.Raster(Output)
+
+# Read the value attribute table (VAT) of an integer raster as a dict of VALUE code: attribute value
+# Requires: Raster=<integer raster with a VAT>, Field=<attribute field, e.g. 'UNIT_NAME'>
+def ReadValueTable(Raster, Field):
+    import arcpy
+
+    with arcpy.da.SearchCursor(str(Raster), ['Value', Field]) as cursor:
+        return {int(code): value for code, value in cursor}
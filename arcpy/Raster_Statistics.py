@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Raster Statistics
+Objective:  Single pass, multithreaded, cached raster statistics (min/max/mean/std and histogram) as a part of ATUR Suitability Analysis
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from Block_Processing import BLOCK_SIZE, MaskedBlocks, BoundedMap, ReadBlock, CommonShape, SourceNoData, ValidMask, EMPTY
+from Instrumentation import Traced, Count
+
+"""
+Replaces CalculateStatistics(..., area_of_interest=extentFeat) followed by .minimum/.maximum on each layer, in each suitability script.
+    - Several rasters on the same grid are read window by window in a single pass, windows on a thread pool. Each window gives partial statistics of every raster (count, mean, sum of squared deviations, min, max, histogram), merged in window order (Chan et al. parallel update of mean and variance), so results do not depend on the number of threads.
+    - The histogram is approximate and needs no prior range: bins are powers of 2 wide, anchored at 0, and at most BINS of them are kept. When the values no longer fit, the bin width doubles and pairs of bins merge. Any two histograms can therefore be merged, by coarsening the finer one.
+    - Results are cached per (raster, extent, snap raster) in a JSON file in the workspace (RasterStatistics.json), keyed on fingerprints of the raster, the extent feature and the snap raster the raster is aligned to (Stage_Cache.Fingerprint), so the flood and recharge models and Flood MAR compute them only once.
+The statistics dicts have the keys the Tf functions of Rescale_Functions.py take their defaults from (minimum, maximum, mean, std) plus count and histogram. A raster without valid cells has count 0 and NaN statistics; LayerStatistics raises a ValueError naming it instead, as its minimum and maximum would make NaN suitability layers.
+"""
+
+CACHE_NAME = 'RasterStatistics.json'
+# Maximum number of histogram bins
+BINS = 256
+
+# Streaming statistics of one raster
+class RunningStatistics:
+
+    def __init__(self, Bins=BINS):
+        self.bins = Bins
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # Sum of squared deviations from the mean
+        self.minimum = np.inf
+        self.maximum = -np.inf
+        # Histogram: counts of bins [k * 2^exponent, (k + 1) * 2^exponent) for k = start .. start + len(counts) - 1
+        self.exponent = None
+        self.start = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    # Statistics of an array of valid values
+    @classmethod
+    def FromValues(cls, Values, Bins=BINS):
+        stats = cls(Bins)
+        values = np.asarray(Values, dtype=np.float64).ravel()
+        if not values.size:
+            return stats
+        stats.count = values.size
+        stats.mean = float(values.mean())
+        stats.m2 = float(np.square(values - stats.mean).sum())
+        stats.minimum, stats.maximum = float(values.min()), float(values.max())
+        # Finest power of 2 bin width that spans the values with Bins bins
+        span = stats.maximum - stats.minimum
+        scale = max(abs(stats.minimum), abs(stats.maximum), np.finfo(np.float64).tiny)
+        stats.exponent = int(np.ceil(np.log2(span / (Bins - 1)))) if span > 0 else int(np.floor(np.log2(scale))) - 20
+        index = np.floor(values / 2.0 ** stats.exponent).astype(np.int64)
+        stats.start = int(index.min())
+        stats.counts = np.bincount(index - stats.start).astype(np.int64)
+        stats._Fit()
+        return stats
+
+    # Coarsen the histogram by 2^Steps
+    def _Coarsen(self, Steps):
+        if Steps <= 0:
+            return
+        index = (self.start + np.arange(self.counts.size)) >> Steps
+        self.start = int(index[0])
+        self.counts = np.bincount(index - self.start, weights=self.counts).astype(np.int64)
+        self.exponent += Steps
+
+    # Double the bin width until at most Bins bins are kept
+    def _Fit(self):
+        while self.counts.size > self.bins:
+            self._Coarsen(1)
+
+    # Merge the statistics of another part of the same raster
+    def Merge(self, Other):
+        if not Other.count:
+            return self
+        if not self.count:
+            self.__dict__.update({k: (v.copy() if isinstance(v, np.ndarray) else v) for k, v in Other.__dict__.items()})
+            return self
+        count = self.count + Other.count
+        delta = Other.mean - self.mean
+        self.m2 += Other.m2 + delta ** 2 * self.count * Other.count / count
+        self.mean += delta * Other.count / count
+        self.count = count
+        self.minimum, self.maximum = min(self.minimum, Other.minimum), max(self.maximum, Other.maximum)
+        other = RunningStatistics(self.bins)
+        other.exponent, other.start, other.counts = Other.exponent, Other.start, Other.counts
+        # Bring both histograms to the coarser bin width, then add them on a common range
+        exponent = max(self.exponent, other.exponent)
+        self._Coarsen(exponent - self.exponent)
+        other._Coarsen(exponent - other.exponent)
+        start = min(self.start, other.start)
+        counts = np.zeros(max(self.start + self.counts.size, other.start + other.counts.size) - start, dtype=np.int64)
+        counts[self.start - start:self.start - start + self.counts.size] += self.counts
+        counts[other.start - start:other.start - start + other.counts.size] += other.counts
+        self.start, self.counts = start, counts
+        self._Fit()
+        return self
+
+    # Histogram bin edges and counts
+    def Histogram(self):
+        if not self.count:
+            return np.zeros(1), np.zeros(0, dtype=np.int64)
+        return (self.start + np.arange(self.counts.size + 1)) * 2.0 ** self.exponent, self.counts
+
+    # Approximate quantile (q in 0 - 1) from the histogram, linear within a bin
+    def Quantile(self, Q):
+        if not self.count:
+            return np.nan
+        edges, counts = self.Histogram()
+        cumulative = np.cumsum(counts)
+        target = Q * self.count
+        i = min(int(np.searchsorted(cumulative, target)), counts.size - 1)
+        before = cumulative[i] - counts[i]
+        fraction = (target - before) / counts[i] if counts[i] else 0.0
+        return float(np.clip(edges[i] + fraction * (edges[i + 1] - edges[i]), self.minimum, self.maximum))
+
+    # Statistics dict (count 0, NaN statistics and an empty histogram if no valid cells)
+    def Result(self):
+        edges, counts = self.Histogram()
+        if not self.count:
+            return {'minimum': np.nan, 'maximum': np.nan, 'mean': np.nan, 'std': np.nan, 'count': 0, 'histogram': {'edges': edges.tolist(), 'counts': counts.tolist()}}
+        return {'minimum': self.minimum, 'maximum': self.maximum, 'mean': self.mean, 'std': float(np.sqrt(self.m2 / self.count)),
+                'count': int(self.count), 'histogram': {'edges': edges.tolist(), 'counts': counts.tolist()}}
+
+# Partial statistics of every source for one window (State and mask block from Block_Processing.MaskedBlocks)
+def _WindowStatistics(Sources, NoData, Window, State, Mask, Bins):
+    partials = []
+    for source, noData in zip(Sources, NoData):
+        if State == EMPTY:
+            partials.append(RunningStatistics(Bins))
+            continue
+        block = ReadBlock(source, Window)
+        valid = ValidMask(block, noData)
+        if np.issubdtype(block.dtype, np.floating):
+            valid &= ~np.isnan(block)
+        if Mask is not None:
+            valid &= Mask
+        partials.append(RunningStatistics.FromValues(block[valid], Bins))
+    return partials
+
+# Statistics of several rasters on the same grid in one blocked pass
+# Requires: Sources=<dict of name: raster source, see Block_Processing.py>, NoData=<optional dict of name: NoData value>, Mask=<optional boolean raster source, True inside processing extent, or Tile_Index.TileIndex>, Workers=<threads>
+# Returns: dict of name: statistics dict (minimum, maximum, mean, std, count, histogram)
+@Traced()
+def MultiRasterStatistics(Sources, NoData=None, Mask=None, Bins=BINS, BlockSize=BLOCK_SIZE, Workers=None):
+    names = list(Sources)
+    sources = [Sources[name] for name in names]
+    noData = [(NoData or {}).get(name, SourceNoData(Sources[name])) for name in names]
+    shape = CommonShape(sources + ([Mask] if Mask is not None else []))
+    totals = [RunningStatistics(Bins) for _ in names]
+    Workers = Workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=Workers) as pool:
+        for partials in BoundedMap(pool, lambda block: _WindowStatistics(sources, noData, *block, Bins), MaskedBlocks(shape, BlockSize, Mask), 2 * Workers):
+            for total, partial in zip(totals, partials):
+                total.Merge(partial)
+
+    return {name: total.Result() for name, total in zip(names, totals)}
+
+# Per-workspace cache of raster statistics, keyed on (raster, extent, snap raster)
+class StatisticsCache:
+
+    def __init__(self, Workspace, Name=CACHE_NAME):
+        self.path = os.path.join(Workspace, Name)
+        self.entries = {}
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path) as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+
+    # Cache key of a raster within an extent, aligned to a snap raster grid
+    # Datasets inside a GDB (or other store) are fingerprinted through their store folder, so any change to the store invalidates them
+    def Key(self, Raster, Extent=None, Snap=None):
+        from Stage_Cache import Fingerprint
+
+        def DatasetFingerprint(Path):
+            path = str(Path)
+            return [path, Fingerprint(path if os.path.exists(path) else os.path.dirname(path))]
+
+        payload = [DatasetFingerprint(Raster), Fingerprint(Extent) if Extent is not None else None, DatasetFingerprint(Snap) if Snap is not None else None]
+        return hashlib.sha256(json.dumps(payload).encode()).hexdigest()
+
+    def Get(self, Key):
+        entry = self.entries.get(Key)
+        Count('cacheHits' if entry is not None else 'cacheMisses')
+        return entry
+
+    def Put(self, Items):
+        self.entries.update(Items)
+        # Write to a temporary file first, so an interrupted run never leaves a corrupt cache
+        temp = f'{self.path}.tmp'
+        with open(temp, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(temp, self.path)
+
+# Statistics of several rasters, computing only those not cached (in one pass)
+# Requires: Sources=<dict of name: raster source>, Keys=<dict of name: cache key, see StatisticsCache.Key>, Cache=<StatisticsCache, or None for no caching>
+# Returns: dict of name: statistics dict
+def CachedStatistics(Sources, Keys, Cache=None, NoData=None, Mask=None, Bins=BINS, BlockSize=BLOCK_SIZE, Workers=None):
+    stats = {name: Cache.Get(Keys[name]) for name in Sources} if Cache is not None else {name: None for name in Sources}
+    missing = {name: Sources[name] for name, value in stats.items() if value is None}
+    if missing:
+        computed = MultiRasterStatistics(missing, NoData, Mask, Bins, BlockSize, Workers)
+        stats.update(computed)
+        if Cache is not None:
+            Cache.Put({Keys[name]: value for name, value in computed.items()})
+    print(f'\t\tStatistics: {len(Sources) - len(missing)} cached, {len(missing)} computed.')
+
+    return stats
+
+# Statistics of rasters within an extent (aligned to the snap raster grid), cached in the workspace, e.g. for the TfLinear minimum/maximum of the suitability scripts
+# Requires: Workspace=<folder holding the cache>, ExtentFeat=<extent shapefile, i.e. mask, or None for the full rasters>, Rasters=<dict of name: raster path>, Snap_Raster=<raster to match extent and resolution>
+# Returns: dict of name: statistics dict, raises ValueError if a raster has no valid cells within the extent
+def LayerStatistics(Workspace, ExtentFeat, Rasters, Snap_Raster=None, BlockSize=BLOCK_SIZE, Workers=None):
+    from Raster_IO import ArcRasterReader, AlignRaster
+
+    cache = StatisticsCache(Workspace)
+    keys = {name: cache.Key(raster, ExtentFeat, Snap_Raster if ExtentFeat is not None else None) for name, raster in Rasters.items()}
+    # Rasters are only read (and aligned) if their statistics are not cached
+    stats = {name: cache.Get(key) for name, key in keys.items()}
+    sources = {name: ArcRasterReader(AlignRaster(Rasters[name], Snap_Raster, ExtentFeat) if ExtentFeat is not None else Rasters[name]) for name, value in stats.items() if value is None}
+    if sources:
+        computed = MultiRasterStatistics(sources, BlockSize=BlockSize, Workers=Workers)
+        stats.update(computed)
+        cache.Put({keys[name]: value for name, value in computed.items()})
+    print(f'\t\tStatistics: {len(Rasters) - len(sources)} cached, {len(sources)} computed.')
+    empty = [name for name, value in stats.items() if not value.get('count')]
+    if empty:
+        raise ValueError(f'No valid cells within the extent in {", ".join(f"{name} ({Rasters[name]})" for name in empty)}, the layer statistics are undefined.')
+
+    return stats
@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Raster Store
+Objective:  Chunked, compressed raster storage (Zarr or Cloud Optimized GeoTIFF) alongside file geodatabases as a part of ATUR Suitability Analysis
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import json
+import os
+import threading
+
+import numpy as np
+
+from Block_Processing import BLOCK_SIZE, MaskedBlocks, EMPTY
+from Instrumentation import CountWindow
+
+# Optional storage backends
+try:
+    import zarr
+    _ZARR3 = int(zarr.__version__.split('.')[0]) >= 3
+except ImportError:
+    zarr = None
+try:
+    import rasterio
+    from rasterio.windows import Window as _RioWindow
+except ImportError:
+    rasterio = None
+
+"""
+A raster is addressed by its path, and the path decides the storage:
+    - <folder>.gdb/<name>   file geodatabase raster (arcpy), as before
+    - <folder>.zarr/<name>  Zarr array, chunked (CHUNKS) and compressed (Blosc/Zstd), georeferencing in its attributes
+    - <folder>/<name>.tif   Cloud Optimized GeoTIFF, tiled, Zstd compressed, with overviews
+    - <folder>.mmap/<name>.npy  uncompressed NumPy array (data 64 byte aligned by the .npy format), georeferencing in a <name>.json sidecar
+Stores are created with StoreLocation(workspace, 'LayerPreprocessing', store) and datasets addressed with DatasetPath(location, 'Slope').
+OpenRaster returns a window-level reader (a raster source, see Block_Processing.py) for any of the three, and CreateRaster a window-level writer (file geodatabase rasters are buffered in a scratch .npy and saved block by block on Close), so stages (and tile servers) read and write only the chunks they need, concurrently.
+SaveRaster saves a whole array to any of them (SaveArcRaster for file geodatabases).
+The .npy store is for intermediates handed from one stage to the next: OpenRaster maps the file read-only (np.memmap), so windows are views of the mapped pages rather than decoded copies, and every process reading a layer (stage workers, batch workers, classification) shares one copy of it in the OS page cache.
+Datasets are written to a temporary file and renamed into place on Close, so readers never map a partial raster.
+"""
+
+STORES = ('gdb', 'zarr', 'cog', 'npy')
+# Default chunk (and COG tile) size, and compression
+CHUNKS = (512, 512)
+CODEC = 'zstd'
+LEVEL = 3
+# COG overview factors
+OVERVIEWS = (2, 4, 8, 16, 32)
+
+# Location of a store in a workspace, e.g. StoreLocation(ws, 'LayerPreprocessing', 'zarr') -> ws/LayerPreprocessing.zarr
+def StoreLocation(Workspace, Name, Store='gdb'):
+    if Store not in STORES:
+        raise ValueError(f'Unknown raster store {Store}, expected one of {STORES}')
+    return {'gdb': f'{Workspace}/{Name}.gdb', 'zarr': f'{Workspace}/{Name}.zarr', 'cog': f'{Workspace}/{Name}', 'npy': f'{Workspace}/{Name}.mmap'}[Store]
+
+# Storage of a store location or dataset path ('gdb', 'zarr', 'cog' or 'npy')
+def StoreType(Path):
+    path = str(Path).replace('\\', '/').rstrip('/')
+    if path.lower().endswith('.zarr') or os.path.dirname(path).lower().endswith('.zarr'):
+        return 'zarr'
+    if path.lower().endswith(('.npy', '.mmap')):
+        return 'npy'
+    if path.lower().endswith(('.tif', '.tiff')):
+        return 'cog'
+    if path.lower().endswith('.gdb') or os.path.dirname(path).lower().endswith('.gdb'):
+        return 'gdb'
+    return 'cog'
+
+# Path of a dataset in a store location
+def DatasetPath(Location, Name):
+    return f'{Location}/{Name}' + {'cog': '.tif', 'npy': '.npy'}.get(StoreType(Location), '')
+
+# Create a store location (file GDB, Zarr group or COG folder) if it does not exist
+def CreateStore(Location):
+    if StoreType(Location) == 'gdb':
+        import arcpy
+        if not arcpy.Exists(Location):
+            arcpy.management.CreateFileGDB(os.path.dirname(Location), os.path.basename(Location))
+    else:
+        os.makedirs(Location, exist_ok=True)
+    return Location
+
+# EPSG code of an arcpy spatial reference, or an EPSG code
+def _Epsg(SpatialReference):
+    if SpatialReference is None:
+        return None
+    return int(getattr(SpatialReference, 'factoryCode', SpatialReference))
+
+# Zarr compressor for the installed zarr version
+def _ZarrCompressor(Codec, Level):
+    if _ZARR3:
+        from zarr.codecs import BloscCodec, ZstdCodec
+        return ZstdCodec(level=Level) if Codec == 'zstd' else BloscCodec(cname=Codec.replace('blosc-', ''), clevel=Level, shuffle='bitshuffle')
+    import numcodecs
+    return numcodecs.Zstd(level=Level) if Codec == 'zstd' else numcodecs.Blosc(cname=Codec.replace('blosc-', ''), clevel=Level, shuffle=numcodecs.Blosc.BITSHUFFLE)
+
+# Zarr raster, window-level reads and writes (chunk aligned writes from several threads or processes are safe)
+class ZarrRaster:
+
+    def __init__(self, Array):
+        self.array = Array
+        attrs = Array.attrs
+        self.shape = tuple(Array.shape)
+        self.dtype = np.dtype(Array.dtype)
+        self.transform = tuple(attrs['transform'])
+        self.noData = attrs.get('noData', None)
+        self.noData = np.nan if self.noData == 'nan' else self.noData
+        self.crs = attrs.get('epsg')
+        self.spatialReference = self.crs  # EPSG code, accepted wherever an arcpy spatial reference is
+
+    def __getitem__(self, Window):
+        CountWindow('Read', Window, self.shape, self.dtype)
+        return self.array[Window]
+
+    def __setitem__(self, Window, Block):
+        CountWindow('Written', Window, self.shape, self.dtype)
+        self.array[Window] = Block
+
+    def Close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.Close()
+
+# Cloud Optimized GeoTIFF raster (rasterio), window-level reads and writes
+# Writes go to a tiled GeoTIFF, which is converted to a COG with overviews on Close
+class CogRaster:
+
+    def __init__(self, Path, Mode='r', Profile=None, Overviews=OVERVIEWS):
+        self.path = Path
+        self.mode = Mode
+        self.overviews = Overviews
+        self._lock = threading.Lock()
+        if Mode == 'w':
+            self._temp = f'{os.path.splitext(Path)[0]}.tmp.tif'
+            self.dataset = rasterio.open(self._temp, 'w', **Profile)
+        else:
+            self.dataset = rasterio.open(Path)
+        self.shape = (self.dataset.height, self.dataset.width)
+        self.dtype = np.dtype(self.dataset.dtypes[0])
+        self.transform = tuple(self.dataset.transform.to_gdal())
+        self.noData = self.dataset.nodata
+        self.crs = self.dataset.crs.to_epsg() if self.dataset.crs else None
+        self.spatialReference = self.crs
+
+    @staticmethod
+    def _Window(Window):
+        rowSlice, colSlice = Window
+        return _RioWindow.from_slices(rowSlice, colSlice)
+
+    def __getitem__(self, Window):
+        CountWindow('Read', Window, self.shape, self.dtype)
+        with self._lock:
+            return self.dataset.read(1, window=self._Window(Window))
+
+    def __setitem__(self, Window, Block):
+        CountWindow('Written', Window, self.shape, self.dtype)
+        with self._lock:
+            self.dataset.write(np.asarray(Block, dtype=self.dtype), 1, window=self._Window(Window))
+
+    def Close(self):
+        # Tile size of the written GeoTIFF, kept for the COG copy (the dataset is closed first)
+        blockSize = self.dataset.block_shapes[0][0]
+        self.dataset.close()
+        if self.mode == 'w':
+            from rasterio.enums import Resampling
+            import rasterio.shutil
+            with rasterio.open(self._temp, 'r+') as dataset:
+                factors = [f for f in self.overviews if min(dataset.height, dataset.width) // f >= 1]
+                dataset.build_overviews(factors, Resampling.nearest if np.dtype(dataset.dtypes[0]).kind in 'iu' else Resampling.average)
+            rasterio.shutil.copy(self._temp, self.path, driver='COG', COMPRESS='ZSTD', BLOCKSIZE=blockSize, OVERVIEWS='FORCE_USE_EXISTING')
+            os.remove(self._temp)
+            self.mode = 'r'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.Close()
+
+# NumPy .npy raster, memory mapped, with a JSON georeferencing sidecar (<name>.json)
+# Reads are views of the mapped pages (zero copy); writes go to <name>.tmp.npy, renamed into place on Close after its sidecar
+class NpyRaster:
+
+    def __init__(self, Path, Mode='r', Shape=None, DType=None, Meta=None):
+        self.path = Path
+        self.mode = Mode
+        if Mode == 'w':
+            self._temp = f'{os.path.splitext(Path)[0]}.tmp.npy'
+            self.array = np.lib.format.open_memmap(self._temp, mode='w+', dtype=DType, shape=tuple(Shape))
+            self._meta = Meta
+        else:
+            self.array = np.load(Path, mmap_mode=Mode)
+            with open(f'{os.path.splitext(Path)[0]}.json') as file:
+                self._meta = json.load(file)
+        self.shape = tuple(self.array.shape)
+        self.dtype = self.array.dtype
+        self.transform = tuple(self._meta['transform'])
+        self.noData = np.nan if self._meta.get('noData') == 'nan' else self._meta.get('noData')
+        self.crs = self._meta.get('epsg')
+        self.spatialReference = self.crs
+
+    def __getitem__(self, Window):
+        CountWindow('Read', Window, self.shape, self.dtype)
+        return self.array[Window]
+
+    def __setitem__(self, Window, Block):
+        CountWindow('Written', Window, self.shape, self.dtype)
+        self.array[Window] = Block
+
+    def Close(self):
+        if self.mode == 'w':
+            self.array.flush()
+            del self.array
+            # The sidecar is in place before the .npy is published, so a reader finding the .npy always finds its georeferencing
+            sidecar = f'{os.path.splitext(self.path)[0]}.json'
+            with open(f'{sidecar}.tmp', 'w') as file:
+                json.dump(self._meta, file)
+            os.replace(f'{sidecar}.tmp', sidecar)
+            os.replace(self._temp, self.path)
+            self.mode = 'r'
+            self.array = np.load(self.path, mmap_mode='r')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.Close()
+
+# File geodatabase raster (or GeoTIFF without rasterio) written window by window through arcpy
+# Windows go to a .npy memory map in the arcpy scratch folder, saved block by block into the output on Close (Raster_IO.SaveArcRasterBlocks)
+class ArcRasterWriter:
+
+    def __init__(self, Path, Shape, DType, Transform, NoData=np.nan, SpatialReference=None, BlockSize=BLOCK_SIZE):
+        import tempfile
+        import arcpy
+
+        self.path = Path
+        self.noData = NoData
+        self.spatialReference = SpatialReference
+        self.blockSize = BlockSize
+        self._folder = tempfile.mkdtemp(dir=arcpy.env.scratchFolder)
+        self.buffer = NpyRaster(os.path.join(self._folder, 'Buffer.npy'), 'w', Shape, DType, _Meta(Transform, NoData, None))
+        self.shape, self.dtype, self.transform = self.buffer.shape, self.buffer.dtype, self.buffer.transform
+
+    def __getitem__(self, Window):
+        return self.buffer[Window]
+
+    def __setitem__(self, Window, Block):
+        self.buffer[Window] = Block
+
+    def Close(self):
+        import shutil
+        from Raster_IO import SaveArcRasterBlocks
+
+        if self.buffer is None:
+            return
+        try:
+            self.buffer.Close()
+            SaveArcRasterBlocks(OpenRaster(self.buffer.path), self.transform, self.path, self.noData, self.spatialReference, self.blockSize)
+        finally:
+            self.buffer = None
+            shutil.rmtree(self._folder, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.Close()
+
+# Georeferencing attributes of Zarr and .npy rasters
+def _Meta(Transform, NoData, SpatialReference):
+    noData = None if NoData is None else ('nan' if isinstance(NoData, float) and np.isnan(NoData) else NoData)
+    noData = noData.item() if isinstance(noData, np.generic) else noData
+    return {'transform': [float(v) for v in Transform], 'noData': noData, 'epsg': _Epsg(SpatialReference)}
+
+# Open a raster for window-level reads
+# Returns: raster source (ZarrRaster, CogRaster, or Raster_IO.ArcRasterReader for file geodatabase rasters)
+def OpenRaster(Path, NoData=None):
+    store = StoreType(Path)
+    if store == 'npy':
+        return NpyRaster(str(Path))
+    if store == 'zarr':
+        if zarr is None:
+            raise ImportError('Zarr raster stores require zarr.')
+        return ZarrRaster(zarr.open_array(str(Path), mode='r'))
+    if store == 'cog' and rasterio is not None:
+        return CogRaster(str(Path))
+    from Raster_IO import ArcRasterReader
+    return ArcRasterReader(Path, NoData)
+
+# Create a raster for window-level writes (any store, file geodatabase rasters through ArcRasterWriter)
+# Requires: Path=<dataset path, see DatasetPath>, Shape=<(rows, cols)>, DType=<numpy dtype>, Transform=<geotransform>, NoData=<NoData value>, SpatialReference=<arcpy spatial reference or EPSG code>, Chunks=<chunk (tile) size>, Codec=<'zstd', 'blosc-zstd', 'blosc-lz4', ...>
+# Returns: ZarrRaster, CogRaster, NpyRaster or ArcRasterWriter, close it when done (or use it as a context manager)
+def CreateRaster(Path, Shape, DType, Transform, NoData=np.nan, SpatialReference=None, Chunks=CHUNKS, Codec=CODEC, Level=LEVEL):
+    store = StoreType(Path)
+    epsg = _Epsg(SpatialReference)
+    DType = np.dtype(DType)
+    if store == 'npy':
+        os.makedirs(os.path.dirname(str(Path)) or '.', exist_ok=True)
+        return NpyRaster(str(Path), 'w', Shape, DType, _Meta(Transform, NoData, SpatialReference))
+    if store == 'zarr':
+        if zarr is None:
+            raise ImportError('Zarr raster stores require zarr.')
+        attrs = _Meta(Transform, NoData, SpatialReference)
+        compressor = _ZarrCompressor(Codec, Level)
+        if _ZARR3:
+            array = zarr.create_array(store=str(Path), shape=Shape, chunks=Chunks, dtype=DType, fill_value=NoData, compressors=compressor, attributes=attrs, overwrite=True)
+        else:
+            array = zarr.open_array(str(Path), mode='w', shape=Shape, chunks=Chunks, dtype=DType, fill_value=NoData, compressor=compressor)
+            array.attrs.update(attrs)
+        return ZarrRaster(array)
+    if store == 'cog' and rasterio is not None:
+        from rasterio.transform import Affine
+        os.makedirs(os.path.dirname(str(Path)) or '.', exist_ok=True)
+        profile = {'driver': 'GTiff', 'height': Shape[0], 'width': Shape[1], 'count': 1, 'dtype': DType.name, 'nodata': NoData,
+                   'crs': f'EPSG:{epsg}' if epsg else None, 'transform': Affine.from_gdal(*Transform),
+                   'tiled': True, 'blockysize': Chunks[0], 'blockxsize': Chunks[1], 'compress': 'ZSTD', 'BIGTIFF': 'IF_SAFER'}
+        return CogRaster(str(Path), 'w', profile)
+    return ArcRasterWriter(str(Path), Shape, DType, Transform, NoData, SpatialReference)
+
+# Save an array to a raster in any store
+# Requires: Array=<2D numpy array>, Transform=<geotransform of the array>, Output=<dataset path>, NoData=<value to be written as NoData>, SpatialReference=<arcpy spatial reference or EPSG code>
+# Returns: Output for Zarr/COG/.npy datasets, the arcpy raster for file geodatabase rasters
+def SaveRaster(Array, Transform, Output, NoData=np.nan, SpatialReference=None):
+    store = StoreType(Output)
+    if store == 'gdb' or (store == 'cog' and rasterio is None):
+        from Raster_IO import SaveArcRaster
+        return SaveArcRaster(Array, Transform, Output, NoData, SpatialReference)
+    with CreateRaster(Output, Array.shape, Array.dtype, Transform, NoData, SpatialReference) as raster:
+        raster[slice(0, Array.shape[0]), slice(0, Array.shape[1])] = Array
+
+    return Output
+
+# Copy a dataset to another dataset path, e.g. from a watershed store into a shared store (arcpy CopyRaster where either is a file geodatabase raster)
+def CopyDataset(Source, Output, BlockSize=BLOCK_SIZE):
+    if 'gdb' in (StoreType(Source), StoreType(Output)) or (rasterio is None and 'cog' in (StoreType(Source), StoreType(Output))):
+        import arcpy
+        arcpy.management.CopyRaster(str(Source), str(Output))
+        return Output
+    source = OpenRaster(Source)
+    CopyRaster(source, Output, source.transform, source.noData, source.crs, BlockSize)
+    return Output
+
+# Copy a raster source (e.g. an aligned arcpy raster, Raster_IO.ArcRasterReader) into a store block by block
+# Requires: Source=<raster source, see Block_Processing.py>, Output=<dataset path>, Transform=<geotransform of the source>, NoData=<NoData value>, SpatialReference=<arcpy spatial reference or EPSG code>, Mask=<optional boolean raster source or Tile_Index.TileIndex, blocks outside the processing extent are written as NoData without reading the source>
+# Returns: the stored raster, opened for reading
+def CopyRaster(Source, Output, Transform, NoData=None, SpatialReference=None, BlockSize=BLOCK_SIZE, Mask=None):
+    with CreateRaster(Output, Source.shape[:2], Source.dtype, Transform, NoData, SpatialReference) as raster:
+        for window, state, _ in MaskedBlocks(Source.shape[:2], BlockSize, Mask):
+            if state == EMPTY:
+                raster[window] = np.full((window[0].stop - window[0].start, window[1].stop - window[1].start), NoData if NoData is not None else 0, dtype=Source.dtype)
+            else:
+                raster[window] = np.asarray(Source[window])
+
+    return OpenRaster(Output)
@@ -40,6 +40,8 @@ contClassifications_filePath = r"C:\GIS_Projects\ATUR\Documents\Quarto\SanPedro_
 catClassifications_filePath = r"C:\GIS_Projects\ATUR\Documents\Quarto\SanPedro_Flood-MAR\SanPedro_Flood-MAR\arcpy\Classification_Tables\Recharge_CategoricalClassificationSchemas.csv"
 # Layer Weights Table
 layerWeights = r"C:\GIS_Projects\ATUR\Documents\Quarto\SanPedro_Flood-MAR\SanPedro_Flood-MAR\arcpy\Classification_Tables\LayerWeights.csv"
+# Raster math backend for the weighted overlay, one of 'arcpy' (Raster Calculator), 'numpy' (tiled NumPy engine, refer to Weighted_Overlay.py) or 'expression' (single fused expression, refer to Raster_Expression.py)
+overlayBackend = 'arcpy'
 
 # Arc Environment Settings
 ap.env.overwriteOutput = True  # Enable file overwriting
@@ -56,6 +58,10 @@ ap.env.outputCoordinateSystem = sr
 nl = '\n'  # var can be used in f-strings to represent newline character
 tb = '\t'  # var can be used in f-strings to represent tab character
 
+# Trace events of this run (with FLOODMAR_TRACE set) are tagged with the watershed, refer to Instrumentation.py
+from Instrumentation import Span, SetTags
+SetTags(watershed=watershedName)
+
 # Check workspace for geodatabase (gdb)
 if ap.Exists(gdb):
     print('GDB', gdb_name, 'Exists.')
@@ -66,35 +72,11 @@ else:
     out_gdb = ap.management.CreateFileGDB(ws, gdb_name)
 
 # Preprocess Requisite Layers ---------
-# Check workspace for preprocessing geodatabase (gdb)
-if ap.Exists('LayerPreprocessing.gdb'):
-    print('Preprocessing GDB Exists.')
-    # Access Preprocessing GDB, print contents
-    ap.env.workspace = f'{ws}/LayerPreprocessing.gdb'
-    print('\tPreprocessing GDB Contents:')
-    print('\t\tFeatures:', ap.ListFeatureClasses())
-    print('\t\tRasters:', ap.ListRasters())
-    # Check if preprocessing gdb has all requisite files (not including intermediate outputs)
-    if all(items in ap.ListRasters() for items in ['Drainage_Density', 'Slope', 'Precipitation', 'Lithology']):
-        # If all files are available
-        print('\tAll requisite files are available. No layer preprocessing required.')
-    else:
-        # If there are missing files, run preprocessing function
-        print('\tMissing files!')
-        print('Preprocessing Layers.')
-        # Import preprocessing function from external script
-        from Preprocessing import PreprocessLayers
-
-        # Preprocessing
-        PreprocessLayers(ws, extentFeat=extentFeat, dem=DEM_filePath, precipitation=Precip_filePath, lithology=Litho_filePath)
-else:
-    # If preprocessing gdb does not exist
-    print('No Preprocessing GDB. Initializing Layer Preprocessing')
-    # Import preprocessing function from external script
-    from Preprocessing import PreprocessLayers
-
-    # Preprocessing
-    PreprocessLayers(ws, extentFeat=extentFeat, dem=DEM_filePath, precipitation=Precip_filePath, lithology=Litho_filePath)
+# Preprocessing stages are cached on their inputs, extent and parameters, only stages which are missing or out of date are re-run
+# Refer to Preprocessing.py and Stage_Cache.py for details
+# Stages run in order in this process (workers=1), parallel worker processes would re-run this script on import (no __main__ guard); refer to Stage_Graph.py
+from Preprocessing import PreprocessLayers
+PreprocessLayers(ws, extentFeat=extentFeat, dem=DEM_filePath, precipitation=Precip_filePath, lithology=Litho_filePath, workers=1)
 
 # Access Preprocessing GDB, set vars to appropriate data layer
 ap.env.workspace = f'{ws}/LayerPreprocessing.gdb'
@@ -120,12 +102,14 @@ from Classification import ContinuousClassification
 
 print('Classifying Layers...')
 # Continuous Layers (Discrete Classification)
+# Statistics of the continuous layers within the extent, in a single pass, cached in the workspace (shared by FloodSuitability.py and RechargeSuitability.py)
+# Refer to Raster_Statistics.py for details
+from Raster_Statistics import LayerStatistics
+layerStats = LayerStatistics(ws, extentFeat, {'DEM': DEM_filePath, 'Slope': slope, 'Lineaments': Lineaments_filePath, 'Drainage': drainage, 'Precip': precip, 'NDVI': NDVI_filePath}, DEM_filePath)
+
 # DEM
-dem = ap.Raster(DEM_filePath)
-# Calculate statistics, only necessary for 'raw' data (not preprocessed)
-ap.management.CalculateStatistics(dem, area_of_interest=extentFeat)
-demMin = dem.minimum  # Caution! Some sinks (elev. < 0) exist in the DEM, particularly near the coast, use .minimum with caution
-demMax = dem.maximum
+demMin = layerStats['DEM']['minimum']  # Caution! Some sinks (elev. < 0) exist in the DEM, particularly near the coast, use .minimum with caution
+demMax = layerStats['DEM']['maximum']
 lowerThreshold = 0
 valueBelowThreshold = 5
 upperThreshold = None
@@ -135,8 +119,8 @@ demFunction = ap.sa.TfLinear(minimum=demMax, maximum=demMin, lowerThreshold=lowe
 DEM_Classified = ContinuousClassification(DEM_filePath, demFunction, 'DEM', f'{gdb}/Classified_DEM')
 
 # Slope
-slopeMin = ap.Raster(slope).minimum
-slopeMax = ap.Raster(slope).maximum
+slopeMin = layerStats['Slope']['minimum']
+slopeMax = layerStats['Slope']['maximum']
 lowerThreshold = None
 valueBelowThreshold = 5
 upperThreshold = None
@@ -146,11 +130,8 @@ slopeFunction = ap.sa.TfLinear(minimum=slopeMax, maximum=slopeMin, lowerThreshol
 Slope_Classified = ContinuousClassification(slope, slopeFunction, 'Slope', f'{gdb}/Classified_Slope')
 
 # Lineament Density
-line = ap.Raster(Lineaments_filePath)
-# Calculate statistics, only necessary for 'raw' data (not preprocessed)
-ap.management.CalculateStatistics(line, area_of_interest=extentFeat)
-lineMin = line.minimum
-lineMax = line.maximum
+lineMin = layerStats['Lineaments']['minimum']
+lineMax = layerStats['Lineaments']['maximum']
 lowerThreshold = None
 valueBelowThreshold = 5
 upperThreshold = None
@@ -160,8 +141,8 @@ lineamentsFunction = ap.sa.TfLinear(minimum=lineMin, maximum=lineMax, lowerThres
 Lineaments_Classified = ContinuousClassification(Lineaments_filePath, lineamentsFunction, 'Lineaments', f'{gdb}/Classified_LineamentDensity')
 
 # Drainage Density
-drainMin = ap.Raster(drainage).minimum
-drainMax = ap.Raster(drainage).maximum
+drainMin = layerStats['Drainage']['minimum']
+drainMax = layerStats['Drainage']['maximum']
 lowerThreshold = None
 valueBelowThreshold = 0
 upperThreshold = None
@@ -171,8 +152,8 @@ lineamentsFunction = ap.sa.TfLinear(minimum=drainMax, maximum=drainMin, lowerThr
 Drainage_Classified = ContinuousClassification(drainage, lineamentsFunction, 'Drainage', f'{gdb}/Classified_DrainageDensity')
 
 # Precipitation
-precipMin = ap.Raster(precip).minimum
-precipMax = ap.Raster(precip).maximum
+precipMin = layerStats['Precip']['minimum']
+precipMax = layerStats['Precip']['maximum']
 lowerThreshold = None
 valueBelowThreshold = 0
 upperThreshold = None
@@ -182,11 +163,8 @@ precipFunction = ap.sa.TfLinear(minimum=precipMin, maximum=precipMax, lowerThres
 Precip_Classified = ContinuousClassification(precip, precipFunction, 'Precip', f'{gdb}/Classified_Precipitation')
 
 # NDVI
-ndvi = ap.Raster(NDVI_filePath)
-# Calculate statistics, only necessary for 'raw' data (not preprocessed)
-ap.management.CalculateStatistics(ndvi, area_of_interest=extentFeat)
-ndviMin = ndvi.minimum
-ndviMax = ndvi.maximum
+ndviMin = layerStats['NDVI']['minimum']
+ndviMax = layerStats['NDVI']['maximum']
 lowerThreshold = None
 valueBelowThreshold = 5
 upperThreshold = None
@@ -219,5 +197,21 @@ lulcWeight = rechargeWeights[rechargeWeights['layer'] == 'LULC']['rechargeWeight
 
 print('Calculating Raster Math...')
 print('\tExpression:', f'(DEM_Classified * {demWeight}) + (Slope_Classified * {slopeWeight}) + (Lineaments_Classified * {lineamentWeight}) + (Drainage_Classified * {drainageWeight}) + (Precip_Classified * {precipWeight}) + (NDVI_Classified * {ndviWeight}) + (Litho_Classified * {lithoWeight}) + (Soil_Classified * {soilWeight}) + (LULC_Classified * {lulcWeight})')
-rechargeSuitability = (DEM_Classified * demWeight) + (Slope_Classified * slopeWeight) + (Lineaments_Classified * lineamentWeight) + (Drainage_Classified * drainageWeight) + (Precip_Classified * precipWeight) + (NDVI_Classified * ndviWeight) + (Litho_Classified * lithoWeight) + (Soil_Classified * soilWeight) + (LULC_Classified * lulcWeight)
-rechargeSuitability.save(f'{gdb}/Recharge_Suitability')
+with Span('Overlay', model='recharge', backend=overlayBackend):
+    if overlayBackend in ('numpy', 'expression'):
+        # Stream the classified layers block by block into a single float32 output
+        # Refer to Weighted_Overlay.py for details
+        from Weighted_Overlay import WeightedOverlay
+        from Raster_IO import ArcRasterReader, SaveArcRaster, AlignRaster
+        # Classified layers built from raw inputs keep their own cell size and extent (the raster calculator resamples them), align every layer to the DEM grid within the extent first
+        classifiedLayers = [ArcRasterReader(AlignRaster(layer, DEM_filePath, extentFeat)) for layer in [DEM_Classified, Slope_Classified, Lineaments_Classified, Drainage_Classified, Precip_Classified, NDVI_Classified, Litho_Classified, Soil_Classified, LULC_Classified]]
+        layerWeightList = [demWeight, slopeWeight, lineamentWeight, drainageWeight, precipWeight, ndviWeight, lithoWeight, soilWeight, lulcWeight]
+        if overlayBackend == 'expression':
+            from Raster_Expression import WeightedSum
+            rechargeArray = WeightedSum(classifiedLayers, layerWeightList).Evaluate()
+        else:
+            rechargeArray = WeightedOverlay(classifiedLayers, layerWeightList)
+        rechargeSuitability = SaveArcRaster(rechargeArray, classifiedLayers[0].transform, f'{gdb}/Recharge_Suitability', SpatialReference=sr)
+    else:
+        rechargeSuitability = (DEM_Classified * demWeight) + (Slope_Classified * slopeWeight) + (Lineaments_Classified * lineamentWeight) + (Drainage_Classified * drainageWeight) + (Precip_Classified * precipWeight) + (NDVI_Classified * ndviWeight) + (Litho_Classified * lithoWeight) + (Soil_Classified * soilWeight) + (LULC_Classified * lulcWeight)
+        rechargeSuitability.save(f'{gdb}/Recharge_Suitability')
@@ -11,22 +11,46 @@ import arcpy
 from arcpy.sa import *
 from sys import argv
 
+from Instrumentation import Traced
+
 # Special characters for improved readability of geoprocessing messages
 nl = '\n'  # var can be used in f-strings to represent newline character
 tb = '\t'  # var can be used in f-strings to represent tab character
 
-def ResampleRaster(Raster, Output, Snap_Raster, Mask_Geom):  # Slope
+# Backend='numpy' interpolates onto the snap raster grid within the mask block by block, reading only the source window it needs, refer to Bilinear_Resample.py for details
+@Traced(Tags=('Backend',))
+def ResampleRaster(Raster, Output, Snap_Raster, Mask_Geom, Backend='arcpy', Workers=None):  # Slope
+
+    # Processing environment, scoped to this function (the global arcpy.env is left unchanged).
+    # To allow overwriting outputs overwriteOutput option is True.
+    with arcpy.EnvManager(overwriteOutput=True, extent=Mask_Geom, mask=Mask_Geom, snapRaster=Snap_Raster):
+
+        if Backend == 'numpy':
+            import numpy as np
+            from Block_Processing import ValidSource
+            from Bilinear_Resample import BilinearResample
+            from Raster_IO import ArcRasterReader, AlignRaster, CoordinateTransform
+            from Raster_Store import CreateRaster
+
+            # Process: Resample, bilinear onto the snap raster grid within the mask, block by block into the output
+            print('\tResampling Raster (NumPy)...')
+            target = ArcRasterReader(AlignRaster(Snap_Raster, Snap_Raster, Mask_Geom))
+            source = ArcRasterReader(Raster)
+            # A source in another coordinate system is interpolated at the target cell centers projected into it, not projected first (which would interpolate twice)
+            project = None
+            if source.spatialReference.factoryCode != target.spatialReference.factoryCode:
+                project = CoordinateTransform(target.spatialReference, source.spatialReference)
+            # Each block reads only the source window around it, and the snap raster (the mask) within the block
+            with CreateRaster(Output, target.shape, np.float32, target.transform, SpatialReference=target.spatialReference) as outRaster:
+                BilinearResample(source, source.transform, target.transform, target.shape, Output=outRaster, NoData=source.noData, Workers=Workers,
+                                 Mask=ValidSource(target), Project=project)
+            return Output
 
-    # To allow overwriting outputs change overwriteOutput option to True.
-    arcpy.env.overwriteOutput = True
-    arcpy.env.extent = Mask_Geom  # Default processing extent
-    arcpy.env.mask = Mask_Geom  # Default processing mask
-    arcpy.env.snapRaster = Snap_Raster  # Default processing snap raster
-    resolution = arcpy.management.GetRasterProperties(Snap_Raster, 'CELLSIZEX')
+        resolution = arcpy.management.GetRasterProperties(Snap_Raster, 'CELLSIZEX')
 
-    # Process: Resample (Resample) (management)
-    print('\tResampling Raster...')
-    outRaster = arcpy.management.Resample(Raster, Output, resolution, 'BILINEAR')
-    print(f'\t\t{arcpy.GetMessages().replace(nl, nl+tb+tb)}')
+        # Process: Resample (Resample) (management)
+        print('\tResampling Raster...')
+        outRaster = arcpy.management.Resample(Raster, Output, resolution, 'BILINEAR')
+        print(f'\t\t{arcpy.GetMessages().replace(nl, nl+tb+tb)}')
 
-    return outRaster
+        return outRaster
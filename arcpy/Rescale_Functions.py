@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Rescale Functions
+Objective:  Native (NumPy/numexpr, no arcpy) RescaleByFunction transforms for continuous classification as a part of ATUR Suitability Analysis
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import abc
+
+import numpy as np
+
+from Block_Processing import BLOCK_SIZE, IterBlocks, ReadBlock, CommonShape, SourceNoData, ValidMask
+from Raster_Expression import Symbol, Where, Exp, Log, Abs, IsValid
+
+"""
+Mirrors arcpy.sa.RescaleByFunction(Raster, Function, From, To) and the arcpy.sa.Tf* transformation functions listed in FloodSuitability.py, with the same argument names, e.g.
+    TfLinear(minimum=slopeMax, maximum=slopeMin, lowerThreshold=None, valueBelowThreshold=5, upperThreshold=None, valueAboveThreshold=0)
+Function formulas follow https://pro.arcgis.com/en/pro-app/3.3/tool-reference/spatial-analyst/rescale-by-function.htm
+    - input values below lowerThreshold (default: data minimum) are assigned valueBelowThreshold (default: NoData)
+    - input values above upperThreshold (default: data maximum) are assigned valueAboveThreshold (default: NoData)
+    - remaining values are transformed by the function and linearly rescaled to From - To
+TfLinear, TfSymmetricLinear and the logistic functions rescale their [minimum, maximum] range to From - To (values beyond it are clamped), the other functions rescale the range of the function over [lowerThreshold, upperThreshold].
+
+Each function is built as a Raster_Expression expression in x (the block) and compiled once to a Raster_Expression.Kernel, in double precision, which evaluates it in place on float32 blocks with numexpr (fused) or, if numexpr is not installed, node by node with NumPy.
+Parameters left as None that depend on the data (minimum, maximum, mean, std) are resolved from a Stats dict, as given by Raster_Statistics.MultiRasterStatistics.
+"""
+
+# Transformation Functions ----------------
+# The block a function is evaluated on
+X = Symbol('x')
+
+# Base class, handles thresholds and rescaling
+class _TransformFunction(abc.ABC):
+    # Function parameters (in arcpy order), subclasses fill in
+    parameters = ()
+    # True if the function rescales its own [minimum, maximum] range rather than the threshold range
+    fixedRange = False
+
+    def __init__(self, *args, lowerThreshold=None, valueBelowThreshold=None, upperThreshold=None, valueAboveThreshold=None, **kwargs):
+        values = dict(zip(self.parameters, args))
+        values.update(kwargs)
+        unknown = set(values) - set(self.parameters)
+        if unknown:
+            raise TypeError(f'{type(self).__name__} got unexpected arguments {sorted(unknown)}')
+        self.values = {p: values.get(p) for p in self.parameters}
+        self.lowerThreshold = lowerThreshold
+        self.valueBelowThreshold = valueBelowThreshold
+        self.upperThreshold = upperThreshold
+        self.valueAboveThreshold = valueAboveThreshold
+
+    def __repr__(self):
+        args = ', '.join(f'{k}={v}' for k, v in list(self.values.items()) + [('lowerThreshold', self.lowerThreshold), ('valueBelowThreshold', self.valueBelowThreshold), ('upperThreshold', self.upperThreshold), ('valueAboveThreshold', self.valueAboveThreshold)])
+        return f'{type(self).__name__}({args})'
+
+    # Resolve data dependent defaults, return dict of parameter values used by Expression()
+    def Defaults(self, Stats):
+        return {}
+
+    # Function expression in x, K=<dict of parameter name: value>
+    @abc.abstractmethod
+    def Expression(self, x, K):
+        pass
+
+    # Critical points (other than the domain ends) where the function may reach its minimum/maximum
+    def CriticalPoints(self, K):
+        return []
+
+    # Compile for RescaleByFunction(From, To)
+    # Returns: Raster_Expression.Kernel of the rescaled function, see EvaluateInPlace
+    def Compile(self, From=1, To=5, Stats=None):
+        Stats = Stats or {}
+        k = {p: v for p, v in self.values.items() if v is not None}
+        k.update({p: v for p, v in self.Defaults(Stats).items() if k.get(p) is None})
+        missing = [p for p in self.parameters if k.get(p) is None or np.isnan(k[p])]
+        if missing:
+            raise ValueError(f'{type(self).__name__} requires {missing} (or data statistics to derive them)')
+        k = {p: float(v) for p, v in k.items()}
+        lower = self.lowerThreshold if self.lowerThreshold is not None else Stats.get('minimum')
+        upper = self.upperThreshold if self.upperThreshold is not None else Stats.get('maximum')
+        if lower is None or upper is None or np.isnan(lower) or np.isnan(upper):
+            raise ValueError(f'{type(self).__name__} requires thresholds or data minimum/maximum')
+        function = self.Expression(X, k)
+
+        # Range of the function to rescale to From - To
+        if self.fixedRange:
+            fLow, fHigh = 0.0, 1.0
+        else:
+            points = np.array([lower, upper] + [p for p in self.CriticalPoints(k) if lower <= p <= upper], dtype=np.float64)
+            f = function.Compile(np.float64)({'x': points}, np.empty_like(points))
+            f = f[np.isfinite(f)]
+            if f.size == 0:
+                raise ValueError(f'{type(self).__name__} is undefined over [{lower}, {upper}]')
+            fLow, fHigh = f.min(), f.max()
+        scale = (To - From) / (fHigh - fLow) if fHigh != fLow else 0.0
+
+        below = np.nan if self.valueBelowThreshold is None else self.valueBelowThreshold
+        above = np.nan if self.valueAboveThreshold is None else self.valueAboveThreshold
+        # NoData (NaN) cells stay NoData
+        rescaled = Where(X < float(lower), below, Where(X > float(upper), above, Where(IsValid(X), From + (function - fLow) * scale, X)))
+
+        return rescaled.Compile(np.float64)
+
+# Clamp an expression to 0 - 1
+def _Clamp01(Expression):
+    return Where(Expression < 0, 0, Where(Expression > 1, 1, Expression))
+
+class TfLinear(_TransformFunction):
+    parameters = ('minimum', 'maximum')
+    fixedRange = True
+
+    def Defaults(self, Stats):
+        return {'minimum': Stats.get('minimum'), 'maximum': Stats.get('maximum')}
+
+    def Expression(self, x, K):
+        # Set minimum > maximum for a negative slope
+        return _Clamp01((x - K['minimum']) / (K['maximum'] - K['minimum']))
+
+class TfSymmetricLinear(_TransformFunction):
+    parameters = ('minimum', 'maximum')
+    fixedRange = True
+
+    def Defaults(self, Stats):
+        return {'minimum': Stats.get('minimum'), 'maximum': Stats.get('maximum')}
+
+    def Expression(self, x, K):
+        # Peak at the midpoint of minimum - maximum
+        return _Clamp01(1 - Abs(2 * x - K['minimum'] - K['maximum']) / abs(K['maximum'] - K['minimum']))
+
+class TfLogisticGrowth(_TransformFunction):
+    parameters = ('minimum', 'maximum', 'yInterceptPercent')
+    fixedRange = True
+
+    def Defaults(self, Stats):
+        return {'minimum': Stats.get('minimum'), 'maximum': Stats.get('maximum'), 'yInterceptPercent': 1.0}
+
+    def Expression(self, x, K):
+        # Logistic curve through yInterceptPercent at minimum and 100 - yInterceptPercent at maximum, normalized to 0 - 1
+        y = K['yInterceptPercent'] / 100
+        t = _Clamp01((x - K['minimum']) / (K['maximum'] - K['minimum']))
+        curve = 1 / (1 + ((1 - y) / y) * Exp(-2 * np.log((1 - y) / y) * t))
+        return (curve - y) / (1 - 2 * y)
+
+class TfLogisticDecay(TfLogisticGrowth):
+
+    def Expression(self, x, K):
+        return 1 - super().Expression(x, K)
+
+class TfGaussian(_TransformFunction):
+    parameters = ('midpoint', 'spread')
+
+    def Defaults(self, Stats):
+        defaults = _MidpointDefaults(Stats)
+        if 'midpoint' in defaults:
+            # Falls to 0.01 at the ends of the data range
+            defaults['spread'] = np.log(100) / max((Stats['maximum'] - Stats['minimum']) / 2, 1e-12) ** 2
+        return defaults
+
+    def Expression(self, x, K):
+        return Exp(-K['spread'] * (x - K['midpoint']) ** 2)
+
+    def CriticalPoints(self, K):
+        return [K['midpoint']]
+
+class TfNear(TfGaussian):
+
+    def Defaults(self, Stats):
+        defaults = _MidpointDefaults(Stats)
+        if 'midpoint' in defaults:
+            # Falls to 0.01 at the ends of the data range
+            defaults['spread'] = 99 / max((Stats['maximum'] - Stats['minimum']) / 2, 1e-12) ** 2
+        return defaults
+
+    def Expression(self, x, K):
+        return 1 / (1 + K['spread'] * (x - K['midpoint']) ** 2)
+
+class TfLarge(_TransformFunction):
+    parameters = ('midpoint', 'spread')
+
+    def Defaults(self, Stats):
+        return dict(_MidpointDefaults(Stats), spread=5.0)
+
+    def Expression(self, x, K):
+        return 1 / (1 + (x / K['midpoint']) ** -K['spread'])
+
+class TfSmall(TfLarge):
+
+    def Expression(self, x, K):
+        return 1 / (1 + (x / K['midpoint']) ** K['spread'])
+
+class TfMSLarge(_TransformFunction):
+    parameters = ('meanMultiplier', 'STDMultiplier', 'mean', 'std')
+
+    def Defaults(self, Stats):
+        return {'meanMultiplier': 1.0, 'STDMultiplier': 1.0, 'mean': Stats.get('mean'), 'std': Stats.get('std')}
+
+    def Expression(self, x, K):
+        # 0 for x <= meanMultiplier * mean
+        center, spread = K['meanMultiplier'] * K['mean'], K['STDMultiplier'] * K['std']
+        return Where(x > center, 1 - spread / (x - center + spread), 0)
+
+    def CriticalPoints(self, K):
+        return [K['meanMultiplier'] * K['mean']]
+
+class TfMSSmall(TfMSLarge):
+
+    def Expression(self, x, K):
+        # 1 for x <= meanMultiplier * mean
+        center, spread = K['meanMultiplier'] * K['mean'], K['STDMultiplier'] * K['std']
+        return Where(x > center, spread / (x - center + spread), 1)
+
+class TfExponential(_TransformFunction):
+    parameters = ('shift', 'baseFactor')
+
+    def Defaults(self, Stats):
+        defaults = {'shift': 0.0}
+        if _HasRange(Stats):
+            defaults['baseFactor'] = 5.0 / max(Stats['maximum'] - Stats['minimum'], 1e-12)
+        return defaults
+
+    def Expression(self, x, K):
+        return Exp(K['baseFactor'] * (x - K['shift']))
+
+class TfLogarithm(_TransformFunction):
+    parameters = ('shift', 'factor')
+
+    def Defaults(self, Stats):
+        # Shift keeps the logarithm defined over the data range
+        defaults = {'factor': 1.0}
+        if _HasRange(Stats):
+            defaults['shift'] = Stats['minimum'] - 1.0
+        return defaults
+
+    def Expression(self, x, K):
+        return K['factor'] * Log(x - K['shift'])
+
+class TfPower(_TransformFunction):
+    parameters = ('shift', 'exponent')
+
+    def Defaults(self, Stats):
+        defaults = {'exponent': 2.0}
+        if _HasRange(Stats):
+            defaults['shift'] = Stats['minimum']
+        return defaults
+
+    def Expression(self, x, K):
+        return (x - K['shift']) ** K['exponent']
+
+# True if the statistics give a data range (not a raster without valid cells)
+def _HasRange(Stats):
+    return Stats.get('minimum') is not None and Stats.get('maximum') is not None and not np.isnan(Stats['minimum'])
+
+# Default midpoint (middle of the data range)
+def _MidpointDefaults(Stats):
+    if not _HasRange(Stats):
+        return {}
+    return {'midpoint': (Stats['minimum'] + Stats['maximum']) / 2}
+
+
+# Evaluation ----------------
+# Evaluate a compiled function in place on a float32 block
+def EvaluateInPlace(Block, Compiled):
+    return Compiled({'x': Block}, Block)
+
+# Statistics of the layers missing them, in one blocked pass over all of them (Raster_Statistics.MultiRasterStatistics)
+# Requires: Layers=<list of raster sources>, Stats=<list of per-layer stats dicts, None where missing>, NoData=<list of per-layer NoData values>
+# Returns: list of stats dicts
+def MissingStatistics(Layers, Stats, NoData, BlockSize=BLOCK_SIZE):
+    from Raster_Statistics import MultiRasterStatistics
+
+    Stats = list(Stats)
+    missing = [i for i, stats in enumerate(Stats) if stats is None]
+    if missing:
+        computed = MultiRasterStatistics({i: Layers[i] for i in missing}, {i: NoData[i] for i in missing}, BlockSize=BlockSize)
+        for i in missing:
+            Stats[i] = computed[i]
+    return Stats
+
+# Native equivalent of arcpy.sa.RescaleByFunction for a single block
+# Requires: Block=<numpy array>, Function=<Tf* function>, From/To=<evaluation scale>, Stats=<dict of data minimum/maximum/mean/std, see Raster_Statistics.MultiRasterStatistics>
+def RescaleByFunction(Block, Function, From=1, To=5, Stats=None, NoData=None):
+    out = np.array(Block, dtype=np.float32)
+    if NoData is not None:
+        out[~ValidMask(np.asarray(Block), NoData)] = np.nan
+    return EvaluateInPlace(out, Function.Compile(From, To, Stats))
+
+# Rescale several continuous layers (e.g. DEM, Slope, Lineaments, Drainage, Precip, NDVI) in one streamed pass
+# Requires: Layers=<list of raster sources>, Functions=<list of Tf* functions>, Outputs=<optional list of preallocated float32 array-likes>, Stats=<optional list of per-layer stats dicts (None entries allowed), missing ones computed in a single pass>
+def RescaleBlocks(Layers, Functions, Outputs=None, From=1, To=5, Stats=None, NoData=None, BlockSize=BLOCK_SIZE):
+    shape = CommonShape(Layers)
+    if NoData is None:
+        NoData = [SourceNoData(layer) for layer in Layers]
+    Stats = MissingStatistics(Layers, Stats if Stats is not None else [None] * len(Layers), NoData, BlockSize)
+    if Outputs is None:
+        Outputs = [np.empty(shape, dtype=np.float32) for _ in Layers]
+    # Compile each function once
+    compiled = [function.Compile(From, To, stats) for function, stats in zip(Functions, Stats)]
+
+    buffer = np.empty(BlockSize, dtype=np.float32)
+    for window in IterBlocks(shape, BlockSize):
+        b = buffer[:window[0].stop - window[0].start, :window[1].stop - window[1].start]
+        for layer, nd, fn, output in zip(Layers, NoData, compiled, Outputs):
+            block = ReadBlock(layer, window)
+            b[...] = block
+            if nd is not None:
+                b[~ValidMask(block, nd)] = np.nan
+            output[window] = EvaluateInPlace(b, fn)
+
+    return Outputs
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Scanline Rasterize
+Objective:  Scanline polygon rasterization to compact integer codes with a sidecar code table (NumPy) as a part of ATUR Suitability Analysis
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from Block_Processing import BLOCK_SIZE, IterBlocks, ReadBlock
+from Raster_IO import TransformOrigin, TransformCellSize
+
+# Optional, spatial index for culling features per tile (bounding box test otherwise) and reading features without arcpy
+try:
+    import shapely
+except ImportError:
+    shapely = None
+try:
+    import pyogrio
+except ImportError:
+    pyogrio = None
+
+"""
+Native backend for arcpy.conversion.FeatureToRaster(polygons, 'UNIT_NAME', Output, cell size).
+    - The string field is mapped to compact uint16 codes (1..n in sorted order, 0 is NoData), saved in a sidecar code table (<output>_Codes.csv, columns Value,<field>), so downstream classification is an integer LUT (Lookup_Reclass.CompileCategoricalTable with Codes=ReadCodeTable(...)) instead of a quoted string remap.
+    - Polygons are rasterized by scanline: for every row, each edge crossing the row center toggles the first column whose center lies beyond the crossing; a running parity (cumulative sum) along the row, within the rows and columns the feature crosses only (so the cost of a feature is its bounding box, not the tile), gives the cells inside (even-odd rule, so holes and multipart polygons need no special handling). As FeatureToRaster, a cell takes the value of the polygon containing its center.
+    - Features are culled per tile with an STRtree over their bounding boxes (shapely), or a vectorized bounding box test. Tiles run on a thread pool.
+    - Where polygons overlap, the later feature wins.
+"""
+
+# A polygon feature: rings (list of (n, 2) coordinate arrays, exterior and interior alike), value code and bounding box
+class PolygonFeature:
+
+    def __init__(self, Rings, Code):
+        self.rings = [np.asarray(ring, dtype=np.float64) for ring in Rings if len(ring) > 2]
+        self.code = Code
+        points = np.concatenate(self.rings) if self.rings else np.zeros((1, 2))
+        self.bbox = (*points.min(axis=0), *points.max(axis=0))
+        # Edges (x1, y1, x2, y2) of all rings, closed
+        self.edges = np.concatenate([np.column_stack([ring, np.roll(ring, -1, axis=0)]) for ring in self.rings]) if self.rings else np.zeros((0, 4))
+
+# Compact codes of the values of a field, 1..n in sorted order
+def BuildCodeTable(Values):
+    return {value: code for code, value in enumerate(sorted({str(v) for v in Values}), start=1)}
+
+# Sidecar code table of an output raster (<gdb folder>/<name>_Codes.csv for GDB rasters, likewise for Zarr stores)
+def CodeTablePath(Output):
+    folder, name = os.path.split(str(Output))
+    if folder.lower().endswith(('.gdb', '.zarr')):
+        folder = os.path.dirname(folder)
+    return os.path.join(folder, f'{os.path.splitext(name)[0]}_Codes.csv')
+
+# Write/read a code table, columns Value,<field>
+def WriteCodeTable(Codes, Path, Field):
+    pd.DataFrame({'Value': list(Codes.values()), Field: list(Codes.keys())}).sort_values('Value').to_csv(Path, index=False)
+    return Path
+
+# Returns: dict of code: field value, as Raster_IO.ReadValueTable
+def ReadCodeTable(Path, Field):
+    table = pd.read_csv(Path, keep_default_na=False)
+    return {int(code): value for code, value in zip(table['Value'], table[Field])}
+
+# Polygon features and their field values, with arcpy (projected to SpatialReference when given)
+# Returns: (list of rings per feature, list of field values)
+def ReadPolygonsArcpy(Feat, Field, SpatialReference=None):
+    import arcpy
+
+    rings, values = [], []
+    with arcpy.da.SearchCursor(str(Feat), ['SHAPE@', Field], spatial_reference=SpatialReference) as cursor:
+        for shape, value in cursor:
+            if shape is None:
+                continue
+            featureRings = []
+            for part in shape:
+                ring = []
+                # Interior rings follow the exterior ring, separated by None
+                for point in part:
+                    if point is None:
+                        featureRings.append(ring)
+                        ring = []
+                    else:
+                        ring.append((point.X, point.Y))
+                featureRings.append(ring)
+            rings.append(featureRings)
+            values.append(value)
+    return rings, values
+
+# Polygon features and their field values, with pyogrio and shapely (no reprojection)
+def ReadPolygonsOgr(Feat, Field):
+    if shapely is None or pyogrio is None:
+        raise ImportError('Reading features without arcpy requires shapely (>= 2.0) and pyogrio.')
+    _, _, geometry, fieldData = pyogrio.raw.read(str(Feat), columns=[Field])
+    rings = []
+    for geom in shapely.from_wkb(geometry):
+        featureRings = []
+        for polygon in shapely.get_parts(geom):
+            featureRings.append(shapely.get_coordinates(shapely.get_exterior_ring(polygon)))
+            featureRings.extend(shapely.get_coordinates(shapely.get_interior_ring(polygon, i)) for i in range(shapely.get_num_interior_rings(polygon)))
+        rings.append(featureRings)
+    return rings, list(fieldData[0])
+
+# Rasterize the features culled to one tile
+# Returns: uint16 tile of feature codes
+def RasterizeTile(Features, Candidates, Transform, Window):
+    x0, y0 = TransformOrigin(Transform)
+    cellX, cellY = TransformCellSize(Transform)
+    rowSlice, colSlice = Window
+    r0, c0 = rowSlice.start, colSlice.start
+    height, width = rowSlice.stop - r0, colSlice.stop - c0
+    tile = np.zeros((height, width), dtype=np.uint16)
+    for index in Candidates:
+        feature = Features[index]
+        x1, y1, x2, y2 = feature.edges.T
+        # Rows whose center y lies in [min(y1, y2), max(y1, y2)) (horizontal edges cross no row)
+        low, high = np.minimum(y1, y2), np.maximum(y1, y2)
+        first = np.floor((y0 - high) / cellY - 0.5).astype(np.int64) + 1
+        last = np.floor((y0 - low) / cellY - 0.5).astype(np.int64)
+        first, last = np.maximum(first, r0), np.minimum(last, r0 + height - 1)
+        counts = np.maximum(last - first + 1, 0)
+        if not counts.sum():
+            continue
+        edge = np.repeat(np.arange(counts.size), counts)
+        rows = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + first[edge]
+        y = y0 - (rows + 0.5) * cellY
+        x = x1[edge] + (y - y1[edge]) * (x2[edge] - x1[edge]) / (y2[edge] - y1[edge])
+        # First column whose center is at or beyond the crossing
+        cols = np.clip(np.ceil((x - x0) / cellX - 0.5).astype(np.int64) - c0, 0, width)
+        # Parity within the rows and columns crossed by the feature only (its bounding box within the tile)
+        rows = rows - r0
+        top, left = rows.min(), cols.min()
+        boxHeight, boxWidth = rows.max() - top + 1, cols.max() - left + 1
+        toggles = np.bincount((rows - top) * boxWidth + cols - left, minlength=boxHeight * boxWidth).reshape(boxHeight, boxWidth)
+        inside = (np.cumsum(toggles, axis=1)[:, :-1] & 1).astype(bool)
+        tile[top:top + boxHeight, left:left + boxWidth - 1][inside] = feature.code
+    return tile
+
+# Feature culling per tile
+# Returns: function of a window, giving the indices of the features whose bounding box intersects it, in feature order (later features win)
+def TileCandidates(Features, Transform):
+    x0, y0 = TransformOrigin(Transform)
+    cellX, cellY = TransformCellSize(Transform)
+    boxes = np.array([feature.bbox for feature in Features]).reshape(-1, 4)
+    tree = shapely.STRtree(shapely.box(*boxes.T)) if shapely is not None and len(Features) else None
+
+    def Candidates(Window):
+        xmin, xmax = x0 + Window[1].start * cellX, x0 + Window[1].stop * cellX
+        ymax, ymin = y0 - Window[0].start * cellY, y0 - Window[0].stop * cellY
+        if tree is not None:
+            return np.sort(tree.query(shapely.box(xmin, ymin, xmax, ymax)))
+        return np.flatnonzero((boxes[:, 0] <= xmax) & (boxes[:, 2] >= xmin) & (boxes[:, 1] <= ymax) & (boxes[:, 3] >= ymin))
+
+    return Candidates
+
+# Rasterize polygon features onto a grid
+# Requires: Features=<list of PolygonFeature>, Transform=<geotransform of the grid>, Shape=<(rows, cols) of the grid>, Output=<optional preallocated uint16 array-like, e.g. a Raster_Store.CreateRaster writer>,
+#           Mask=<optional boolean raster source, cells outside it are 0>, Workers=<threads>
+# Returns: uint16 array of feature codes (Output), 0 outside all features
+def RasterizePolygons(Features, Transform, Shape, Output=None, BlockSize=BLOCK_SIZE, Workers=None, Mask=None):
+    if Output is None:
+        Output = np.zeros(Shape, dtype=np.uint16)
+    windows = list(IterBlocks(Shape, BlockSize))
+    candidates = TileCandidates(Features, Transform)
+
+    def Rasterize(window):
+        tile = RasterizeTile(Features, candidates(window), Transform, window)
+        if Mask is not None:
+            tile[~ReadBlock(Mask, window)] = 0
+        Output[window] = tile
+
+    with ThreadPoolExecutor(max_workers=Workers or os.cpu_count() or 1) as pool:
+        list(pool.map(Rasterize, windows))
+
+    return Output
+
+# Polygon features coded by a field
+# Requires: Rings=<list of rings per feature>, Values=<field value per feature>, Codes=<optional code table, built from Values if None>
+# Returns: (list of PolygonFeature, code table of field value: code)
+def CodeFeatures(Rings, Values, Codes=None):
+    Codes = Codes or BuildCodeTable(Values)
+    if len(Codes) > np.iinfo(np.uint16).max:
+        raise ValueError(f'{len(Codes)} distinct values do not fit in uint16 codes.')
+    return [PolygonFeature(rings, Codes[str(value)]) for rings, value in zip(Rings, Values)], Codes
@@ -11,22 +11,40 @@ import arcpy
 from arcpy.sa import *
 from sys import argv
 
+from Instrumentation import Traced
+
 # Special characters for improved readability of geoprocessing messages
 nl = '\n'  # var can be used in f-strings to represent newline character
 tb = '\t'  # var can be used in f-strings to represent tab character
 
-def CalcSlope(DEM, Slope, Snap_Raster, Mask_Geom):  # Slope
+# Backend='numpy' computes Horn planar slope on tiles with a thread pool, skipping tiles outside the mask; the arcpy reads are serialized, so only the arithmetic runs in parallel. Refer to Slope_Tiles.py for details
+@Traced(Tags=('Backend',))
+def CalcSlope(DEM, Slope, Snap_Raster, Mask_Geom, Backend='arcpy', Workers=None):  # Slope
+
+    # Processing environment, scoped to this function (the global arcpy.env is left unchanged).
+    # To allow overwriting outputs overwriteOutput option is True.
+    with arcpy.EnvManager(overwriteOutput=True, extent=Mask_Geom, mask=Mask_Geom, snapRaster=Snap_Raster):
 
-    # To allow overwriting outputs change overwriteOutput option to True.
-    arcpy.env.overwriteOutput = True
-    arcpy.env.extent = Mask_Geom  # Default processing extent
-    arcpy.env.mask = Mask_Geom  # Default processing mask
-    arcpy.env.snapRaster = Snap_Raster  # Default processing snap raster
+        if Backend == 'numpy':
+            import numpy as np
+            from Block_Processing import ValidSource
+            from Slope_Tiles import SlopeTiles
+            from Raster_IO import ArcRasterReader, AlignRaster, TransformCellSize
+            from Raster_Store import CreateRaster
 
+            # Process: Slope, tiles read with a 1 cell halo from the DEM within the mask, computed in parallel and written to their window of the output
+            print('\tSlope (NumPy)...')
+            reader = ArcRasterReader(AlignRaster(DEM, Snap_Raster, Mask_Geom))
+            # The snap raster within the mask, read per tile, so tiles outside the mask never read the DEM (as Resample_Raster.py)
+            mask = ValidSource(ArcRasterReader(AlignRaster(Snap_Raster, Snap_Raster, Mask_Geom)))
+            with CreateRaster(Slope, reader.shape, np.float32, reader.transform, SpatialReference=reader.spatialReference) as outSlope:
+                _, skipped = SlopeTiles(reader, TransformCellSize(reader.transform), Output=outSlope, Mask=mask, NoData=reader.noData, Workers=Workers)
+            print(f'\t\t{skipped:.0%} of tiles outside the mask skipped.')
+            return Slope
 
-    # Process: Slope (Slope) (sa)
-    outSlope = arcpy.sa.Slope(DEM, 'DEGREE', method='PLANAR')
-    print(f'\t{arcpy.GetMessages().replace(nl, nl+tb)}')
-    outSlope.save(Slope)
+        # Process: Slope (Slope) (sa)
+        outSlope = arcpy.sa.Slope(DEM, 'DEGREE', method='PLANAR')
+        print(f'\t{arcpy.GetMessages().replace(nl, nl+tb)}')
+        outSlope.save(Slope)
 
-    return outSlope
+        return outSlope
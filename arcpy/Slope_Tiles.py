@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Slope Tiles
+Objective:  Tiled, multithreaded planar slope (Horn 3x3, degrees) (NumPy, no arcpy) as a part of ATUR Suitability Analysis
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from Block_Processing import BLOCK_SIZE, IterBlocks, ReadBlock, SourceNoData, ValidMask
+
+"""
+Native backend for arcpy.sa.Slope(DEM, 'DEGREE', method='PLANAR').
+    - Slope is computed with the Horn (1981) 3x3 kernel, as the PLANAR method:
+        dz/dx = ((c + 2f + i) - (a + 2d + g)) / (8 * cellX), dz/dy = ((g + 2h + i) - (a + 2b + c)) / (8 * cellY), slope = atan(sqrt(dz/dx^2 + dz/dy^2))
+    - As with arcpy, NoData neighbours (and neighbours outside the raster) take the value of the center cell, and NoData centers are NoData.
+    - Tiles are read with a 1 cell halo and computed on a thread pool (NumPy releases the GIL in the array arithmetic). Tiles without any cell inside the mask are skipped without reading the DEM (without a mask, tiles of NoData only are skipped after the read).
+    - Reads of a Raster_IO.ArcRasterReader are serialized under its lock, so with an arcpy DEM only the slope arithmetic scales with the threads; memory mapped (.npy) and Zarr sources are read in parallel.
+    - Each tile is written to its window of the output (any array-like accepting [rowSlice, colSlice] assignment, e.g. np.memmap or a Raster_Store.CreateRaster writer), so neither the DEM nor the slope is held whole in memory.
+"""
+
+# Horn planar slope (degrees) of the inner cells of a block with a 1 cell halo
+# Requires: Block=<float array with a 1 cell halo, NaN for NoData (and outside the raster)>, CellSize=<(x, y) cell size>
+def HornSlope(Block, CellSize):
+    cellX, cellY = CellSize
+    center = Block[1:-1, 1:-1]
+    rows, cols = center.shape
+
+    # Neighbour of the center cell at (dr, dc), NoData replaced by the center value
+    def Neighbour(dr, dc):
+        n = Block[1 + dr:1 + dr + rows, 1 + dc:1 + dc + cols]
+        return np.where(np.isnan(n), center, n)
+
+    a, b, c = Neighbour(-1, -1), Neighbour(-1, 0), Neighbour(-1, 1)
+    d, f = Neighbour(0, -1), Neighbour(0, 1)
+    g, h, i = Neighbour(1, -1), Neighbour(1, 0), Neighbour(1, 1)
+    dzdx = ((c + 2 * f + i) - (a + 2 * d + g)) / (8 * cellX)
+    dzdy = ((g + 2 * h + i) - (a + 2 * b + c)) / (8 * cellY)
+    return np.degrees(np.arctan(np.hypot(dzdx, dzdy))).astype(np.float32)
+
+# Read a window with a 1 cell halo, NaN outside the raster and for NoData
+def _ReadHalo(Source, Window, NoData):
+    rows, cols = Source.shape[:2]
+    rowSlice, colSlice = Window
+    r0, r1, c0, c1 = max(rowSlice.start - 1, 0), min(rowSlice.stop + 1, rows), max(colSlice.start - 1, 0), min(colSlice.stop + 1, cols)
+    block = ReadBlock(Source, (slice(r0, r1), slice(c0, c1)))
+    halo = np.full((rowSlice.stop - rowSlice.start + 2, colSlice.stop - colSlice.start + 2), np.nan, dtype=np.float64)
+    top, left = r0 - (rowSlice.start - 1), c0 - (colSlice.start - 1)
+    halo[top:top + block.shape[0], left:left + block.shape[1]] = np.where(ValidMask(block, NoData), block, np.nan)
+    return halo
+
+# Slope of one tile, written to its window of the output
+# Without a mask, the DEM NoData is the mask: tiles without a valid center cell are skipped after the read
+# Returns: True if the tile was computed, False if skipped (no cell inside the mask, written as NoData)
+def _SlopeTile(DEM, Output, Window, CellSize, NoData, Mask):
+    shape = (Window[0].stop - Window[0].start, Window[1].stop - Window[1].start)
+    mask = None if Mask is None else ReadBlock(Mask, Window).astype(bool)
+    if mask is not None and not mask.any():
+        Output[Window] = np.full(shape, np.nan, dtype=np.float32)
+        return False
+    halo = _ReadHalo(DEM, Window, NoData)
+    if np.isnan(halo[1:-1, 1:-1]).all():
+        Output[Window] = np.full(shape, np.nan, dtype=np.float32)
+        return False
+    slope = HornSlope(halo, CellSize)
+    slope[np.isnan(halo[1:-1, 1:-1])] = np.nan
+    if mask is not None:
+        slope[~mask] = np.nan
+    Output[Window] = slope
+    return True
+
+# Planar slope (degrees) of a DEM, tile by tile on a thread pool
+# Requires: DEM=<raster source, see Block_Processing.py>, CellSize=<(x, y) cell size>, Output=<optional float32 array-like, e.g. a Raster_Store.CreateRaster writer, every window is written>, Mask=<optional boolean raster source, True inside processing extent>, NoData=<DEM NoData value>, Workers=<threads>
+# Returns: (Output, fraction of tiles skipped by the mask)
+def SlopeTiles(DEM, CellSize, Output=None, Mask=None, NoData=None, BlockSize=BLOCK_SIZE, Workers=None):
+    NoData = NoData if NoData is not None else SourceNoData(DEM)
+    if Output is None:
+        Output = np.full(DEM.shape[:2], np.nan, dtype=np.float32)
+    windows = list(IterBlocks(DEM.shape[:2], BlockSize))
+    Workers = Workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=Workers) as pool:
+        computed = list(pool.map(lambda window: _SlopeTile(DEM, Output, window, CellSize, NoData, Mask), windows))
+
+    return Output, 1 - sum(computed) / len(windows)
+
+# Check the native slope against arcpy.sa.Slope(DEM, 'DEGREE', method='PLANAR')
+# Requires: DEM=<test DEM raster>, Mask_Geom=<feature to define mask>
+# Returns: dict of compared cells, maximum and mean absolute difference (degrees)
+def CompareWithArcpy(DEM, Mask_Geom):
+    import arcpy
+    from Raster_IO import ArcRasterReader, AlignRaster, TransformCellSize
+
+    reader = ArcRasterReader(AlignRaster(DEM, DEM, Mask_Geom))
+    slope, _ = SlopeTiles(reader[:, :], TransformCellSize(reader.transform), NoData=reader.noData)
+    with arcpy.EnvManager(extent=Mask_Geom, mask=Mask_Geom, snapRaster=DEM):
+        reference = ArcRasterReader(arcpy.sa.Slope(reader.raster, 'DEGREE', method='PLANAR'))[:, :]
+    valid = ~np.isnan(slope) & ~np.isnan(reference)
+    difference = np.abs(slope[valid] - reference[valid])
+    report = {'cells': int(valid.sum()), 'maxAbsoluteDifference': float(difference.max()) if difference.size else 0.0,
+              'meanAbsoluteDifference': float(difference.mean()) if difference.size else 0.0}
+    print('\tNative vs. arcpy slope (degrees):')
+    print('\n'.join(f'\t\t{name}: {value}' for name, value in report.items()))
+
+    return report
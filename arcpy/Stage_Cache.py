@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Stage Cache
+Objective:  Content-hash cache for preprocessing stages as a part of ATUR Suitability Analysis
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+
+"""
+Each preprocessing stage is keyed on a hash of
+    - its input files (path, size and modification time, or full contents for small files such as the extent shapefile)
+    - the keys of the stages it depends on (e.g. drainage density depends on the stream features)
+    - its parameters (extent, snap raster, coordinate system, stream threshold, search radius, ...)
+The key of every completed stage is recorded, with its outputs, in a JSON manifest (StageCache.json) in the workspace.
+A stage is re-run only if its key changed or one of its outputs is missing, so a cache hit costs only a metadata lookup.
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime
+
+from Instrumentation import Count
+
+MANIFEST_NAME = 'StageCache.json'
+# Files smaller than this are fingerprinted by content rather than size/mtime (i.e. extent shapefiles)
+CONTENT_HASH_LIMIT = 16 * 1024 ** 2
+# Shapefile sidecar files that are part of the geometry/attributes
+SHAPEFILE_PARTS = ('.shp', '.shx', '.dbf', '.prj', '.cpg')
+
+# Fingerprint of a single file, by content (Content=True) or by size and modification time
+def _FileFingerprint(Path, Content=None):
+    stat = os.stat(Path)
+    if Content is None:
+        Content = stat.st_size <= CONTENT_HASH_LIMIT
+    if Content:
+        digest = hashlib.sha256()
+        with open(Path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 ** 2), b''):
+                digest.update(chunk)
+        return f'sha256:{digest.hexdigest()}'
+    return f'stat:{stat.st_size}:{stat.st_mtime_ns}'
+
+# Fingerprint of an input path: a file, a shapefile (with its sidecar files), or a folder (e.g. file GDB or layer package)
+def Fingerprint(Path, Content=None):
+    Path = os.path.abspath(str(Path))
+    parts = []
+    if os.path.isdir(Path):
+        for root, dirs, files in os.walk(Path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith('.lock'):
+                    continue
+                full = os.path.join(root, name)
+                parts.append((os.path.relpath(full, Path), _FileFingerprint(full, False)))
+    elif os.path.isfile(Path):
+        stem, ext = os.path.splitext(Path)
+        files = [stem + p for p in SHAPEFILE_PARTS if os.path.isfile(stem + p)] if ext.lower() == '.shp' else [Path]
+        parts = [(os.path.basename(f), _FileFingerprint(f, Content)) for f in files]
+    else:
+        # Not a file on disk (e.g. a dataset inside a GDB), fingerprint by name only
+        parts = [('missing', Path)]
+
+    return hashlib.sha256(json.dumps([Path, parts]).encode()).hexdigest()
+
+# Per-workspace cache of preprocessing stages
+# Requires: Workspace=<folder holding the manifest>, Exists=<function testing if an output exists, e.g. arcpy.Exists for GDB datasets>
+class StageCache:
+
+    def __init__(self, Workspace, Exists=os.path.exists, ManifestName=MANIFEST_NAME):
+        self.path = os.path.join(Workspace, ManifestName)
+        self.exists = Exists
+        self.manifest = {}
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path) as f:
+                    self.manifest = json.load(f)
+            except (OSError, ValueError):
+                self.manifest = {}
+
+    # Cache key of a stage
+    # Requires: Stage=<stage name>, Inputs=<list of input paths>, Depends=<list of upstream stage keys>, Params=<dict of JSON serializable parameters>
+    def Key(self, Stage, Inputs=(), Depends=(), Params=None):
+        payload = {
+            'stage': Stage,
+            'inputs': [Fingerprint(path) for path in Inputs],
+            'depends': list(Depends),
+            'params': Params or {},
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    # True if the stage was completed with the same key and all of its outputs still exist
+    def Hit(self, Stage, Key):
+        entry = self.manifest.get(Stage)
+        hit = entry is not None and entry['key'] == Key and all(self.exists(output) for output in entry['outputs'])
+        Count('cacheHits' if hit else 'cacheMisses')
+        return hit
+
+    # Record a completed stage
+    def Record(self, Stage, Key, Outputs):
+        self.manifest[Stage] = {'key': Key, 'outputs': [str(o) for o in Outputs], 'completed': datetime.now().isoformat(timespec='seconds')}
+        # Write to a temporary file first, so an interrupted run never leaves a corrupt manifest
+        temp = f'{self.path}.tmp'
+        with open(temp, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(temp, self.path)
+
+    # Run a stage unless it is cached
+    # Requires: Stage=<stage name>, Key=<cache key>, Outputs=<list of stage outputs>, Function=<callable running the stage>
+    # Returns: (result of Function, or None if cached; True if cached)
+    def Run(self, Stage, Key, Outputs, Function, *args, **kwargs):
+        if self.Hit(Stage, Key):
+            print(f'\tCached ({Stage}), skipping.')
+            return None, True
+        result = Function(*args, **kwargs)
+        self.Record(Stage, Key, Outputs)
+        return result, False
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Stage Graph
+Objective:  Dependency-graph executor for preprocessing stages as a part of ATUR Suitability Analysis
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+
+"""
+Preprocessing stages are declared with the stages they depend on (e.g. drainage density depends on the stream features from hydrologic conditioning).
+A stage is started as soon as all of its dependencies are done, so independent branches (slope, precipitation resampling, lithology rasterization) run alongside hydrologic conditioning.
+    - Each stage runs in a separate worker process (spawn) with its own arcpy session, and its environment (workspace, extent, mask, snap raster, coordinate system, ...) is applied with arcpy.EnvManager for the call only.
+    - Cached stages (Stage_Cache.py) are checked and recorded in the main process only, so workers never write the cache manifest.
+    - A stage's Setup (e.g. creating the store it writes to) runs in the main process before the stage starts, and its Publish (e.g. copying its outputs from its own store into a shared one) after it is done and before any dependent stage starts, one stage at a time. Stores that do not support concurrent writers (file geodatabases) are only ever written by one process.
+    - Start and end times of every stage are recorded, and the critical path (the chain of dependencies ending with the last stage to finish) is reported.
+    - With tracing enabled, each stage run is a trace event (Instrumentation.py) nested in the caller's event, in worker processes too. Cached stages are not events (they would sit in the critical path and hotspots at zero length): they are counted as cache hits and listed in the notes (cachedStages) of the caller's event.
+"""
+
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from time import perf_counter
+
+from Instrumentation import Span, Context, Note
+
+# A stage of the graph
+# Requires: Name=<unique stage name>, Function=<module level callable running the stage>, Args/Kwargs=<arguments of Function>, Depends=<names of upstream stages>, Env=<dict of arcpy.env settings for the stage>, Key=<optional cache key, see Stage_Cache.py>, Outputs=<outputs recorded in the cache>,
+#           Setup/Publish=<optional callables (no arguments) run in the main process before the stage starts and after it is done>
+class Stage:
+
+    def __init__(self, Name, Function, Args=(), Kwargs=None, Depends=(), Env=None, Key=None, Outputs=(), Setup=None, Publish=None):
+        self.name = Name
+        self.function = Function
+        self.args = tuple(Args)
+        self.kwargs = dict(Kwargs or {})
+        self.depends = tuple(Depends)
+        self.env = dict(Env or {})
+        self.key = Key
+        self.outputs = list(Outputs)
+        self.setup = Setup
+        self.publish = Publish
+
+# Worker, run one stage within its own arcpy environment
+# Geoprocessing results are not returned (they cannot be pickled), stage outputs are written to the workspace
+# The stage is traced as a span named after it, nested in the Parent span (Instrumentation.Context) of the process running the graph
+def _RunStage(Function, Args, Kwargs, Env, Name=None, Parent=None, Tags=None):
+    start = perf_counter()
+    with Span(Name or Function.__name__, Parent, **(Tags or {})):
+        _Call(Function, Args, Kwargs, Env)
+
+    return perf_counter() - start
+
+def _Call(Function, Args, Kwargs, Env):
+    if Env:
+        import arcpy
+        Env = dict(Env)
+        # Coordinate systems are passed as WKID (arcpy.SpatialReference cannot be pickled)
+        if isinstance(Env.get('outputCoordinateSystem'), int):
+            Env['outputCoordinateSystem'] = arcpy.SpatialReference(Env['outputCoordinateSystem'])
+        with arcpy.EnvManager(**Env):
+            Function(*Args, **Kwargs)
+    else:
+        Function(*Args, **Kwargs)
+
+# Check that all dependencies exist and the graph has no cycles
+# Returns: list of stage names in a valid (topological) order
+def TopologicalOrder(Stages):
+    stages = {stage.name: stage for stage in Stages}
+    if len(stages) != len(Stages):
+        raise ValueError('Stage names must be unique.')
+    for stage in Stages:
+        for depend in stage.depends:
+            if depend not in stages:
+                raise ValueError(f'Stage {stage.name} depends on unknown stage {depend}.')
+    order, done = [], set()
+    remaining = list(stages)
+    while remaining:
+        ready = [name for name in remaining if all(d in done for d in stages[name].depends)]
+        if not ready:
+            raise ValueError(f'Stage graph has a cycle: {", ".join(remaining)}')
+        for name in ready:
+            remaining.remove(name)
+            done.add(name)
+            order.append(name)
+    return order
+
+# Critical path, the chain of dependencies ending with the stage that finished last (cached stages took no time and are left out)
+# Requires: Stages=<list of Stage>, Timings=<dict of stage name: {'start', 'end', 'status', ...}> (from RunGraph)
+# Returns: list of stage names, first to last
+def CriticalPath(Stages, Timings):
+    stages = {stage.name: stage for stage in Stages}
+    ran = {name: t for name, t in Timings.items() if t['status'] != 'cached'}
+    if not ran:
+        return []
+    name = max(ran, key=lambda n: ran[n]['end'])
+    path = [name]
+    while [d for d in stages[name].depends if d in ran]:
+        name = max([d for d in stages[name].depends if d in ran], key=lambda n: ran[n]['end'])
+        path.append(name)
+    return path[::-1]
+
+# Run a graph of stages, independent stages concurrently
+# Requires: Stages=<list of Stage>, Workers=<max worker processes (1 runs every stage in this process, in order)>, Cache=<optional StageCache (Stage_Cache.py)>
+# Returns: dict of stage name: {'start', 'end', 'wall', 'status'}, times (s) relative to the start of the graph
+def RunGraph(Stages, Workers=None, Cache=None):
+    order = TopologicalOrder(Stages)
+    stages = {stage.name: stage for stage in Stages}
+    Workers = Workers or min(len(Stages), os.cpu_count() or 1)
+    timings = {}
+    origin = perf_counter()
+
+    # Cached stages are done before the graph starts
+    done = set()
+    for name in order:
+        stage = stages[name]
+        if Cache is not None and stage.key is not None and Cache.Hit(name, stage.key):
+            print(f'\tCached ({name}), skipping.')
+            Note('cachedStages', name)
+            timings[name] = {'start': 0.0, 'end': 0.0, 'wall': 0.0, 'status': 'cached'}
+            done.add(name)
+    pending = [name for name in order if name not in done]
+
+    # Trace tags of a stage that is run
+    def StageTags(name):
+        return {'cache': 'miss'} if Cache is not None and stages[name].key is not None else {}
+
+    # Stage about to start, run its setup (main process only)
+    def Start(name):
+        print(f'\tStarting {name}...')
+        if stages[name].setup is not None:
+            stages[name].setup()
+        return perf_counter() - origin
+
+    # Completed stage, publish its outputs and record it in the cache (main process only)
+    def Complete(name, start):
+        if stages[name].publish is not None:
+            stages[name].publish()
+        end = perf_counter() - origin
+        timings[name] = {'start': start, 'end': end, 'wall': end - start, 'status': 'done'}
+        done.add(name)
+        if Cache is not None and stages[name].key is not None:
+            Cache.Record(name, stages[name].key, stages[name].outputs)
+        print(f'\t{name} done in {end - start:.1f} s')
+
+    if Workers <= 1:
+        for name in pending:
+            stage = stages[name]
+            start = Start(name)
+            _RunStage(stage.function, stage.args, stage.kwargs, stage.env, name, Tags=StageTags(name))
+            Complete(name, start)
+    else:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=Workers, mp_context=context) as pool:
+            running = {}  # future: (stage name, start)
+            while pending or running:
+                # Start every stage whose dependencies are done
+                for name in [n for n in pending if all(d in done for d in stages[n].depends)]:
+                    if len(running) >= Workers:
+                        break
+                    stage = stages[name]
+                    pending.remove(name)
+                    start = Start(name)
+                    running[pool.submit(_RunStage, stage.function, stage.args, stage.kwargs, stage.env, name, Context(), StageTags(name))] = (name, start)
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name, start = running.pop(future)
+                    try:
+                        future.result()
+                    except Exception:
+                        # Let running stages finish (they may be cached on the next run), but start no new stages
+                        for other in running:
+                            other.cancel()
+                        wait(running)
+                        for other, (otherName, otherStart) in running.items():
+                            if not other.cancelled() and other.exception() is None:
+                                Complete(otherName, otherStart)
+                        raise
+                    Complete(name, start)
+
+    ReportTimings(Stages, timings)
+
+    return timings
+
+# Print the per-stage timing table and the critical path
+def ReportTimings(Stages, Timings):
+    print('Stage Timings (s):')
+    print(f'\t{"stage":<24}{"status":<8}{"start":>8}{"end":>8}{"wall":>8}')
+    for name, t in sorted(Timings.items(), key=lambda item: item[1]['start']):
+        print(f"\t{name:<24}{t['status']:<8}{t['start']:>8.1f}{t['end']:>8.1f}{t['wall']:>8.1f}")
+    path = CriticalPath(Stages, Timings)
+    if path:
+        total = Timings[path[-1]]['end']
+        print(f"\tCritical path ({total:.1f} s): {' -> '.join(path)}")
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Stream Vectors
+Objective:  Stream link extraction from a D8 direction grid, Douglas-Peucker simplification and bulk vector output (NumPy, no arcpy) as a part of ATUR Suitability Analysis
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import numpy as np
+
+from Flow_Routing import DownstreamIndex
+from Raster_IO import CellCenters
+
+# Optional, bulk geometry construction and GDAL output (GeoPackage, FlatGeobuf, file GDB)
+try:
+    import shapely
+except ImportError:
+    shapely = None
+try:
+    import pyogrio
+except ImportError:
+    pyogrio = None
+
+"""
+Native replacement for arcpy.sa.StreamToFeature(streams, flow direction, output, "SIMPLIFY").
+    - Stream cells are split into links at sources and junctions (a link starts at every stream cell without exactly one upstream stream cell) and at outlets.
+    - Cells are ordered along their link by pointer jumping (list ranking) on the downstream stream cell, so no cell is visited in a Python loop.
+    - Links are held as flat arrays: X and Y of all vertices, and the offset of the first vertex of each link. Each link ends on the first cell of the link downstream of it, so links are connected as in StreamToFeature.
+    - Douglas-Peucker simplification runs on all links at once, splitting every segment whose furthest vertex is beyond the tolerance on each iteration.
+    - Links are written in a single call (shapely.linestrings + pyogrio), to GeoPackage (.gpkg), FlatGeobuf (.fgb), shapefile (.shp) or file GDB (<folder>.gdb/<layer>).
+"""
+
+# Stream links from a D8 direction grid and a stream grid
+# Requires: FlowDir=<uint8 D8 direction array (Flow_Routing.py)>, Streams=<boolean array, True for stream cells>, Transform=<geotransform of the grid>
+# Returns: dict of 'x', 'y' (vertex coordinates), 'offsets' (first vertex of each link, plus the total count), 'fromNode' (flat index of the first cell of each link), 'toNode' (flat index of the downstream junction, -1 at outlets), 'toLink' (downstream link, -1 at outlets)
+def ExtractStreamLinks(FlowDir, Streams, Transform):
+    cols = FlowDir.shape[1]
+    streams = np.asarray(Streams, dtype=bool).ravel()
+    cells = np.flatnonzero(streams)
+    down = DownstreamIndex(FlowDir).astype(np.int64)
+    # Downstream stream cell of every stream cell (-1 where the stream ends)
+    downStream = down[cells]
+    downStream[downStream >= 0] = np.where(streams[downStream[downStream >= 0]], downStream[downStream >= 0], -1)
+
+    # Compact index of stream cells
+    compact = np.full(streams.size, -1, dtype=np.int64)
+    compact[cells] = np.arange(cells.size)
+    nxt = np.where(downStream >= 0, compact[np.maximum(downStream, 0)], -1)
+    upstream = np.bincount(nxt[nxt >= 0], minlength=cells.size)
+    # Link heads, sources (no upstream) and junctions (two or more upstream)
+    head = upstream != 1
+    junction = np.where(nxt >= 0, nxt, 0)
+    junction = np.where((nxt >= 0) & head[junction], nxt, -1)
+
+    # List ranking, last cell (tail) of the link of every cell and the distance to it
+    link = np.where((nxt >= 0) & (junction < 0), nxt, np.arange(cells.size))
+    distance = (link != np.arange(cells.size)).astype(np.int64)
+    while True:
+        jumped = link[link]
+        if np.array_equal(jumped, link):
+            break
+        distance = distance + distance[link]
+        link = jumped
+
+    # Vertices, link cells from head to tail, then the downstream junction cell
+    tails = np.flatnonzero(link == np.arange(cells.size))
+    tailJunction = junction[tails]
+    joins = tailJunction >= 0
+    vertexLink = np.concatenate([link, tails[joins]])
+    vertexCell = np.concatenate([cells, cells[tailJunction[joins]]])
+    vertexOrder = np.concatenate([-distance, np.ones(np.count_nonzero(joins), dtype=np.int64)])
+    order = np.lexsort((vertexOrder, vertexLink))
+    vertexLink, vertexCell = vertexLink[order], vertexCell[order]
+    linkIds, starts = np.unique(vertexLink, return_index=True)
+
+    rows, columns = np.divmod(vertexCell, cols)
+    x, y = CellCenters(Transform, rows, columns)
+    # Link ids are numbered by tail; the downstream link of a link is the link its junction cell heads
+    linkOf = np.full(cells.size, -1, dtype=np.int64)
+    linkOf[linkIds] = np.arange(linkIds.size)
+    toLink = np.where(tailJunction >= 0, linkOf[link[np.maximum(tailJunction, 0)]], -1)
+    return {
+        'x': x, 'y': y,
+        'offsets': np.append(starts, vertexCell.size),
+        'fromNode': vertexCell[starts],
+        'toNode': np.where(tailJunction >= 0, cells[np.maximum(tailJunction, 0)], -1),
+        'toLink': toLink,
+    }
+
+# Douglas-Peucker simplification of all links at once
+# Requires: X, Y=<vertex coordinates>, Offsets=<first vertex of each line, plus the total count>, Tolerance=<maximum distance of a removed vertex from the simplified line>
+# Returns: (X, Y, Offsets) of the simplified lines; the first and last vertex of every line are kept
+def SimplifyLines(X, Y, Offsets, Tolerance):
+    keep = np.zeros(X.size, dtype=bool)
+    keep[Offsets[:-1]] = True
+    keep[Offsets[1:] - 1] = True
+    # Pending segments (first, last vertex), with at least one vertex between them
+    first, last = Offsets[:-1], Offsets[1:] - 1
+    pending = last - first > 1
+    first, last = first[pending], last[pending]
+    while first.size:
+        counts = last - first - 1
+        segment = np.repeat(np.arange(first.size), counts)
+        vertex = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + first[segment] + 1
+        # Distance of each interior vertex from the chord of its segment
+        x0, y0, x1, y1 = X[first][segment], Y[first][segment], X[last][segment], Y[last][segment]
+        dx, dy = x1 - x0, y1 - y0
+        length = np.hypot(dx, dy)
+        cross = np.abs(dx * (Y[vertex] - y0) - dy * (X[vertex] - x0))
+        dist = np.where(length > 0, cross / np.where(length > 0, length, 1), np.hypot(X[vertex] - x0, Y[vertex] - y0))
+        # Furthest vertex of each segment
+        starts = np.cumsum(counts) - counts
+        furthest = np.maximum.reduceat(dist, starts)
+        split = furthest > Tolerance
+        isMax = dist == np.repeat(furthest, counts)
+        # First vertex reaching the maximum of each segment
+        candidate = np.where(isMax, np.arange(dist.size), dist.size)
+        at = np.minimum.reduceat(candidate, starts)
+        splitAt = vertex[at[split]]
+        keep[splitAt] = True
+        first, last = np.concatenate([first[split], splitAt]), np.concatenate([splitAt, last[split]])
+        pending = last - first > 1
+        first, last = first[pending], last[pending]
+
+    lineOf = np.repeat(np.arange(Offsets.size - 1), np.diff(Offsets))
+    kept = np.bincount(lineOf[keep], minlength=Offsets.size - 1)
+    return X[keep], Y[keep], np.concatenate([[0], np.cumsum(kept)])
+
+# Write lines to a vector dataset in a single call
+# Requires: X, Y, Offsets=<flat line arrays>, Output=<.gpkg, .fgb or .shp file, or <folder>.gdb/<layer>>, Fields=<dict of field name: array, one value per line>, CRS=<coordinate system, e.g. 'EPSG:32612'>
+def WriteLines(X, Y, Offsets, Output, Fields=None, CRS='EPSG:32612'):
+    if shapely is None or pyogrio is None:
+        raise ImportError('Writing stream vectors requires shapely (>= 2.0) and pyogrio.')
+    import os
+
+    indices = np.repeat(np.arange(Offsets.size - 1), np.diff(Offsets))
+    lines = shapely.linestrings(np.column_stack([X, Y]), indices=indices)
+    fields = Fields or {}
+    path, layer, driver = Output, None, None
+    if os.path.dirname(Output).lower().endswith('.gdb'):
+        path, layer, driver = os.path.dirname(Output), os.path.basename(Output), 'OpenFileGDB'
+    pyogrio.write(path, shapely.to_wkb(lines), [np.asarray(v) for v in fields.values()], list(fields), layer=layer, driver=driver,
+                  geometry_type='LineString', crs=CRS)
+
+    return Output
+
+# Stream features from a D8 direction grid and a stream grid (native StreamToFeature)
+# Requires: FlowDir=<uint8 D8 direction array>, Streams=<boolean array>, Transform=<geotransform of the grid>, Output=<output vector dataset, see WriteLines>, Tolerance=<Douglas-Peucker tolerance (map units), None or 0 to keep every cell>
+# Returns: dict from ExtractStreamLinks (simplified)
+def StreamToFeature(FlowDir, Streams, Transform, Output=None, Tolerance=None, CRS='EPSG:32612'):
+    links = ExtractStreamLinks(FlowDir, Streams, Transform)
+    if Tolerance:
+        links['x'], links['y'], links['offsets'] = SimplifyLines(links['x'], links['y'], links['offsets'], Tolerance)
+    print(f"\t\t{links['offsets'].size - 1} stream links, {links['x'].size} vertices.")
+    if Output is not None:
+        fields = {'arcid': np.arange(1, links['offsets'].size, dtype=np.int32), 'grid_code': np.ones(links['offsets'].size - 1, dtype=np.int32),
+                  'from_node': links['fromNode'].astype(np.int64), 'to_node': links['toNode'].astype(np.int64),
+                  'to_arcid': np.where(links['toLink'] >= 0, links['toLink'] + 1, 0).astype(np.int32)}
+        WriteLines(links['x'], links['y'], links['offsets'], Output, fields, CRS)
+
+    return links
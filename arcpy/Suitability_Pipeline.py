@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Suitability Pipeline
+Objective:  Fused single-pass classify-and-weight suitability pipeline (NumPy, no arcpy) as a part of ATUR Suitability Analysis
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import numpy as np
+
+from Block_Processing import BLOCK_SIZE, MaskedBlocks, ReadBlock, CommonShape, SourceNoData, ValidMask, EMPTY
+from Instrumentation import Traced
+from Lookup_Reclass import NODATA_CLASS
+from Rescale_Functions import MissingStatistics, EvaluateInPlace
+from Weighted_Overlay import OverlayAccumulator
+
+"""
+FloodSuitability.py and RechargeSuitability.py classify each of the nine layers, save it to Classified_X in the file GDB, and read all nine back for the raster calculator.
+The fused pipeline reads each input window once, classifies it (range LUT, categorical LUT, or Tf function) and adds (classified * weight) straight into the float32 accumulator, so no Classified_X intermediates are written.
+Classified layers can still be kept for debugging with SaveIntermediates=True.
+"""
+
+# A layer of the fused pipeline
+# Requires: Name=<layer name, e.g. 'DEM'>, Source=<raster source, see Block_Processing.py>, Classifier=<RangeLUT/CategoricalLUT (Lookup_Reclass.py) or Tf* function (Rescale_Functions.py)>, Weight=<layer weight>, NoData=<optional source NoData value>, Stats=<optional dict of data minimum/maximum/mean/std, Tf functions only>
+class PipelineLayer:
+
+    def __init__(self, Name, Source, Classifier, Weight, NoData=None, Stats=None):
+        self.name = Name
+        self.source = Source
+        self.classifier = Classifier
+        self.weight = Weight
+        self.noData = NoData if NoData is not None else SourceNoData(Source)
+        self.stats = Stats
+
+    # True for Tf* functions (continuous, float32 output), False for lookup tables (uint8 output)
+    @property
+    def continuous(self):
+        return hasattr(self.classifier, 'Compile')
+
+    # NoData value of the classified output
+    @property
+    def classNoData(self):
+        return np.nan if self.continuous else NODATA_CLASS
+
+    # Prepare for streaming, compile Tf functions once (statistics are computed if not given, refer to CompileLayers to compute them for several layers in one pass)
+    def Compile(self, From=1, To=5, BlockSize=BLOCK_SIZE):
+        if self.continuous:
+            if self.stats is None:
+                self.stats = MissingStatistics([self.source], [None], [self.noData], BlockSize)[0]
+            self._compiled = self.classifier.Compile(From, To, self.stats)
+            self._buffer = np.empty(BlockSize, dtype=np.float32)
+
+    # Classify a block of the source
+    def Classify(self, Block):
+        if not self.continuous:
+            return self.classifier(Block, self.noData)
+        out = self._buffer[:Block.shape[0], :Block.shape[1]]
+        out[...] = Block
+        if self.noData is not None:
+            out[~ValidMask(Block, self.noData)] = np.nan
+        return EvaluateInPlace(out, self._compiled)
+
+# Compile the layers of a pipeline, with the statistics missing from continuous layers computed in a single pass over their sources (Raster_Statistics.MultiRasterStatistics)
+# Layers sharing a source (e.g. DEM of the flood and recharge models) share its statistics
+def CompileLayers(Layers, From=1, To=5, BlockSize=BLOCK_SIZE):
+    missing = {}
+    for layer in Layers:
+        if layer.continuous and layer.stats is None:
+            missing.setdefault(id(layer.source), layer)
+    computed = MissingStatistics([layer.source for layer in missing.values()], [None] * len(missing), [layer.noData for layer in missing.values()], BlockSize)
+    stats = dict(zip(missing, computed))
+    for layer in Layers:
+        if layer.continuous and layer.stats is None:
+            layer.stats = stats[id(layer.source)]
+        layer.Compile(From, To, BlockSize)
+
+# Class levels (multiples of Step) of a classified block, classes coded as integers (refer to Combination_Index.py and Weight_Sensitivity.py)
+# Requires: Classified=<classified block>, NoData=<classified NoData value, refer to PipelineLayer.classNoData>, Step=<class quantization step>, Levels=<number of levels, classes must round to 0 - Levels - 1>, NoDataLevel=<level of NoData cells>, DType=<integer dtype of the levels>
+def ClassLevels(Classified, NoData, Step, Levels, NoDataLevel=-1, DType=np.int64):
+    valid = ~np.isnan(Classified) if np.isnan(NoData) else Classified != NoData
+    levels = np.full(Classified.shape, NoDataLevel, dtype=DType)
+    values = np.rint(Classified[valid] / Step)
+    if values.size and (values.min() < 0 or values.max() >= Levels):
+        raise ValueError(f'Classified values outside 0 - {(Levels - 1) * Step:g} cannot be coded as class levels.')
+    levels[valid] = values
+    return levels
+
+# Classify and weight all layers of several models (e.g. flood and recharge) in a single streamed pass
+# Layers of different models that share a Source object read each window of it only once. Running min/max of each output are tracked for normalization (e.g. FloodMAR.py).
+# Requires: Models=<dict of model name: list of PipelineLayer, in raster calculator order>, Outputs=<optional dict of model name: preallocated float32 array-like>, Mask=<optional boolean raster source, True inside processing extent, or Tile_Index.TileIndex>, SaveIntermediates=<debug flag, keep the classified layers>
+# Returns: (dict of model name: output, dict of model name: (minimum, maximum), dict of model name: {layer name: classified array}, empty unless SaveIntermediates)
+@Traced()
+def FusedSuitabilityModels(Models, Outputs=None, Mask=None, SaveIntermediates=False, From=1, To=5, OutNoData=np.nan, BlockSize=BLOCK_SIZE):
+    allLayers = [layer for layers in Models.values() for layer in layers]
+    shape = CommonShape([layer.source for layer in allLayers] + ([Mask] if Mask is not None else []))
+    Outputs = dict(Outputs or {})
+    for model in Models:
+        if Outputs.get(model) is None:
+            Outputs[model] = np.empty(shape, dtype=np.float32)
+    CompileLayers(allLayers, From, To, BlockSize)
+    intermediates = {model: {} for model in Models}
+    if SaveIntermediates:
+        intermediates = {model: {layer.name: np.empty(shape, dtype=np.float32 if layer.continuous else np.uint8) for layer in layers} for model, layers in Models.items()}
+    ranges = {model: (np.inf, -np.inf) for model in Models}
+
+    accumulators = {model: OverlayAccumulator(BlockSize) for model in Models}
+    for window, state, maskBlock in MaskedBlocks(shape, BlockSize, Mask):
+        # Outside the processing extent, no layer is read or classified
+        if state == EMPTY:
+            for model, layers in Models.items():
+                Outputs[model][window] = OutNoData
+                if SaveIntermediates:
+                    for layer in layers:
+                        intermediates[model][layer.name][window] = layer.classNoData
+            continue
+        blockShape = (window[0].stop - window[0].start, window[1].stop - window[1].start)
+        blocks = {}  # Source blocks read for this window, keyed on source identity
+        for model, layers in Models.items():
+            accumulator = accumulators[model]
+            accumulator.Start(blockShape, maskBlock)
+            for layer in layers:
+                if id(layer.source) not in blocks:
+                    blocks[id(layer.source)] = ReadBlock(layer.source, window)
+                classified = layer.Classify(blocks[id(layer.source)])
+                if SaveIntermediates:
+                    intermediates[model][layer.name][window] = classified
+                accumulator.Add(classified, layer.weight, layer.classNoData)
+            result = accumulator.Finish(OutNoData)
+            Outputs[model][window] = result
+            # Running min/max over valid cells
+            values = result[accumulator.valid]
+            if values.size:
+                low, high = ranges[model]
+                ranges[model] = (min(low, float(values.min())), max(high, float(values.max())))
+
+    return Outputs, ranges, intermediates
+
+# Classify and weight all layers in a single streamed pass
+# Requires: Layers=<list of PipelineLayer, in raster calculator order>, Output=<optional preallocated float32 array-like, or None>, Mask=<optional boolean raster source, True inside processing extent, or Tile_Index.TileIndex>, SaveIntermediates=<debug flag, keep the classified layers>
+# Returns: (Output, dict of layer name: classified array, empty unless SaveIntermediates)
+def FusedSuitability(Layers, Output=None, Mask=None, SaveIntermediates=False, From=1, To=5, OutNoData=np.nan, BlockSize=BLOCK_SIZE):
+    outputs, _, intermediates = FusedSuitabilityModels({'suitability': Layers}, {'suitability': Output}, Mask, SaveIntermediates, From, To, OutNoData, BlockSize)
+
+    return outputs['suitability'], intermediates['suitability']
+
+# Save classified intermediates from FusedSuitability as Classified_<name> rasters (debugging)
+# Requires: Intermediates=<dict from FusedSuitability>, Transform=<geotransform of the grid>, Workspace=<output gdb or folder>
+def SaveIntermediateRasters(Intermediates, Transform, Workspace, SpatialReference=None):
+    from Raster_Store import DatasetPath, SaveRaster
+
+    for name, array in Intermediates.items():
+        noData = NODATA_CLASS if array.dtype == np.uint8 else np.nan
+        print(f'\t\tSaving Classified_{name}...')
+        SaveRaster(array, Transform, DatasetPath(Workspace, f'Classified_{name}'), NoData=noData, SpatialReference=SpatialReference)
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Synthetic Data
+Objective:  Seeded synthetic input layers (fractal DEM, precipitation, NDVI, lineament density, LULC, lithology and soil polygons) for benchmarking, as a part of ATUR Suitability Analysis
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from Block_Processing import BLOCK_SIZE, IterBlocks
+
+"""
+Stand-ins for the ATUR inputs of INPUTS (FloodMAR_Driver.py) at any size, without arcpy or any downloaded data, so the NumPy backends can be benchmarked on a plain Linux box (refer to Benchmark.py).
+    - Continuous layers are fractal (fBm) noise: octaves of smoothly interpolated random lattices, lattice spacing halving and amplitude falling by 2^Hurst per octave. Every lattice is drawn up front from the seed, and blocks are evaluated independently, so a raster of any size is written block by block with bounded memory, and is the same for any block size.
+    - DEM: fractal relief (578 - 2876 m, the range of the DEM classification table) on a regional slope, so flow routing finds realistic drainage. Precipitation: a coarser grid (PRECIP_FACTOR cells) with an orographic gradient. NDVI, lineament density: fractal noise. LULC: fractal noise cut into the LULC classes (1 - 10).
+    - Lithology and soil: jittered lattice polygons covering the extent, each with a random unit name of the classification tables (Scanline_Rasterize.PolygonFeature).
+Rasters are written to a .npy store, <folder>/Synthetic_<size>_<seed>.mmap, refer to Raster_Store.py. A dataset is reused if it exists.
+"""
+
+CELL_SIZE = 30.0
+ORIGIN = (500000.0, 3600000.0)  # Upper left corner, WGS 1984 UTM Zone 12N
+EPSG = 32612
+PRECIP_FACTOR = 8  # Precipitation cells per DEM cell (along each axis)
+# Mean polygon size (m) of the lithology and soil layers
+LITHOLOGY_SPACING = 1500.0
+SOIL_SPACING = 900.0
+RASTERS = ('DEM', 'Precip', 'NDVI', 'Lineaments', 'LULC')
+# Layer names of the categorical classification tables, where they differ (as FloodMAR_Driver.TABLE_NAMES)
+TABLE_NAMES = {'Soil': 'Soils'}
+TABLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Classification_Tables')
+
+# Geotransform of the synthetic grids (DEM cell size, or the precipitation cell size)
+def GridTransform(CellSize=CELL_SIZE):
+    return (ORIGIN[0], CellSize, 0.0, ORIGIN[1], 0.0, -CellSize)
+
+# Fractal noise of a grid, evaluated block by block
+# Requires: Shape=<(rows, cols)>, Seed=<random seed>, Hurst=<roughness, 0 - 1 (smoother when larger)>, Finest=<lattice spacing of the finest octave (cells)>
+class FractalNoise:
+
+    def __init__(self, Shape, Seed, Hurst=0.8, Finest=8, Octaves=None):
+        rng = np.random.default_rng(Seed)
+        Octaves = Octaves or max(1, int(np.log2(max(Shape) / Finest)))
+        self.lattices = []
+        for octave in range(Octaves):
+            spacing = Finest * 2 ** (Octaves - 1 - octave)
+            lattice = rng.standard_normal((Shape[0] // spacing + 2, Shape[1] // spacing + 2)).astype(np.float32)
+            self.lattices.append((spacing, np.float32(spacing ** Hurst), lattice))
+        # Standard deviation of the sum (interpolation smooths each octave by ~ 2/3)
+        self.scale = np.float32(np.sqrt(sum(float(amplitude) ** 2 for _, amplitude, _ in self.lattices)) * 0.66)
+
+    # Smoothstep interpolation indices and weights along an axis, at cell indices
+    @staticmethod
+    def _Axis(Cells, Spacing):
+        position = (Cells + 0.5) / Spacing
+        index = np.floor(position).astype(np.int64)
+        fraction = (position - index).astype(np.float32)
+        return index, fraction * fraction * (3 - 2 * fraction)
+
+    # Noise at the cells of row and column index arrays (outer grid), ~ unit standard deviation
+    def Grid(self, Rows, Cols):
+        out = np.zeros((len(Rows), len(Cols)), dtype=np.float32)
+        for spacing, amplitude, lattice in self.lattices:
+            rows, fy = self._Axis(Rows, spacing)
+            cols, fx = self._Axis(Cols, spacing)
+            top = lattice[rows][:, cols] * (1 - fx) + lattice[rows][:, cols + 1] * fx
+            bottom = lattice[rows + 1][:, cols] * (1 - fx) + lattice[rows + 1][:, cols + 1] * fx
+            out += amplitude * (top * (1 - fy[:, None]) + bottom * fy[:, None])
+        return out / self.scale
+
+    # Noise of a window
+    def __getitem__(self, Window):
+        return self.Grid(np.arange(Window[0].start, Window[0].stop), np.arange(Window[1].start, Window[1].stop))
+
+# Write a raster of the dataset block by block
+def _WriteRaster(Path, Shape, DType, Transform, NoData, Block, BlockSize):
+    from Raster_Store import CreateRaster
+
+    with CreateRaster(Path, Shape, DType, Transform, NoData, EPSG) as raster:
+        for window in IterBlocks(Shape, BlockSize):
+            raster[window] = Block(window)
+
+# Store of a dataset
+def DatasetLocation(Folder, Size, Seed=0):
+    from Raster_Store import StoreLocation
+
+    return StoreLocation(Folder, f'Synthetic_{Size}_{Seed}', 'npy')
+
+# Generate the synthetic rasters of a Size x Size DEM grid (kept if they exist)
+# Returns: store folder
+def GenerateDataset(Folder, Size, Seed=0, BlockSize=BLOCK_SIZE):
+    from Raster_Store import DatasetPath
+
+    store = DatasetLocation(Folder, Size, Seed)
+    if all(os.path.isfile(DatasetPath(store, name)) for name in RASTERS):
+        return store
+    os.makedirs(store, exist_ok=True)
+    shape = (Size, Size)
+    transform = GridTransform()
+    print(f'\tGenerating {Size} x {Size} synthetic dataset (seed {Seed})...')
+
+    relief = FractalNoise(shape, Seed, Hurst=0.85)
+    # Fractal relief on a regional slope down to the south-west, clamped to the DEM classification range
+    def Elevation(rows, cols):
+        north = 1 - (rows[:, None] + 0.5) / Size
+        east = (cols[None, :] + 0.5) / Size
+        return np.clip(1700 + 450 * relief.Grid(rows, cols) + 300 * north + 150 * east, 578, 2876).astype(np.float32)
+    _WriteRaster(DatasetPath(store, 'DEM'), shape, np.float32, transform, np.nan,
+                 lambda window: Elevation(np.arange(window[0].start, window[0].stop), np.arange(window[1].start, window[1].stop)), BlockSize)
+
+    # Precipitation on a coarser grid, wetter with elevation (sampled at the coarse cell centres)
+    precipShape = (-(-Size // PRECIP_FACTOR),) * 2
+    weather = FractalNoise(precipShape, Seed + 1, Hurst=0.9, Finest=4)
+    def Precipitation(window):
+        rows = np.minimum(np.arange(window[0].start, window[0].stop) * PRECIP_FACTOR + PRECIP_FACTOR // 2, Size - 1)
+        cols = np.minimum(np.arange(window[1].start, window[1].stop) * PRECIP_FACTOR + PRECIP_FACTOR // 2, Size - 1)
+        return np.maximum(150 + 0.25 * (Elevation(rows, cols) - 578) + 60 * weather[window], 50).astype(np.float32)
+    _WriteRaster(DatasetPath(store, 'Precip'), precipShape, np.float32, GridTransform(CELL_SIZE * PRECIP_FACTOR), np.nan, Precipitation, BlockSize)
+
+    vegetation = FractalNoise(shape, Seed + 2, Hurst=0.6)
+    _WriteRaster(DatasetPath(store, 'NDVI'), shape, np.float32, transform, np.nan, lambda window: np.clip(0.25 + 0.12 * vegetation[window], -0.1, 0.9), BlockSize)
+    faults = FractalNoise(shape, Seed + 3, Hurst=0.4)
+    _WriteRaster(DatasetPath(store, 'Lineaments'), shape, np.float32, transform, np.nan, lambda window: np.maximum(0.5 + 0.3 * faults[window], 0), BlockSize)
+    # LULC classes 1 - 10 from equal-probability cuts of fractal noise (normal quantiles)
+    landCover = FractalNoise(shape, Seed + 4, Hurst=0.7)
+    cuts = np.array([-1.2816, -0.8416, -0.5244, -0.2533, 0.0, 0.2533, 0.5244, 0.8416, 1.2816], dtype=np.float32)
+    _WriteRaster(DatasetPath(store, 'LULC'), shape, np.uint8, transform, 0, lambda window: (np.searchsorted(cuts, landCover[window]) + 1).astype(np.uint8), BlockSize)
+
+    return store
+
+# Open the rasters of a generated dataset
+# Returns: dict of layer name: raster source (memory mapped)
+def OpenDataset(Folder, Size, Seed=0):
+    from Raster_Store import DatasetPath, OpenRaster
+
+    store = DatasetLocation(Folder, Size, Seed)
+    return {name: OpenRaster(DatasetPath(store, name)) for name in RASTERS}
+
+# Jittered lattice polygons covering a grid, each with a random name
+# Requires: Size=<grid size (cells)>, Names=<unit names to draw from>, Spacing=<mean polygon size (m)>
+# Returns: (rings of each polygon, name of each polygon)
+def LatticePolygons(Size, Names, Spacing, Seed=0, CellSize=CELL_SIZE):
+    rng = np.random.default_rng(Seed)
+    extent = Size * CellSize
+    count = max(1, int(np.ceil(extent / Spacing)))
+    step = extent / count
+    # Lattice vertices (count + 1)^2, interior vertices jittered, so the polygons still tile the extent
+    x = ORIGIN[0] + np.arange(count + 1) * step
+    y = ORIGIN[1] - np.arange(count + 1) * step
+    vx, vy = np.meshgrid(x, y)
+    jitter = rng.uniform(-0.3, 0.3, (2, count - 1, count - 1)) * step
+    vx[1:-1, 1:-1] += jitter[0]
+    vy[1:-1, 1:-1] += jitter[1]
+    rings = []
+    for i in range(count):
+        for j in range(count):
+            rows, cols = [i, i, i + 1, i + 1], [j, j + 1, j + 1, j]
+            rings.append([np.column_stack([vx[rows, cols], vy[rows, cols]])])
+    names = list(rng.choice(np.asarray(Names, dtype=object), size=len(rings)))
+    return rings, names
+
+# Lithology and soil polygons with the unit names of the categorical classification tables
+# Returns: dict of 'Lithology'/'Soil': (list of PolygonFeature, code table of unit name: code), refer to Scanline_Rasterize.CodeFeatures
+def PolygonLayers(Size, Seed=0, Tables=TABLES):
+    from Scanline_Rasterize import CodeFeatures
+
+    table = pd.read_csv(os.path.join(Tables, 'Flooding_CategoricalClassificationSchemas.csv'))
+    layers = {}
+    for i, (name, spacing) in enumerate((('Lithology', LITHOLOGY_SPACING), ('Soil', SOIL_SPACING))):
+        names = table[table['layer'] == TABLE_NAMES.get(name, name)]['oldValue'].unique()
+        layers[name] = CodeFeatures(*LatticePolygons(Size, names, spacing, Seed + 10 + i))
+    return layers
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Tile Index
+Objective:  Block-level coverage index of the processing mask (extent feature), so tiles outside a watershed are never read or computed, as a part of ATUR Suitability Analysis
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from Block_Processing import BLOCK_SIZE, IterBlocks, ReadBlock, BoundedMap, EMPTY, PARTIAL, FULL
+
+"""
+Every stage runs with extent and mask set to the watershed shapefile, but an irregular watershed (e.g. Salt) covers a small part of its bounding box, and every block of the box is still read, classified and written.
+The tile index classifies each block (BLOCK_SIZE tiles of the snap raster grid, in IterBlocks order) against the mask polygon:
+    - EMPTY, no cell center inside the mask: not read, not computed, written as NoData.
+    - FULL, every cell center inside: computed without per-cell masking.
+    - PARTIAL: computed with the cell mask of the tile, kept bit-packed for these tiles only.
+The mask is rasterized tile by tile (Scanline_Rasterize.py, cell centers as ExtractByMask), only for tiles the mask bounding box reaches. The index is saved in the watershed workspace (TileIndex.npz), keyed on the extent feature and the grid.
+A TileIndex is passed as the Mask of the block processing functions (refer to Block_Processing.MaskedBlocks); it can also be sliced like a boolean raster source.
+"""
+
+INDEX_NAME = 'TileIndex.npz'
+STATE_NAMES = {EMPTY: 'empty', PARTIAL: 'partial', FULL: 'full'}
+
+# Coverage of a grid by a processing mask, one state per tile
+# Requires: States=<(tile rows, tile cols) uint8 array of EMPTY/PARTIAL/FULL>, Masks=<dict of (tile row, tile col): packed cell mask, PARTIAL tiles only>, Shape=<(rows, cols) of the grid>, Inside=<number of cells inside the mask>
+class TileIndex:
+
+    def __init__(self, States, Masks, Shape, BlockSize=BLOCK_SIZE, Inside=None):
+        self.states = np.asarray(States, dtype=np.uint8)
+        self.masks = Masks
+        self.shape = tuple(Shape[:2])
+        self.blockSize = tuple(BlockSize)
+        self.dtype = np.dtype(bool)
+        self.noData = None
+        self.inside = Inside
+
+    # Classify the tiles of a boolean mask raster source
+    @classmethod
+    def FromMask(cls, Mask, BlockSize=BLOCK_SIZE):
+        return cls._Build(Mask.shape[:2], BlockSize, lambda window: ReadBlock(Mask, window).astype(bool))
+
+    # Classify the tiles of a grid against mask polygons
+    # Requires: Features=<list of Scanline_Rasterize.PolygonFeature>, Transform=<geotransform of the grid>, Shape=<(rows, cols) of the grid>, Workers=<threads>
+    @classmethod
+    def FromPolygons(cls, Features, Transform, Shape, BlockSize=BLOCK_SIZE, Workers=None):
+        from Scanline_Rasterize import TileCandidates, RasterizeTile
+
+        candidates = TileCandidates(Features, Transform)
+
+        # Tiles out of reach of every feature bounding box are not rasterized
+        def TileMask(window):
+            culled = candidates(window)
+            if not len(culled):
+                return None
+            return RasterizeTile(Features, culled, Transform, window) != 0
+
+        return cls._Build(Shape, BlockSize, TileMask, Workers)
+
+    @classmethod
+    def _Build(cls, Shape, BlockSize, TileMask, Workers=None):
+        tileRows, tileCols = -(-Shape[0] // BlockSize[0]), -(-Shape[1] // BlockSize[1])
+        states = np.zeros((tileRows, tileCols), dtype=np.uint8)
+        masks = {}
+        inside = 0
+        windows = list(IterBlocks(Shape, BlockSize))
+        Workers = Workers or os.cpu_count() or 1
+        with ThreadPoolExecutor(max_workers=Workers) as pool:
+            for window, mask in zip(windows, BoundedMap(pool, TileMask, windows, 2 * Workers)):
+                tile = (window[0].start // BlockSize[0], window[1].start // BlockSize[1])
+                count = 0 if mask is None else int(np.count_nonzero(mask))
+                inside += count
+                if count == 0:
+                    states[tile] = EMPTY
+                elif count == mask.size:
+                    states[tile] = FULL
+                else:
+                    states[tile] = PARTIAL
+                    masks[tile] = np.packbits(mask.ravel())
+        return cls(states, masks, Shape, BlockSize, inside)
+
+    # Window of a tile
+    def _Window(self, Tile):
+        r0, c0 = Tile[0] * self.blockSize[0], Tile[1] * self.blockSize[1]
+        return slice(r0, min(r0 + self.blockSize[0], self.shape[0])), slice(c0, min(c0 + self.blockSize[1], self.shape[1]))
+
+    # Cell mask of a tile (new array)
+    def TileMask(self, Tile):
+        window = self._Window(Tile)
+        rows, cols = window[0].stop - window[0].start, window[1].stop - window[1].start
+        state = self.states[Tile]
+        if state != PARTIAL:
+            return np.full((rows, cols), state == FULL)
+        return np.unpackbits(self.masks[Tile], count=rows * cols).view(bool).reshape(rows, cols)
+
+    # Boolean mask of any window, as a raster source (True inside the mask)
+    def __getitem__(self, Window):
+        r0, r1, _ = Window[0].indices(self.shape[0])
+        c0, c1, _ = Window[1].indices(self.shape[1])
+        out = np.zeros((r1 - r0, c1 - c0), dtype=bool)
+        for tileRow in range(r0 // self.blockSize[0], -(-r1 // self.blockSize[0])):
+            for tileCol in range(c0 // self.blockSize[1], -(-c1 // self.blockSize[1])):
+                tile = (tileRow, tileCol)
+                if self.states[tile] == EMPTY:
+                    continue
+                rows, cols = self._Window(tile)
+                top, bottom = max(rows.start, r0), min(rows.stop, r1)
+                left, right = max(cols.start, c0), min(cols.stop, c1)
+                mask = self.TileMask(tile)
+                out[top - r0:bottom - r0, left - c0:right - c0] = mask[top - rows.start:bottom - rows.start, left - cols.start:right - cols.start]
+        return out
+
+    # (window, state, mask block) of every block, as Block_Processing.MaskedBlocks
+    # Blocks of another size than the index are classified from the tiles they overlap
+    def MaskedBlocks(self, BlockSize=BLOCK_SIZE):
+        same = tuple(BlockSize) == self.blockSize
+        for window in IterBlocks(self.shape, BlockSize):
+            if same:
+                tile = (window[0].start // self.blockSize[0], window[1].start // self.blockSize[1])
+                state = self.states[tile]
+                yield window, state, self.TileMask(tile) if state == PARTIAL else None
+                continue
+            tiles = self.states[window[0].start // self.blockSize[0]:-(-window[0].stop // self.blockSize[0]),
+                                window[1].start // self.blockSize[1]:-(-window[1].stop // self.blockSize[1])]
+            mask = None if (tiles == EMPTY).all() or (tiles == FULL).all() else self[window]
+            if (tiles == EMPTY).all() or (mask is not None and not mask.any()):
+                yield window, EMPTY, None
+            elif mask is None or mask.all():
+                yield window, FULL, None
+            else:
+                yield window, PARTIAL, mask
+
+    # Tile counts and the fraction of the grid cells in EMPTY tiles (never read or computed)
+    def Report(self):
+        counts = {name: int((self.states == state).sum()) for state, name in STATE_NAMES.items()}
+        rows = np.diff(np.minimum(np.arange(self.states.shape[0] + 1) * self.blockSize[0], self.shape[0]))
+        cols = np.diff(np.minimum(np.arange(self.states.shape[1] + 1) * self.blockSize[1], self.shape[1]))
+        cells = np.outer(rows, cols)
+        total = self.shape[0] * self.shape[1]
+        report = {'tiles': int(self.states.size), **counts, 'skipped': float(cells[self.states == EMPTY].sum() / total) if total else 0.0}
+        if self.inside is not None:
+            report['inside'] = self.inside / total if total else 0.0
+        return report
+
+    def Save(self, Path, Key=''):
+        tiles = sorted(self.masks)
+        np.savez(Path, key=np.array(Key), states=self.states, shape=np.array(self.shape), blockSize=np.array(self.blockSize), inside=np.array(-1 if self.inside is None else self.inside),
+                 tiles=np.array(tiles, dtype=np.int64).reshape(-1, 2), lengths=np.array([self.masks[t].size for t in tiles], dtype=np.int64),
+                 packed=np.concatenate([self.masks[t] for t in tiles]) if tiles else np.zeros(0, dtype=np.uint8))
+        return Path
+
+    # Returns: (TileIndex, key it was saved with)
+    @classmethod
+    def Load(cls, Path):
+        with np.load(Path) as data:
+            offsets = np.concatenate([[0], np.cumsum(data['lengths'])])
+            packed = data['packed']
+            masks = {(int(r), int(c)): packed[offsets[i]:offsets[i + 1]] for i, (r, c) in enumerate(data['tiles'])}
+            inside = int(data['inside'])
+            index = cls(data['states'], masks, tuple(data['shape']), tuple(data['blockSize']), None if inside < 0 else inside)
+            return index, str(data['key'])
+
+# Tile index of an extent feature on a grid, loaded from the workspace if the feature and grid are unchanged
+# Requires: Workspace=<folder holding the index>, ExtentFeat=<extent shapefile, i.e. mask>, Transform=<geotransform of the grid, e.g. the aligned DEM>, Shape=<(rows, cols) of the grid>, SpatialReference=<arcpy spatial reference of the grid, the polygons are projected to it>
+# Returns: TileIndex
+def MaskTileIndex(Workspace, ExtentFeat, Transform, Shape, BlockSize=BLOCK_SIZE, SpatialReference=None, Workers=None):
+    from Stage_Cache import Fingerprint
+
+    path = os.path.join(Workspace, INDEX_NAME)
+    key = hashlib.sha256(json.dumps([Fingerprint(ExtentFeat), [float(v) for v in Transform], [int(v) for v in Shape[:2]], [int(v) for v in BlockSize]]).encode()).hexdigest()
+    index = None
+    if os.path.isfile(path):
+        try:
+            index, savedKey = TileIndex.Load(path)
+            if savedKey != key:
+                index = None
+        except (OSError, ValueError, KeyError):
+            index = None
+    if index is None:
+        from Scanline_Rasterize import ReadPolygonsArcpy, PolygonFeature
+
+        rings, _ = ReadPolygonsArcpy(ExtentFeat, 'OID@', SpatialReference)
+        index = TileIndex.FromPolygons([PolygonFeature(featureRings, 1) for featureRings in rings], Transform, Shape, BlockSize, Workers)
+        index.Save(path, key)
+    report = index.Report()
+    print(f"\tTiles: {report['tiles']} ({report['empty']} empty, {report['partial']} partial, {report['full']} full), {report['skipped']:.1%} of cells skipped")
+
+    return index
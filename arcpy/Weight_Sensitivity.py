@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Weight Sensitivity
+Objective:  Monte Carlo sensitivity of flood, recharge and Flood MAR suitability to the layer weights, K weight vectors evaluated at once per block, as a part of ATUR Suitability Analysis
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import numpy as np
+import pandas as pd
+
+from Block_Processing import BLOCK_SIZE, MaskedBlocks, ReadBlock, CommonShape, EMPTY
+from Suitability_Pipeline import CompileLayers, ClassLevels
+
+"""
+Uncertainty bands of the Flood MAR map, from thousands of weight vectors perturbed around LayerWeights.csv, without running the overlay (or keeping a map) per vector.
+    - Weight samples are drawn per model from a Dirichlet distribution centred on the LayerWeights.csv weights (Concentration sets the spread, larger is narrower), rescaled to the same total. Sample 0 is the LayerWeights.csv weights themselves (the reference map).
+    - Each block is classified once (classification as FloodMAR_Driver.py), and the nine classified layers of each model are stacked as a (layers x cells) uint8 matrix of class levels (STEP = 1/50, so categorical classes are exact, continuous classes rounded by at most 0.01). Weighted sums of all K samples are a single (K x layers) @ (layers x cells) matrix product, done on chunks of cells so that K x chunk stays within ChunkBytes.
+    - Pass 1 keeps the min/max of the flood and recharge sums of every sample, for the Flood MAR normalization. Pass 2 recomputes the sums, the Flood MAR product of every sample, and per cell statistics over the samples: mean and std of flood, recharge and Flood MAR, Flood MAR percentile bands, and class agreement.
+    - Class agreement (rank stability) is the fraction of samples in which a cell falls in the same Flood MAR class (Classes equal intervals of the 0 - 1 range) as in the reference map.
+Sums are float32 matrix products, so they may differ from the raster calculator in the last float32 digit.
+"""
+
+# Class level step and NoData level of the stacked classified layers
+STEP = 1 / 50
+NODATA_LEVEL = 255
+# Dirichlet concentration of the weight samples, Flood MAR agreement classes and percentile bands
+CONCENTRATION = 200
+CLASSES = 5
+BANDS = (5, 95)
+# Memory of the (samples x cells) chunks of the matrix product
+CHUNK_BYTES = 64 * 1024 ** 2
+
+# Weight vectors around the given weights
+# Requires: Weights=<1D array of layer weights>, Samples=<number of samples K, including the reference>, Concentration=<Dirichlet concentration>, Seed=<random seed>
+# Returns: (K, layers) array, row 0 is Weights
+def SampleWeights(Weights, Samples, Concentration=CONCENTRATION, Seed=0):
+    weights = np.asarray(Weights, dtype=np.float64)
+    total = weights.sum()
+    rng = np.random.default_rng(Seed)
+    samples = rng.dirichlet(Concentration * weights / total, size=Samples) * total
+    samples[0] = weights
+    return samples
+
+# Classified (layers x cells) uint8 stacks of every model, block by block
+# Yields: (window, state, valid cells, dict of model: stack of the valid cells), stacks are None for EMPTY blocks
+def _ClassifiedStacks(Models, Shape, Mask, BlockSize):
+    for window, state, mask in MaskedBlocks(Shape, BlockSize, Mask):
+        if state == EMPTY:
+            yield window, state, None, None
+            continue
+        blocks = {}  # Source blocks read for this window, keyed on source identity
+        stacks = {}
+        for model, layers in Models.items():
+            stack = np.empty((len(layers), (window[0].stop - window[0].start) * (window[1].stop - window[1].start)), dtype=np.uint8)
+            for i, layer in enumerate(layers):
+                if id(layer.source) not in blocks:
+                    blocks[id(layer.source)] = ReadBlock(layer.source, window)
+                # uint8 class levels (multiples of STEP), NODATA_LEVEL for NoData
+                stack[i] = ClassLevels(layer.Classify(blocks[id(layer.source)]), layer.classNoData, STEP, NODATA_LEVEL, NODATA_LEVEL, np.uint8).ravel()
+            stacks[model] = stack
+        valid = np.ones(stack.shape[1], dtype=bool) if mask is None else mask.ravel()
+        for stack in stacks.values():
+            valid &= (stack != NODATA_LEVEL).all(axis=0)
+        yield window, state, valid, {model: stack[:, valid] for model, stack in stacks.items()}
+
+# Weighted sums of all samples, (K x layers) @ (layers x cells)
+def _Sums(Weights, Stack):
+    return Weights @ Stack.astype(np.float32)
+
+# Monte Carlo weight sensitivity of flood, recharge and Flood MAR
+# Requires: Models=<dict of 'flood'/'recharge': list of Suitability_Pipeline.PipelineLayer, refer to FloodMAR_Driver.BuildModels>, Weights=<dict of model: (K, layers) weight samples, row 0 the reference, refer to SampleWeights>, Mask=<optional boolean raster source or Tile_Index.TileIndex, True inside processing extent>, Outputs=<optional dict of output name: preallocated float32 array-like>
+# Returns: dict of output name (<model>_mean, <model>_std for flood/recharge/floodmar, floodmar_p<band>, floodmar_agreement): float32 array
+def WeightSensitivity(Models, Weights, Mask=None, Outputs=None, Bands=BANDS, Classes=CLASSES, From=1, To=5, OutNoData=np.nan, BlockSize=BLOCK_SIZE, ChunkBytes=CHUNK_BYTES):
+    allLayers = [layer for layers in Models.values() for layer in layers]
+    shape = CommonShape([layer.source for layer in allLayers] + ([Mask] if Mask is not None else []))
+    CompileLayers(allLayers, From, To, BlockSize)
+    # Class levels are scaled back to class values by the weights
+    weights = {model: (np.asarray(Weights[model], dtype=np.float64) * STEP).astype(np.float32) for model in Models}
+    samples = len(next(iter(weights.values())))
+    chunk = max(1, ChunkBytes // (4 * samples * 4))
+    names = [f'{model}_{stat}' for model in ('flood', 'recharge', 'floodmar') for stat in ('mean', 'std')] + [f'floodmar_p{band:g}' for band in Bands] + ['floodmar_agreement']
+    Outputs = dict(Outputs or {})
+    for name in names:
+        if Outputs.get(name) is None:
+            Outputs[name] = np.empty(shape, dtype=np.float32)
+
+    # Pass 1, range of every sample
+    print(f'\tPass 1, range of {samples} weight samples...')
+    low = {model: np.full(samples, np.inf) for model in Models}
+    high = {model: np.full(samples, -np.inf) for model in Models}
+    for window, state, valid, stacks in _ClassifiedStacks(Models, shape, Mask, BlockSize):
+        if state == EMPTY:
+            continue
+        for model, stack in stacks.items():
+            for c0 in range(0, stack.shape[1], chunk):
+                sums = _Sums(weights[model], stack[:, c0:c0 + chunk])
+                low[model] = np.minimum(low[model], sums.min(axis=1))
+                high[model] = np.maximum(high[model], sums.max(axis=1))
+    scale = {model: (1 / np.maximum(high[model] - low[model], np.finfo(np.float32).tiny)).astype(np.float32)[:, None] for model in Models}
+    offset = {model: low[model].astype(np.float32)[:, None] for model in Models}
+
+    # Pass 2, Flood MAR of every sample and per cell statistics
+    print(f'\tPass 2, statistics of {samples} weight samples...')
+    for window, state, valid, stacks in _ClassifiedStacks(Models, shape, Mask, BlockSize):
+        if state == EMPTY:
+            for name in names:
+                Outputs[name][window] = OutNoData
+            continue
+        blockShape = (window[0].stop - window[0].start, window[1].stop - window[1].start)
+        results = {name: np.full(valid.size, OutNoData, dtype=np.float32) for name in names}
+        cells = np.flatnonzero(valid)
+        for c0 in range(0, cells.size, chunk):
+            index = cells[c0:c0 + chunk]
+            sums = {model: _Sums(weights[model], stack[:, c0:c0 + chunk]) for model, stack in stacks.items()}
+            sums['floodmar'] = ((sums['flood'] - offset['flood']) * scale['flood']) * ((sums['recharge'] - offset['recharge']) * scale['recharge'])
+            for model, values in sums.items():
+                results[f'{model}_mean'][index] = values.mean(axis=0)
+                results[f'{model}_std'][index] = values.std(axis=0)
+            for band, values in zip(Bands, np.percentile(sums['floodmar'], Bands, axis=0)):
+                results[f'floodmar_p{band:g}'][index] = values
+            classes = np.minimum((sums['floodmar'] * Classes).astype(np.int64), Classes - 1)
+            results['floodmar_agreement'][index] = (classes == classes[0]).mean(axis=0)
+        for name in names:
+            Outputs[name][window] = results[name].reshape(blockShape)
+
+    return Outputs
+
+# Weight sensitivity of a watershed, from the same sources and tables as FloodMAR_Driver.RunFloodMAR
+# Requires: Sources=<dict of layer name: raster source, all on the same grid>, CatTables=<dict of model: categorical classification df>, LayerWeights=<LayerWeights.csv df, the sample centre>, Codes=<dict of categorical layer name: VAT codes>, Stats=<dict of continuous layer name: stats dict>, Samples=<number of weight samples>
+# Returns: (dict of outputs, dict of model: weight samples df)
+def RunSensitivity(Sources, CatTables, LayerWeights, Codes, Stats, Samples=1000, Concentration=CONCENTRATION, Seed=0, Mask=None, BlockSize=BLOCK_SIZE):
+    from FloodMAR_Driver import BuildModels, ModelWeights, LAYERS
+
+    models = BuildModels(Sources, CatTables, LayerWeights, Codes or {}, Stats)
+    weights = {}
+    for i, model in enumerate(models):
+        centre = ModelWeights(LayerWeights, model)
+        weights[model] = SampleWeights([centre[layer] for layer in LAYERS], Samples, Concentration, Seed + i)
+    outputs = WeightSensitivity(models, weights, Mask, BlockSize=BlockSize)
+
+    return outputs, {model: pd.DataFrame(samples, columns=LAYERS) for model, samples in weights.items()}
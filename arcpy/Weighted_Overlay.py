@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Weighted Overlay
+Objective:  Tiled NumPy weighted overlay (suitability raster math) as a part of ATUR Suitability Analysis
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import numpy as np
+
+from Block_Processing import BLOCK_SIZE, MaskedBlocks, ReadBlock, CommonShape, SourceNoData, ValidMask, EMPTY
+from Instrumentation import Traced
+
+"""
+Replaces the raster calculator expression used in FloodSuitability.py and RechargeSuitability.py,
+    (DEM_Classified * demWeight) + (Slope_Classified * slopeWeight) + ... + (LULC_Classified * lulcWeight)
+which materializes a full size temporary raster for every operator. Here the classified layers are streamed block by block and summed into a single preallocated float32 output. Runs without arcpy.
+
+To reproduce the raster calculator numbers, each product is evaluated in double precision and rounded to float32 (a Python float weight times a raster), and the products are then summed left to right in float32, as the chained map algebra expression does.
+Any NoData input cell results in a NoData output cell, as in map algebra.
+"""
+
+# Block accumulator for the weighted sum, (Layer * weight) terms are added one layer at a time
+# Scratch buffers are allocated once and reused for every block
+class OverlayAccumulator:
+
+    def __init__(self, BlockSize=BLOCK_SIZE):
+        self._product = np.empty(BlockSize, dtype=np.float64)
+        self._term = np.empty(BlockSize, dtype=np.float32)
+        self._acc = np.empty(BlockSize, dtype=np.float32)
+        self._valid = np.empty(BlockSize, dtype=bool)
+
+    # Begin a new block, Mask=<optional boolean block, True inside processing extent>
+    def Start(self, BlockShape, Mask=None):
+        rows, cols = BlockShape
+        self.product = self._product[:rows, :cols]
+        self.term = self._term[:rows, :cols]
+        self.acc = self._acc[:rows, :cols]
+        self.valid = self._valid[:rows, :cols]
+        self.valid[...] = True if Mask is None else Mask
+        self.first = True
+
+    # Add (Block * Weight) to the block sum
+    def Add(self, Block, Weight, NoData=None):
+        self.valid &= ValidMask(Block, NoData)
+        # (Layer * weight), rounded to float32
+        np.multiply(Block, np.float64(Weight), out=self.product)
+        self.term[...] = self.product
+        # Sum left to right in float32
+        if self.first:
+            self.acc[...] = self.term
+            self.first = False
+        else:
+            self.acc += self.term
+
+    # Block sum, with NoData cells set to OutNoData
+    def Finish(self, OutNoData=np.nan):
+        self.acc[~self.valid] = OutNoData
+        return self.acc
+
+# Weighted sum of classified layers
+# Requires: Layers=<list of raster sources, see Block_Processing.py>, Weights=<list of layer weights, same order>, Output=<optional preallocated float32 array-like, or None>, NoData=<optional list of per-layer NoData values>, Mask=<optional boolean raster source, True inside processing extent, or Tile_Index.TileIndex>, OutNoData=<value written to NoData cells>
+@Traced()
+def WeightedOverlay(Layers, Weights, Output=None, NoData=None, Mask=None, OutNoData=np.nan, BlockSize=BLOCK_SIZE):
+    if len(Layers) != len(Weights):
+        raise ValueError(f'{len(Layers)} layers were given with {len(Weights)} weights')
+    shape = CommonShape(list(Layers) + ([Mask] if Mask is not None else []))
+    # Per-layer NoData, default to the NoData value carried by the source (if any)
+    if NoData is None:
+        NoData = [SourceNoData(layer) for layer in Layers]
+    # Preallocate output
+    if Output is None:
+        Output = np.empty(shape, dtype=np.float32)
+
+    accumulator = OverlayAccumulator(BlockSize)
+    for window, state, mask in MaskedBlocks(shape, BlockSize, Mask):
+        # No layer is read outside the processing extent
+        if state == EMPTY:
+            Output[window] = OutNoData
+            continue
+        accumulator.Start((window[0].stop - window[0].start, window[1].stop - window[1].start), mask)
+        for layer, weight, noData in zip(Layers, Weights, NoData):
+            accumulator.Add(ReadBlock(layer, window), weight, noData)
+        Output[window] = accumulator.Finish(OutNoData)
+
+    return Output
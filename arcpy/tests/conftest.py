@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Test Configuration
+Objective:  Shared fixtures of the NumPy backend tests (no arcpy) as a part of ATUR Suitability Analysis
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# The modules import each other by bare name, as the stage scripts do
+ARCPY_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ARCPY_FOLDER not in sys.path:
+    sys.path.insert(0, ARCPY_FOLDER)
+
+"""
+The tests run the NumPy backends on the seeded synthetic dataset (Synthetic_Data.py) and the classification tables of the repository, and check them against the tables and brute force references.
+    - The dataset is generated once per session, at SIZE x SIZE cells, in a temporary folder.
+    - Block sizes smaller than the grid (BLOCK) are used throughout, so block edges are exercised.
+Run: python -m pytest -q arcpy/tests
+"""
+
+# Grid size of the synthetic dataset, and a block size that does not divide it
+SIZE = 96
+BLOCK = (40, 40)
+
+# Synthetic rasters, generated once per session
+# Returns: dict of layer name: raster source (DEM, Precip, NDVI, Lineaments, LULC)
+@pytest.fixture(scope='session')
+def synthetic(tmp_path_factory):
+    from Synthetic_Data import GenerateDataset, OpenDataset
+
+    folder = str(tmp_path_factory.mktemp('synthetic'))
+    GenerateDataset(folder, SIZE)
+    return OpenDataset(folder, SIZE)
+
+# Lithology and soil polygons rasterized onto the synthetic grid
+# Returns: dict of 'Lithology'/'Soil': (uint16 code array, dict of code: unit name)
+@pytest.fixture(scope='session')
+def polygons():
+    from Synthetic_Data import PolygonLayers, GridTransform
+    from Scanline_Rasterize import RasterizePolygons
+
+    rasters = {}
+    for name, (features, codes) in PolygonLayers(SIZE).items():
+        rasters[name] = (RasterizePolygons(features, GridTransform(), (SIZE, SIZE), BlockSize=BLOCK, Workers=1), {code: value for value, code in codes.items()})
+    return rasters
+
+# Classification tables of the repository
+# Returns: dict of table name (file name without the suffix, e.g. 'Flooding_ContinuousClassificationSchemas', 'LayerWeights'): df
+@pytest.fixture(scope='session')
+def tables():
+    from Synthetic_Data import TABLES
+
+    return {os.path.splitext(name)[0]: pd.read_csv(os.path.join(TABLES, name)) for name in os.listdir(TABLES) if name.endswith('.csv')}
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+# Inputs of FloodMAR_Driver.RunFloodMAR on the synthetic grid: the synthetic rasters (precipitation resampled to the grid), slope of the DEM, a drainage density field and the polygon layers
+# Returns: (dict of layer name: source, dict of model: categorical classification df, LayerWeights df, dict of categorical layer name: codes, dict of continuous layer name: stats dict)
+@pytest.fixture(scope='session')
+def watershed(synthetic, polygons, tables):
+    from Bilinear_Resample import BilinearResample
+    from FloodMAR_Driver import CONTINUOUS_LAYERS
+    from Raster_Statistics import MultiRasterStatistics
+    from Slope_Tiles import SlopeTiles
+    from Synthetic_Data import CELL_SIZE, GridTransform
+
+    sources = {name: synthetic[name] for name in ('DEM', 'NDVI', 'Lineaments', 'LULC')}
+    sources['Precip'] = BilinearResample(synthetic['Precip'], synthetic['Precip'].transform, GridTransform(), (SIZE, SIZE), BlockSize=BLOCK, Workers=1)
+    sources['Slope'] = SlopeTiles(synthetic['DEM'], (CELL_SIZE, CELL_SIZE), BlockSize=BLOCK, Workers=1)[0]
+    rows, cols = np.mgrid[:SIZE, :SIZE]
+    sources['Drainage'] = (np.hypot(rows - SIZE / 3, cols - SIZE / 2) * 0.02 + np.random.default_rng(1).gamma(2, 0.1, (SIZE, SIZE))).astype(np.float32)
+    sources.update({name: polygons[name][0] for name in ('Lithology', 'Soil')})
+    catTables = {'flood': tables['Flooding_CategoricalClassificationSchemas'], 'recharge': tables['Recharge_CategoricalClassificationSchemas']}
+    codes = {name: polygons[name][1] for name in ('Lithology', 'Soil')}
+    stats = MultiRasterStatistics({name: sources[name] for name in CONTINUOUS_LAYERS}, BlockSize=BLOCK, Workers=1)
+    return sources, catTables, tables['LayerWeights'], codes, stats
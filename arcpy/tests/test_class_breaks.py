@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Class Breaks Tests
+Objective:  Quantile sketches and class breaks (Class_Breaks.py) against exact ranks, brute force Jenks and the classification table format
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import itertools
+
+import numpy as np
+import pytest
+
+from conftest import SIZE, BLOCK
+from Class_Breaks import KLLSketch, SketchRasters, JenksBreaks, SketchBreaks, ClassBreaksTable
+
+K = 200
+
+# Rank (0 - 1) of each value in sorted data
+def Rank(Sorted, Values):
+    return np.searchsorted(Sorted, Values, side='right') / Sorted.size
+
+def test_kll_rank_error(rng):
+    values = rng.lognormal(3, 1, 200000)
+    sketch = KLLSketch(K)
+    for part in np.array_split(values, 37):
+        sketch.Update(part)
+    assert sketch.count == values.size
+    assert sketch.minimum == values.min() and sketch.maximum == values.max()
+    q = np.linspace(0.01, 0.99, 99)
+    # Rank error ~1/K
+    assert np.abs(Rank(np.sort(values), sketch.Quantiles(q)) - q).max() <= 3 / K
+    # O(K log(n / K)) items, far fewer than the values
+    assert sum(level.size for level in sketch.levels) < 10 * K
+    np.testing.assert_array_equal(sketch.Quantiles([0, 1]), [values.min(), values.max()])
+
+def test_kll_merge(rng):
+    values = rng.normal(0, 1, 100000)
+    parts = [KLLSketch(K, Seed=i).Update(part) for i, part in enumerate(np.array_split(values, 13))]
+    merged = parts[0]
+    for part in parts[1:]:
+        merged.Merge(part)
+    q = np.linspace(0.05, 0.95, 19)
+    assert merged.count == values.size
+    assert np.abs(Rank(np.sort(values), merged.Quantiles(q)) - q).max() <= 3 / K
+    assert np.isnan(KLLSketch(K).Quantiles(0.5)).all()
+
+def test_sketches_do_not_depend_on_threads(synthetic):
+    sources = {name: synthetic[name] for name in ('DEM', 'NDVI')}
+    single = SketchRasters(sources, K=32, BlockSize=(16, 16), Workers=1)
+    threaded = SketchRasters(sources, K=32, BlockSize=(16, 16), Workers=4)
+    for name in sources:
+        for a, b in zip(single[name].Items(), threaded[name].Items()):
+            np.testing.assert_array_equal(a, b)
+        values = np.array(synthetic[name][:, :], dtype=np.float64)
+        assert single[name].count == np.isfinite(values).sum()
+
+def test_sketch_with_mask(synthetic):
+    mask = np.zeros((SIZE, SIZE), dtype=bool)
+    mask[10:60, 20:50] = True
+    sketch = SketchRasters({'DEM': synthetic['DEM']}, Mask=mask, BlockSize=BLOCK, Workers=2)['DEM']
+    values = np.array(synthetic['DEM'][:, :], dtype=np.float64)[mask]
+    values = values[np.isfinite(values)]
+    assert sketch.count == values.size and sketch.minimum == values.min() and sketch.maximum == values.max()
+
+# Least within-class sum of squares over every split of the sorted values into contiguous classes
+def BruteForceJenks(Values, Classes):
+    x = np.sort(Values)
+    best, breaks = np.inf, None
+    for cuts in itertools.combinations(range(1, x.size), Classes - 1):
+        classes = np.split(x, cuts)
+        cost = sum(((c - c.mean()) ** 2).sum() for c in classes)
+        if cost < best:
+            best, breaks = cost, [c[-1] for c in classes[:-1]]
+    return np.array(breaks)
+
+@pytest.mark.parametrize('classes', [2, 3, 4])
+def test_jenks_matches_brute_force(rng, classes):
+    for _ in range(5):
+        values = np.concatenate([rng.normal(center, 1, 4) for center in rng.uniform(0, 30, 4)])
+        np.testing.assert_array_equal(JenksBreaks(values, classes), BruteForceJenks(values, classes))
+
+def test_breaks_of_a_sketch(rng):
+    values = rng.uniform(0, 100, 50000)
+    sketch = KLLSketch(K).Update(values)
+    for method in ('quantile', 'jenks'):
+        edges = SketchBreaks(sketch, 5, method)
+        assert edges.size == 6 and edges[0] == values.min() and edges[-1] == values.max()
+        assert (np.diff(edges) > 0).all()
+        # Uniform data: both methods give about equal intervals
+        np.testing.assert_allclose(edges[1:-1], [20, 40, 60, 80], atol=3)
+    with pytest.raises(ValueError):
+        SketchBreaks(sketch, 5, 'equal')
+
+def test_class_breaks_table(synthetic, tables):
+    template = tables['Flooding_ContinuousClassificationSchemas']
+    sketches = SketchRasters({'DEM': synthetic['DEM']}, BlockSize=BLOCK, Workers=2)
+    table = ClassBreaksTable(sketches, template)
+    assert list(table.columns) == ['layer', 'startValue', 'endValue', 'newValue']
+    assert list(table['layer'].unique()) == list(template['layer'].unique())
+    for layer, rows in table.groupby('layer', sort=False):
+        expected = template[template['layer'] == layer].sort_values('startValue')
+        assert len(rows) == len(expected)
+        # Class values in order of increasing range, as the template
+        assert list(rows['newValue']) == list(expected['newValue'])
+        if layer != 'DEM':
+            # Layers without a sketch are copied
+            np.testing.assert_array_equal(rows[['startValue', 'endValue']].to_numpy(), expected[['startValue', 'endValue']].to_numpy())
+    dem = table[table['layer'] == 'DEM']
+    values = np.array(synthetic['DEM'][:, :], dtype=np.float64)
+    values = values[np.isfinite(values)]
+    # Contiguous ranges from the minimum to the maximum, interior breaks rounded to 4 significant digits
+    np.testing.assert_array_equal(dem['startValue'].to_numpy()[1:], dem['endValue'].to_numpy()[:-1])
+    assert dem['startValue'].iloc[0] == values.min() and dem['endValue'].iloc[-1] == values.max()
+    assert all(float(f'{edge:.4g}') == edge for edge in dem['endValue'].to_numpy()[:-1])
+    # Quantile classes hold about equal counts
+    counts = np.histogram(values, np.concatenate([dem['startValue'].to_numpy(), dem['endValue'].to_numpy()[-1:]]))[0]
+    np.testing.assert_allclose(counts / values.size, 1 / len(dem), atol=0.03)
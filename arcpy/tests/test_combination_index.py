@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Combination Index Tests
+Objective:  Re-weighting from the class-combination index (Combination_Index.py) against FloodMAR_Driver.RunFloodMAR, within the quantization bound
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import numpy as np
+import pytest
+
+from conftest import BLOCK
+from Combination_Index import CombinationIndex, BuildWatershedIndex, ReweightWatershed, STEP
+from FloodMAR_Driver import RunFloodMAR
+from Raster_Store import StoreLocation, DatasetPath, OpenRaster
+from Synthetic_Data import GridTransform
+
+OUTPUTS = ('flood', 'recharge', 'floodmar')
+# float32 rounding of the sums and of the Flood MAR normalization
+TOLERANCE = 1e-5
+
+# Layer weights moved away from LayerWeights.csv, as a re-weighting would
+def NewWeights(LayerWeights):
+    weights = LayerWeights.copy()
+    weights['floodingWeight'] = weights['floodingWeight'].to_numpy()[::-1]
+    weights['rechargeWeight'] = np.roll(weights['rechargeWeight'].to_numpy(), 2)
+    return weights
+
+# Combination index of the synthetic watershed; MaxRatio=1, since random fields on a small grid hardly compress
+def BuildIndex(Watershed, Step=STEP):
+    sources, catTables, layerWeights, codes, stats = Watershed
+    return BuildWatershedIndex(sources, catTables, layerWeights, codes, stats, Transform=GridTransform(), BlockSize=BLOCK, Step=Step, MaxRatio=1.0)
+
+# Largest difference of the re-weighted outputs from RunFloodMAR, NoData cells matching
+def Differences(Watershed, Index, LayerWeights):
+    sources, catTables, _, codes, _ = Watershed
+    expected, _ = RunFloodMAR(sources, catTables, LayerWeights, codes, BlockSize=BLOCK)
+    results = Index.Suitability(LayerWeights, BLOCK)
+    differences = {}
+    for name in OUTPUTS:
+        np.testing.assert_array_equal(np.isnan(results[name]), np.isnan(expected[name]), err_msg=name)
+        differences[name] = float(np.nanmax(np.abs(results[name] - expected[name])))
+    return differences
+
+@pytest.mark.parametrize('step', [STEP, 1 / 16])
+@pytest.mark.parametrize('reweight', [False, True])
+def test_reweighting_within_bound(watershed, step, reweight):
+    index = BuildIndex(watershed, step)
+    weights = NewWeights(watershed[2]) if reweight else watershed[2]
+    bounds = index.QuantizationBound(weights)
+    differences = Differences(watershed, index, weights)
+    for name in OUTPUTS:
+        assert differences[name] <= bounds[name] + TOLERANCE, name
+    # Continuous classes are rounded, so the outputs do differ
+    assert differences['flood'] > 0
+
+def test_exact_without_continuous_rounding(watershed):
+    index = BuildIndex(watershed, 1 / 1024)
+    bounds = index.QuantizationBound(watershed[2])
+    assert bounds['flood'] < 1e-3 and all(difference <= 1e-3 + TOLERANCE for difference in Differences(watershed, index, watershed[2]).values())
+
+def test_save_load_and_reweight(watershed, tmp_path):
+    index = BuildIndex(watershed)
+    index.Save(str(tmp_path))
+    loaded = CombinationIndex.Load(str(tmp_path))
+    assert loaded.step == index.step and loaded.continuous == index.continuous and loaded.layers == index.layers
+    store = StoreLocation(str(tmp_path), 'Reweighted', 'npy')
+    outputs = {name: DatasetPath(store, name) for name in OUTPUTS}
+    weights = NewWeights(watershed[2])
+    results = ReweightWatershed(str(tmp_path), weights, outputs, BlockSize=BLOCK)
+    expected = index.Suitability(weights, BLOCK)
+    for name in OUTPUTS:
+        np.testing.assert_array_equal(results[name], expected[name])
+        np.testing.assert_array_equal(OpenRaster(outputs[name])[:, :], expected[name])
+
+def test_no_index_when_combinations_do_not_compress(watershed):
+    sources, catTables, layerWeights, codes, stats = watershed
+    assert BuildWatershedIndex(sources, catTables, layerWeights, codes, stats, BlockSize=BLOCK, MaxRatio=1e-3) is None
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Drainage Density Tests
+Objective:  Circular window sums from row-wise prefix sums (Drainage_Density_Raster.py) against a brute force sum over the disc of every cell
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import numpy as np
+import pytest
+
+from Drainage_Density_Raster import CircleSum, DrainageDensityRaster, StreamLength
+from Flow_Routing import FLOW_NODATA
+
+# Sum of Values over the cells whose center lies within Radius of the center of every cell (cells off the grid count as 0)
+def BruteForceDisc(Values, Radius, CellSize):
+    rows, cols = Values.shape
+    cellX, cellY = CellSize
+    r, c = np.mgrid[:rows, :cols]
+    out = np.zeros((rows, cols), dtype=np.float64)
+    for i in range(rows):
+        for j in range(cols):
+            # Relative tolerance for centers exactly on the circle
+            disc = ((c - j) * cellX) ** 2 + ((r - i) * cellY) ** 2 <= Radius ** 2 * (1 + 1e-12)
+            out[i, j] = Values[disc].sum()
+    return out
+
+# Radius (map units), cell size, block size; 150 passes exactly through cell centers (3 - 4 - 5 triangles)
+@pytest.mark.parametrize('radius, cellSize, blockSize', [
+    (150.0, (30.0, 30.0), (7, 5)),
+    (100.0, (30.0, 30.0), (64, 64)),
+    (95.0, (30.0, 20.0), (11, 13)),
+    (20.0, (30.0, 30.0), (8, 8)),
+    (1000.0, (30.0, 30.0), (16, 40)),
+])
+def test_circle_sum_matches_brute_force(rng, radius, cellSize, blockSize):
+    shape = (37, 45)
+    # Integers, so the prefix sum differences are exact
+    counts = rng.integers(0, 10, shape).astype(np.float64)
+    np.testing.assert_array_equal(CircleSum(counts, radius, cellSize, blockSize), BruteForceDisc(counts, radius, cellSize))
+    values = rng.uniform(0, 50, shape) * (rng.random(shape) < 0.2)
+    np.testing.assert_allclose(CircleSum(values, radius, cellSize, blockSize), BruteForceDisc(values, radius, cellSize), rtol=1e-12, atol=1e-9)
+
+def test_drainage_density_of_a_straight_stream():
+    # Stream flowing east along row 20, ending at the east edge
+    shape, cellSize, radius = (41, 60), (30.0, 30.0), 300.0
+    flowDir = np.ones(shape, dtype=np.uint8)
+    flowDir[:, 0] = FLOW_NODATA
+    streams = np.zeros(shape, dtype=bool)
+    streams[20, 1:] = True
+    length = StreamLength(flowDir, streams, cellSize)
+    # The last cell of the stream has no downstream stream cell
+    np.testing.assert_array_equal(length[20, 1:-1], 30.0)
+    assert length[20, -1] == 0 and length.sum() == 30.0 * (shape[1] - 2)
+    density = DrainageDensityRaster(flowDir, streams, cellSize, radius, BlockSize=(16, 16))
+    assert np.isnan(density[:, 0]).all()
+    expected = BruteForceDisc(length, radius, cellSize) / 1000 / (np.pi * radius ** 2 / 1e6)
+    np.testing.assert_allclose(density[:, 1:], expected[:, 1:], rtol=1e-6)
+    # Away from the stream ends, the circle holds 21 stream cells on the center row
+    assert density[20, 30] == pytest.approx(21 * 30 / 1000 / (np.pi * 0.3 ** 2), rel=1e-6)
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Flow Routing Tests
+Objective:  Depression filling, D8 direction and flow accumulation (Flow_Routing.py) against cell by cell brute force
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import numpy as np
+import pytest
+
+from Flow_Routing import (FillDepressions, D8Direction, FlowAccumulation, FlowRouting, EdgeCells,
+                          D8_CODES, D8_OFFSETS, FLOW_NODATA)
+
+OFFSETS = dict(zip(D8_CODES, D8_OFFSETS))
+
+# Test DEMs: the synthetic DEM, random noise (many pits), and integer terraces (many flats) with a NoData hole
+@pytest.fixture(params=['synthetic', 'noise', 'terraces'])
+def dem(request, synthetic, rng):
+    if request.param == 'synthetic':
+        values = np.array(synthetic['DEM'][:, :], dtype=np.float64)
+        return values, np.isfinite(values)
+    shape = (48, 56)
+    values = rng.uniform(0, 100, shape)
+    if request.param == 'terraces':
+        values = np.floor(values / 25) * 25
+        values[20:26, 30:34] = np.nan
+    return values, np.isfinite(values)
+
+# Water level of every cell by relaxation: edge cells drain to the outside, every other cell is at least the lowest level of its neighbours
+def BruteForceFill(DEM, Valid):
+    rows, cols = DEM.shape
+    level = np.where(EdgeCells(Valid), DEM, np.inf)
+    while True:
+        padded = np.pad(np.where(Valid, level, np.inf), 1, constant_values=np.inf)
+        lowest = np.min([padded[1 + dr:1 + dr + rows, 1 + dc:1 + dc + cols] for dr, dc in D8_OFFSETS], axis=0)
+        updated = np.where(Valid & ~EdgeCells(Valid), np.maximum(DEM, np.minimum(level, lowest)), level)
+        if np.array_equal(updated, level):
+            return np.where(Valid, level, DEM)
+        level = updated
+
+# Steepest downhill neighbour of a cell, first in code order on ties, 0 without one
+def BruteForceDirection(DEM, Valid, r, c):
+    best, code = 0.0, 0
+    for k, (dr, dc) in OFFSETS.items():
+        rr, cc = r + dr, c + dc
+        if Valid[rr, cc]:
+            drop = (DEM[r, c] - DEM[rr, cc]) / np.hypot(dr, dc)
+            if drop > best:
+                best, code = drop, k
+    return code
+
+# Number of upstream cells of every cell, following the path of every cell to the edge
+def BruteForceAccumulation(FlowDir):
+    rows, cols = FlowDir.shape
+    accumulation = np.zeros(FlowDir.shape, dtype=np.uint32)
+    for r, c in zip(*np.nonzero(FlowDir != FLOW_NODATA)):
+        for _ in range(FlowDir.size):
+            dr, dc = OFFSETS.get(FlowDir[r, c], (None, None))
+            if dr is None:
+                break
+            r, c = r + dr, c + dc
+            if not (0 <= r < rows and 0 <= c < cols) or FlowDir[r, c] == FLOW_NODATA:
+                break
+            accumulation[r, c] += 1
+        else:
+            raise AssertionError('Flow path does not leave the DEM.')
+    return accumulation
+
+def test_fill_matches_relaxation(dem):
+    values, valid = dem
+    filled = FillDepressions(values, valid)
+    np.testing.assert_array_equal(filled[valid], BruteForceFill(values, valid)[valid])
+    assert np.isnan(filled[~valid]).all()
+
+def test_direction_matches_steepest_descent(dem):
+    values, valid = dem
+    filled = FillDepressions(values, valid)
+    direction = D8Direction(filled, valid)
+    edges = EdgeCells(valid)
+    assert (direction[~valid] == FLOW_NODATA).all()
+    for r, c in zip(*np.nonzero(valid & ~edges)):
+        expected = BruteForceDirection(filled, valid, r, c)
+        if expected:
+            assert direction[r, c] == expected, (r, c)
+        else:
+            # Flats drain to a neighbour of the same elevation
+            dr, dc = OFFSETS[direction[r, c]]
+            assert filled[r + dr, c + dc] == filled[r, c], (r, c)
+    # Edge cells flow outward (FORCE)
+    rows, cols = values.shape
+    for r, c in zip(*np.nonzero(edges)):
+        dr, dc = OFFSETS[direction[r, c]]
+        rr, cc = r + dr, c + dc
+        assert not (0 <= rr < rows and 0 <= cc < cols) or not valid[rr, cc], (r, c)
+
+def test_accumulation_matches_path_following(dem):
+    values, valid = dem
+    direction = D8Direction(FillDepressions(values, valid), valid)
+    accumulation, streams = FlowAccumulation(direction, Threshold=20)
+    np.testing.assert_array_equal(accumulation, BruteForceAccumulation(direction))
+    np.testing.assert_array_equal(streams, valid & (accumulation >= 20))
+
+def test_flow_routing_with_nodata_value():
+    # An integer DEM with a NoData value, a pit and a flat
+    dem = np.array([[9, 9, 9, 9, 9],
+                    [9, 5, 5, 5, 9],
+                    [9, 5, 1, 5, 4],
+                    [9, 5, 5, 5, 9],
+                    [9, 9, 9, 9, 9],
+                    [-1, 9, 9, 9, 9]], dtype=np.int16)
+    flowDir, flowAcc, streams = FlowRouting(dem, NoData=-1, Threshold=8)
+    assert flowDir[5, 0] == FLOW_NODATA
+    # The filled pit, the flat around it and the two inner cells of row 4 drain through the spill cell on the east edge
+    assert flowDir[2, 4] == 1
+    assert flowAcc[2, 4] == 11
+    assert streams[2, 4] and streams.sum() == 1
+    np.testing.assert_array_equal(flowAcc, BruteForceAccumulation(flowDir))
+    # Without filling the pit is a sink
+    assert FlowRouting(dem, NoData=-1, Fill=False)[0][2, 2] == 0
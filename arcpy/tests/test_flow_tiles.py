@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Flow Tiles Tests
+Objective:  Tiled flow accumulation with boundary stitching (Flow_Tiles.py) against the single pass Flow_Routing.FlowAccumulation
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import numpy as np
+import pytest
+
+from Flow_Routing import FlowRouting, FlowAccumulation, FLOW_NODATA
+from Flow_Tiles import TiledFlowAccumulation, SourceToNpy, ACCUMULATION_NODATA
+
+THRESHOLD = 20
+
+# Flow direction of a random DEM with NoData holes (filled, or with sinks left in)
+def RandomFlowDir(rng, Shape, Fill):
+    dem = rng.uniform(0, 100, Shape)
+    # Tilted, so flow paths run across several tiles
+    dem += np.linspace(0, 400, Shape[1])[None, :] + np.linspace(0, 200, Shape[0])[:, None]
+    dem[rng.random(Shape) < 0.03] = np.nan
+    dem[Shape[0] // 3:Shape[0] // 3 + 5, Shape[1] // 2:Shape[1] // 2 + 9] = np.nan
+    return FlowRouting(dem, NoData=np.nan, Threshold=THRESHOLD, Fill=Fill)[0]
+
+# Tile sizes that do not divide the grid, including thin tiles and a single tile
+@pytest.mark.parametrize('tileSize', [(7, 11), (13, 5), (1, 64), (200, 200)])
+@pytest.mark.parametrize('fill', [True, False])
+def test_tiled_equals_single_pass(tmp_path, rng, tileSize, fill):
+    flowDir = RandomFlowDir(rng, (61, 74), fill)
+    np.save(tmp_path / 'FlowDir.npy', flowDir)
+    accumulation, streams = TiledFlowAccumulation(str(tmp_path / 'FlowDir.npy'), str(tmp_path / 'FlowAcc.npy'), str(tmp_path / 'Streams.npy'),
+                                                  Threshold=THRESHOLD, TileSize=tileSize, Workers=1)
+    expected, expectedStreams = FlowAccumulation(flowDir, THRESHOLD)
+    valid = flowDir != FLOW_NODATA
+    np.testing.assert_array_equal(accumulation[valid], expected[valid])
+    assert (accumulation[~valid] == ACCUMULATION_NODATA).all()
+    np.testing.assert_array_equal(streams.astype(bool), expectedStreams & valid)
+
+def test_worker_processes(tmp_path, rng):
+    flowDir = RandomFlowDir(rng, (53, 47), True)
+    np.save(tmp_path / 'FlowDir.npy', flowDir)
+    accumulation, streams = TiledFlowAccumulation(str(tmp_path / 'FlowDir.npy'), str(tmp_path / 'FlowAcc.npy'), Threshold=THRESHOLD, TileSize=(17, 12), Workers=2)
+    valid = flowDir != FLOW_NODATA
+    np.testing.assert_array_equal(accumulation[valid], FlowAccumulation(flowDir)[0][valid])
+    assert streams is None
+
+def test_source_to_npy(tmp_path, rng):
+    source = rng.integers(0, 10, (30, 25)).astype(np.uint8)
+    SourceToNpy(source, str(tmp_path / 'Copy.npy'), NoData=0, BlockSize=(8, 9))
+    np.testing.assert_array_equal(np.load(tmp_path / 'Copy.npy'), np.where(source == 0, FLOW_NODATA, source))
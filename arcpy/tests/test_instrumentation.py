@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Instrumentation Tests
+Objective:  Trace events (Instrumentation.py): span nesting, counters and notes, the disabled path, and the critical path/hotspot report of a small synthetic trace
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import os
+import json
+import threading
+
+import numpy as np
+import pytest
+
+import Instrumentation
+from Instrumentation import Enable, Disable, Enabled, SetTags, Count, CountWindow, Context, Note, Span, Traced, ReadTrace, CriticalPath, Hotspots, Report
+
+# Tracing enabled to a temporary file for one test, restored afterwards
+# Returns: path of the trace file
+@pytest.fixture
+def trace(tmp_path):
+    path = str(tmp_path / 'trace.jsonl')
+    tags = dict(Instrumentation._tags)
+    Enable(path)
+    yield path
+    Disable()
+    Instrumentation._tags.clear()
+    Instrumentation._tags.update(tags)
+
+# Events of a trace file, by name
+def EventsByName(Path):
+    return {event['name']: event for event in ReadTrace(Path)}
+
+@Traced(Tags=('Backend',))
+def TracedStage(Value, Backend='arcpy'):
+    return Value * 2
+
+def test_span_nesting_and_parents(trace):
+    SetTags(watershed='SanPedro')
+    with Span('outer', stage='suitability') as outer:
+        with Span('inner', layer='DEM'):
+            pass
+        assert TracedStage(3, Backend='numpy') == 6
+    events = EventsByName(trace)
+    # Written as the calls return
+    assert [event['name'] for event in ReadTrace(trace)] == ['inner', 'TracedStage', 'outer']
+    assert events['outer']['parent'] is None and events['outer']['id'] == outer.id
+    assert events['inner']['parent'] == outer.id and events['TracedStage']['parent'] == outer.id
+    # Tags are inherited by nested events
+    assert events['outer']['tags'] == {'watershed': 'SanPedro', 'stage': 'suitability'}
+    assert events['inner']['tags'] == {'watershed': 'SanPedro', 'stage': 'suitability', 'layer': 'DEM'}
+    assert events['TracedStage']['tags']['Backend'] == 'numpy'
+    for event in events.values():
+        assert event['status'] == 'ok' and event['pid'] == os.getpid()
+        assert event['end'] >= event['start'] and event['wall'] >= 0
+    assert events['outer']['start'] <= events['inner']['start'] and events['inner']['end'] <= events['outer']['end'] + 1e-6
+    assert Context() is None
+
+def test_traced_default_tags(trace):
+    TracedStage(1)
+    assert EventsByName(trace)['TracedStage']['tags'] == {'Backend': 'arcpy'}
+
+def test_parent_from_another_thread(trace):
+    with Span('batch', watershed='Salt') as batch:
+        context = Context()
+        worker = threading.Thread(target=lambda: Span('worker', context).__enter__().__exit__(None, None, None))
+        worker.start()
+        worker.join()
+    events = EventsByName(trace)
+    assert events['worker']['parent'] == batch.id and events['worker']['tags'] == {'watershed': 'Salt'}
+
+def test_error_status(trace):
+    with pytest.raises(ValueError):
+        with Span('failing'):
+            raise ValueError('no valid cells')
+    event = EventsByName(trace)['failing']
+    assert event['status'] == 'error' and event['error'] == 'ValueError: no valid cells'
+
+def test_counter_deltas(trace):
+    with Span('outer'):
+        Count('cacheHits', 2)
+        with Span('inner'):
+            CountWindow('Read', (slice(0, 10), slice(0, 5)), (100, 100), np.dtype(np.float32))
+            # Windows are clipped to the raster
+            CountWindow('Written', (slice(95, 110), slice(None)), (100, 100), np.dtype(np.uint8))
+            Count('cacheMisses')
+    events = EventsByName(trace)
+    assert events['inner']['pixelsRead'] == 50 and events['inner']['bytesRead'] == 200
+    assert events['inner']['pixelsWritten'] == 500 and events['inner']['bytesWritten'] == 500
+    assert events['inner']['cacheHits'] == 0 and events['inner']['cacheMisses'] == 1
+    # Counts of nested calls are included
+    assert events['outer']['pixelsRead'] == 50 and events['outer']['cacheHits'] == 2 and events['outer']['cacheMisses'] == 1
+
+def test_notes(trace):
+    with Span('stages'):
+        Note('cachedStages', 'Slope')
+        with Span('nested'):
+            Note('cachedStages', 'Precipitation')
+        Note('cachedStages', 'Drainage_Density')
+    events = EventsByName(trace)
+    assert events['stages']['notes'] == {'cachedStages': ['Slope', 'Drainage_Density']}
+    assert events['nested']['notes'] == {'cachedStages': ['Precipitation']}
+    # Notes outside a span are dropped
+    Note('cachedStages', 'Lithology')
+    assert len(ReadTrace(trace)) == 2
+
+def test_disabled_is_a_no_op(tmp_path):
+    Disable()
+    assert not Enabled()
+    counters = dict(Instrumentation._counters)
+    with Span('ignored') as span:
+        Count('cacheHits', 5)
+        CountWindow('Read', (slice(0, 10), slice(0, 10)), (10, 10), np.dtype(np.float32))
+        Note('cachedStages', 'Slope')
+        assert Context() is None
+    assert span.event is None
+    assert TracedStage(4, Backend='numpy') == 8
+    assert Instrumentation._counters == counters
+    assert not os.listdir(tmp_path)
+
+# Synthetic events: (name, start, end), children of a root event of 0 - 10 s
+def Events(Spans, Parent='root', **Fields):
+    return [{'id': name, 'parent': Parent, 'name': name, 'tags': {}, 'start': start, 'end': end, 'wall': end - start, 'cpu': 0.0, 'status': 'ok', **Fields} for name, start, end in Spans]
+
+def test_critical_path():
+    children = Events([('a', 0, 5), ('b', 5, 9), ('c', 2, 8), ('d', 9, 10)])
+    assert [event['name'] for event in CriticalPath(children)] == ['a', 'b', 'd']
+    # Overlapping children: only the one ending last
+    assert [event['name'] for event in CriticalPath(Events([('x', 0, 10), ('y', 1, 9)]))] == ['x']
+    assert CriticalPath([]) == []
+
+def test_hotspots():
+    root = Events([('root', 0, 10)], Parent=None, pixelsRead=100)
+    children = Events([('read', 0, 3), ('read', 3, 7)], pixelsRead=40)
+    totals = dict(Hotspots(root + children, {'root': children}))
+    assert totals['root']['self'] == pytest.approx(3) and totals['root']['wall'] == 10
+    assert totals['read']['calls'] == 2 and totals['read']['self'] == pytest.approx(7) and totals['read']['pixelsRead'] == 80
+    # Sorted by self time
+    assert [name for name, _ in Hotspots(root + children, {'root': children})] == ['read', 'root']
+
+def test_report(tmp_path, capsys):
+    events = Events([('RunWatershed', 0, 10)], Parent=None)
+    events += Events([('Preprocessing', 0, 4), ('RunFloodMAR', 4, 10)], Parent='RunWatershed')
+    events += Events([('CalcSlope', 0, 3)], Parent='Preprocessing')
+    for event in events:
+        event['tags'] = {'watershed': 'SanPedro'}
+    events[1]['notes'] = {'cachedStages': ['Precipitation']}
+    other = Events([('RunWatershed-Salt', 20, 21)], Parent=None, status='error', error='RuntimeError: ExtractByMask failed')
+    other[0]['tags'] = {'watershed': 'Salt'}
+    path = tmp_path / 'trace.jsonl'
+    path.write_text(''.join(json.dumps(event) + '\n' for event in events + other))
+    Report(str(path))
+    output = capsys.readouterr().out
+    assert 'SanPedro: 4 events, 10.0 s' in output and 'Salt: 1 events, 1.0 s' in output
+    # Critical path, nested calls indented under their parent
+    lines = [line.strip() for line in output.splitlines()]
+    names = [line.split()[0] for line in lines if line.split() and line.split()[0] in ('RunWatershed', 'Preprocessing', 'CalcSlope', 'RunFloodMAR')]
+    assert names[:4] == ['RunWatershed', 'Preprocessing', 'CalcSlope', 'RunFloodMAR']
+    assert 'Cached stages (skipped): Precipitation' in output
+    assert 'Error in RunWatershed-Salt: RuntimeError: ExtractByMask failed' in output
+    assert '[error]' in output
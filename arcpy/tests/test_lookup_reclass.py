@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Lookup Reclass Tests
+Objective:  Compiled range and categorical LUTs (Lookup_Reclass.py) against the classification tables
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import numpy as np
+import pytest
+
+from conftest import BLOCK
+from Lookup_Reclass import CompileRangeTable, CompileCategoricalTable, ReclassifyBlocks, NODATA_CLASS
+
+# Class of a newValue entry of a table ("NODATA" is NoData)
+def NewClass(NewValue):
+    return NODATA_CLASS if str(NewValue).strip().upper() == 'NODATA' else int(NewValue)
+
+# Class of a value by reading the table row by row, as arcpy Reclassify: ranges include their end value, only the first range its start value
+def TableClass(Rows, Value):
+    if np.isnan(Value):
+        return NODATA_CLASS
+    for i, (start, end, newValue) in enumerate(Rows):
+        if start < Value <= end or (i == 0 and Value == start):
+            return NewClass(newValue)
+    return NODATA_CLASS
+
+@pytest.mark.parametrize('table', ['Flooding_ContinuousClassificationSchemas', 'Recharge_ContinuousClassificationSchemas'])
+def test_range_lut_matches_table(tables, table, rng):
+    reclass = tables[table]
+    for layer in reclass['layer'].unique():
+        rows = sorted(reclass[reclass['layer'] == layer][['startValue', 'endValue', 'newValue']].itertuples(index=False), key=lambda row: row[0])
+        bounds = np.array([[start, end] for start, end, _ in rows], dtype=np.float64)
+        low, high = bounds.min(), bounds.max()
+        # Every boundary, values between them and outside the table, and NoData
+        values = np.concatenate([bounds.ravel(), rng.uniform(low - (high - low) * 0.1, high + (high - low) * 0.1, 500), [np.nan]])
+        lut = CompileRangeTable(reclass, layer)
+        expected = np.array([TableClass(rows, value) for value in values], dtype=np.uint8)
+        np.testing.assert_array_equal(lut(values), expected, err_msg=layer)
+
+def test_range_lut_rejects_overlaps():
+    import pandas as pd
+
+    table = pd.DataFrame({'layer': ['A', 'A'], 'startValue': [0, 5], 'endValue': [10, 20], 'newValue': [1, 2]})
+    with pytest.raises(ValueError):
+        CompileRangeTable(table, 'A')
+
+def test_categorical_lut_matches_table(tables, polygons):
+    for table in ('Flooding_CategoricalClassificationSchemas', 'Recharge_CategoricalClassificationSchemas'):
+        reclass = tables[table]
+        for name, layer in (('Lithology', 'Lithology'), ('Soil', 'Soils')):
+            raster, codes = polygons[name]
+            rows = reclass[reclass['layer'] == layer]
+            remap = {str(old).strip(): new for old, new in zip(rows['oldValue'], rows['newValue'])}
+            lut = CompileCategoricalTable(reclass, layer, codes)
+            # Code 0 (outside every polygon) and codes missing from the code table are NoData
+            expected = np.full(raster.shape, NODATA_CLASS, dtype=np.uint8)
+            for code, value in codes.items():
+                if str(value).strip() in remap:
+                    expected[raster == code] = NewClass(remap[str(value).strip()])
+            np.testing.assert_array_equal(ReclassifyBlocks(raster, lut, NoData=0, BlockSize=BLOCK), expected, err_msg=f'{table} {layer}')
+
+def test_categorical_lut_of_raster_values(tables, synthetic):
+    reclass = tables['Flooding_CategoricalClassificationSchemas']
+    rows = reclass[reclass['layer'] == 'LULC']
+    remap = {int(float(old)): NewClass(new) for old, new in zip(rows['oldValue'], rows['newValue'])}
+    lulc = np.array(synthetic['LULC'][:, :])
+    # Values outside the table (and the NoData value 0) are NoData
+    lulc[:3] = 0
+    lulc[-3:] = 200
+    expected = np.array([remap.get(int(value), NODATA_CLASS) for value in lulc.ravel()], dtype=np.uint8).reshape(lulc.shape)
+    expected[lulc == 0] = NODATA_CLASS
+    classified = ReclassifyBlocks(lulc, CompileCategoricalTable(reclass, 'LULC'), NoData=0, BlockSize=BLOCK)
+    np.testing.assert_array_equal(classified, expected)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Raster Expression Tests
+Objective:  Lazy raster expressions (Raster_Expression.py): constant folding, NoData propagation, and the fused evaluation against NumPy and the tiled weighted overlay
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import numpy as np
+import pytest
+
+from conftest import SIZE, BLOCK
+from Raster_Expression import Constant, Layer, Operation, Symbol, Exp, Where, IsValid, Normalize, WeightedSum
+from Weighted_Overlay import WeightedOverlay
+
+WEIGHTS = [0.25, 0.1, 0.3, 0.35]
+
+# Float layers with NaN NoData, and an integer layer (NoData 0 where given, plain arrays carry no NoData value)
+def Layers(rng):
+    a = rng.normal(50, 10, (SIZE, SIZE)).astype(np.float32)
+    b = rng.uniform(1, 9, (SIZE, SIZE)).astype(np.float32)
+    a[rng.random(a.shape) < 0.05] = np.nan
+    b[rng.random(b.shape) < 0.05] = np.nan
+    c = rng.integers(0, 6, (SIZE, SIZE)).astype(np.uint8)
+    return a, b, c
+
+def test_scalar_subtrees_are_folded(rng):
+    a, _, _ = Layers(rng)
+    minimum, maximum = 10.0, 90.0
+    kernel = Normalize(a, minimum, maximum).Compile()
+    # (maximum - minimum) is one constant
+    assert sorted(float(v) for v in kernel.constants.values()) == [minimum, maximum - minimum]
+    assert kernel.text == '((l0 - c0) / c1)'
+    folded = (Constant(2) * Constant(3) + Exp(Constant(0))).Fold()
+    assert isinstance(folded, Constant) and folded.value == 7.0
+
+def test_identities_are_dropped(rng):
+    a, _, _ = Layers(rng)
+    layer = Layer(a)
+    assert (layer * 1 + 0).Fold() is layer
+    assert (0 + 1 * (layer / 1) - 0).Fold() is layer
+    assert isinstance((layer * 2).Fold(), Operation)
+
+def test_layer_used_twice_is_read_once(rng):
+    a, _, _ = Layers(rng)
+    layer = Layer(a)
+    kernel = (layer * layer + Layer(a)).Compile()
+    assert len(kernel.layers) == 1 and kernel.text == '((l0 * l0) + l0)'
+
+def test_evaluate_matches_numpy(rng):
+    a, b, _ = Layers(rng)
+    result = (Normalize(a, 10.0, 90.0) * Normalize(b, 1.0, 9.0)).Evaluate(BlockSize=BLOCK)
+    expected = ((a - np.float32(10.0)) / np.float32(80.0)) * ((b - np.float32(1.0)) / np.float32(8.0))
+    np.testing.assert_array_equal(result, expected)
+    assert result.dtype == np.float32
+
+def test_nodata_propagates(rng):
+    a, b, c = Layers(rng)
+    result = (Layer(a) + Layer(b) * Layer(c, NoData=0)).Evaluate(BlockSize=BLOCK)
+    invalid = np.isnan(a) | np.isnan(b) | (c == 0)
+    assert np.isnan(result[invalid]).all() and np.isfinite(result[~invalid]).all()
+    # Another NoData value, and a mask
+    mask = rng.random((SIZE, SIZE)) < 0.7
+    result = (Layer(a) + Layer(b) * Layer(c, NoData=0)).Evaluate(Mask=mask, OutNoData=-9999, BlockSize=BLOCK)
+    assert (result[invalid | ~mask] == -9999).all() and (result[~invalid & mask] != -9999).all()
+    # An explicit NoData value overrides the one of the source
+    result = (Layer(c, NoData=1) * 2).Evaluate(BlockSize=BLOCK)
+    np.testing.assert_array_equal(result, np.where(c == 1, np.nan, 2 * c.astype(np.float32)))
+
+def test_where_keeps_nodata(rng):
+    a, _, _ = Layers(rng)
+    x = Symbol('x')
+    kernel = Where(IsValid(x), Where(x > 50, 1.0, 0.0), x).Compile(np.float64)
+    out = kernel({'x': a.astype(np.float64)}, np.empty(a.shape))
+    np.testing.assert_array_equal(out, np.where(np.isnan(a), np.nan, (a > 50).astype(np.float64)))
+
+def test_expression_without_layers():
+    with pytest.raises(ValueError, match='no raster layers'):
+        (Constant(1) + 2).Evaluate()
+
+def test_weighted_sum_matches_weighted_overlay(rng):
+    layers = [rng.integers(1, 6, (SIZE, SIZE)).astype(np.float32) for _ in WEIGHTS]
+    layers[0][rng.random((SIZE, SIZE)) < 0.05] = np.nan
+    layers[3][rng.random((SIZE, SIZE)) < 0.05] = np.nan
+    result = WeightedSum(layers, WEIGHTS).Evaluate(BlockSize=BLOCK)
+    overlay = WeightedOverlay(layers, WEIGHTS, NoData=[np.nan] * len(WEIGHTS), BlockSize=BLOCK)
+    # Products rounded to float32 before the sum, so up to the last float32 digit
+    np.testing.assert_allclose(result, overlay, rtol=2 * np.finfo(np.float32).eps, equal_nan=True)
+    np.testing.assert_array_equal(np.isnan(result), np.isnan(overlay))
+    with pytest.raises(ValueError):
+        WeightedSum(layers, WEIGHTS[:3])
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Raster Statistics Tests
+Objective:  Single pass raster statistics and their cache (Raster_Statistics.py) against NumPy over the whole array
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import numpy as np
+import pytest
+
+from conftest import SIZE, BLOCK
+from Raster_Statistics import MultiRasterStatistics, RunningStatistics, StatisticsCache
+from Raster_Store import SaveRaster, OpenRaster
+from Synthetic_Data import GridTransform, EPSG
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_statistics_match_numpy(synthetic, workers):
+    stats = MultiRasterStatistics({name: synthetic[name] for name in ('DEM', 'NDVI', 'Lineaments')}, BlockSize=BLOCK, Workers=workers)
+    for name, result in stats.items():
+        values = np.array(synthetic[name][:, :], dtype=np.float64)
+        values = values[np.isfinite(values)]
+        assert result['count'] == values.size
+        assert result['minimum'] == values.min() and result['maximum'] == values.max()
+        np.testing.assert_allclose([result['mean'], result['std']], [values.mean(), values.std()], rtol=1e-10)
+        assert sum(result['histogram']['counts']) == values.size
+
+def test_statistics_with_mask(synthetic):
+    mask = np.zeros((SIZE, SIZE), dtype=bool)
+    mask[10:50, 20:70] = True
+    result = MultiRasterStatistics({'DEM': synthetic['DEM']}, Mask=mask, BlockSize=BLOCK, Workers=2)['DEM']
+    values = np.array(synthetic['DEM'][:, :], dtype=np.float64)[mask]
+    assert result['count'] == values.size
+    np.testing.assert_allclose(result['mean'], values.mean(), rtol=1e-10)
+
+def test_histogram_merge_and_quantiles(rng):
+    values = rng.lognormal(3, 1, 20000)
+    merged = RunningStatistics()
+    for part in np.array_split(values, 7):
+        merged.Merge(RunningStatistics.FromValues(part))
+    edges, counts = merged.Histogram()
+    assert counts.size <= merged.bins and counts.sum() == values.size
+    np.testing.assert_array_equal(counts, np.histogram(values, edges)[0])
+    # Quantiles are within one bin of the exact ones
+    width = edges[1] - edges[0]
+    for q in (0.1, 0.5, 0.9):
+        assert abs(merged.Quantile(q) - np.quantile(values, q)) <= width
+
+def test_all_nodata_statistics(tmp_path):
+    path = f'{tmp_path}/Store.mmap/Empty.npy'
+    SaveRaster(np.full((SIZE, SIZE), np.nan, dtype=np.float32), GridTransform(), path, SpatialReference=EPSG)
+    stats = MultiRasterStatistics({'Empty': OpenRaster(path)}, BlockSize=BLOCK, Workers=1)['Empty']
+    assert stats['count'] == 0
+    assert all(np.isnan(stats[key]) for key in ('minimum', 'maximum', 'mean', 'std'))
+
+def test_cache_key_includes_snap_raster(tmp_path):
+    for name in ('Layer', 'SnapA', 'SnapB', 'Extent'):
+        (tmp_path / f'{name}.tif').write_bytes(name.encode())
+    cache = StatisticsCache(str(tmp_path))
+    key = cache.Key(tmp_path / 'Layer.tif', tmp_path / 'Extent.tif', tmp_path / 'SnapA.tif')
+    assert key == cache.Key(tmp_path / 'Layer.tif', tmp_path / 'Extent.tif', tmp_path / 'SnapA.tif')
+    assert key != cache.Key(tmp_path / 'Layer.tif', tmp_path / 'Extent.tif', tmp_path / 'SnapB.tif')
+    assert key != cache.Key(tmp_path / 'Layer.tif', tmp_path / 'Extent.tif')
+    # A changed snap raster invalidates the entry
+    (tmp_path / 'SnapA.tif').write_bytes(b'changed grid')
+    assert key != cache.Key(tmp_path / 'Layer.tif', tmp_path / 'Extent.tif', tmp_path / 'SnapA.tif')
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Raster Store Tests
+Objective:  Round trips of the raster stores (Raster_Store.py): values, georeferencing and NoData, without arcpy
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import os
+
+import numpy as np
+import pytest
+
+from conftest import SIZE, BLOCK
+from Block_Processing import IterBlocks
+from Raster_Store import CreateRaster, SaveRaster, OpenRaster, CopyRaster, CopyDataset, StoreLocation, DatasetPath, StoreType
+from Synthetic_Data import GridTransform, EPSG
+
+# Stores that run without arcpy; Zarr and COG only where zarr and rasterio are installed
+STORES = ['npy', 'zarr', 'cog']
+
+# Dataset path in a store of a temporary workspace, skipping stores whose package is missing
+def StorePath(Folder, Store, Name):
+    if Store == 'zarr':
+        pytest.importorskip('zarr')
+    if Store == 'cog':
+        pytest.importorskip('rasterio')
+    return DatasetPath(StoreLocation(str(Folder), 'Store', Store), Name)
+
+# Arrays of each dtype the backends write, with NoData cells
+# Returns: (array, NoData value)
+def Sample(rng, DType):
+    if np.dtype(DType).kind == 'f':
+        array = rng.normal(100, 20, (SIZE, SIZE)).astype(DType)
+        array[rng.random(array.shape) < 0.1] = np.nan
+        return array, np.nan
+    array = rng.integers(1, 250, (SIZE, SIZE)).astype(DType)
+    array[rng.random(array.shape) < 0.1] = 0
+    return array, 0
+
+def test_store_paths():
+    assert StoreType(StoreLocation('ws', 'Layers', 'npy')) == 'npy'
+    assert StoreType(DatasetPath(StoreLocation('ws', 'Layers', 'cog'), 'DEM')) == 'cog'
+    assert StoreType(DatasetPath(StoreLocation('ws', 'Layers', 'zarr'), 'DEM')) == 'zarr'
+    assert StoreType(DatasetPath(StoreLocation('ws', 'Layers', 'gdb'), 'DEM')) == 'gdb'
+    with pytest.raises(ValueError):
+        StoreLocation('ws', 'Layers', 'hdf')
+
+@pytest.mark.parametrize('store', STORES)
+@pytest.mark.parametrize('dtype', [np.float32, np.uint8, np.uint16])
+def test_save_and_open_round_trip(tmp_path, store, dtype, rng):
+    path = StorePath(tmp_path, store, 'Layer')
+    array, noData = Sample(rng, dtype)
+    SaveRaster(array, GridTransform(), path, NoData=noData, SpatialReference=EPSG)
+    raster = OpenRaster(path)
+    assert raster.shape == array.shape and raster.dtype == array.dtype
+    np.testing.assert_array_equal(raster[:, :], array)
+    np.testing.assert_allclose(raster.transform, GridTransform())
+    assert raster.crs == EPSG
+    assert np.isnan(raster.noData) if np.isnan(noData) else raster.noData == noData
+
+@pytest.mark.parametrize('store', STORES)
+def test_window_writes(tmp_path, store, rng):
+    path = StorePath(tmp_path, store, 'Layer')
+    array, noData = Sample(rng, np.float32)
+    with CreateRaster(path, array.shape, array.dtype, GridTransform(), noData, EPSG) as raster:
+        # Out of order, with windows that do not align with the chunks
+        for window in reversed(list(IterBlocks(array.shape, BLOCK))):
+            raster[window] = array[window]
+    np.testing.assert_array_equal(OpenRaster(path)[:, :], array)
+
+def test_npy_publishes_atomically(tmp_path, rng):
+    path = StorePath(tmp_path, 'npy', 'Layer')
+    array, noData = Sample(rng, np.float32)
+    raster = CreateRaster(path, array.shape, array.dtype, GridTransform(), noData, EPSG)
+    raster[:, :] = array
+    # Nothing is published until Close
+    assert not os.path.exists(path) and not os.path.exists(f'{os.path.splitext(path)[0]}.json')
+    raster.Close()
+    folder = os.path.dirname(path)
+    assert sorted(os.listdir(folder)) == ['Layer.json', 'Layer.npy']
+    np.testing.assert_array_equal(raster[:, :], array)
+
+@pytest.mark.parametrize('store', STORES)
+def test_copy_raster_with_mask(tmp_path, store, synthetic):
+    source = synthetic['DEM']
+    path = StorePath(tmp_path, store, 'DEM')
+    mask = np.zeros(source.shape, dtype=bool)
+    mask[:SIZE // 3, :SIZE // 3] = True
+    copy = CopyRaster(source, path, source.transform, np.nan, EPSG, BlockSize=BLOCK, Mask=mask)
+    values, expected = copy[:, :], np.array(source[:, :])
+    # Blocks touching the mask are copied, blocks entirely outside it are NoData
+    touched = np.zeros(source.shape, dtype=bool)
+    for window in IterBlocks(source.shape, BLOCK):
+        touched[window] = mask[window].any()
+    np.testing.assert_array_equal(values[touched], expected[touched])
+    assert np.isnan(values[~touched]).all()
+
+@pytest.mark.parametrize('store', STORES)
+def test_copy_dataset(tmp_path, store, synthetic):
+    source = synthetic['LULC']
+    path = StorePath(tmp_path, store, 'LULC')
+    CopyDataset(source.path, path, BlockSize=BLOCK)
+    copy = OpenRaster(path)
+    np.testing.assert_array_equal(copy[:, :], source[:, :])
+    assert copy.noData == source.noData and copy.crs == source.crs
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Rescale Functions Tests
+Objective:  Tf transformation functions (Rescale_Functions.py) against their closed forms
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import numpy as np
+import pytest
+
+from conftest import BLOCK
+import Rescale_Functions as rf
+from Raster_Statistics import MultiRasterStatistics
+
+# Thresholds of the tests, the function domain, and the data statistics the defaults are derived from
+LOWER, UPPER = 2.0, 12.0
+STATS = {'minimum': 1.0, 'maximum': 14.0, 'mean': 6.0, 'std': 2.5}
+
+# Logistic growth through y at low and 1 - y at high, normalized to 0 - 1
+def Logistic(x, low, high, y):
+    t = np.clip((x - low) / (high - low), 0, 1)
+    curve = 1 / (1 + ((1 - y) / y) * np.exp(-2 * np.log((1 - y) / y) * t))
+    return (curve - y) / (1 - 2 * y)
+
+# Closed forms of the ArcGIS transformation functions (rescale-by-function documentation), and whether they rescale their own 0 - 1 range (True) or their range over the thresholds (False)
+CASES = {
+    'TfLinear': (rf.TfLinear(3.0, 11.0), lambda x: np.clip((x - 3) / 8, 0, 1), True),
+    'TfLinearNegative': (rf.TfLinear(11.0, 3.0), lambda x: np.clip((x - 11) / -8, 0, 1), True),
+    'TfSymmetricLinear': (rf.TfSymmetricLinear(3.0, 11.0), lambda x: np.clip(1 - np.abs(2 * x - 14) / 8, 0, 1), True),
+    'TfLogisticGrowth': (rf.TfLogisticGrowth(3.0, 11.0, 5.0), lambda x: Logistic(x, 3, 11, 0.05), True),
+    'TfLogisticDecay': (rf.TfLogisticDecay(3.0, 11.0, 5.0), lambda x: 1 - Logistic(x, 3, 11, 0.05), True),
+    'TfGaussian': (rf.TfGaussian(6.0, 0.1), lambda x: np.exp(-0.1 * (x - 6) ** 2), False),
+    'TfNear': (rf.TfNear(6.0, 0.3), lambda x: 1 / (1 + 0.3 * (x - 6) ** 2), False),
+    'TfLarge': (rf.TfLarge(6.0, 3.0), lambda x: 1 / (1 + (x / 6) ** -3), False),
+    'TfSmall': (rf.TfSmall(6.0, 3.0), lambda x: 1 / (1 + (x / 6) ** 3), False),
+    'TfMSLarge': (rf.TfMSLarge(1.0, 1.0, 6.0, 2.5), lambda x: np.where(x > 6, 1 - 2.5 / (x - 6 + 2.5), 0), False),
+    'TfMSSmall': (rf.TfMSSmall(1.0, 1.0, 6.0, 2.5), lambda x: np.where(x > 6, 2.5 / (x - 6 + 2.5), 1), False),
+    'TfExponential': (rf.TfExponential(1.0, 0.3), lambda x: np.exp(0.3 * (x - 1)), False),
+    'TfLogarithm': (rf.TfLogarithm(0.5, 2.0), lambda x: 2 * np.log(x - 0.5), False),
+    'TfPower': (rf.TfPower(1.0, 1.5), lambda x: (x - 1) ** 1.5, False),
+}
+
+# Reference rescaling to From - To, with the thresholds and the values below/above them
+def Reference(Function, Fixed, Values, From=1, To=5, Below=np.nan, Above=np.nan):
+    with np.errstate(all='ignore'):
+        domain = np.array([0.0, 1.0]) if Fixed else Function(np.linspace(LOWER, UPPER, 200001))
+        out = From + (Function(Values) - domain.min()) * (To - From) / (domain.max() - domain.min())
+    out = np.where(Values < LOWER, Below, np.where(Values > UPPER, Above, out))
+    return np.where(np.isnan(Values), np.nan, out)
+
+@pytest.mark.parametrize('name', list(CASES))
+def test_transform_matches_closed_form(name, rng):
+    function, reference, fixed = CASES[name]
+    function.lowerThreshold, function.upperThreshold = LOWER, UPPER
+    function.valueBelowThreshold, function.valueAboveThreshold = 0, 9
+    values = np.concatenate([rng.uniform(LOWER - 1, UPPER + 1, 2000), [LOWER, UPPER, np.nan]]).astype(np.float32).reshape(-1, 1)
+    result = rf.RescaleByFunction(values, function, From=1, To=5, Stats=STATS)
+    expected = Reference(reference, fixed, values.astype(np.float64), Below=0, Above=9)
+    np.testing.assert_allclose(result, expected, rtol=1e-5, atol=1e-4, err_msg=name)
+
+def test_defaults_from_statistics():
+    # Without thresholds the data range is the domain, and TfLinear takes the data minimum and maximum
+    values = np.linspace(STATS['minimum'], STATS['maximum'], 50, dtype=np.float32)
+    result = rf.RescaleByFunction(values, rf.TfLinear(), From=1, To=5, Stats=STATS)
+    np.testing.assert_allclose(result, 1 + 4 * (values - 1) / 13, rtol=1e-6, atol=1e-5)
+    with pytest.raises(ValueError):
+        rf.TfGaussian().Compile(1, 5, {})
+
+def test_rescale_blocks_matches_single_block(synthetic):
+    layers = [synthetic['DEM'], synthetic['NDVI']]
+    functions = [rf.TfLinear(), rf.TfGaussian()]
+    # Missing statistics are computed in one pass, as Raster_Statistics does
+    outputs = rf.RescaleBlocks(layers, functions, BlockSize=BLOCK)
+    stats = MultiRasterStatistics({'DEM': layers[0], 'NDVI': layers[1]}, BlockSize=BLOCK)
+    for layer, function, output, name in zip(layers, functions, outputs, ('DEM', 'NDVI')):
+        np.testing.assert_array_equal(output, rf.RescaleByFunction(layer[:, :], function, Stats=stats[name]))
+
+def test_functions_are_shared_expressions():
+    # Tf functions compile to Raster_Expression kernels; the base class is abstract
+    kernel = rf.TfLinear(3.0, 11.0).Compile(1, 5, STATS)
+    assert 'x' in kernel.text and not kernel.layers
+    with pytest.raises(TypeError):
+        rf._TransformFunction()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Scanline Rasterize Tests
+Objective:  Polygon rasterization (Scanline_Rasterize.py) against an even-odd point-in-polygon test of every cell center
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import numpy as np
+import pytest
+
+from conftest import SIZE, BLOCK
+from Scanline_Rasterize import PolygonFeature, CodeFeatures, RasterizePolygons
+from Synthetic_Data import GridTransform, LatticePolygons, ORIGIN, CELL_SIZE
+
+EXTENT = SIZE * CELL_SIZE
+
+# Codes of the features containing each cell center (even-odd rule over all rings of a feature), later features win
+def PointInPolygon(Features, Shape):
+    rows, cols = np.mgrid[:Shape[0], :Shape[1]]
+    px = ORIGIN[0] + (cols + 0.5) * CELL_SIZE
+    py = ORIGIN[1] - (rows + 0.5) * CELL_SIZE
+    codes = np.zeros(Shape, dtype=np.uint16)
+    for feature in Features:
+        inside = np.zeros(Shape, dtype=bool)
+        for x1, y1, x2, y2 in feature.edges:
+            # Horizontal edges cross no center (the division is masked by the first test)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                inside ^= ((y1 > py) != (y2 > py)) & (px < x1 + (py - y1) * (x2 - x1) / (y2 - y1))
+        codes[inside] = feature.code
+    return codes
+
+# Random polygons over the grid: self-intersecting rings, polygons with a hole, and multipart polygons
+def RandomFeatures(rng, Count=12):
+    features = []
+    for code in range(1, Count + 1):
+        center = ORIGIN[0] + rng.uniform(0, EXTENT), ORIGIN[1] - rng.uniform(0, EXTENT)
+        radius = rng.uniform(0.05, 0.3) * EXTENT
+        kind = code % 3
+        if kind == 0:
+            # Random vertices around the center, in random order (self-intersecting)
+            rings = [np.column_stack([center[0] + rng.uniform(-radius, radius, 9), center[1] + rng.uniform(-radius, radius, 9)])]
+        else:
+            angles = np.sort(rng.uniform(0, 2 * np.pi, 16))
+            ring = np.column_stack([center[0] + radius * np.cos(angles), center[1] + radius * np.sin(angles)])
+            # A hole (kind 1) or a second part away from the first (kind 2)
+            other = center if kind == 1 else (center[0] + 2.5 * radius, center[1])
+            scale = 0.4 if kind == 1 else 0.6
+            rings = [ring, np.column_stack([other[0] + scale * radius * np.cos(angles), other[1] + scale * radius * np.sin(angles)])]
+        features.append(PolygonFeature(rings, code))
+    return features
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_lattice_polygons_match_point_in_polygon(workers):
+    features, _ = CodeFeatures(*LatticePolygons(SIZE, ['A', 'B', 'C', 'D'], 700.0, Seed=3))
+    codes = RasterizePolygons(features, GridTransform(), (SIZE, SIZE), BlockSize=BLOCK, Workers=workers)
+    np.testing.assert_array_equal(codes, PointInPolygon(features, (SIZE, SIZE)))
+    # The lattice tiles the extent, so every cell is covered
+    assert (codes > 0).all()
+
+def test_random_polygons_match_point_in_polygon(rng):
+    features = RandomFeatures(rng)
+    codes = RasterizePolygons(features, GridTransform(), (SIZE, SIZE), BlockSize=BLOCK, Workers=2)
+    expected = PointInPolygon(features, (SIZE, SIZE))
+    np.testing.assert_array_equal(codes, expected)
+    # Overlaps, holes and empty cells all occur
+    assert (expected == 0).any() and len(np.unique(expected)) > 4
+
+def test_later_feature_wins():
+    square = [np.array([[0, 0], [EXTENT / 2, 0], [EXTENT / 2, -EXTENT / 2], [0, -EXTENT / 2]]) + ORIGIN]
+    shifted = [square[0] + (EXTENT / 4, -EXTENT / 4)]
+    features = [PolygonFeature(square, 1), PolygonFeature(shifted, 2)]
+    codes = RasterizePolygons(features, GridTransform(), (SIZE, SIZE), BlockSize=BLOCK, Workers=1)
+    quarter = SIZE // 4
+    assert (codes[quarter:3 * quarter, quarter:3 * quarter] == 2).all()
+    assert (codes[:quarter, :2 * quarter] == 1).all()
+    np.testing.assert_array_equal(codes, PointInPolygon(features, (SIZE, SIZE)))
+
+def test_mask_and_output(rng):
+    features = RandomFeatures(rng)
+    mask = rng.random((SIZE, SIZE)) < 0.7
+    output = np.full((SIZE, SIZE), 999, dtype=np.uint16)
+    result = RasterizePolygons(features, GridTransform(), (SIZE, SIZE), Output=output, BlockSize=BLOCK, Workers=2, Mask=mask)
+    assert result is output
+    np.testing.assert_array_equal(output, np.where(mask, PointInPolygon(features, (SIZE, SIZE)), 0))
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Slope Tiles Tests
+Objective:  Horn planar slope (Slope_Tiles.py) against the slope of a plane and a cell by cell 3x3 kernel, and the tiles skipped by the mask
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import threading
+
+import numpy as np
+import pytest
+
+from conftest import SIZE, BLOCK
+from Block_Processing import IterBlocks
+from Slope_Tiles import HornSlope, SlopeTiles
+from Synthetic_Data import CELL_SIZE
+
+CELL = (CELL_SIZE, CELL_SIZE)
+
+# Horn slope of one cell, NoData neighbours (and neighbours outside the grid) taking the center value
+def BruteForceSlope(DEM, r, c):
+    rows, cols = DEM.shape
+    if np.isnan(DEM[r, c]):
+        return np.nan
+    z = {}
+    for dr in (-1, 0, 1):
+        for dc in (-1, 0, 1):
+            rr, cc = r + dr, c + dc
+            inside = 0 <= rr < rows and 0 <= cc < cols and not np.isnan(DEM[rr, cc])
+            z[dr, dc] = DEM[rr, cc] if inside else DEM[r, c]
+    dzdx = ((z[-1, 1] + 2 * z[0, 1] + z[1, 1]) - (z[-1, -1] + 2 * z[0, -1] + z[1, -1])) / (8 * CELL[0])
+    dzdy = ((z[1, -1] + 2 * z[1, 0] + z[1, 1]) - (z[-1, -1] + 2 * z[-1, 0] + z[-1, 1])) / (8 * CELL[1])
+    return np.degrees(np.arctan(np.hypot(dzdx, dzdy)))
+
+# Synthetic DEM with NoData holes
+def HoledDEM(Synthetic, rng):
+    dem = np.array(Synthetic['DEM'][:, :], dtype=np.float64)
+    dem[rng.random(dem.shape) < 0.05] = np.nan
+    dem[30:45, 60:80] = np.nan
+    return dem
+
+# Raster source recording the windows read
+class RecordingSource:
+
+    def __init__(self, Array):
+        self.array, self.shape, self.dtype = Array, Array.shape, Array.dtype
+        self.windows, self._lock = [], threading.Lock()
+
+    def __getitem__(self, Window):
+        with self._lock:
+            self.windows.append(Window)
+        return self.array[Window]
+
+@pytest.mark.parametrize('gradient', [(0.0, 0.0), (0.3, 0.0), (-0.2, 0.5), (1.5, -2.0)])
+def test_plane(gradient):
+    rows, cols = np.mgrid[:20, :30]
+    plane = gradient[0] * cols * CELL[0] + gradient[1] * rows * CELL[1] + 1000.0
+    expected = np.degrees(np.arctan(np.hypot(*gradient)))
+    np.testing.assert_allclose(HornSlope(plane, CELL), expected, atol=1e-4)
+
+def test_tiles_match_cell_by_cell(synthetic, rng):
+    dem = HoledDEM(synthetic, rng)
+    slope, skipped = SlopeTiles(dem, CELL, NoData=np.nan, BlockSize=BLOCK, Workers=3)
+    expected = np.array([[BruteForceSlope(dem, r, c) for c in range(SIZE)] for r in range(SIZE)], dtype=np.float32)
+    np.testing.assert_allclose(slope, expected, rtol=1e-5, atol=1e-5)
+    np.testing.assert_array_equal(np.isnan(slope), np.isnan(dem))
+    assert skipped == 0
+
+def test_masked_tiles_are_not_read(synthetic, rng):
+    dem = HoledDEM(synthetic, rng)
+    source = RecordingSource(dem)
+    mask = np.zeros(dem.shape, dtype=bool)
+    mask[5:35, 10:38] = True
+    output = np.full(dem.shape, -1, dtype=np.float32)
+    _, skipped = SlopeTiles(source, CELL, Output=output, Mask=mask, NoData=np.nan, BlockSize=BLOCK, Workers=2)
+    windows = list(IterBlocks(dem.shape, BLOCK))
+    outside = [window for window in windows if not mask[window].any()]
+    assert skipped == len(outside) / len(windows) and outside
+    # Only tiles touching the mask are read (with their halo)
+    assert len(source.windows) == len(windows) - len(outside)
+    full = SlopeTiles(dem, CELL, NoData=np.nan, BlockSize=BLOCK, Workers=1)[0]
+    np.testing.assert_array_equal(output, np.where(mask, full, np.float32(np.nan)))
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Stream Vectors Tests
+Objective:  Vectorized Douglas-Peucker simplification (Stream_Vectors.py) against the recursive algorithm, line by line
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import numpy as np
+import pytest
+
+from Stream_Vectors import SimplifyLines
+
+# Distance of points from the chord of (x0, y0) - (x1, y1), or from (x0, y0) when the chord has no length
+def ChordDistance(X, Y, x0, y0, x1, y1):
+    dx, dy = x1 - x0, y1 - y0
+    length = np.hypot(dx, dy)
+    if length == 0:
+        return np.hypot(X - x0, Y - y0)
+    return np.abs(dx * (Y - y0) - dy * (X - x0)) / length
+
+# Recursive Douglas-Peucker of one line, the first vertex reaching the maximum distance splits the line
+# Returns: indices of the kept vertices
+def DouglasPeucker(X, Y, Tolerance, First=0, Last=None):
+    last = X.size - 1 if Last is None else Last
+    if last - First < 2:
+        return sorted({First, last})
+    dist = ChordDistance(X[First + 1:last], Y[First + 1:last], X[First], Y[First], X[last], Y[last])
+    at = First + 1 + int(np.argmax(dist))
+    if dist.max() <= Tolerance:
+        return [First, last]
+    return DouglasPeucker(X, Y, Tolerance, First, at)[:-1] + DouglasPeucker(X, Y, Tolerance, at, last)
+
+# Random lines: random walks on the cell grid (as stream links), smooth curves, closed loops, and lines of one and two vertices
+def RandomLines(rng):
+    lines = []
+    for _ in range(30):
+        steps = rng.choice([-1, 0, 1], (rng.integers(3, 120), 2)) * 30.0
+        lines.append(np.cumsum(np.vstack([rng.uniform(0, 3000, (1, 2)), steps]), axis=0))
+    for _ in range(10):
+        t = np.linspace(0, rng.uniform(1, 6), rng.integers(5, 80))
+        lines.append(np.column_stack([t * 400, 300 * np.sin(t * rng.uniform(1, 4))]) + rng.normal(0, 5, (t.size, 2)))
+    loop = rng.uniform(0, 1000, (12, 2))
+    lines.append(np.vstack([loop, loop[:1]]))
+    lines.append(rng.uniform(0, 1000, (1, 2)))
+    lines.append(rng.uniform(0, 1000, (2, 2)))
+    order = rng.permutation(len(lines))
+    return [lines[i] for i in order]
+
+# Flat arrays of lines: (X, Y, Offsets)
+def Flatten(Lines):
+    vertices = np.vstack(Lines)
+    return vertices[:, 0].copy(), vertices[:, 1].copy(), np.concatenate([[0], np.cumsum([line.shape[0] for line in Lines])])
+
+@pytest.mark.parametrize('tolerance', [0.0, np.sqrt(0.5) * 30, 50.0, 500.0])
+def test_matches_recursive_douglas_peucker(rng, tolerance):
+    lines = RandomLines(rng)
+    x, y, offsets = Flatten(lines)
+    sx, sy, so = SimplifyLines(x, y, offsets, tolerance)
+    assert so.size == offsets.size and so[-1] == sx.size == sy.size
+    for i, line in enumerate(lines):
+        kept = DouglasPeucker(line[:, 0], line[:, 1], tolerance)
+        np.testing.assert_array_equal(sx[so[i]:so[i + 1]], line[kept, 0], err_msg=f'line {i}')
+        np.testing.assert_array_equal(sy[so[i]:so[i + 1]], line[kept, 1], err_msg=f'line {i}')
+
+def test_removed_vertices_within_tolerance(rng):
+    tolerance = 40.0
+    lines = RandomLines(rng)
+    x, y, offsets = Flatten(lines)
+    sx, sy, so = SimplifyLines(x, y, offsets, tolerance)
+    for i, line in enumerate(lines):
+        simplified = np.column_stack([sx[so[i]:so[i + 1]], sy[so[i]:so[i + 1]]])
+        # First and last vertex kept
+        np.testing.assert_array_equal(simplified[[0, -1]], line[[0, -1]])
+        # Every vertex between two kept vertices lies within the tolerance of their chord
+        kept = [0]
+        for vertex in simplified[1:]:
+            # Walks may revisit a vertex, so match in order along the line
+            kept.append(kept[-1] + 1 + int(np.flatnonzero((line[kept[-1] + 1:] == vertex).all(axis=1))[0]))
+        for a, b in zip(kept[:-1], kept[1:]):
+            if b - a > 1:
+                assert ChordDistance(line[a + 1:b, 0], line[a + 1:b, 1], *line[a], *line[b]).max() <= tolerance
+
+def test_straight_lines_reduce_to_their_ends():
+    t = np.arange(50, dtype=np.float64)
+    lines = [np.column_stack([t * 30, t * 15]), np.column_stack([t * 0 + 90, -t * 30])]
+    x, y, offsets = Flatten(lines)
+    sx, sy, so = SimplifyLines(x, y, offsets, 1e-6)
+    np.testing.assert_array_equal(so, [0, 2, 4])
+    np.testing.assert_array_equal(sx, [0, 49 * 30, 90, 90])
+    np.testing.assert_array_equal(sy, [0, 49 * 15, 0, -49 * 30])
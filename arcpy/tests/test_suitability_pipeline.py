@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Suitability Pipeline Tests
+Objective:  Fused classify-and-weight pipeline (Suitability_Pipeline.py) against classification then weighted overlay, layer by layer
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import numpy as np
+import pytest
+
+from conftest import SIZE, BLOCK
+from FloodMAR_Driver import LinearFunction, ModelWeights, TABLE_NAMES
+from Lookup_Reclass import CompileCategoricalTable, ReclassifyBlocks, NODATA_CLASS
+from Raster_Statistics import MultiRasterStatistics
+from Rescale_Functions import RescaleBlocks
+from Suitability_Pipeline import PipelineLayer, FusedSuitability, FusedSuitabilityModels
+from Weighted_Overlay import WeightedOverlay
+
+CONTINUOUS = ['DEM', 'Lineaments', 'NDVI']
+CATEGORICAL = ['Lithology', 'Soil', 'LULC']
+MODELS = {'flood': 'Flooding', 'recharge': 'Recharge'}
+
+# Layers of a model on the synthetic grid: sources, classifiers (TfLinear functions and compiled LUTs), weights and classified NoData values
+# Returns: (list of names, dict of name: source, dict of name: classifier, dict of name: weight, dict of name: source NoData, dict of name: statistics)
+def ModelLayers(Model, Synthetic, Polygons, Tables):
+    sources = {name: Synthetic[name] for name in CONTINUOUS + ['LULC']}
+    sources.update({name: Polygons[name][0] for name in ('Lithology', 'Soil')})
+    stats = MultiRasterStatistics({name: sources[name] for name in CONTINUOUS}, BlockSize=BLOCK, Workers=1)
+    classifiers = {name: LinearFunction(Model, name, stats[name]) for name in CONTINUOUS}
+    table = Tables[f'{MODELS[Model]}_CategoricalClassificationSchemas']
+    classifiers.update({name: CompileCategoricalTable(table, TABLE_NAMES.get(name, name), Polygons[name][1] if name in Polygons else None) for name in CATEGORICAL})
+    weights = ModelWeights(Tables['LayerWeights'], Model)
+    noData = {name: (np.nan if name in CONTINUOUS else 0) for name in sources}
+    return CONTINUOUS + CATEGORICAL, sources, classifiers, weights, noData, stats
+
+# Each layer classified on its own (RescaleBlocks, ReclassifyBlocks), then the weighted overlay of the classified layers
+def Unfused(Names, Sources, Classifiers, Weights, NoData, Stats, Mask=None):
+    classified = dict(zip(CONTINUOUS, RescaleBlocks([Sources[name] for name in CONTINUOUS], [Classifiers[name] for name in CONTINUOUS],
+                                                    Stats=[Stats[name] for name in CONTINUOUS], NoData=[NoData[name] for name in CONTINUOUS], BlockSize=BLOCK)))
+    classified.update({name: ReclassifyBlocks(Sources[name], Classifiers[name], NoData=NoData[name], BlockSize=BLOCK) for name in CATEGORICAL})
+    overlay = WeightedOverlay([classified[name] for name in Names], [Weights[name] for name in Names],
+                              NoData=[np.nan if name in CONTINUOUS else NODATA_CLASS for name in Names], Mask=Mask, BlockSize=BLOCK)
+    return overlay, classified
+
+@pytest.mark.parametrize('model', list(MODELS))
+def test_fused_matches_unfused(model, synthetic, polygons, tables):
+    names, sources, classifiers, weights, noData, stats = ModelLayers(model, synthetic, polygons, tables)
+    layers = [PipelineLayer(name, sources[name], classifiers[name], weights[name], NoData=noData[name], Stats=stats.get(name)) for name in names]
+    fused, intermediates = FusedSuitability(layers, SaveIntermediates=True, BlockSize=BLOCK)
+    overlay, classified = Unfused(names, sources, classifiers, weights, noData, stats)
+    # Same float32 products summed in the same order, so the results are identical
+    np.testing.assert_array_equal(fused, overlay)
+    for name in names:
+        np.testing.assert_array_equal(intermediates[name], classified[name], err_msg=name)
+    assert np.isfinite(fused).any()
+
+def test_fused_with_mask(synthetic, polygons, tables):
+    names, sources, classifiers, weights, noData, stats = ModelLayers('flood', synthetic, polygons, tables)
+    layers = [PipelineLayer(name, sources[name], classifiers[name], weights[name], NoData=noData[name], Stats=stats.get(name)) for name in names]
+    # A disc, so some blocks are fully outside (EMPTY), some partial and some fully inside
+    rows, cols = np.mgrid[:SIZE, :SIZE]
+    mask = np.hypot(rows - SIZE / 2, cols - SIZE / 2) < SIZE / 2.5
+    fused, _ = FusedSuitability(layers, Mask=mask, BlockSize=BLOCK)
+    overlay, _ = Unfused(names, sources, classifiers, weights, noData, stats, Mask=mask)
+    np.testing.assert_array_equal(fused, overlay)
+    assert np.isnan(fused[~mask]).all()
+
+def test_models_share_source_reads(synthetic, polygons, tables):
+    models, expected = {}, {}
+    for model in MODELS:
+        names, sources, classifiers, weights, noData, stats = ModelLayers(model, synthetic, polygons, tables)
+        models[model] = [PipelineLayer(name, sources[name], classifiers[name], weights[name], NoData=noData[name], Stats=stats.get(name)) for name in names]
+        expected[model] = FusedSuitability(models[model], BlockSize=BLOCK)[0]
+    outputs, ranges, _ = FusedSuitabilityModels(models, BlockSize=BLOCK)
+    for model in MODELS:
+        np.testing.assert_array_equal(outputs[model], expected[model])
+        assert ranges[model] == (float(np.nanmin(expected[model])), float(np.nanmax(expected[model])))
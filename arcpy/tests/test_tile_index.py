@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Tile Index Tests
+Objective:  Block-level coverage index of the processing mask (Tile_Index.py) against the rasterized mask, its re-blocking, save/load round trip and report
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import numpy as np
+import pytest
+
+from conftest import SIZE, BLOCK
+from Block_Processing import IterBlocks, MaskedBlocks, EMPTY, PARTIAL, FULL
+from Scanline_Rasterize import PolygonFeature
+from Synthetic_Data import GridTransform, ORIGIN, CELL_SIZE
+from Tile_Index import TileIndex
+from test_scanline_rasterize import PointInPolygon
+
+# Map coordinates of (column, row) vertices
+def Ring(Cells):
+    cells = np.asarray(Cells, dtype=np.float64) * CELL_SIZE
+    return np.column_stack([ORIGIN[0] + cells[:, 0], ORIGIN[1] - cells[:, 1]])
+
+# Irregular watershed-like polygon with a hole: of the 40 x 40 tiles, the center one lies fully inside, the upper right one fully outside
+def Watershed():
+    outer = Ring([(5, 2), (80, 0), (80, 40), (92, 44), (86, 86), (30, 92), (2, 50)])
+    hole = Ring([(15.3, 14.8), (26.1, 17.2), (22.4, 27.9)])
+    return [PolygonFeature([outer, hole], 1)]
+
+# Mask of the watershed, cell centers inside the polygon (by the crossing number of each cell)
+@pytest.fixture(scope='module')
+def mask():
+    return PointInPolygon(Watershed(), (SIZE, SIZE)) != 0
+
+@pytest.fixture(scope='module')
+def index():
+    return TileIndex.FromPolygons(Watershed(), GridTransform(), (SIZE, SIZE), BLOCK, Workers=2)
+
+def test_states_match_the_rasterized_mask(index, mask):
+    assert index.states.shape == (3, 3)
+    for window in IterBlocks((SIZE, SIZE), BLOCK):
+        tile = (window[0].start // BLOCK[0], window[1].start // BLOCK[1])
+        block = mask[window]
+        assert index.states[tile] == (EMPTY if not block.any() else FULL if block.all() else PARTIAL), tile
+        np.testing.assert_array_equal(index.TileMask(tile), block)
+    assert set(np.unique(index.states)) == {EMPTY, PARTIAL, FULL}
+    assert index.inside == mask.sum()
+    np.testing.assert_array_equal(index[:, :], mask)
+    # Windows that do not align with the tiles
+    np.testing.assert_array_equal(index[7:61, 33:90], mask[7:61, 33:90])
+
+def test_from_mask_matches_from_polygons(index, mask):
+    fromMask = TileIndex.FromMask(mask, BLOCK)
+    np.testing.assert_array_equal(fromMask.states, index.states)
+    assert fromMask.inside == index.inside
+    np.testing.assert_array_equal(fromMask[:, :], mask)
+
+@pytest.mark.parametrize('blockSize', [BLOCK, (16, 24), (7, 9), (64, 64), (SIZE, SIZE)])
+def test_masked_blocks_match_the_mask(index, mask, blockSize):
+    # Blocks of another size are classified from the tiles they overlap, as the boolean mask itself would be
+    for (window, state, block), (expectedWindow, expectedState, expectedBlock) in zip(index.MaskedBlocks(blockSize), MaskedBlocks((SIZE, SIZE), blockSize, mask), strict=True):
+        assert window == expectedWindow and state == expectedState, window
+        if expectedBlock is None:
+            assert block is None
+        else:
+            np.testing.assert_array_equal(block, expectedBlock)
+
+def test_save_load_round_trip(index, tmp_path):
+    path = index.Save(str(tmp_path / 'TileIndex.npz'), Key='watershed-grid')
+    loaded, key = TileIndex.Load(path)
+    assert key == 'watershed-grid'
+    np.testing.assert_array_equal(loaded.states, index.states)
+    assert loaded.shape == index.shape and loaded.blockSize == index.blockSize and loaded.inside == index.inside
+    assert sorted(loaded.masks) == sorted(index.masks)
+    np.testing.assert_array_equal(loaded[:, :], index[:, :])
+    # No PARTIAL tiles, and no cell count
+    full = TileIndex(np.full((2, 3), FULL), {}, (SIZE, SIZE), (48, 32))
+    loaded, key = TileIndex.Load(full.Save(str(tmp_path / 'Full.npz')))
+    assert key == '' and loaded.inside is None and not loaded.masks
+    assert loaded[:, :].all()
+
+def test_report(index, mask):
+    report = index.Report()
+    assert report['tiles'] == 9
+    assert report['empty'] + report['partial'] + report['full'] == 9
+    assert report['empty'] == int((index.states == EMPTY).sum()) and report['full'] == int((index.states == FULL).sum())
+    empty = sum(mask[window].size for window in IterBlocks((SIZE, SIZE), BLOCK) if not mask[window].any())
+    assert report['skipped'] == pytest.approx(empty / SIZE ** 2)
+    assert report['inside'] == pytest.approx(mask.mean())
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Weight Sensitivity Tests
+Objective:  Monte Carlo weight sensitivity (Weight_Sensitivity.py): the reference sample against FloodMAR_Driver.RunFloodMAR, and the per cell statistics over the samples
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import numpy as np
+
+from conftest import BLOCK
+from FloodMAR_Driver import RunFloodMAR, BuildModels, ModelWeights, LAYERS
+from Weight_Sensitivity import RunSensitivity, WeightSensitivity, SampleWeights, STEP
+
+MODELS = ('flood', 'recharge', 'floodmar')
+
+def test_single_sample_reproduces_flood_mar(watershed):
+    sources, catTables, layerWeights, codes, stats = watershed
+    expected, _ = RunFloodMAR(sources, catTables, layerWeights, codes, BlockSize=BLOCK)
+    outputs, samples = RunSensitivity(sources, catTables, layerWeights, codes, stats, Samples=1, BlockSize=BLOCK)
+    for model in ('flood', 'recharge'):
+        np.testing.assert_array_equal(samples[model].iloc[0].to_numpy(), [ModelWeights(layerWeights, model)[layer] for layer in LAYERS])
+    # Classes are rounded to STEP, each weighted sum by at most STEP / 2 (the weights sum to 1)
+    for model in MODELS:
+        np.testing.assert_array_equal(np.isnan(outputs[f'{model}_mean']), np.isnan(expected[model]), err_msg=model)
+        assert np.nanmax(np.abs(outputs[f'{model}_mean'] - expected[model])) <= STEP / 2, model
+        assert np.nanmax(outputs[f'{model}_std']) == 0
+    assert np.nanmin(outputs['floodmar_agreement']) == 1
+
+def test_agreement_with_the_reference(watershed):
+    sources, catTables, layerWeights, codes, stats = watershed
+    samples = 40
+    outputs, weights = RunSensitivity(sources, catTables, layerWeights, codes, stats, Samples=samples, Concentration=30, BlockSize=BLOCK)
+    agreement = outputs['floodmar_agreement']
+    valid = np.isfinite(outputs['floodmar_mean'])
+    np.testing.assert_array_equal(np.isfinite(agreement), valid)
+    # Sample 0 is the reference, so it always agrees with itself
+    assert agreement[valid].min() >= 1 / samples and agreement[valid].max() <= 1
+    assert agreement[valid].min() < 1
+    assert (outputs['floodmar_p5'][valid] <= outputs['floodmar_p95'][valid]).all()
+    for model in ('flood', 'recharge'):
+        np.testing.assert_allclose(weights[model].sum(axis=1), weights[model].iloc[0].sum())
+
+def test_identical_samples_agree(watershed):
+    sources, catTables, layerWeights, codes, stats = watershed
+    models = BuildModels(sources, catTables, layerWeights, codes, stats)
+    weights = {model: np.repeat(SampleWeights([ModelWeights(layerWeights, model)[layer] for layer in LAYERS], 1), 5, axis=0) for model in models}
+    outputs = WeightSensitivity(models, weights, BlockSize=BLOCK)
+    valid = np.isfinite(outputs['floodmar_mean'])
+    assert (outputs['floodmar_agreement'][valid] == 1).all()
+    # Zero up to the float32 rounding of the mean
+    for model in MODELS:
+        assert outputs[f'{model}_std'][valid].max() <= 1e-6
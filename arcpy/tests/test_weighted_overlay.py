@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Name:       Weighted Overlay Tests
+Objective:  Tiled weighted overlay (Weighted_Overlay.py) against the raster calculator arithmetic, and the common grid check of its inputs
+Author:     Travis Zalesky
+Date:       10/18/26
+
+Based on San Pedro Flood-MAR model builder, Zalesky, Dec. 2024
+"""
+import numpy as np
+import pytest
+
+from conftest import SIZE, BLOCK
+from Block_Processing import CommonShape
+from Weighted_Overlay import WeightedOverlay
+from Synthetic_Data import GridTransform
+
+WEIGHTS = [0.25, 0.1, 0.3, 0.35]
+
+# Classified layers (float32 with NaN NoData, and uint8 with NoData 0)
+def ClassifiedLayers(rng):
+    layers = [rng.integers(1, 6, (SIZE, SIZE)).astype(np.float32) for _ in WEIGHTS[:2]]
+    layers += [rng.integers(0, 6, (SIZE, SIZE)).astype(np.uint8) for _ in WEIGHTS[2:]]
+    layers[0][rng.random((SIZE, SIZE)) < 0.05] = np.nan
+    return layers, [np.nan, np.nan, 0, 0]
+
+# Raster calculator arithmetic: each (layer * weight) in double precision rounded to float32, summed left to right in float32
+def Reference(Layers, Weights, NoData):
+    total, valid = None, np.ones((SIZE, SIZE), dtype=bool)
+    for layer, weight, noData in zip(Layers, Weights, NoData):
+        valid &= ~np.isnan(layer) if np.isnan(noData) else layer != noData
+        term = (layer.astype(np.float64) * weight).astype(np.float32)
+        total = term if total is None else total + term
+    return np.where(valid, total, np.float32(np.nan))
+
+def test_overlay_matches_raster_calculator(rng):
+    layers, noData = ClassifiedLayers(rng)
+    np.testing.assert_array_equal(WeightedOverlay(layers, WEIGHTS, NoData=noData, BlockSize=BLOCK), Reference(layers, WEIGHTS, noData))
+
+def test_overlay_with_mask(rng):
+    layers, noData = ClassifiedLayers(rng)
+    mask = np.zeros((SIZE, SIZE), dtype=bool)
+    mask[5:60, 30:90] = True
+    result = WeightedOverlay(layers, WEIGHTS, NoData=noData, Mask=mask, BlockSize=BLOCK)
+    np.testing.assert_array_equal(result, np.where(mask, Reference(layers, WEIGHTS, noData), np.float32(np.nan)))
+
+# Raster source on a grid, as the Raster_IO and Raster_Store readers
+class GridSource:
+
+    def __init__(self, Array, Transform):
+        self.array, self.shape, self.transform = Array, Array.shape, Transform
+
+    def __getitem__(self, Window):
+        return self.array[Window]
+
+def test_inputs_must_share_the_grid(rng):
+    layers, noData = ClassifiedLayers(rng)
+    x0, cell, _, y0, _, _ = GridTransform()
+    aligned = [GridSource(layer, GridTransform()) for layer in layers]
+    # Float rounding of the origin is not a mismatch
+    aligned[1].transform = (x0 + 1e-7, cell, 0.0, y0, 0.0, -cell)
+    assert CommonShape(aligned) == (SIZE, SIZE)
+    np.testing.assert_array_equal(WeightedOverlay(aligned, WEIGHTS, NoData=noData, BlockSize=BLOCK), Reference(layers, WEIGHTS, noData))
+    # Same shape, shifted by one cell or with another cell size
+    for transform in [(x0 + cell, cell, 0.0, y0, 0.0, -cell), (x0, 2 * cell, 0.0, y0, 0.0, -2 * cell)]:
+        aligned[2].transform = transform
+        with pytest.raises(ValueError, match='geotransforms'):
+            WeightedOverlay(aligned, WEIGHTS, NoData=noData, BlockSize=BLOCK)
+    with pytest.raises(ValueError, match='shapes'):
+        WeightedOverlay(layers[:3] + [layers[3][:-1]], WEIGHTS, NoData=noData, BlockSize=BLOCK)